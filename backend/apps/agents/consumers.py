@@ -1,20 +1,284 @@
+import os
 import json
+import asyncio
+import logging
+from datetime import datetime
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-class ChatConsumer(AsyncWebsocketConsumer):
+from .services.conversation_memory import ConversationMemory
+from .services.context_gatherer import get_context_gatherer
+from .services.turn_writer import get_turn_writer
+from .views import AgentContextMixin
+
+logger = logging.getLogger(__name__)
+
+
+class ChatConsumer(AgentContextMixin, AsyncWebsocketConsumer):
+    """
+    Chat con agentes sobre una conexión WebSocket persistente.
+
+    Cada mensaje recorre el mismo pipeline que AgentChatAPIView (fuentes de
+    contexto de AgentContextMixin y routing con AgentManager) y la respuesta
+    se emite con AgentManager.astream_query en los eventos 'start', 'delta',
+    'done' o 'error', sin ocupar un hilo por conexión.
+
+    La conexión mantiene su propio estado de sesión: la memoria y el
+    historial reciente de cada agente se leen una sola vez y se actualizan
+    localmente tras cada turno. Los fragmentos del modelo pasan por una cola
+    acotada; si el cliente no los consume, el productor deja de leer del
+    modelo, los deltas pendientes se agrupan en un único frame y, pasado
+    WS_SLOW_CLIENT_TIMEOUT, la respuesta se aborta.
+
+    Mensajes del cliente:
+        {"text": "...", "agent_type": "...", "context": "...", "is_quiz_system": false}
+        {"type": "cancel"}  Cancela la respuesta en curso
+    """
+
     async def connect(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.queue_size = int(os.getenv('WS_STREAM_QUEUE_SIZE', 64))
+        self.slow_client_timeout = float(os.getenv('WS_SLOW_CLIENT_TIMEOUT', 30))
+
+        # Estado de sesión de la conexión
+        self.user_id = None
+        self.agent_manager = None
+        self.rag_service = None
+        self.memories = {}
+        self.histories = {}
+        self.session_metadata = {}
+        self.current_task = None
+
         await self.accept()
 
     async def disconnect(self, code):
-        pass
-
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        user_id = data.get('userId')
-        text = data.get('text')
-        # Lógica de agente dummy (por ejemplo, llamar a OpenAI aquí)
-        response_text = f"Respuesta en tiempo real: «{text}»"
-        await self.send(text_data=json.dumps({
-            'from': 'agent',
-            'text': response_text
-        })) 
\ No newline at end of file
+        await self._cancel_current()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '{}')
+        except json.JSONDecodeError:
+            await self._send_event({'type': 'error', 'error': 'Mensaje JSON no válido'})
+            return
+
+        if data.get('type') == 'cancel':
+            cancelled = await self._cancel_current()
+            if cancelled:
+                await self._send_event({'type': 'cancelled'})
+            return
+
+        message = data.get('text') or data.get('message') or data.get('query')
+        if not message:
+            await self._send_event({
+                'type': 'error',
+                'error': "El campo 'text', 'message' o 'query' es requerido."
+            })
+            return
+
+        # Una respuesta en curso por conexión; receive no se bloquea para poder recibir 'cancel'
+        if self.current_task and not self.current_task.done():
+            await self._send_event({
+                'type': 'error',
+                'error': 'Ya hay una respuesta en curso. Espera a que termine o envía {"type": "cancel"}.'
+            })
+            return
+
+        self.current_task = asyncio.ensure_future(self._handle_message(data, message))
+
+    async def _cancel_current(self) -> bool:
+        """Cancelar la respuesta en curso, si la hay"""
+        if not self.current_task or self.current_task.done():
+            return False
+
+        self.current_task.cancel()
+        try:
+            await self.current_task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    async def _handle_message(self, data, message):
+        """Procesar un mensaje del usuario emitiendo la respuesta en streaming"""
+        user_id = self._resolve_user_id(data)
+        agent_type = data.get('agent_type')
+        conversation_agent_type = agent_type or 'tutor'  # Default temporal
+        explicit_context = data.get('explicit_context') or data.get('context', None)
+        is_quiz_system = data.get('is_quiz_system', False)
+
+        try:
+            await self._ensure_services()
+            context = await self._build_context(
+                user_id, message, conversation_agent_type, explicit_context, is_quiz_system,
+                bool(data.get('bypass_cache', False))
+            )
+
+            async for event in self._stream_agent(message, agent_type, context):
+                if event['type'] == 'done':
+                    # Guardar mensajes en memoria una vez completada la respuesta
+                    await database_sync_to_async(self._save_turn, thread_sensitive=False)(
+                        user_id, event['agent_used'], message, event['response']
+                    )
+                    event = {
+                        **event,
+                        'context_sources': len(context['relevant_documents']),
+                        'user_id': user_id,
+                        # Compatibilidad con el formato anterior del consumer
+                        'from': 'agent',
+                        'text': event['response']
+                    }
+                await self._send_event(event)
+
+        except Exception as e:
+            self.logger.error(f"Error en ChatConsumer: {e}")
+            await self._send_event({
+                'type': 'error',
+                'error': 'Error interno del servidor',
+                'response': 'Lo siento, hubo un problema procesando tu consulta. Por favor, intenta de nuevo.',
+                'user_id': user_id
+            })
+
+    async def _stream_agent(self, message, agent_type, context):
+        """
+        Reenviar los eventos de AgentManager.astream_query a través de una cola acotada
+
+        El productor se detiene cuando la cola está llena, de modo que un
+        cliente lento frena la lectura del modelo en lugar de acumular memoria.
+        Al terminar o cancelarse la respuesta se cierra el stream del modelo.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        state = {'slow_client': False}
+
+        async def produce():
+            events = self.agent_manager.astream_query(query=message, agent_type=agent_type, context=context)
+            try:
+                async for event in events:
+                    try:
+                        await asyncio.wait_for(queue.put(event), self.slow_client_timeout)
+                    except asyncio.TimeoutError:
+                        state['slow_client'] = True
+                        break
+            finally:
+                # Cerrar el generador cierra también el stream HTTP del modelo
+                await events.aclose()
+
+        producer = asyncio.ensure_future(produce())
+        getter = None
+        try:
+            while not (producer.done() and queue.empty()):
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+
+                event = getter.result()
+                if event['type'] != 'delta':
+                    yield event
+                    continue
+
+                # Agrupar los deltas pendientes en un único frame
+                parts = [event['content']]
+                following = None
+                while not queue.empty():
+                    candidate = queue.get_nowait()
+                    if candidate['type'] != 'delta':
+                        following = candidate
+                        break
+                    parts.append(candidate['content'])
+                yield {'type': 'delta', 'content': ''.join(parts)}
+                if following is not None:
+                    yield following
+
+            await producer
+            if state['slow_client']:
+                self.logger.warning(f"Respuesta abortada: el cliente no consume el stream ({self.user_id})")
+                yield {'type': 'error', 'error': 'Respuesta cancelada: el cliente no consume los mensajes a tiempo'}
+        finally:
+            if getter is not None and not getter.done():
+                getter.cancel()
+            if not producer.done():
+                producer.cancel()
+                try:
+                    await producer
+                except asyncio.CancelledError:
+                    pass
+
+    async def _send_event(self, event):
+        await self.send(text_data=json.dumps(event, ensure_ascii=False))
+
+    def _resolve_user_id(self, data) -> str:
+        """Usuario autenticado de la conexión, o el indicado en el mensaje"""
+        user = self.scope.get('user')
+        if user is not None and getattr(user, 'is_authenticated', False):
+            user_id = str(user.id)
+        else:
+            user_id = data.get('userId') or self.user_id or 'default-user'
+
+        if user_id != self.user_id:
+            # Cambio de usuario: descartar el estado de sesión anterior
+            self.user_id = user_id
+            self.memories = {}
+            self.histories = {}
+            self.session_metadata = {}
+        return user_id
+
+    async def _ensure_services(self):
+        """Obtener AgentManager y crear el servicio RAG una sola vez por conexión"""
+        if self.agent_manager is None:
+            self.agent_manager, self.rag_service = await database_sync_to_async(self._create_services)()
+
+    def _create_services(self):
+        from .services.agent_manager import get_agent_manager
+        return get_agent_manager(), self._init_rag_service()
+
+    def _get_memory(self, user_id: str, agent_type: str) -> ConversationMemory:
+        memory = self.memories.get(agent_type)
+        if memory is None:
+            memory = self.memories[agent_type] = ConversationMemory(user_id, agent_type)
+        return memory
+
+    async def _build_context(self, user_id, message, conversation_agent_type, explicit_context, is_quiz_system,
+                             bypass_cache=False):
+        """
+        Construir el contexto para el agente usando el historial de la sesión
+
+        Las fuentes son las de AgentContextMixin y se esperan en paralelo con
+        plazo por fuente; el historial y los metadatos de sesión solo se leen
+        en el primer mensaje para cada agente.
+        """
+        memory = self.memories.get(conversation_agent_type)
+        if memory is None:
+            memory = await database_sync_to_async(self._get_memory, thread_sensitive=False)(
+                user_id, conversation_agent_type
+            )
+
+        sources = self._context_sources(memory, user_id, message)
+        cached = conversation_agent_type in self.histories
+        if cached:
+            del sources['history'], sources['session']
+
+        gathered = await get_context_gatherer().agather(sources)
+        if cached:
+            gathered['history'] = self.histories[conversation_agent_type]
+            gathered['session'] = self.session_metadata[conversation_agent_type]
+        elif gathered['history']:
+            # Un historial vacío (sesión nueva o fuente expirada) se vuelve a consultar en el siguiente mensaje
+            self.histories[conversation_agent_type] = gathered['history']
+            self.session_metadata[conversation_agent_type] = gathered['session']
+        gathered['history'] = list(gathered['history'])
+
+        return self._assemble_agent_context(gathered, user_id, explicit_context, is_quiz_system, bypass_cache)
+
+    def _save_turn(self, user_id: str, agent_type: str, message: str, response: str):
+        """Encolar el turno para persistirlo y actualizar el historial local de la sesión"""
+        memory = self._get_memory(user_id, agent_type)
+        get_turn_writer().submit_turn(memory, message, response)
+
+        history = self.histories.get(agent_type)
+        if history is not None:
+            # Mismo orden que ConversationMemory.get_context: del más reciente al más antiguo
+            timestamp = datetime.now().isoformat()
+            history.insert(0, {'role': 'user', 'content': message, 'timestamp': timestamp, 'metadata': {}})
+            history.insert(0, {'role': 'assistant', 'content': response, 'timestamp': timestamp, 'metadata': {}})
+            del history[self.history_limit:]
@@ -3,7 +3,9 @@ Agent Manager - Sistema central de gestión de agentes especializados
 """
 
 import logging
-from typing import Dict, Any, Optional, List
+import time
+import threading
+from typing import Dict, Any, Optional, List, Iterator, AsyncIterator
 from datetime import datetime
 
 from .tutor_agent import TutorAgent
@@ -13,13 +15,49 @@ from .curriculum_agent import CurriculumPlannerAgent
 from .content_creator_agent import ContentCreatorAgent
 from .analytics_agent import AnalyticsAgent
 from .quiz_agent import QuizAgent
+from .ai_service import LLM_REQUEST_LATENCY, LLM_REQUEST_ERRORS, LLM_TOKENS
+from backend_project.tracing import span
+from backend_project.metrics import get_metrics_registry
 
 logger = logging.getLogger(__name__)
 
+# Agentes especializados disponibles, por id
+AGENT_CLASSES = {
+    'tutor': TutorAgent,
+    'evaluator': EvaluatorAgent,
+    'counselor': CounselorAgent,
+    'curriculum': CurriculumPlannerAgent,
+    'content_creator': ContentCreatorAgent,
+    'analytics': AnalyticsAgent,
+    'quiz': QuizAgent,
+}
+
+_registry = get_metrics_registry()
+AGENT_REQUEST_LATENCY = _registry.histogram(
+    'agent_request_duration_seconds',
+    'Latencia de las consultas a los agentes, de la selección del agente a la respuesta completa',
+    ['agent', 'mode']
+)
+AGENT_REQUEST_ERRORS = _registry.counter(
+    'agent_request_errors_total',
+    'Consultas a los agentes que terminaron en error, por tipo de excepción',
+    ['agent', 'error']
+)
+AGENT_FIRST_TOKEN_LATENCY = _registry.histogram(
+    'agent_time_to_first_token_seconds',
+    'Tiempo hasta el primer fragmento de las respuestas en streaming',
+    ['agent']
+)
+
 class AgentManager:
     """
     Gestor central para todos los agentes especializados.
     
+    Hay una sola instancia por proceso (get_agent_manager) y cada agente se
+    construye la primera vez que se usa. Las métricas (histogramas de
+    latencia por agente y errores por tipo) viven en el registro de métricas
+    del proceso y se acumulan entre peticiones.
+    
     Responsabilidades:
     - Routing de consultas al agente apropiado
     - Coordinación entre agentes
@@ -29,74 +67,41 @@ class AgentManager:
     """
     
     def __init__(self):
-        """Inicializar el gestor de agentes"""
+        """Inicializar el gestor de agentes (los agentes se construyen al primer uso)"""
         self.logger = logging.getLogger(self.__class__.__name__)
         
-        # Inicializar agentes especializados
-        self.agents = {
-            'tutor': TutorAgent(),
-            'evaluator': EvaluatorAgent(),
-            'counselor': CounselorAgent(),
-            'curriculum': CurriculumPlannerAgent(),
-            'content_creator': ContentCreatorAgent(),
-            'analytics': AnalyticsAgent(),
-            'quiz': QuizAgent(),  # Nuevo agente para quizzes
-        }
+        # Agentes especializados ya construidos, por id
+        self.agents: Dict[str, Any] = {}
+        self._agents_lock = threading.Lock()
         
         # Configuración de routing
         self.routing_config = self._setup_routing_config()
         
-        # Métricas y monitoreo
-        self.metrics = {
-            'total_queries': 0,
-            'agent_usage': {agent_id: 0 for agent_id in self.agents.keys()},
-            'average_response_time': 0,
-            'errors': 0
-        }
-        
-        self.logger.info(f"AgentManager inicializado con {len(self.agents)} agentes")
+        self.logger.info(f"AgentManager inicializado ({len(AGENT_CLASSES)} agentes disponibles)")
     
-    def _initialize_agents(self) -> Dict[str, Any]:
-        """Inicializar todos los agentes especializados"""
-        agents = {}
-        
-        try:
-            agents['tutor'] = TutorAgent()
-            self.logger.info("✅ Tutor Agent inicializado")
-        except Exception as e:
-            self.logger.error(f"❌ Error inicializando Tutor Agent: {e}")
-        
-        try:
-            agents['evaluator'] = EvaluatorAgent()
-            self.logger.info("✅ Evaluator Agent inicializado")
-        except Exception as e:
-            self.logger.error(f"❌ Error inicializando Evaluator Agent: {e}")
-        
-        try:
-            agents['counselor'] = CounselorAgent()
-            self.logger.info("✅ Counselor Agent inicializado")
-        except Exception as e:
-            self.logger.error(f"❌ Error inicializando Counselor Agent: {e}")
-        
-        try:
-            agents['curriculum'] = CurriculumPlannerAgent()
-            self.logger.info("✅ Curriculum Agent inicializado")
-        except Exception as e:
-            self.logger.error(f"❌ Error inicializando Curriculum Agent: {e}")
-        
-        try:
-            agents['analytics'] = AnalyticsAgent()
-            self.logger.info("✅ Analytics Agent inicializado")
-        except Exception as e:
-            self.logger.error(f"❌ Error inicializando Analytics Agent: {e}")
+    def get_agent(self, agent_id: str):
+        """
+        Obtener un agente, construyéndolo la primera vez que se usa
         
-        try:
-            agents['content_creator'] = ContentCreatorAgent()
-            self.logger.info("✅ Content Creator Agent inicializado")
-        except Exception as e:
-            self.logger.error(f"❌ Error inicializando Content Creator Agent: {e}")
+        Args:
+            agent_id: Id del agente ('tutor', 'quiz', ...)
         
-        return agents
+        Returns:
+            Instancia del agente
+        """
+        agent = self.agents.get(agent_id)
+        if agent is not None:
+            return agent
+        
+        if agent_id not in AGENT_CLASSES:
+            raise ValueError(f"Agente '{agent_id}' no disponible")
+        
+        with self._agents_lock:
+            agent = self.agents.get(agent_id)
+            if agent is None:
+                agent = self.agents[agent_id] = AGENT_CLASSES[agent_id]()
+                self.logger.info(f"✅ Agente {agent_id} inicializado")
+        return agent
     
     def _setup_routing_config(self) -> Dict[str, Dict[str, Any]]:
         """Configurar reglas de routing para cada agente"""
@@ -175,40 +180,23 @@ class AgentManager:
         
         try:
             # Determinar agente apropiado
-            if agent_type and agent_type in self.agents:
-                selected_agent_id = agent_type
-            else:
-                # Verificar si es una solicitud del sistema de quiz
-                is_quiz_system = context.get('is_quiz_system', False)
-                if is_quiz_system:
-                    # Para el sistema de quiz, usar el Quiz Agent
-                    selected_agent_id = 'quiz'
-                    self.logger.info(f"Quiz system detected - routing to Quiz Agent")
-                else:
-                    # Para chat normal, usar el Tutor Agent
-                    selected_agent_id = 'tutor'
-                    self.logger.info(f"Chat system detected - routing to Tutor Agent")
-            
-            # Verificar que el agente existe
-            if selected_agent_id not in self.agents:
-                raise ValueError(f"Agente '{selected_agent_id}' no disponible")
+            selected_agent_id = self._select_agent(agent_type, context)
             
-            agent = self.agents[selected_agent_id]
+            # Obtener el agente (se construye en su primer uso)
+            agent = self.get_agent(selected_agent_id)
             
             # Enriquecer contexto
             enriched_context = self._enrich_context(context, selected_agent_id)
             
             # Procesar consulta
-            if hasattr(agent, 'process_specialized_query'):
+            with span('agent.process', agent=selected_agent_id):
                 response = agent.process_specialized_query(query, enriched_context)
-            else:
-                response = agent.process_query(query, enriched_context)
             
             # Calcular tiempo de respuesta
             response_time = (datetime.now() - start_time).total_seconds()
             
             # Actualizar métricas
-            self._update_metrics(selected_agent_id, response_time, success=True)
+            self._update_metrics(selected_agent_id, response_time, 'sync')
             
             # Registrar interacción
             self._log_interaction(query, selected_agent_id, response, response_time)
@@ -227,7 +215,7 @@ class AgentManager:
             # Manejar errores
             response_time = (datetime.now() - start_time).total_seconds()
             self._update_metrics(selected_agent_id if 'selected_agent_id' in locals() else 'unknown', 
-                               response_time, success=False)
+                               response_time, 'sync', error=e)
             
             self.logger.error(f"Error procesando consulta: {e}")
             
@@ -240,6 +228,215 @@ class AgentManager:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def _select_agent(self, agent_type: Optional[str], context: Dict[str, Any]) -> str:
+        """Elegir el agente para una consulta: el solicitado, o quiz/tutor según el sistema"""
+        if agent_type and agent_type in AGENT_CLASSES:
+            return agent_type
+        
+        # Verificar si es una solicitud del sistema de quiz
+        is_quiz_system = context.get('is_quiz_system', False)
+        if is_quiz_system:
+            # Para el sistema de quiz, usar el Quiz Agent
+            self.logger.info(f"Quiz system detected - routing to Quiz Agent")
+            return 'quiz'
+        
+        # Para chat normal, usar el Tutor Agent
+        self.logger.info(f"Chat system detected - routing to Tutor Agent")
+        return 'tutor'
+    
+    async def aroute_query(self, query: str, agent_type: Optional[str] = None,
+                           context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Variante asíncrona de route_query: el worker ASGI no queda bloqueado
+        mientras el agente espera al modelo
+        
+        Args:
+            query: Consulta del usuario
+            agent_type: Tipo de agente específico (opcional)
+            context: Contexto adicional para la consulta
+        
+        Returns:
+            Dict con la respuesta del agente y metadatos (mismo formato que route_query)
+        """
+        start_time = datetime.now()
+        context = context or {}
+        selected_agent_id = None
+        
+        try:
+            selected_agent_id = self._select_agent(agent_type, context)
+            agent = self.get_agent(selected_agent_id)
+            enriched_context = self._enrich_context(context, selected_agent_id)
+            
+            with span('agent.process', agent=selected_agent_id):
+                response = await agent.aprocess_specialized_query(query, enriched_context)
+            
+            response_time = (datetime.now() - start_time).total_seconds()
+            self._update_metrics(selected_agent_id, response_time, 'async')
+            self._log_interaction(query, selected_agent_id, response, response_time)
+            
+            return {
+                'success': True,
+                'agent_used': selected_agent_id,
+                'agent_name': agent.get_agent_name(),
+                'response': response,
+                'response_time': response_time,
+                'context_used': enriched_context,
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            response_time = (datetime.now() - start_time).total_seconds()
+            self._update_metrics(selected_agent_id or 'unknown', response_time, 'async', error=e)
+            
+            self.logger.error(f"Error procesando consulta asíncrona: {e}")
+            
+            return {
+                'success': False,
+                'error': str(e),
+                'agent_used': selected_agent_id,
+                'response': self._get_fallback_response(),
+                'response_time': response_time,
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    def stream_query(self, query: str, agent_type: Optional[str] = None,
+                     context: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Enrutar consulta al agente apropiado emitiendo la respuesta en streaming
+        
+        Args:
+            query: Consulta del usuario
+            agent_type: Tipo de agente específico (opcional)
+            context: Contexto adicional para la consulta
+        
+        Yields:
+            Eventos 'start' (agente elegido), 'delta' (fragmento de texto),
+            y 'done' (respuesta completa y tiempos) o 'error'
+        """
+        start = time.perf_counter()
+        context = context or {}
+        selected_agent_id = None
+        
+        try:
+            selected_agent_id = self._select_agent(agent_type, context)
+            agent = self.get_agent(selected_agent_id)
+            enriched_context = self._enrich_context(context, selected_agent_id)
+            
+            yield {
+                'type': 'start',
+                'agent_used': selected_agent_id,
+                'agent_name': agent.get_agent_name()
+            }
+            
+            parts = []
+            first_token_time = None
+            for delta in agent.process_specialized_query_stream(query, enriched_context):
+                if not delta:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start
+                    AGENT_FIRST_TOKEN_LATENCY.observe(first_token_time, agent=selected_agent_id)
+                parts.append(delta)
+                yield {'type': 'delta', 'content': delta}
+            
+            response = ''.join(parts)
+            response_time = time.perf_counter() - start
+            self._update_metrics(selected_agent_id, response_time, 'stream')
+            self._log_interaction(query, selected_agent_id, response, response_time)
+            
+            yield {
+                'type': 'done',
+                'agent_used': selected_agent_id,
+                'agent_name': agent.get_agent_name(),
+                'response': response,
+                'response_time': response_time,
+                'time_to_first_token': first_token_time,
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            response_time = time.perf_counter() - start
+            self._update_metrics(selected_agent_id or 'unknown', response_time, 'stream', error=e)
+            self.logger.error(f"Error procesando consulta en streaming: {e}")
+            
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'agent_used': selected_agent_id,
+                'response': self._get_fallback_response(),
+                'response_time': response_time,
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    async def astream_query(self, query: str, agent_type: Optional[str] = None,
+                            context: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Variante asíncrona de stream_query para el servidor ASGI: cada evento
+        se emite en cuanto el modelo envía el fragmento, sin ocupar un hilo
+        
+        Args:
+            query: Consulta del usuario
+            agent_type: Tipo de agente específico (opcional)
+            context: Contexto adicional para la consulta
+        
+        Yields:
+            Los mismos eventos que stream_query
+        """
+        start = time.perf_counter()
+        context = context or {}
+        selected_agent_id = None
+        
+        try:
+            selected_agent_id = self._select_agent(agent_type, context)
+            agent = self.get_agent(selected_agent_id)
+            enriched_context = self._enrich_context(context, selected_agent_id)
+        
+            yield {
+                'type': 'start',
+                'agent_used': selected_agent_id,
+                'agent_name': agent.get_agent_name()
+            }
+        
+            parts = []
+            first_token_time = None
+            async for delta in agent.aprocess_specialized_query_stream(query, enriched_context):
+                if not delta:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start
+                    AGENT_FIRST_TOKEN_LATENCY.observe(first_token_time, agent=selected_agent_id)
+                parts.append(delta)
+                yield {'type': 'delta', 'content': delta}
+        
+            response = ''.join(parts)
+            response_time = time.perf_counter() - start
+            self._update_metrics(selected_agent_id, response_time, 'stream')
+            self._log_interaction(query, selected_agent_id, response, response_time)
+        
+            yield {
+                'type': 'done',
+                'agent_used': selected_agent_id,
+                'agent_name': agent.get_agent_name(),
+                'response': response,
+                'response_time': response_time,
+                'time_to_first_token': first_token_time,
+                'timestamp': datetime.now().isoformat()
+            }
+        
+        except Exception as e:
+            response_time = time.perf_counter() - start
+            self._update_metrics(selected_agent_id or 'unknown', response_time, 'stream', error=e)
+            self.logger.error(f"Error procesando consulta asíncrona en streaming: {e}")
+        
+            yield {
+                'type': 'error',
+                'error': str(e),
+                'agent_used': selected_agent_id,
+                'response': self._get_fallback_response(),
+                'response_time': response_time,
+                'timestamp': datetime.now().isoformat()
+            }
+    
     def _determine_best_agent(self, query: str) -> str:
         """
         Determinar el mejor agente para una consulta basándose en análisis de contenido
@@ -287,19 +484,20 @@ class AgentManager:
         
         return enriched_context
     
-    def _update_metrics(self, agent_id: str, response_time: float, success: bool):
-        """Actualizar métricas de rendimiento"""
-        self.metrics['total_queries'] += 1
-        
-        if agent_id in self.metrics['agent_usage']:
-            self.metrics['agent_usage'][agent_id] += 1
-        
-        # Actualizar tiempo promedio de respuesta
-        total_time = self.metrics['average_response_time'] * (self.metrics['total_queries'] - 1)
-        self.metrics['average_response_time'] = (total_time + response_time) / self.metrics['total_queries']
+    def _update_metrics(self, agent_id: str, response_time: float, mode: str,
+                        error: Optional[BaseException] = None):
+        """
+        Registrar la latencia de una consulta y, si falló, el tipo de error
         
-        if not success:
-            self.metrics['errors'] += 1
+        Args:
+            agent_id: Agente que atendió la consulta ('unknown' si no se llegó a elegir)
+            response_time: Segundos hasta la respuesta completa
+            mode: 'sync', 'async' o 'stream'
+            error: Excepción si la consulta falló
+        """
+        AGENT_REQUEST_LATENCY.observe(response_time, agent=agent_id, mode=mode)
+        if error is not None:
+            AGENT_REQUEST_ERRORS.inc(agent=agent_id, error=type(error).__name__)
     
     def _log_interaction(self, query: str, agent_id: str, response: str, response_time: float):
         """Registrar interacción en logs"""
@@ -324,10 +522,47 @@ Por favor, intenta reformular tu pregunta o especifica qué tipo de ayuda necesi
     
     def _get_session_metrics(self) -> Dict[str, Any]:
         """Obtener métricas de la sesión actual"""
+        count, total_time = AGENT_REQUEST_LATENCY.count_and_sum()
+        return {
+            'queries_processed': count,
+            'average_response_time': total_time / count if count else 0,
+            'error_rate': AGENT_REQUEST_ERRORS.value() / max(count, 1) * 100
+        }
+    
+    def _metrics_snapshot(self) -> Dict[str, Any]:
+        """Consultas, uso por agente, errores por tipo y percentiles de latencia"""
+        latency = AGENT_REQUEST_LATENCY.summary()
+        errors_by_type: Dict[str, int] = {}
+        for labels in AGENT_REQUEST_ERRORS.label_values():
+            errors_by_type[labels['error']] = errors_by_type.get(labels['error'], 0) + int(AGENT_REQUEST_ERRORS.value(**labels))
+        
+        agents = {labels['agent'] for labels in AGENT_REQUEST_LATENCY.label_values()}
+        latency_by_agent = {agent_id: AGENT_REQUEST_LATENCY.summary(agent=agent_id) for agent_id in sorted(agents)}
+        
+        return {
+            'total_queries': latency['count'],
+            'agent_usage': {
+                agent_id: latency_by_agent.get(agent_id, {}).get('count', 0)
+                for agent_id in AGENT_CLASSES
+            },
+            'average_response_time': latency['avg'],
+            'errors': int(AGENT_REQUEST_ERRORS.value()),
+            'errors_by_type': errors_by_type,
+            'latency': latency,
+            'latency_by_agent': latency_by_agent
+        }
+    
+    def _provider_metrics(self) -> Dict[str, Any]:
+        """Latencia, errores y tokens de las llamadas a cada proveedor de LLM"""
+        providers = {labels['provider'] for labels in LLM_REQUEST_LATENCY.label_values()}
         return {
-            'queries_processed': self.metrics['total_queries'],
-            'average_response_time': self.metrics['average_response_time'],
-            'error_rate': self.metrics['errors'] / max(self.metrics['total_queries'], 1) * 100
+            provider: {
+                'latency': LLM_REQUEST_LATENCY.summary(provider=provider),
+                'errors': int(LLM_REQUEST_ERRORS.value(provider=provider)),
+                'prompt_tokens': int(LLM_TOKENS.value(provider=provider, kind='prompt')),
+                'completion_tokens': int(LLM_TOKENS.value(provider=provider, kind='completion'))
+            }
+            for provider in sorted(providers)
         }
     
     # Métodos públicos para gestión de agentes
@@ -335,27 +570,33 @@ Por favor, intenta reformular tu pregunta o especifica qué tipo de ayuda necesi
     def get_available_agents(self) -> Dict[str, Dict[str, Any]]:
         """Obtener información de todos los agentes disponibles"""
         agents_info = {}
+        usage = self._metrics_snapshot()['agent_usage']
         
-        for agent_id, agent in self.agents.items():
+        for agent_id in AGENT_CLASSES:
+            try:
+                agent = self.get_agent(agent_id)
+            except Exception as e:
+                self.logger.error(f"❌ Error inicializando agente {agent_id}: {e}")
+                agent = None
+            
             agents_info[agent_id] = {
                 'id': agent_id,
-                'name': agent.get_agent_name(),
+                'name': agent.get_agent_name() if agent else agent_id,
                 'description': self.routing_config.get(agent_id, {}).get('description', 'N/A'),
                 'status': 'active' if agent else 'inactive',
-                'capabilities': self.get_agent_capabilities(agent_id),
-                'usage_count': self.metrics['agent_usage'].get(agent_id, 0)
+                'capabilities': self.get_agent_capabilities(agent_id) if agent else {},
+                'usage_count': usage.get(agent_id, 0)
             }
         
         return agents_info
     
     def get_agent_capabilities(self, agent_id: str) -> Dict[str, Any]:
         """Obtener capacidades específicas de un agente"""
-        if agent_id not in self.agents:
+        if agent_id not in AGENT_CLASSES:
             return {}
         
-        agent = self.agents[agent_id]
-        
         try:
+            agent = self.get_agent(agent_id)
             if hasattr(agent, 'get_specialized_capabilities'):
                 return agent.get_specialized_capabilities()
             elif hasattr(agent, 'get_capabilities'):
@@ -367,18 +608,23 @@ Por favor, intenta reformular tu pregunta o especifica qué tipo de ayuda necesi
             return {}
     
     def health_check(self) -> Dict[str, Any]:
-        """Verificar estado de salud del sistema de agentes"""
+        """
+        Verificar estado de salud del sistema de agentes
+        
+        Solo se comprueban los agentes ya construidos; el resto aparece como 'idle'.
+        """
+        agents = dict(self.agents)
         health_status = {
             'status': 'healthy',
-            'agents_online': len(self.agents),
-            'total_agents': 5,  # Número esperado de agentes
-            'metrics': self.metrics.copy(),
+            'agents_online': len(agents),
+            'total_agents': len(AGENT_CLASSES),
+            'metrics': self._metrics_snapshot(),
             'timestamp': datetime.now().isoformat()
         }
         
         # Verificar estado de cada agente
         agent_health = {}
-        for agent_id, agent in self.agents.items():
+        for agent_id, agent in agents.items():
             try:
                 if hasattr(agent, 'health_check'):
                     agent_status = agent.health_check()
@@ -389,61 +635,77 @@ Por favor, intenta reformular tu pregunta o especifica qué tipo de ayuda necesi
             except Exception as e:
                 agent_health[agent_id] = {'status': 'error', 'message': str(e)}
         
-        health_status['agents_status'] = agent_health
+        health_status['agents_status'] = {
+            agent_id: agent_health.get(agent_id, {'status': 'idle', 'message': 'Aún no inicializado'})
+            for agent_id in AGENT_CLASSES
+        }
         
         # Determinar estado general
         failed_agents = sum(1 for status in agent_health.values() 
                           if status.get('status') != 'healthy')
         
         if failed_agents > 0:
-            health_status['status'] = 'degraded' if failed_agents < len(self.agents) / 2 else 'unhealthy'
+            health_status['status'] = 'degraded' if failed_agents < len(agent_health) / 2 else 'unhealthy'
         
         return health_status
     
     def get_usage_statistics(self) -> Dict[str, Any]:
         """Obtener estadísticas de uso detalladas"""
+        metrics = self._metrics_snapshot()
         return {
-            'total_queries': self.metrics['total_queries'],
-            'agent_usage_distribution': self.metrics['agent_usage'].copy(),
-            'average_response_time': self.metrics['average_response_time'],
-            'error_rate': self.metrics['errors'] / max(self.metrics['total_queries'], 1) * 100,
-            'most_used_agent': max(self.metrics['agent_usage'], 
-                                 key=self.metrics['agent_usage'].get) if self.metrics['agent_usage'] else None,
+            'total_queries': metrics['total_queries'],
+            'agent_usage_distribution': metrics['agent_usage'],
+            'average_response_time': metrics['average_response_time'],
+            'error_rate': metrics['errors'] / max(metrics['total_queries'], 1) * 100,
+            'errors_by_type': metrics['errors_by_type'],
+            'latency_percentiles': metrics['latency'],
+            'latency_by_agent': metrics['latency_by_agent'],
+            'providers': self._provider_metrics(),
+            'most_used_agent': max(metrics['agent_usage'], 
+                                 key=metrics['agent_usage'].get) if metrics['total_queries'] else None,
+            'agents_loaded': list(self.agents),
             'uptime': 'Sistema activo',  # Se podría calcular tiempo real
             'last_updated': datetime.now().isoformat()
         }
     
     def reset_metrics(self):
         """Reiniciar métricas de uso"""
-        self.metrics = {
-            'total_queries': 0,
-            'agent_usage': {agent_id: 0 for agent_id in self.agents.keys()},
-            'average_response_time': 0,
-            'errors': 0
-        }
+        for metric in (AGENT_REQUEST_LATENCY, AGENT_REQUEST_ERRORS, AGENT_FIRST_TOKEN_LATENCY):
+            metric.reset()
         self.logger.info("Métricas reiniciadas")
     
     def reload_agent(self, agent_id: str) -> bool:
-        """Recargar un agente específico"""
-        if agent_id not in self.agents:
+        """
+        Recargar un agente específico
+        
+        La nueva instancia se construye antes de sustituir a la anterior, de
+        modo que las consultas en curso terminan con el agente viejo.
+        """
+        if agent_id not in AGENT_CLASSES:
             return False
         
         try:
-            # Mapeo de IDs a clases
-            agent_classes = {
-                'tutor': TutorAgent,
-                'evaluator': EvaluatorAgent,
-                'counselor': CounselorAgent,
-                'curriculum': CurriculumPlannerAgent,
-                'analytics': AnalyticsAgent
-            }
-            
-            if agent_id in agent_classes:
-                self.agents[agent_id] = agent_classes[agent_id]()
-                self.logger.info(f"Agente {agent_id} recargado exitosamente")
-                return True
+            agent = AGENT_CLASSES[agent_id]()
+            with self._agents_lock:
+                self.agents[agent_id] = agent
+            self.logger.info(f"Agente {agent_id} recargado exitosamente")
+            return True
             
         except Exception as e:
             self.logger.error(f"Error recargando agente {agent_id}: {e}")
         
-        return False 
\ No newline at end of file
+        return False
+
+
+_agent_manager: Optional[AgentManager] = None
+_agent_manager_lock = threading.Lock()
+
+
+def get_agent_manager() -> AgentManager:
+    """Obtener el gestor de agentes del proceso"""
+    global _agent_manager
+    if _agent_manager is None:
+        with _agent_manager_lock:
+            if _agent_manager is None:
+                _agent_manager = AgentManager()
+    return _agent_manager
@@ -4,31 +4,73 @@ Este módulo contiene la clase base que todos los agentes especializados heredar
 """
 
 import os
+import time
 import logging
-import asyncio
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterator, AsyncIterator, Tuple
 from datetime import datetime
 
-import tiktoken
 from openai import OpenAI
 from anthropic import Anthropic
 from django.conf import settings
 
+from .client_provider import get_client_provider
+from .response_cache import get_response_cache
+from .single_flight import get_single_flight
+from .context_assembler import ContextAssembler, PromptSection
+from .token_counter import get_token_counter
+from .rate_limiter import get_rate_limiter, get_rate_limit_stats
+from .provider_dispatcher import get_provider_dispatcher, mark_first_token
+from .background_loop import get_background_loop
+from backend_project.tracing import span, record_span
+from backend_project.metrics import get_metrics_registry
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Prompts estáticos precompilados por clase de agente: texto y tokens, calculados una sola vez
+_compiled_prompts: Dict[Tuple[type, str], Tuple[str, int]] = {}
+_compiled_prompts_lock = threading.Lock()
+
+_registry = get_metrics_registry()
+LLM_REQUEST_LATENCY = _registry.histogram(
+    'llm_request_duration_seconds',
+    'Latencia de las llamadas a los proveedores de LLM (respuesta completa)',
+    ['provider', 'model']
+)
+LLM_REQUEST_ERRORS = _registry.counter(
+    'llm_request_errors_total',
+    'Llamadas a los proveedores de LLM que fallaron, por tipo de excepción',
+    ['provider', 'error']
+)
+LLM_TOKENS = _registry.counter(
+    'llm_tokens_total',
+    'Tokens consumidos en los proveedores de LLM (prompt y completion)',
+    ['provider', 'kind']
+)
+
 class BaseAIService(ABC):
     """
     Clase base para todos los servicios de IA.
     Proporciona funcionalidad común para interactuar con APIs de IA.
     """
     
+    # Segundos que se cachean las respuestas del agente (0 = sin caché).
+    # Configurable por agente con LLM_RESPONSE_CACHE_TTL_<CLASE>, p. ej. LLM_RESPONSE_CACHE_TTL_QUIZAGENT
+    response_cache_ttl = 0
+    
+    # Prioridad ante los límites del proveedor: 'interactive', 'standard' o 'background'.
+    # Se puede fijar por petición con context['priority']
+    request_priority = 'standard'
+    
     def __init__(self):
         """Inicializar el servicio base de IA"""
         # Configurar logging primero
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = get_client_provider().get_encoding("cl100k_base")
+        self.token_counter = get_token_counter()
         
         self.openai_client = self._init_openai_client()
         self.claude_client = self._init_claude_client()
@@ -37,69 +79,31 @@ class BaseAIService(ABC):
         self.max_tokens = int(os.getenv('OPENAI_MAX_TOKENS', 1500))
         self.temperature = float(os.getenv('OPENAI_TEMPERATURE', 0.7))
         self.timeout = int(os.getenv('AGENT_RESPONSE_TIMEOUT', 30))
+        
+        # Presupuesto de tokens del prompt (sistema + contexto) y mínimo garantizado al contexto
+        self.prompt_token_budget = int(os.getenv('LLM_PROMPT_TOKEN_BUDGET', 3000))
+        self.min_context_tokens = int(os.getenv('LLM_CONTEXT_MIN_TOKENS', 2000))
+        self.document_token_limit = int(os.getenv('LLM_CONTEXT_DOCUMENT_TOKENS', 150))
+        self.context_assembler = ContextAssembler(self.count_tokens, self.truncate_to_token_limit)
+        
+        # Caché de respuestas (opt-in: LLM_RESPONSE_CACHE y TTL del agente)
+        self.response_cache = get_response_cache()
+        self.response_cache_ttl = int(os.getenv(
+            f"LLM_RESPONSE_CACHE_TTL_{self.__class__.__name__.upper()}", self.response_cache_ttl
+        ))
+        # Peticiones idénticas simultáneas comparten una sola llamada al modelo
+        self.single_flight = get_single_flight()
+        
+        # Precompilar el prompt del sistema al crear el agente
+        self.get_compiled_system_prompt()
     
     def _init_openai_client(self) -> Optional[OpenAI]:
-        """Inicializar cliente de OpenAI"""
-        try:
-            api_key = os.getenv('OPENAI_API_KEY')
-            
-            # Debug: Imprimir API key que está usando
-            if api_key:
-                masked_key = f"{api_key[:10]}...{api_key[-4:]}" if len(api_key) > 14 else "***"
-                print(f"🔍 AI Service usando API Key: {masked_key}")
-            else:
-                print("❌ AI Service: No se encontró OPENAI_API_KEY")
-            
-            if not api_key or api_key == 'sk-your-openai-key-here':
-                self.logger.warning("OpenAI API key no configurada")
-                return None
-            
-            # Limpiar variables de entorno que puedan causar conflictos
-            env_vars_to_clean = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
-            for var in env_vars_to_clean:
-                if var in os.environ:
-                    del os.environ[var]
-            
-            # Inicializar cliente con configuración mínima
-            try:
-                # Inicialización completamente aislada
-                import openai
-                # Limpiar cualquier configuración global
-                if hasattr(openai, 'api_key'):
-                    del openai.api_key
-                if hasattr(openai, 'api_base'):
-                    del openai.api_base
-                
-                # Crear cliente con configuración mínima
-                client = openai.OpenAI(api_key=api_key)
-            except Exception as e:
-                self.logger.error(f"Error en inicialización aislada: {e}")
-                # Intentar con configuración manual
-                try:
-                    import openai
-                    client = openai.OpenAI()
-                    client.api_key = api_key
-                except Exception as e2:
-                    self.logger.error(f"Error en configuración manual: {e2}")
-                    raise e2
-            
-            self.logger.info(f"OpenAI cliente inicializado correctamente")
-            return client
-        except Exception as e:
-            self.logger.error(f"Error inicializando cliente OpenAI: {e}")
-            return None
+        """Obtener el cliente de OpenAI compartido por todos los agentes del proceso"""
+        return get_client_provider().get_openai_client()
     
     def _init_claude_client(self) -> Optional[Anthropic]:
-        """Inicializar cliente de Claude"""
-        try:
-            api_key = os.getenv('ANTHROPIC_API_KEY')
-            if not api_key or api_key == 'your-claude-key-here':
-                self.logger.warning("Claude API key no configurada")
-                return None
-            return Anthropic(api_key=api_key)
-        except Exception as e:
-            self.logger.error(f"Error inicializando cliente Claude: {e}")
-            return None
+        """Obtener el cliente de Claude compartido por todos los agentes del proceso"""
+        return get_client_provider().get_anthropic_client()
     
     @abstractmethod
     def get_system_prompt(self) -> str:
@@ -117,10 +121,47 @@ class BaseAIService(ABC):
         """
         pass
     
+    def get_compiled_system_prompt(self) -> Tuple[str, int]:
+        """
+        Prompt del sistema del agente y su número de tokens.
+        
+        Los prompts del sistema son estáticos: se construyen y se cuentan una
+        sola vez por clase de agente y proceso.
+        
+        Returns:
+            Tupla (prompt del sistema, tokens)
+        """
+        return self._compile_prompt('system', self.get_system_prompt)
+    
+    def _get_instructions(self, is_quiz_system: bool) -> str:
+        """Instrucciones finales del prompt con contexto (precompiladas por agente y modo)"""
+        def build() -> str:
+            restriction = (
+                '✅ MODO QUIZ: Responde ÚNICAMENTE en formato JSON válido para generar el quiz.'
+                if is_quiz_system else
+                '🚫 RESTRICCIÓN: En el chat normal está PROHIBIDO generar quizzes, evaluaciones o respuestas en formato JSON. Solo proporciona explicaciones claras y ejercicios prácticos.'
+            )
+            return f"""Por favor, responde como {self.get_agent_name()} considerando todo el contexto proporcionado.
+
+{restriction}
+"""
+        return self._compile_prompt('quiz_instructions' if is_quiz_system else 'instructions', build)[0]
+    
+    def _compile_prompt(self, name: str, build) -> Tuple[str, int]:
+        key = (self.__class__, name)
+        compiled = _compiled_prompts.get(key)
+        if compiled is None:
+            with _compiled_prompts_lock:
+                compiled = _compiled_prompts.get(key)
+                if compiled is None:
+                    text = build()
+                    compiled = _compiled_prompts[key] = (text, self.count_tokens(text))
+        return compiled
+    
     def count_tokens(self, text: str) -> int:
-        """Contar tokens en un texto"""
+        """Contar tokens en un texto (memoizado por hash del texto y compartido entre agentes)"""
         try:
-            return len(self.encoding.encode(text))
+            return self.token_counter.count(text)
         except Exception as e:
             self.logger.error(f"Error contando tokens: {e}")
             return len(text.split()) * 1.3  # Estimación aproximada
@@ -140,10 +181,37 @@ class BaseAIService(ABC):
             char_limit = max_tokens * 4  # Aproximación
             return text[:char_limit] + "..." if len(text) > char_limit else text
     
-    def _build_context_prompt(self, query: str, context: Dict[str, Any]) -> str:
+    def _build_context_prompt(self, query: str, context: Dict[str, Any],
+                              token_budget: Optional[int] = None) -> str:
         """
         Construir el prompt con contexto para el agente.
         """
+        return self._assemble_context_prompt(query, context, token_budget)[0]
+    
+    def _context_token_budget(self, system_tokens: int) -> int:
+        """Tokens disponibles para el prompt con contexto tras el prompt del sistema"""
+        return max(self.prompt_token_budget - system_tokens, self.min_context_tokens)
+    
+    def _assemble_context_prompt(self, query: str, context: Dict[str, Any],
+                                 token_budget: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Construir el prompt con contexto ajustado a un presupuesto de tokens.
+        
+        La consulta y las instrucciones se conservan siempre; el presupuesto
+        restante se reparte por prioridad entre el contexto explícito, los
+        documentos relevantes (RAG) y el historial de conversación.
+        
+        Args:
+            query: Consulta del usuario
+            context: Contexto del agente
+            token_budget: Tokens máximos del prompt; por defecto, lo que deja libre el prompt del sistema
+        
+        Returns:
+            Tupla (prompt con contexto, tokens del prompt)
+        """
+        if token_budget is None:
+            token_budget = self._context_token_budget(self.get_compiled_system_prompt()[1])
+        
         user_level = context.get('user_level', 'Estudiante')
         subject = context.get('subject', 'General')
         conversation_history = context.get('conversation_history', [])
@@ -151,34 +219,6 @@ class BaseAIService(ABC):
         user_profile = context.get('user_profile', {})
         explicit_context = context.get('explicit_context', None)
         
-        # Construir contexto explícito del usuario
-        explicit_context_prompt = ""
-        if explicit_context:
-            explicit_context_prompt = f"""
---- Contexto Explícito Proporcionado por el Usuario ---
-El usuario ha seleccionado el siguiente texto del documento para que lo uses como contexto principal para tu respuesta. Préstale especial atención:
-
-<context>
-{explicit_context}
-</context>
-"""
-
-        # Construir contexto de conversación
-        conversation_context = ""
-        if conversation_history:
-            conversation_context = "\n--- Historial de Conversación Reciente ---\n"
-            for msg in conversation_history[-5:]:  # Últimos 5 mensajes
-                role = msg.get('role', 'unknown')
-                content = msg.get('content', '')
-                conversation_context += f"{role.upper()}: {content}\n"
-        
-        # Construir contexto de documentos
-        documents_context = ""
-        if relevant_documents:
-            documents_context = "\n--- Documentos Relevantes ---\n"
-            for i, doc in enumerate(relevant_documents[:3]):  # Top 3 documentos
-                documents_context += f"Documento {i+1}: {doc[:300]}...\n"
-        
         # Construir perfil de usuario
         profile_context = ""
         if user_profile:
@@ -187,22 +227,149 @@ El usuario ha seleccionado el siguiente texto del documento para que lo uses com
             profile_context += f"Nivel: {user_level}\n"
             profile_context += f"Área de interés: {subject}\n"
         
-        # Prompt final
-        context_prompt = f"""
-{explicit_context_prompt}
-{profile_context}
-{conversation_context}
-{documents_context}
-
---- Consulta Actual ---
+        # Consulta e instrucciones finales: nunca se recortan
+        query_prompt = f"""--- Consulta Actual ---
 {query}
 
-Por favor, responde como {self.get_agent_name()} considerando todo el contexto proporcionado.
+"""
+        instructions = self._get_instructions(context.get('is_quiz_system', False))
+        
+        sections = [
+            PromptSection('query', [query_prompt, instructions], required=True),
+            PromptSection('profile', [profile_context] if profile_context else [], required=True),
+            # Contexto explícito del usuario
+            PromptSection(
+                'explicit_context', [str(explicit_context)] if explicit_context else [],
+                priority=0, max_share=0.6,
+                header="""
+--- Contexto Explícito Proporcionado por el Usuario ---
+El usuario ha seleccionado el siguiente texto del documento para que lo uses como contexto principal para tu respuesta. Préstale especial atención:
 
-{'🚫 RESTRICCIÓN: En el chat normal está PROHIBIDO generar quizzes, evaluaciones o respuestas en formato JSON. Solo proporciona explicaciones claras y ejercicios prácticos.' if not context.get('is_quiz_system', False) else '✅ MODO QUIZ: Responde ÚNICAMENTE en formato JSON válido para generar el quiz.'}
+<context>
+""",
+                footer="""
+</context>
 """
+            ),
+            # Documentos relevantes (Top 3)
+            PromptSection(
+                'documents',
+                [f"Documento {i+1}: {doc}\n" for i, doc in enumerate(relevant_documents[:3])],
+                priority=1, max_share=0.25, unit_max_tokens=self.document_token_limit,
+                header="\n--- Documentos Relevantes ---\n"
+            ),
+            # Historial de conversación (últimos 5 mensajes)
+            PromptSection(
+                'history',
+                [f"{msg.get('role', 'unknown').upper()}: {msg.get('content', '')}\n"
+                 for msg in conversation_history[-5:]],
+                priority=2, max_share=0.15,
+                header="\n--- Historial de Conversación Reciente ---\n"
+            ),
+        ]
+        rendered, prompt_tokens = self.context_assembler.assemble(sections, token_budget)
+        
+        # Prompt final
+        context_prompt = f"""
+{rendered['explicit_context']}
+{rendered['profile']}
+{rendered['history']}
+{rendered['documents']}
+
+{rendered['query']}"""
+        
+        return context_prompt, prompt_tokens
+    
+    def _build_prompts(self, query: str, context: Dict[str, Any]) -> Tuple[str, str, int]:
+        """
+        Construir los prompts de sistema y de usuario respetando el límite de tokens.
+        
+        Returns:
+            Tupla (prompt del sistema, prompt con contexto, tokens totales)
+        """
+        with span('prompt.build') as current:
+            system_prompt, system_tokens = self.get_compiled_system_prompt()
+            context_prompt, context_tokens = self._assemble_context_prompt(
+                query, context, self._context_token_budget(system_tokens)
+            )
+            current.set(tokens=system_tokens + context_tokens)
         
-        return context_prompt
+        return system_prompt, context_prompt, system_tokens + context_tokens
+    
+    def _request_priority(self, context: Dict[str, Any]) -> str:
+        return context.get('priority') or self.request_priority
+    
+    def _acquire_rate_limit(self, provider: str, prompt_tokens: int, context: Dict[str, Any]):
+        """Esperar cupo en el límite del proveedor (tokens del prompt más los de la respuesta)"""
+        with span('llm.rate_limit', provider=provider):
+            waited = get_rate_limiter(provider).acquire(
+                prompt_tokens + self.max_tokens, self._request_priority(context)
+            )
+        if waited > 0:
+            self.logger.info(f"Petición a {provider} en cola {waited:.2f}s por límite de uso")
+    
+    async def _aacquire_rate_limit(self, provider: str, prompt_tokens: int, context: Dict[str, Any]):
+        with span('llm.rate_limit', provider=provider):
+            waited = await get_rate_limiter(provider).aacquire(
+                prompt_tokens + self.max_tokens, self._request_priority(context)
+            )
+        if waited > 0:
+            self.logger.info(f"Petición a {provider} en cola {waited:.2f}s por límite de uso")
+    
+    @contextmanager
+    def _llm_call(self, provider: str, model: str):
+        """Medir una llamada al proveedor: span de la traza, histograma de latencia y errores por tipo"""
+        start = time.perf_counter()
+        try:
+            with span('llm.call', provider=provider, model=model):
+                yield
+        except Exception as e:
+            LLM_REQUEST_ERRORS.inc(provider=provider, error=type(e).__name__)
+            raise
+        finally:
+            LLM_REQUEST_LATENCY.observe(time.perf_counter() - start, provider=provider, model=model)
+    
+    def _record_usage(self, provider: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        """Sumar los tokens de una llamada (los que informa el proveedor o, en el streaming de OpenAI, la estimación local)"""
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, provider=provider, kind='prompt')
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, provider=provider, kind='completion')
+    
+    def _record_response_usage(self, provider: str, response: Any):
+        """Sumar los tokens que informa la respuesta (usage de OpenAI o de Anthropic), si los trae"""
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            self._record_usage(
+                provider,
+                getattr(usage, 'prompt_tokens', None) or getattr(usage, 'input_tokens', None),
+                getattr(usage, 'completion_tokens', None) or getattr(usage, 'output_tokens', None)
+            )
+    
+    def _request_fingerprint(self, model: str, system_prompt: str, context_prompt: str) -> str:
+        """Huella de la petición: clave de la caché de respuestas y del single-flight"""
+        return self.response_cache.fingerprint(
+            model, self.temperature, self.max_tokens, system_prompt, context_prompt
+        )
+    
+    @property
+    def _response_cache_active(self) -> bool:
+        return self.response_cache.enabled and self.response_cache_ttl > 0
+    
+    def _get_cached_response(self, fingerprint: str, context: Dict[str, Any]) -> Optional[str]:
+        """Respuesta cacheada; context['bypass_cache'] fuerza una nueva generación"""
+        if not self._response_cache_active or context.get('bypass_cache'):
+            return None
+        with span('cache.lookup') as current:
+            cached = self.response_cache.get(fingerprint, agent=self.get_agent_name())
+            current.set(hit=cached is not None)
+        if cached is not None:
+            self.logger.info(f"Respuesta servida desde caché ({fingerprint[:12]})")
+        return cached
+    
+    def _store_cached_response(self, fingerprint: str, response: str):
+        if self._response_cache_active:
+            self.response_cache.set(fingerprint, response, self.response_cache_ttl, agent=self.get_agent_name())
     
     def process_query_with_openai(self, query: str, context: Dict[str, Any]) -> str:
         """
@@ -212,41 +379,49 @@ Por favor, responde como {self.get_agent_name()} considerando todo el contexto p
             return "Lo siento, el servicio de OpenAI no está disponible en este momento."
         
         try:
-            # Construir prompt con contexto
-            context_prompt = self._build_context_prompt(query, context)
-            system_prompt = self.get_system_prompt()
-            
-            # Verificar límites de tokens
-            total_tokens = self.count_tokens(system_prompt + context_prompt)
-            if total_tokens > 3000:  # Dejar espacio para la respuesta
-                context_prompt = self.truncate_to_token_limit(context_prompt, 2000)
-            
-            self.logger.info(f"Procesando consulta con OpenAI GPT-4o-mini - Tokens: {total_tokens}")
-            
-            # Debug: Verificar API key antes de la llamada
-            current_api_key = os.getenv('OPENAI_API_KEY')
-            if current_api_key:
-                masked_key = f"{current_api_key[:10]}...{current_api_key[-4:]}" if len(current_api_key) > 14 else "***"
-                print(f"🔍 Llamada OpenAI usando API Key: {masked_key}")
-            
-            # Llamada a OpenAI usando gpt-4o-mini (más económico)
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",  # Modelo más económico para consultas de texto
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": context_prompt}
-                ],
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                timeout=self.timeout
-            )
-            
-            return response.choices[0].message.content
+            return self._complete_with_openai(query, context)
             
         except Exception as e:
             self.logger.error(f"Error procesando consulta con OpenAI: {e}")
             return f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
     
+    def _complete_with_openai(self, query: str, context: Dict[str, Any]) -> str:
+        """Llamada a OpenAI; los errores se propagan (failover del dispatcher)"""
+        # Construir prompt con contexto
+        system_prompt, context_prompt, total_tokens = self._build_prompts(query, context)
+        
+        fingerprint = self._request_fingerprint("gpt-4o-mini", system_prompt, context_prompt)
+        cached = self._get_cached_response(fingerprint, context)
+        if cached is not None:
+            return cached
+        
+        self.logger.info(f"Procesando consulta con OpenAI GPT-4o-mini - Tokens: {total_tokens}")
+        
+        self.logger.debug("Llamada a OpenAI con el cliente compartido del proveedor")
+        
+        def call_openai() -> str:
+            self._acquire_rate_limit('openai', total_tokens, context)
+            
+            # Llamada a OpenAI usando gpt-4o-mini (más económico)
+            with self._llm_call('openai', 'gpt-4o-mini'):
+                response = self.openai_client.chat.completions.create(
+                    model="gpt-4o-mini",  # Modelo más económico para consultas de texto
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": context_prompt}
+                    ],
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    timeout=self.timeout
+                )
+            
+            self._record_response_usage('openai', response)
+            content = response.choices[0].message.content
+            self._store_cached_response(fingerprint, content)
+            return content
+        
+        return self.single_flight.do(fingerprint, call_openai)
+    
     def process_image_with_openai(self, prompt: str, image_data: str, context: Dict[str, Any]) -> str:
         """
         Procesar imagen usando OpenAI GPT-4o Vision (específicamente para análisis de imágenes).
@@ -297,37 +472,185 @@ Por favor, responde como {self.get_agent_name()} considerando todo el contexto p
             return "Lo siento, el servicio de Claude no está disponible en este momento."
         
         try:
-            # Construir prompt con contexto
-            context_prompt = self._build_context_prompt(query, context)
-            system_prompt = self.get_system_prompt()
+            return self._complete_with_claude(query, context)
             
-            self.logger.info(f"Procesando consulta con Claude")
+        except Exception as e:
+            self.logger.error(f"Error procesando consulta con Claude: {e}")
+            return f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+    
+    def _complete_with_claude(self, query: str, context: Dict[str, Any]) -> str:
+        """Llamada a Claude; los errores se propagan (failover del dispatcher)"""
+        # Construir prompt con contexto
+        system_prompt, context_prompt, total_tokens = self._build_prompts(query, context)
+        
+        claude_model = os.getenv('CLAUDE_MODEL', 'claude-3-sonnet-20240229')
+        fingerprint = self._request_fingerprint(claude_model, system_prompt, context_prompt)
+        cached = self._get_cached_response(fingerprint, context)
+        if cached is not None:
+            return cached
+        
+        self.logger.info(f"Procesando consulta con Claude")
+        
+        def call_claude() -> str:
+            self._acquire_rate_limit('anthropic', total_tokens, context)
             
             # Llamada a Claude
-            response = self.claude_client.messages.create(
-                model=os.getenv('CLAUDE_MODEL', 'claude-3-sonnet-20240229'),
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                system=system_prompt,
+            with self._llm_call('anthropic', claude_model):
+                response = self.claude_client.messages.create(
+                    model=claude_model,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    system=system_prompt,
+                    messages=[
+                        {"role": "user", "content": context_prompt}
+                    ]
+                )
+            
+            self._record_response_usage('anthropic', response)
+            text = response.content[0].text
+            self._store_cached_response(fingerprint, text)
+            return text
+        
+        return self.single_flight.do(fingerprint, call_claude)
+    
+    def stream_query_with_openai(self, query: str, context: Dict[str, Any]) -> Iterator[str]:
+        """
+        Variante en streaming de process_query_with_openai.
+        
+        Yields:
+            Fragmentos de texto a medida que llegan del modelo
+        """
+        if not self.openai_client:
+            yield "Lo siento, el servicio de OpenAI no está disponible en este momento."
+            return
+        
+        try:
+            yield from self._stream_with_openai(query, context)
+        except Exception as e:
+            self.logger.error(f"Error en streaming con OpenAI: {e}")
+            yield f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+    
+    def _stream_with_openai(self, query: str, context: Dict[str, Any]) -> Iterator[str]:
+        """Streaming con OpenAI; los errores se propagan para que el dispatcher pase a otro proveedor"""
+        if not self.openai_client:
+            raise RuntimeError("El servicio de OpenAI no está disponible en este momento.")
+        
+        stream = None
+        llm_start = None
+        try:
+            system_prompt, context_prompt, total_tokens = self._build_prompts(query, context)
+            
+            fingerprint = self._request_fingerprint("gpt-4o-mini", system_prompt, context_prompt)
+            cached = self._get_cached_response(fingerprint, context)
+            if cached is not None:
+                yield cached
+                return
+            
+            self.logger.info(f"Streaming de consulta con OpenAI GPT-4o-mini - Tokens: {total_tokens}")
+            
+            self._acquire_rate_limit('openai', total_tokens, context)
+            llm_start = time.perf_counter()
+            stream = self.openai_client.chat.completions.create(
+                model="gpt-4o-mini",
                 messages=[
+                    {"role": "system", "content": system_prompt},
                     {"role": "user", "content": context_prompt}
-                ]
+                ],
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                timeout=self.timeout,
+                stream=True
             )
             
-            return response.content[0].text
+            parts = []
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not parts:
+                        record_span('llm.first_token', llm_start, time.perf_counter() - llm_start, provider='openai')
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            record_span('llm.stream', llm_start, time.perf_counter() - llm_start, provider='openai', chunks=len(parts))
+            LLM_REQUEST_LATENCY.observe(time.perf_counter() - llm_start, provider='openai', model='gpt-4o-mini')
             
+            response = ''.join(parts)
+            self._record_usage('openai', total_tokens, self.count_tokens(response))
+            self._store_cached_response(fingerprint, response)
+                    
         except Exception as e:
-            self.logger.error(f"Error procesando consulta con Claude: {e}")
-            return f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+            if llm_start is not None:
+                LLM_REQUEST_ERRORS.inc(provider='openai', error=type(e).__name__)
+            raise
+        finally:
+            # Si el cliente se desconecta se cierra la respuesta HTTP y la conexión vuelve al pool
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
     
-    def process_query(self, query: str, context: Dict[str, Any]) -> str:
+    def stream_query_with_claude(self, query: str, context: Dict[str, Any]) -> Iterator[str]:
         """
-        Método principal para procesar consultas.
-        Usa OpenAI exclusivamente.
+        Variante en streaming de process_query_with_claude.
+        
+        Yields:
+            Fragmentos de texto a medida que llegan del modelo
         """
-        start_time = datetime.now()
+        if not self.claude_client:
+            yield "Lo siento, el servicio de Claude no está disponible en este momento."
+            return
+        
+        try:
+            yield from self._stream_with_claude(query, context)
+        except Exception as e:
+            self.logger.error(f"Error en streaming con Claude: {e}")
+            yield f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+    
+    def _stream_with_claude(self, query: str, context: Dict[str, Any]) -> Iterator[str]:
+        """Streaming con Claude; los errores se propagan para que el dispatcher pase a otro proveedor"""
+        if not self.claude_client:
+            raise RuntimeError("El servicio de Claude no está disponible en este momento.")
         
-        # Validar entrada
+        llm_start = None
+        try:
+            system_prompt, context_prompt, total_tokens = self._build_prompts(query, context)
+            
+            claude_model = os.getenv('CLAUDE_MODEL', 'claude-3-sonnet-20240229')
+            fingerprint = self._request_fingerprint(claude_model, system_prompt, context_prompt)
+            cached = self._get_cached_response(fingerprint, context)
+            if cached is not None:
+                yield cached
+                return
+            
+            self.logger.info(f"Streaming de consulta con Claude")
+            
+            self._acquire_rate_limit('anthropic', total_tokens, context)
+            parts = []
+            llm_start = time.perf_counter()
+            with self.claude_client.messages.stream(
+                model=claude_model,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                system=system_prompt,
+                messages=[
+                    {"role": "user", "content": context_prompt}
+                ]
+            ) as stream:
+                for text in stream.text_stream:
+                    if not parts:
+                        record_span('llm.first_token', llm_start, time.perf_counter() - llm_start, provider='anthropic')
+                    parts.append(text)
+                    yield text
+                final_message = stream.get_final_message()
+            record_span('llm.stream', llm_start, time.perf_counter() - llm_start, provider='anthropic', chunks=len(parts))
+            LLM_REQUEST_LATENCY.observe(time.perf_counter() - llm_start, provider='anthropic', model=claude_model)
+            self._record_response_usage('anthropic', final_message)
+            
+            self._store_cached_response(fingerprint, ''.join(parts))
+                    
+        except Exception as e:
+            if llm_start is not None:
+                LLM_REQUEST_ERRORS.inc(provider='anthropic', error=type(e).__name__)
+            raise
+    
+    def _validate_query(self, query: str) -> Optional[str]:
+        """Devolver el mensaje de error si la consulta no es válida, o None"""
         if not query or not query.strip():
             return "Por favor, proporciona una consulta válida."
         
@@ -335,15 +658,466 @@ Por favor, responde como {self.get_agent_name()} considerando todo el contexto p
         if len(query) > max_length:
             return f"La consulta es demasiado larga. Máximo {max_length} caracteres."
         
-        # Usar OpenAI exclusivamente
+        return None
+    
+    def process_query_stream(self, query: str, context: Dict[str, Any]) -> Iterator[str]:
+        """
+        Variante en streaming de process_query.
+        Usa OpenAI como proveedor principal y pasa a Claude si OpenAI no está
+        configurado, tiene el circuito abierto o falla antes del primer fragmento.
+        
+        Yields:
+            Fragmentos de texto de la respuesta
+        """
+        error = self._validate_query(query)
+        if error:
+            yield error
+            return
+        
+        calls = {}
+        if self.openai_client:
+            calls['openai'] = lambda: self._stream_with_openai(query, context)
+        if self.claude_client:
+            calls['anthropic'] = lambda: self._stream_with_claude(query, context)
+        
+        if not calls:
+            yield "Lo siento, el servicio de OpenAI no está disponible en este momento. Por favor, configura la API key de OpenAI en el archivo .env."
+            return
+        
+        start = time.perf_counter()
+        first_token_at = None
+        try:
+            for delta in get_provider_dispatcher().stream(calls):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    self.logger.info(f"Primer token en {(first_token_at - start) * 1000:.0f}ms")
+                yield delta
+        except Exception as e:
+            self.logger.error(f"Error en streaming: {e}")
+            yield f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+            return
+        
+        self.logger.info(f"Streaming completado en {time.perf_counter() - start:.2f}s")
+    
+    def get_local_response(self, query: str, context: Dict[str, Any]) -> Optional[str]:
+        """
+        Respuesta que el agente genera sin llamar al modelo (p. ej. errores de
+        validación o contenido generado localmente).
+        
+        Returns:
+            Texto de la respuesta, o None si la consulta debe ir al modelo
+        """
+        return None
+    
+    def build_specialized_request(self, query: str, context: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Construir la consulta que el agente envía al modelo.
+        Los agentes especializados la sobrescriben para añadir su prompt y su contexto.
+        
+        Returns:
+            Tupla (prompt, contexto)
+        """
+        return query, context
+    
+    def process_specialized_query(self, query: str, context: Dict[str, Any]) -> str:
+        """
+        Procesar una consulta con la lógica especializada del agente
+        """
+        response = self.get_local_response(query, context)
+        if response is not None:
+            return response
+        
+        prompt, prompt_context = self.build_specialized_request(query, context)
+        return self.process_query(prompt, prompt_context)
+    
+    def process_specialized_query_stream(self, query: str, context: Dict[str, Any]) -> Iterator[str]:
+        """
+        Variante en streaming de process_specialized_query. Las respuestas
+        locales del agente se emiten completas de una vez.
+        
+        Yields:
+            Fragmentos de texto de la respuesta
+        """
+        response = self.get_local_response(query, context)
+        if response is not None:
+            yield response
+            return
+        
+        prompt, prompt_context = self.build_specialized_request(query, context)
+        yield from self.process_query_stream(prompt, prompt_context)
+    
+    async def _aget_cached_response(self, fingerprint: str, context: Dict[str, Any]) -> Optional[str]:
+        if not self._response_cache_active or context.get('bypass_cache'):
+            return None
+        with span('cache.lookup') as current:
+            cached = await self.response_cache.aget(fingerprint, agent=self.get_agent_name())
+            current.set(hit=cached is not None)
+        if cached is not None:
+            self.logger.info(f"Respuesta servida desde caché ({fingerprint[:12]})")
+        return cached
+    
+    async def _astore_cached_response(self, fingerprint: str, response: str):
+        if self._response_cache_active:
+            await self.response_cache.aset(fingerprint, response, self.response_cache_ttl, agent=self.get_agent_name())
+    
+    async def aprocess_query_with_openai(self, query: str, context: Dict[str, Any]) -> str:
+        """
+        Variante asíncrona de process_query_with_openai (AsyncOpenAI).
+        """
+        client = get_client_provider().get_async_openai_client()
+        if not client:
+            return "Lo siento, el servicio de OpenAI no está disponible en este momento."
+        
+        try:
+            return await self._acomplete_with_openai(query, context)
+            
+        except Exception as e:
+            self.logger.error(f"Error procesando consulta asíncrona con OpenAI: {e}")
+            return f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+    
+    async def _acomplete_with_openai(self, query: str, context: Dict[str, Any]) -> str:
+        """Variante asíncrona de _complete_with_openai"""
+        client = get_client_provider().get_async_openai_client()
+        if not client:
+            raise RuntimeError("El servicio de OpenAI no está disponible en este momento.")
+        
+        system_prompt, context_prompt, total_tokens = self._build_prompts(query, context)
+        
+        fingerprint = self._request_fingerprint("gpt-4o-mini", system_prompt, context_prompt)
+        cached = await self._aget_cached_response(fingerprint, context)
+        if cached is not None:
+            return cached
+        
+        self.logger.info(f"Procesando consulta asíncrona con OpenAI GPT-4o-mini - Tokens: {total_tokens}")
+        
+        async def call_openai() -> str:
+            await self._aacquire_rate_limit('openai', total_tokens, context)
+            async with get_client_provider().get_async_semaphore():
+                with self._llm_call('openai', 'gpt-4o-mini'):
+                    # En streaming: la espera de cobertura se mide hasta el primer fragmento
+                    stream = await client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": context_prompt}
+                        ],
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens,
+                        timeout=self.timeout,
+                        stream=True
+                    )
+                    parts = []
+                    try:
+                        async for chunk in stream:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                if not parts:
+                                    mark_first_token()
+                                parts.append(chunk.choices[0].delta.content)
+                    finally:
+                        # Si la petición pierde la cobertura se cierra la respuesta HTTP
+                        await stream.close()
+            
+            content = ''.join(parts)
+            self._record_usage('openai', total_tokens, self.count_tokens(content))
+            await self._astore_cached_response(fingerprint, content)
+            return content
+        
+        return await self.single_flight.ado(fingerprint, call_openai)
+    
+    async def aprocess_query_with_claude(self, query: str, context: Dict[str, Any]) -> str:
+        """
+        Variante asíncrona de process_query_with_claude (AsyncAnthropic).
+        """
+        client = get_client_provider().get_async_anthropic_client()
+        if not client:
+            return "Lo siento, el servicio de Claude no está disponible en este momento."
+        
+        try:
+            return await self._acomplete_with_claude(query, context)
+            
+        except Exception as e:
+            self.logger.error(f"Error procesando consulta asíncrona con Claude: {e}")
+            return f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+    
+    async def _acomplete_with_claude(self, query: str, context: Dict[str, Any]) -> str:
+        """Variante asíncrona de _complete_with_claude"""
+        client = get_client_provider().get_async_anthropic_client()
+        if not client:
+            raise RuntimeError("El servicio de Claude no está disponible en este momento.")
+        
+        system_prompt, context_prompt, total_tokens = self._build_prompts(query, context)
+        
+        claude_model = os.getenv('CLAUDE_MODEL', 'claude-3-sonnet-20240229')
+        fingerprint = self._request_fingerprint(claude_model, system_prompt, context_prompt)
+        cached = await self._aget_cached_response(fingerprint, context)
+        if cached is not None:
+            return cached
+        
+        self.logger.info(f"Procesando consulta asíncrona con Claude")
+        
+        async def call_claude() -> str:
+            await self._aacquire_rate_limit('anthropic', total_tokens, context)
+            async with get_client_provider().get_async_semaphore():
+                with self._llm_call('anthropic', claude_model):
+                    # En streaming: la espera de cobertura se mide hasta el primer fragmento
+                    parts = []
+                    async with client.messages.stream(
+                        model=claude_model,
+                        max_tokens=self.max_tokens,
+                        temperature=self.temperature,
+                        system=system_prompt,
+                        messages=[
+                            {"role": "user", "content": context_prompt}
+                        ]
+                    ) as stream:
+                        async for text in stream.text_stream:
+                            if not parts:
+                                mark_first_token()
+                            parts.append(text)
+                        response = await stream.get_final_message()
+            
+            self._record_response_usage('anthropic', response)
+            text = ''.join(parts)
+            await self._astore_cached_response(fingerprint, text)
+            return text
+        
+        return await self.single_flight.ado(fingerprint, call_claude)
+    
+    async def aprocess_query(self, query: str, context: Dict[str, Any]) -> str:
+        """
+        Variante asíncrona de process_query (con cobertura y failover entre proveedores).
+        La llamada no bloquea el worker mientras espera al modelo.
+        """
+        start_time = datetime.now()
+        
+        error = self._validate_query(query)
+        if error:
+            return error
+        
+        calls = {}
         if self.openai_client:
-            response = self.process_query_with_openai(query, context)
-            processing_time = (datetime.now() - start_time).total_seconds()
-            self.logger.info(f"Consulta procesada exitosamente en {processing_time:.2f}s")
+            calls['openai'] = lambda: self._acomplete_with_openai(query, context)
+        if self.claude_client:
+            calls['anthropic'] = lambda: self._acomplete_with_claude(query, context)
+        
+        if not calls:
+            return "Lo siento, el servicio de OpenAI no está disponible en este momento. Por favor, configura la API key de OpenAI en el archivo .env."
+        
+        try:
+            with span('llm.dispatch') as current:
+                provider, response = await get_provider_dispatcher().acall(calls)
+                current.set(provider=provider)
+        except Exception as e:
+            self.logger.error(f"Error procesando consulta asíncrona: {e}")
+            return f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+        
+        processing_time = (datetime.now() - start_time).total_seconds()
+        self.logger.info(f"Consulta asíncrona procesada exitosamente con {provider} en {processing_time:.2f}s")
+        return response
+    
+    async def aprocess_specialized_query(self, query: str, context: Dict[str, Any]) -> str:
+        """
+        Variante asíncrona de process_specialized_query: la consulta construida
+        por el agente se envía al modelo con aprocess_query.
+        """
+        response = self.get_local_response(query, context)
+        if response is not None:
             return response
         
-        # Si OpenAI no está disponible
-        return "Lo siento, el servicio de OpenAI no está disponible en este momento. Por favor, configura la API key de OpenAI en el archivo .env."
+        prompt, prompt_context = self.build_specialized_request(query, context)
+        return await self.aprocess_query(prompt, prompt_context)
+    
+    async def astream_query_with_openai(self, query: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Variante asíncrona de stream_query_with_openai (AsyncOpenAI).
+        Cada fragmento se emite en cuanto llega, sin bloquear el worker ASGI.
+        
+        Yields:
+            Fragmentos de texto a medida que llegan del modelo
+        """
+        if not get_client_provider().get_async_openai_client():
+            yield "Lo siento, el servicio de OpenAI no está disponible en este momento."
+            return
+        
+        try:
+            async for delta in self._astream_with_openai(query, context):
+                yield delta
+        except Exception as e:
+            self.logger.error(f"Error en streaming asíncrono con OpenAI: {e}")
+            yield f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+    
+    async def _astream_with_openai(self, query: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+        """Variante asíncrona de _stream_with_openai"""
+        client = get_client_provider().get_async_openai_client()
+        if not client:
+            raise RuntimeError("El servicio de OpenAI no está disponible en este momento.")
+        
+        stream = None
+        llm_start = None
+        try:
+            system_prompt, context_prompt, total_tokens = self._build_prompts(query, context)
+        
+            fingerprint = self._request_fingerprint("gpt-4o-mini", system_prompt, context_prompt)
+            cached = await self._aget_cached_response(fingerprint, context)
+            if cached is not None:
+                yield cached
+                return
+        
+            self.logger.info(f"Streaming asíncrono de consulta con OpenAI GPT-4o-mini - Tokens: {total_tokens}")
+        
+            await self._aacquire_rate_limit('openai', total_tokens, context)
+            # El stream ocupa un hueco de LLM_MAX_CONCURRENCY hasta que termina o se cierra
+            async with get_client_provider().get_async_semaphore():
+                llm_start = time.perf_counter()
+                stream = await client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": context_prompt}
+                    ],
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    timeout=self.timeout,
+                    stream=True
+                )
+        
+                parts = []
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not parts:
+                            record_span('llm.first_token', llm_start, time.perf_counter() - llm_start, provider='openai')
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            record_span('llm.stream', llm_start, time.perf_counter() - llm_start, provider='openai', chunks=len(parts))
+            LLM_REQUEST_LATENCY.observe(time.perf_counter() - llm_start, provider='openai', model='gpt-4o-mini')
+        
+            response = ''.join(parts)
+            self._record_usage('openai', total_tokens, self.count_tokens(response))
+            await self._astore_cached_response(fingerprint, response)
+        
+        except Exception as e:
+            if llm_start is not None:
+                LLM_REQUEST_ERRORS.inc(provider='openai', error=type(e).__name__)
+            raise
+        finally:
+            # Si el cliente se desconecta se cierra la respuesta HTTP y la conexión vuelve al pool
+            if stream is not None and hasattr(stream, 'close'):
+                await stream.close()
+    
+    async def _astream_with_claude(self, query: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+        """Variante asíncrona de _stream_with_claude (AsyncAnthropic)"""
+        client = get_client_provider().get_async_anthropic_client()
+        if not client:
+            raise RuntimeError("El servicio de Claude no está disponible en este momento.")
+        
+        llm_start = None
+        try:
+            system_prompt, context_prompt, total_tokens = self._build_prompts(query, context)
+        
+            claude_model = os.getenv('CLAUDE_MODEL', 'claude-3-sonnet-20240229')
+            fingerprint = self._request_fingerprint(claude_model, system_prompt, context_prompt)
+            cached = await self._aget_cached_response(fingerprint, context)
+            if cached is not None:
+                yield cached
+                return
+        
+            self.logger.info(f"Streaming asíncrono de consulta con Claude")
+        
+            await self._aacquire_rate_limit('anthropic', total_tokens, context)
+            parts = []
+            async with get_client_provider().get_async_semaphore():
+                llm_start = time.perf_counter()
+                async with client.messages.stream(
+                    model=claude_model,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    system=system_prompt,
+                    messages=[
+                        {"role": "user", "content": context_prompt}
+                    ]
+                ) as stream:
+                    async for text in stream.text_stream:
+                        if not parts:
+                            record_span('llm.first_token', llm_start, time.perf_counter() - llm_start, provider='anthropic')
+                        parts.append(text)
+                        yield text
+                    final_message = await stream.get_final_message()
+            record_span('llm.stream', llm_start, time.perf_counter() - llm_start, provider='anthropic', chunks=len(parts))
+            LLM_REQUEST_LATENCY.observe(time.perf_counter() - llm_start, provider='anthropic', model=claude_model)
+            self._record_response_usage('anthropic', final_message)
+        
+            await self._astore_cached_response(fingerprint, ''.join(parts))
+        
+        except Exception as e:
+            if llm_start is not None:
+                LLM_REQUEST_ERRORS.inc(provider='anthropic', error=type(e).__name__)
+            raise
+    
+    async def aprocess_query_stream(self, query: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Variante asíncrona de process_query_stream (con failover a Claude).
+        
+        Yields:
+            Fragmentos de texto de la respuesta
+        """
+        error = self._validate_query(query)
+        if error:
+            yield error
+            return
+        
+        calls = {}
+        if get_client_provider().get_async_openai_client():
+            calls['openai'] = lambda: self._astream_with_openai(query, context)
+        if get_client_provider().get_async_anthropic_client():
+            calls['anthropic'] = lambda: self._astream_with_claude(query, context)
+        
+        if not calls:
+            yield "Lo siento, el servicio de OpenAI no está disponible en este momento. Por favor, configura la API key de OpenAI en el archivo .env."
+            return
+        
+        start = time.perf_counter()
+        first_token_at = None
+        try:
+            async for delta in get_provider_dispatcher().astream(calls):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    self.logger.info(f"Primer token en {(first_token_at - start) * 1000:.0f}ms")
+                yield delta
+        except Exception as e:
+            self.logger.error(f"Error en streaming asíncrono: {e}")
+            yield f"Lo siento, hubo un error procesando tu consulta: {str(e)}"
+            return
+        
+        self.logger.info(f"Streaming asíncrono completado en {time.perf_counter() - start:.2f}s")
+    
+    async def aprocess_specialized_query_stream(self, query: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Variante asíncrona de process_specialized_query_stream: la consulta
+        construida por el agente se emite con aprocess_query_stream.
+        
+        Yields:
+            Fragmentos de texto de la respuesta
+        """
+        response = self.get_local_response(query, context)
+        if response is not None:
+            yield response
+            return
+        
+        prompt, prompt_context = self.build_specialized_request(query, context)
+        async for delta in self.aprocess_query_stream(prompt, prompt_context):
+            yield delta
+    
+    def process_query(self, query: str, context: Dict[str, Any]) -> str:
+        """
+        Método principal para procesar consultas.
+        Usa OpenAI como proveedor principal; si Claude está configurado, el
+        dispatcher lo usa como cobertura ante respuestas lentas y como failover.
+        
+        Se ejecuta como aprocess_query en el event loop de fondo del proceso,
+        de modo que la petición perdedora de una cobertura se cancela y su
+        conexión se cierra también en el camino síncrono.
+        """
+        return get_background_loop().run(self.aprocess_query(query, context))
     
     def get_capabilities(self) -> Dict[str, Any]:
         """
@@ -355,7 +1129,8 @@ Por favor, responde como {self.get_agent_name()} considerando todo el contexto p
             'claude_available': self.claude_client is not None,
             'max_tokens': self.max_tokens,
             'temperature': self.temperature,
-            'timeout': self.timeout
+            'timeout': self.timeout,
+            'response_cache': self._response_cache_stats()
         }
     
     def health_check(self) -> Dict[str, Any]:
@@ -368,7 +1143,19 @@ Por favor, responde como {self.get_agent_name()} considerando todo el contexto p
             'openai_available': self.openai_client is not None,
             'claude_available': self.claude_client is not None,
             'agent_name': self.get_agent_name(),
-            'capabilities': self.get_capabilities()
+            'capabilities': self.get_capabilities(),
+            'response_cache': self._response_cache_stats(),
+            'single_flight': self.single_flight.get_stats(),
+            'token_counter': self.token_counter.get_stats(),
+            'rate_limits': get_rate_limit_stats(),
+            'providers': get_provider_dispatcher().get_stats()
+        }
+    
+    def _response_cache_stats(self) -> Dict[str, Any]:
+        """Aciertos de la caché de respuestas para este agente"""
+        return {
+            **self.response_cache.get_stats(self.get_agent_name()),
+            'ttl': self.response_cache_ttl
         }
 
 
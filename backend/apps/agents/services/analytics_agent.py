@@ -22,6 +22,9 @@ class AnalyticsAgent(BaseAIService):
     - Métricas de efectividad pedagógica
     """
     
+    # Los reportes ceden el cupo del proveedor al chat interactivo
+    request_priority = 'background'
+    
     def get_agent_name(self) -> str:
         """Nombre del agente"""
         return "Analytics - Análisis de Datos Educativos"
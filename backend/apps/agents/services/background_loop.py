@@ -0,0 +1,84 @@
+"""
+Background Loop - Event loop privado del proceso para ejecutar corrutinas desde código síncrono
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundEventLoop:
+    """
+    Event loop en un hilo propio en el que el código síncrono (vistas WSGI,
+    hilos de trabajo) ejecuta las llamadas asíncronas a los proveedores LLM.
+
+    Todas las peticiones síncronas del proceso comparten el loop, así que
+    comparten también sus clientes asíncronos, el semáforo de concurrencia y
+    el single-flight; y, al ser tareas, la petición perdedora de una
+    cobertura se cancela y su conexión se cierra en lugar de abandonarse.
+    Tras un fork el loop heredado no tiene hilo y se vuelve a crear.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Event loop en ejecución (se arranca en el primer uso)"""
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever, name='llm-loop', daemon=True)
+                    thread.start()
+                    self._loop, self._thread, self._pid = loop, thread, os.getpid()
+                    self.logger.info("Event loop de fondo iniciado")
+        return self._loop
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Ejecutar una corrutina en el loop de fondo y esperar su resultado
+
+        La traza activa del hilo que llama se propaga a la tarea.
+
+        Args:
+            coro: Corrutina a ejecutar
+            timeout: Segundos máximos de espera (la tarea se cancela al agotarse)
+
+        Returns:
+            Resultado de la corrutina
+        """
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("No se puede esperar al loop de fondo desde su propio hilo")
+
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Timeout o hilo interrumpido: no dejar la llamada en curso
+            future.cancel()
+            raise
+
+
+_background_loop: Optional[BackgroundEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundEventLoop:
+    """Obtener el event loop de fondo del proceso"""
+    global _background_loop
+    if _background_loop is None:
+        with _background_loop_lock:
+            if _background_loop is None:
+                _background_loop = BackgroundEventLoop()
+    return _background_loop
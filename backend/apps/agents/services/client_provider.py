@@ -0,0 +1,280 @@
+"""
+Proveedor de clientes LLM compartidos por proceso.
+Mantiene un único cliente (y su pool de conexiones HTTP keep-alive) por proveedor
+para que todos los agentes reutilicen las conexiones ya abiertas.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Dict, Any, Optional
+
+import httpx
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClientProvider:
+    """
+    Proveedor de clientes de OpenAI y Anthropic a nivel de proceso.
+
+    Cada cliente se crea una sola vez con un `httpx.Client` propio cuyo pool
+    de conexiones se reutiliza entre peticiones, evitando el handshake TLS y
+    el calentamiento del pool en cada turno de chat. Tras un fork (workers de
+    gunicorn) los clientes se vuelven a crear, ya que los sockets heredados
+    no se pueden compartir entre procesos. Los clientes asíncronos se crean
+    uno por event loop, junto con el semáforo de concurrencia.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self._clients: Dict[str, Any] = {}
+        self._http_clients: Dict[str, httpx.Client] = {}
+        self._encodings: Dict[str, Any] = {}
+        # Los clientes asíncronos y el semáforo pertenecen a un event loop concreto
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+        # Configuración del pool HTTP
+        self.max_connections = int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', 100))
+        self.max_keepalive = int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', 20))
+        self.keepalive_expiry = float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', 30))
+        self.connect_timeout = float(os.getenv('LLM_HTTP_CONNECT_TIMEOUT', 5))
+        self.read_timeout = float(os.getenv('LLM_HTTP_READ_TIMEOUT', os.getenv('AGENT_RESPONSE_TIMEOUT', 30)))
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', 2))
+        # Máximo de llamadas LLM asíncronas simultáneas por proceso
+        self.max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', 200))
+
+    def _check_fork(self):
+        """Descartar los clientes heredados del proceso padre"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._clients = {}
+            self._http_clients = {}
+            self._async_clients = weakref.WeakKeyDictionary()
+            self._semaphores = weakref.WeakKeyDictionary()
+
+    def _build_http_client(self) -> httpx.Client:
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        )
+
+    def _build_async_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        )
+
+    def _get_client(self, provider: str, factory):
+        client = self._clients.get(provider)
+        if client is not None and self._pid == os.getpid():
+            return client
+
+        with self._lock:
+            self._check_fork()
+            if provider not in self._clients:
+                self._clients[provider] = factory()
+            return self._clients[provider]
+
+    def get_openai_client(self):
+        """Cliente de OpenAI compartido, o None si no hay API key válida"""
+        return self._get_client('openai', self._create_openai_client)
+
+    def get_anthropic_client(self):
+        """Cliente de Anthropic compartido, o None si no hay API key válida"""
+        return self._get_client('anthropic', self._create_anthropic_client)
+
+    def _create_openai_client(self):
+        try:
+            api_key = os.getenv('OPENAI_API_KEY')
+
+            self.logger.debug(f"OPENAI_API_KEY {'configurada' if api_key else 'no encontrada'}")
+
+            if not api_key or api_key == 'sk-your-openai-key-here':
+                self.logger.warning("OpenAI API key no configurada")
+                return None
+
+            # Limpiar variables de entorno que puedan causar conflictos
+            env_vars_to_clean = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
+            for var in env_vars_to_clean:
+                if var in os.environ:
+                    del os.environ[var]
+
+            import openai
+            # Limpiar cualquier configuración global
+            if hasattr(openai, 'api_key'):
+                del openai.api_key
+            if hasattr(openai, 'api_base'):
+                del openai.api_base
+
+            http_client = self._build_http_client()
+            client = openai.OpenAI(api_key=api_key, http_client=http_client, max_retries=self.max_retries)
+            self._http_clients['openai'] = http_client
+
+            self.logger.info(
+                f"Cliente OpenAI compartido inicializado (pool de {self.max_connections} conexiones, "
+                f"{self.max_keepalive} keep-alive)"
+            )
+            return client
+        except Exception as e:
+            self.logger.error(f"Error inicializando cliente OpenAI: {e}")
+            return None
+
+    def _create_anthropic_client(self):
+        try:
+            api_key = os.getenv('ANTHROPIC_API_KEY')
+            if not api_key or api_key == 'your-claude-key-here':
+                self.logger.warning("Claude API key no configurada")
+                return None
+
+            from anthropic import Anthropic
+            http_client = self._build_http_client()
+            try:
+                client = Anthropic(api_key=api_key, http_client=http_client, max_retries=self.max_retries)
+                self._http_clients['anthropic'] = http_client
+            except (TypeError, ValueError) as e:
+                # Versiones del SDK con su propio cliente HTTP: se comparte igualmente su pool interno
+                self.logger.warning(f"Cliente HTTP propio no admitido por el SDK de Anthropic: {e}")
+                http_client.close()
+                client = Anthropic(
+                    api_key=api_key,
+                    timeout=self.read_timeout,
+                    max_retries=self.max_retries
+                )
+
+            self.logger.info("Cliente Claude compartido inicializado")
+            return client
+        except Exception as e:
+            self.logger.error(f"Error inicializando cliente Claude: {e}")
+            return None
+
+    def _get_async_client(self, provider: str, factory):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._check_fork()
+            clients = self._async_clients.setdefault(loop, {})
+            if provider not in clients:
+                clients[provider] = factory()
+            return clients[provider]
+
+    def get_async_openai_client(self):
+        """Cliente AsyncOpenAI compartido en el event loop actual, o None si no hay API key válida"""
+        return self._get_async_client('openai', self._create_async_openai_client)
+
+    def get_async_anthropic_client(self):
+        """Cliente AsyncAnthropic compartido en el event loop actual, o None si no hay API key válida"""
+        return self._get_async_client('anthropic', self._create_async_anthropic_client)
+
+    def _create_async_openai_client(self):
+        try:
+            api_key = os.getenv('OPENAI_API_KEY')
+            if not api_key or api_key == 'sk-your-openai-key-here':
+                self.logger.warning("OpenAI API key no configurada")
+                return None
+
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                api_key=api_key,
+                http_client=self._build_async_http_client(),
+                max_retries=self.max_retries
+            )
+            self.logger.info("Cliente AsyncOpenAI compartido inicializado")
+            return client
+        except Exception as e:
+            self.logger.error(f"Error inicializando cliente AsyncOpenAI: {e}")
+            return None
+
+    def _create_async_anthropic_client(self):
+        try:
+            api_key = os.getenv('ANTHROPIC_API_KEY')
+            if not api_key or api_key == 'your-claude-key-here':
+                self.logger.warning("Claude API key no configurada")
+                return None
+
+            from anthropic import AsyncAnthropic
+            http_client = self._build_async_http_client()
+            try:
+                client = AsyncAnthropic(api_key=api_key, http_client=http_client, max_retries=self.max_retries)
+            except (TypeError, ValueError) as e:
+                # Versiones del SDK con su propio cliente HTTP: se comparte igualmente su pool interno
+                self.logger.warning(f"Cliente HTTP propio no admitido por el SDK de Anthropic: {e}")
+                client = AsyncAnthropic(api_key=api_key, timeout=self.read_timeout, max_retries=self.max_retries)
+            self.logger.info("Cliente AsyncAnthropic compartido inicializado")
+            return client
+        except Exception as e:
+            self.logger.error(f"Error inicializando cliente AsyncAnthropic: {e}")
+            return None
+
+    def get_async_semaphore(self) -> asyncio.Semaphore:
+        """Semáforo que limita las llamadas LLM asíncronas simultáneas (LLM_MAX_CONCURRENCY)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._check_fork()
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return semaphore
+
+    def get_encoding(self, name: str = 'cl100k_base'):
+        """Codificación de tiktoken compartida (su carga lee y compila el vocabulario)"""
+        encoding = self._encodings.get(name)
+        if encoding is None:
+            with self._lock:
+                encoding = self._encodings.get(name)
+                if encoding is None:
+                    encoding = self._encodings[name] = tiktoken.get_encoding(name)
+        return encoding
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado de los clientes y configuración del pool"""
+        return {
+            'pid': self._pid,
+            'clients': {provider: client is not None for provider, client in self._clients.items()},
+            'max_connections': self.max_connections,
+            'max_keepalive_connections': self.max_keepalive,
+            'keepalive_expiry': self.keepalive_expiry,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'max_retries': self.max_retries,
+            'max_concurrency': self.max_concurrency,
+            'event_loops': len(self._async_clients)
+        }
+
+    def close(self):
+        """Cerrar los pools de conexiones (los clientes se recrean bajo demanda)"""
+        with self._lock:
+            for provider, http_client in self._http_clients.items():
+                try:
+                    http_client.close()
+                except Exception as e:
+                    self.logger.error(f"Error cerrando cliente HTTP de {provider}: {e}")
+            self._clients = {}
+            self._http_clients = {}
+
+
+_provider: Optional[LLMClientProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_client_provider() -> LLMClientProvider:
+    """Obtener el proveedor de clientes LLM del proceso"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = LLMClientProvider()
+    return _provider
@@ -3,7 +3,7 @@ Agente Creador de Contenido Interactivo
 Especializado en generar ejercicios y simulaciones matemáticas interactivas.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from .ai_service import BaseAIService
 import json
 
@@ -19,6 +19,9 @@ class ContentCreatorAgent(BaseAIService):
     - Adaptar contenido al nivel educativo
     """
     
+    # Las peticiones repetidas sobre el mismo material producen el mismo prompt
+    response_cache_ttl = 86400
+    
     def get_agent_name(self) -> str:
         """Nombre del agente"""
         return "Creador de Contenido Interactivo"
@@ -112,25 +115,31 @@ Eres un Creador de Contenido Interactivo especializado en matemáticas. Tu misi
 ¡Tu objetivo es hacer que las matemáticas cobren vida a través de experiencias interactivas memorables!
 """
     
-    def process_specialized_query(self, query: str, context: Dict[str, Any]) -> str:
+    def get_local_response(self, query: str, context: Dict[str, Any]) -> Optional[str]:
+        """
+        Los diseños de simulación se generan localmente, sin llamar al modelo.
+        """
+        if self._identify_content_type(query) == 'simulacion':
+            return self._generate_simulation_design(query, self._extract_math_context(context))
+        return None
+    
+    def build_specialized_request(self, query: str, context: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """
         Procesamiento especializado para creación de contenido interactivo.
         """
         # Extraer información del contexto matemático
         math_context = self._extract_math_context(context)
-        
-        # Identificar tipo de contenido a crear
-        content_type = self._identify_content_type(query)
+        # La bandera no forma parte de math_context porque este se interpola en el prompt
+        prompt_context = {**math_context, 'bypass_cache': context.get('bypass_cache', False)}
         
         # Generar contenido específico según el tipo
-        if content_type == 'simulacion':
-            return self._generate_simulation_design(query, math_context)
-        elif content_type == 'ejercicio_interactivo':
-            return self._generate_interactive_exercise(query, math_context)
+        content_type = self._identify_content_type(query)
+        if content_type == 'ejercicio_interactivo':
+            return self._interactive_exercise_prompt(query, math_context), prompt_context
         elif content_type == 'juego_matematico':
-            return self._generate_math_game(query, math_context)
+            return self._math_game_prompt(query, math_context), prompt_context
         else:
-            return self._generate_general_interactive_content(query, math_context)
+            return self._general_interactive_content_prompt(query, math_context), prompt_context
     
     def _extract_math_context(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """Extraer contexto matemático específico del contexto de documentos"""
@@ -206,26 +215,6 @@ Eres un Creador de Contenido Interactivo especializado en matemáticas. Tu misi
         
         return None
     
-    def process_specialized_query(self, query: str, context: Dict[str, Any]) -> str:
-        """
-        Procesamiento especializado para creación de contenido interactivo.
-        """
-        # Extraer información del contexto matemático
-        math_context = self._extract_math_context(context)
-        
-        # Identificar tipo de contenido a crear
-        content_type = self._identify_content_type(query)
-        
-        # Generar contenido específico según el tipo
-        if content_type == 'simulacion':
-            return self._generate_simulation_design(query, math_context)
-        elif content_type == 'ejercicio_interactivo':
-            return self._generate_interactive_exercise(query, math_context)
-        elif content_type == 'juego_matematico':
-            return self._generate_math_game(query, math_context)
-        else:
-            return self._generate_general_interactive_content(query, math_context)
-    
     def _identify_content_type(self, query: str) -> str:
         """Identificar qué tipo de contenido crear"""
         query_lower = query.lower()
@@ -338,9 +327,9 @@ He creado un diseño completo para una simulación matemática interactiva basad
 ¿Te gustaría que desarrolle algún aspecto específico de esta simulación o que cree diseños para otros conceptos matemáticos?
 """
     
-    def _generate_interactive_exercise(self, query: str, math_context: Dict[str, Any]) -> str:
-        """Generar ejercicio interactivo específico"""
-        return self.process_query(f"""
+    def _interactive_exercise_prompt(self, query: str, math_context: Dict[str, Any]) -> str:
+        """Prompt para generar un ejercicio interactivo específico"""
+        return f"""
         Crear un ejercicio interactivo basado en: {query}
         
         Contexto: {math_context}
@@ -351,11 +340,11 @@ He creado un diseño completo para una simulación matemática interactiva basad
         3. Múltiples niveles de dificultad
         4. Elementos visuales atractivos
         5. Sistema de puntuación
-        """, math_context)
+        """
     
-    def _generate_math_game(self, query: str, math_context: Dict[str, Any]) -> str:
-        """Generar juego matemático gamificado"""
-        return self.process_query(f"""
+    def _math_game_prompt(self, query: str, math_context: Dict[str, Any]) -> str:
+        """Prompt para generar un juego matemático gamificado"""
+        return f"""
         Diseñar un juego matemático basado en: {query}
         
         Contexto: {math_context}
@@ -366,11 +355,11 @@ He creado un diseño completo para una simulación matemática interactiva basad
         3. Sistema de recompensas
         4. Competencia saludable
         5. Aprendizaje implícito del concepto
-        """, math_context)
+        """
     
-    def _generate_general_interactive_content(self, query: str, math_context: Dict[str, Any]) -> str:
-        """Generar contenido interactivo general"""
-        return self.process_query(f"""
+    def _general_interactive_content_prompt(self, query: str, math_context: Dict[str, Any]) -> str:
+        """Prompt para generar contenido interactivo general"""
+        return f"""
         Crear contenido interactivo matemático para: {query}
         
         Contexto: {math_context}
@@ -381,4 +370,4 @@ He creado un diseño completo para una simulación matemática interactiva basad
         3. Actividades hands-on
         4. Conexiones con la vida real
         5. Evaluación integrada
-        """, math_context) 
\ No newline at end of file
+        """ 
\ No newline at end of file
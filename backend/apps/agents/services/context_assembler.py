@@ -0,0 +1,159 @@
+"""
+Context Assembler - Reparto del presupuesto de tokens entre las secciones del prompt
+"""
+
+import re
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fin de frase (., !, ?, …) seguido de espacio, o salto de línea
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+|\n+')
+
+
+@dataclass
+class PromptSection:
+    """Sección del prompt con contexto"""
+    name: str
+    units: List[str]
+    priority: int = 0
+    required: bool = False
+    max_share: float = 1.0
+    header: str = ''
+    footer: str = ''
+    unit_max_tokens: Optional[int] = None
+    unit_tokens: List[int] = field(default_factory=list)
+    overhead_tokens: int = 0
+
+    @property
+    def tokens(self) -> int:
+        if not self.units:
+            return 0
+        return self.overhead_tokens + sum(self.unit_tokens)
+
+
+class ContextAssembler:
+    """
+    Ensambla las secciones del prompt dentro de un presupuesto de tokens.
+
+    Cada sección se tokeniza una sola vez. Las secciones obligatorias (consulta
+    e instrucciones) se conservan siempre; el resto del presupuesto se reparte
+    por prioridad en dos pasadas: primero cada sección recibe como máximo su
+    cuota (max_share) y después el sobrante se asigna, de nuevo por prioridad,
+    a las que no cupieron completas. Las secciones que exceden su asignación
+    se recortan por unidades (documentos, mensajes) y, dentro de la última
+    unidad, en límites de frase.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], truncate: Callable[[str, int], str]):
+        self.count_tokens = count_tokens
+        self.truncate = truncate
+
+    def assemble(self, sections: List[PromptSection], budget: int) -> Tuple[Dict[str, str], int]:
+        """
+        Ajustar las secciones al presupuesto
+
+        Args:
+            sections: Secciones del prompt
+            budget: Tokens disponibles para el prompt con contexto
+
+        Returns:
+            Tupla (texto de cada sección por nombre, tokens totales)
+        """
+        for section in sections:
+            self._measure(section)
+
+        allocations = {section.name: section.tokens for section in sections if section.required}
+        remaining = max(budget - sum(allocations.values()), 0)
+        optional = sorted((s for s in sections if not s.required), key=lambda s: s.priority)
+
+        # Primera pasada: cuota de cada sección
+        initial = remaining
+        for section in optional:
+            allocation = min(section.tokens, int(initial * section.max_share), remaining)
+            allocations[section.name] = allocation
+            remaining -= allocation
+
+        # Segunda pasada: sobrante por prioridad
+        for section in optional:
+            extra = min(section.tokens - allocations[section.name], remaining)
+            if extra > 0:
+                allocations[section.name] += extra
+                remaining -= extra
+
+        rendered = {}
+        total_tokens = 0
+        for section in sections:
+            text, tokens = self._render(section, allocations[section.name])
+            rendered[section.name] = text
+            total_tokens += tokens
+
+        return rendered, total_tokens
+
+    def _measure(self, section: PromptSection):
+        """Contar los tokens de la sección (una vez) y aplicar el límite por unidad"""
+        units, unit_tokens = [], []
+        for unit in section.units:
+            tokens = self.count_tokens(unit)
+            if section.unit_max_tokens and tokens > section.unit_max_tokens:
+                unit, tokens = self.trim_to_sentences(unit, section.unit_max_tokens)
+            if unit:
+                units.append(unit)
+                unit_tokens.append(tokens)
+
+        section.units = units
+        section.unit_tokens = unit_tokens
+        section.overhead_tokens = self.count_tokens(section.header + section.footer) if units else 0
+
+    def _render(self, section: PromptSection, allocation: int) -> Tuple[str, int]:
+        if not section.units:
+            return '', 0
+        if allocation >= section.tokens:
+            return section.header + ''.join(section.units) + section.footer, section.tokens
+
+        available = allocation - section.overhead_tokens
+        kept, used = [], 0
+        for unit, tokens in zip(section.units, section.unit_tokens):
+            if used + tokens <= available:
+                kept.append(unit)
+                used += tokens
+                continue
+            trimmed, tokens = self.trim_to_sentences(unit, available - used)
+            if trimmed:
+                kept.append(trimmed)
+                used += tokens
+            break
+
+        if not kept:
+            return '', 0
+        return section.header + ''.join(kept) + section.footer, used + section.overhead_tokens
+
+    def trim_to_sentences(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        """
+        Recortar un texto a max_tokens en límites de frase
+
+        Returns:
+            Tupla (texto recortado, tokens); si ni la primera frase cabe, se corta por tokens
+        """
+        if max_tokens <= 0:
+            return '', 0
+
+        kept, used = [], 0
+        position = 0
+        for match in _SENTENCE_BOUNDARY.finditer(text + '\n'):
+            sentence = text[position:match.end()]
+            position = match.end()
+            tokens = self.count_tokens(sentence)
+            if used + tokens > max_tokens:
+                break
+            kept.append(sentence)
+            used += tokens
+
+        ending = '\n' if text.endswith('\n') else ''
+        if kept:
+            return ''.join(kept).rstrip() + ending, used
+
+        truncated = self.truncate(text, max_tokens)
+        return truncated.rstrip() + '...' + ending, self.count_tokens(truncated)
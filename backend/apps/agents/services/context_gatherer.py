@@ -0,0 +1,187 @@
+"""
+Context Gatherer - Recopilación concurrente del contexto de una consulta
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Dict, Any, Callable, Optional
+
+from backend_project.tracing import span, propagate
+
+logger = logging.getLogger(__name__)
+
+# Plazo por defecto de cada fuente (segundos); la búsqueda RAG incluye el embedding de la consulta
+DEFAULT_TIMEOUTS = {
+    'documents': 3.0,
+}
+
+
+@dataclass
+class ContextSource:
+    """Fuente de contexto: función sin argumentos y valor a usar si falla o no responde a tiempo"""
+    fetch: Callable[[], Any]
+    default: Any = None
+    timeout: Optional[float] = None
+
+
+class ContextGatherer:
+    """
+    Ejecuta en paralelo las fuentes de contexto de una consulta (historial,
+    documentos RAG, perfil, metadatos de sesión), de modo que la latencia
+    previa al LLM es la de la fuente más lenta y no la suma de todas.
+
+    Cada fuente tiene su propio plazo: si no responde a tiempo o lanza una
+    excepción, la consulta continúa con el valor por defecto de la fuente
+    (contexto vacío). La llamada que no respondió no se puede interrumpir;
+    termina en segundo plano y su resultado se descarta.
+    """
+
+    def __init__(self, default_timeout: float = 2.0, timeouts: Optional[Dict[str, float]] = None,
+                 max_workers: int = 32):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='context')
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._stages = 0
+        self._stage_time = 0.0
+
+    def timeout_for(self, name: str, source: ContextSource) -> float:
+        if source.timeout is not None:
+            return source.timeout
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _source_stats(self, name: str) -> Dict[str, float]:
+        return self._stats.setdefault(name, {'calls': 0, 'timeouts': 0, 'errors': 0, 'total_time': 0.0})
+
+    def _timed(self, name: str, fetch: Callable[[], Any]) -> Any:
+        start = time.monotonic()
+        try:
+            with span(f'context.{name}'):
+                return fetch()
+        finally:
+            with self._lock:
+                stats = self._source_stats(name)
+                stats['calls'] += 1
+                stats['total_time'] += time.monotonic() - start
+
+    def _degrade(self, name: str, source: ContextSource, error: Optional[BaseException]) -> Any:
+        """Registrar el fallo de una fuente y devolver su valor por defecto"""
+        with self._lock:
+            self._source_stats(name)['errors' if error else 'timeouts'] += 1
+        if error:
+            self.logger.warning(f"Fuente de contexto '{name}' falló: {error}")
+        else:
+            self.logger.warning(
+                f"Fuente de contexto '{name}' sin respuesta tras {self.timeout_for(name, source):.1f}s; "
+                f"se continúa sin ella"
+            )
+        return source.default
+
+    def _record_stage(self, start: float):
+        with self._lock:
+            self._stages += 1
+            self._stage_time += time.monotonic() - start
+
+    def gather(self, sources: Dict[str, ContextSource]) -> Dict[str, Any]:
+        """
+        Obtener todas las fuentes en paralelo (hilos del pool)
+
+        Args:
+            sources: Fuentes de contexto por nombre
+
+        Returns:
+            Valor de cada fuente por nombre (el valor por defecto si falló o expiró)
+        """
+        start = time.monotonic()
+        futures = {
+            name: self._executor.submit(propagate(self._timed), name, source.fetch)
+            for name, source in sources.items()
+        }
+
+        results = {}
+        for name, future in futures.items():
+            source = sources[name]
+            remaining = self.timeout_for(name, source) - (time.monotonic() - start)
+            try:
+                results[name] = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                future.cancel()
+                results[name] = self._degrade(name, source, None)
+            except Exception as e:
+                results[name] = self._degrade(name, source, e)
+
+        self._record_stage(start)
+        return results
+
+    async def agather(self, sources: Dict[str, ContextSource]) -> Dict[str, Any]:
+        """Variante asíncrona de gather: las fuentes se esperan con asyncio.gather"""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+
+        async def fetch(name: str, source: ContextSource) -> Any:
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, propagate(self._timed), name, source.fetch),
+                    self.timeout_for(name, source)
+                )
+            except asyncio.TimeoutError:
+                return self._degrade(name, source, None)
+            except Exception as e:
+                return self._degrade(name, source, e)
+
+        names = list(sources)
+        values = await asyncio.gather(*(fetch(name, sources[name]) for name in names))
+        self._record_stage(start)
+        return dict(zip(names, values))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Latencia media de cada fuente y de la etapa completa, plazos expirados y errores"""
+        with self._lock:
+            return {
+                'stages': self._stages,
+                'avg_stage_time': round(self._stage_time / self._stages, 4) if self._stages else 0.0,
+                'sources': {
+                    name: {
+                        'calls': int(stats['calls']),
+                        'timeouts': int(stats['timeouts']),
+                        'errors': int(stats['errors']),
+                        'avg_time': round(stats['total_time'] / stats['calls'], 4) if stats['calls'] else 0.0
+                    }
+                    for name, stats in self._stats.items()
+                }
+            }
+
+
+_context_gatherer: Optional[ContextGatherer] = None
+_context_gatherer_lock = threading.Lock()
+
+
+def get_context_gatherer() -> ContextGatherer:
+    """
+    Obtener el recopilador de contexto del proceso
+
+    Se configura con CONTEXT_SOURCE_TIMEOUT (plazo por defecto),
+    CONTEXT_TIMEOUT_<FUENTE> (p. ej. CONTEXT_TIMEOUT_DOCUMENTS) y
+    CONTEXT_MAX_WORKERS.
+    """
+    global _context_gatherer
+    if _context_gatherer is None:
+        with _context_gatherer_lock:
+            if _context_gatherer is None:
+                timeouts = dict(DEFAULT_TIMEOUTS)
+                for key, value in os.environ.items():
+                    if key.startswith('CONTEXT_TIMEOUT_'):
+                        timeouts[key[len('CONTEXT_TIMEOUT_'):].lower()] = float(value)
+                _context_gatherer = ContextGatherer(
+                    default_timeout=float(os.getenv('CONTEXT_SOURCE_TIMEOUT', 2.0)),
+                    timeouts=timeouts,
+                    max_workers=int(os.getenv('CONTEXT_MAX_WORKERS', 32))
+                )
+    return _context_gatherer
@@ -67,6 +67,16 @@ class ConversationMemory:
             self.logger.info(f"Redis no disponible: {e}. Usando cache de Django.")
             return None
     
+    @staticmethod
+    def build_message(role: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Construir un mensaje con la marca de tiempo actual"""
+        return {
+            'role': role,
+            'content': content,
+            'timestamp': datetime.now().isoformat(),
+            'metadata': metadata or {}
+        }
+    
     def add_message(self, role: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
         """
         Agregar mensaje a la memoria conversacional
@@ -79,57 +89,81 @@ class ConversationMemory:
         Returns:
             bool: True si se guardó exitosamente
         """
+        return self.add_messages([self.build_message(role, content, metadata)])
+    
+    def add_messages(self, messages: List[Dict[str, Any]]) -> bool:
+        """
+        Agregar varios mensajes (del más antiguo al más reciente) en una sola escritura
+        
+        Con Redis se envían en un pipeline (una ida y vuelta, incluidos los
+        metadatos de sesión); con la caché de Django se hace una sola
+        lectura-modificación-escritura.
+        
+        Args:
+            messages: Mensajes construidos con build_message
+        
+        Returns:
+            bool: True si se guardaron exitosamente
+        """
+        if not messages:
+            return True
+        
         try:
-            message = {
-                'role': role,
-                'content': content,
-                'timestamp': datetime.now().isoformat(),
-                'metadata': metadata or {}
-            }
-            
             if self.redis_client:
                 # Usar Redis
-                self._add_message_redis(message)
+                self._add_messages_redis(messages)
             else:
                 # Usar cache de Django como fallback
-                self._add_message_cache(message)
+                self._add_messages_cache(messages)
             
-            # Actualizar metadatos de sesión
-            self._update_session_metadata()
-            
-            self.logger.info(f"Mensaje agregado: {role} - {len(content)} caracteres")
+            self.logger.info(
+                f"{len(messages)} mensaje(s) agregado(s): "
+                + ", ".join(f"{m['role']} - {len(m['content'])} caracteres" for m in messages)
+            )
             return True
             
         except Exception as e:
-            self.logger.error(f"Error agregando mensaje: {e}")
+            self.logger.error(f"Error agregando mensajes: {e}")
             return False
     
-    def _add_message_redis(self, message: Dict[str, Any]):
-        """Agregar mensaje usando Redis"""
-        # Agregar a lista
-        self.redis_client.lpush(self.conversation_key, json.dumps(message))
+    def _add_messages_redis(self, messages: List[Dict[str, Any]]):
+        """Agregar mensajes usando Redis"""
+        pipeline = self.redis_client.pipeline()
+        
+        # Agregar a lista (LPUSH deja el último mensaje en la cabeza)
+        pipeline.lpush(self.conversation_key, *[json.dumps(message) for message in messages])
         
         # Mantener solo los últimos N mensajes
-        self.redis_client.ltrim(self.conversation_key, 0, self.max_messages - 1)
+        pipeline.ltrim(self.conversation_key, 0, self.max_messages - 1)
         
         # Establecer expiración
         expire_seconds = self.max_age_days * 24 * 60 * 60
-        self.redis_client.expire(self.conversation_key, expire_seconds)
+        pipeline.expire(self.conversation_key, expire_seconds)
+        
+        # Actualizar metadatos de sesión
+        pipeline.setex(self.session_key, self.session_timeout * 60, json.dumps(self._session_metadata()))
+        pipeline.execute()
     
-    def _add_message_cache(self, message: Dict[str, Any]):
-        """Agregar mensaje usando cache de Django"""
+    def _add_messages_cache(self, messages: List[Dict[str, Any]]):
+        """Agregar mensajes usando cache de Django"""
         # Obtener mensajes existentes
-        messages = cache.get(self.conversation_key, [])
+        stored = cache.get(self.conversation_key, [])
         
-        # Agregar nuevo mensaje al inicio
-        messages.insert(0, message)
+        # Agregar nuevos mensajes al inicio, el más reciente primero
+        stored = list(reversed(messages)) + stored
         
         # Mantener solo los últimos N mensajes
-        messages = messages[:self.max_messages]
+        stored = stored[:self.max_messages]
         
         # Guardar en cache con timeout
         timeout = self.max_age_days * 24 * 60 * 60
-        cache.set(self.conversation_key, messages, timeout)
+        cache.set(self.conversation_key, stored, timeout)
+        
+        # Actualizar metadatos de sesión
+        try:
+            cache.set(self.session_key, self._session_metadata(), self.session_timeout * 60)
+        except Exception as e:
+            self.logger.warning(f"Error actualizando metadatos: {e}")
     
     def get_context(self, limit: int = 10, include_system: bool = False) -> List[Dict[str, Any]]:
         """
@@ -278,27 +312,14 @@ class ConversationMemory:
             'user_id': self.user_id
         }
     
-    def _update_session_metadata(self):
-        """Actualizar metadatos de la sesión"""
-        try:
-            metadata = {
-                'last_activity': datetime.now().isoformat(),
-                'agent_type': self.agent_type,
-                'user_id': self.user_id,
-                'session_active': True
-            }
-            
-            if self.redis_client:
-                self.redis_client.setex(
-                    self.session_key,
-                    self.session_timeout * 60,  # convertir a segundos
-                    json.dumps(metadata)
-                )
-            else:
-                cache.set(self.session_key, metadata, self.session_timeout * 60)
-                
-        except Exception as e:
-            self.logger.warning(f"Error actualizando metadatos: {e}")
+    def _session_metadata(self) -> Dict[str, Any]:
+        """Metadatos de la sesión tras una escritura"""
+        return {
+            'last_activity': datetime.now().isoformat(),
+            'agent_type': self.agent_type,
+            'user_id': self.user_id,
+            'session_active': True
+        }
     
     def is_session_active(self) -> bool:
         """
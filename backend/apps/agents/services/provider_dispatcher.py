@@ -0,0 +1,422 @@
+"""
+Provider Dispatcher - Peticiones con cobertura (hedging) y failover entre proveedores LLM
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from typing import Dict, Any, AsyncIterator, Callable, Awaitable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Petición en curso de la tarea actual (para señalar su primer fragmento)
+_current_attempt: contextvars.ContextVar = contextvars.ContextVar('llm_attempt', default=None)
+
+
+class NoProviderAvailable(Exception):
+    """Ningún proveedor LLM configurado para la petición"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de un proveedor.
+
+    Tras `failure_threshold` fallos consecutivos el circuito se abre y el
+    proveedor se omite durante `reset_timeout` segundos. Después pasa a
+    semiabierto: se deja pasar una petición de prueba, que lo cierra si
+    tiene éxito o lo vuelve a abrir si falla.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """True si se puede enviar una petición al proveedor"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            # Semiabierto: una única petición de prueba
+            self._state = self.HALF_OPEN
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Liberar la petición de prueba sin resultado (petición cancelada)"""
+        with self._lock:
+            self._probing = False
+
+
+class _Attempt:
+    """Petición a un proveedor dentro de una llamada con cobertura"""
+
+    __slots__ = ('provider', 'start', 'first_token_at', 'responding')
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.start = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        # Se activa con el primer fragmento o al terminar la petición
+        self.responding = asyncio.Event()
+
+
+def mark_first_token():
+    """
+    Señalar que el proveedor de la petición en curso empezó a responder.
+
+    La espera de cobertura se mide hasta este punto: la primera petición que
+    responde gana y la otra se cancela. Fuera de `acall` no hace nada.
+    """
+    attempt = _current_attempt.get()
+    if attempt is not None and attempt.first_token_at is None:
+        attempt.first_token_at = time.monotonic()
+        attempt.responding.set()
+
+
+class LatencyTracker:
+    """Latencias recientes de un proveedor (ventana deslizante)"""
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(int(round(percentile / 100 * (len(samples) - 1))), len(samples) - 1)
+        return samples[index]
+
+
+class ProviderDispatcher:
+    """
+    Envía cada consulta al proveedor principal y, si no ha empezado a
+    responder dentro del percentil `hedge_percentile` de su tiempo reciente
+    hasta el primer fragmento, lanza una petición de cobertura al secundario;
+    gana la primera que empieza a responder y la otra se cancela. Si el
+    principal falla, se pasa al secundario sin esperar. El código síncrono
+    usa este mismo camino a través del event loop de fondo del proceso.
+
+    Cada proveedor tiene un circuit breaker: mientras está abierto, el
+    proveedor no recibe peticiones y el secundario actúa como principal.
+    Las respuestas en streaming (`stream`/`astream`) usan los mismos
+    circuitos y el failover, pero sin cobertura.
+    """
+
+    def __init__(self, providers: List[str], hedge_enabled: bool = True, hedge_percentile: float = 95,
+                 min_samples: int = 20, default_hedge_delay: float = 10.0, min_hedge_delay: float = 0.5,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, window: int = 100):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.providers = providers
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.breakers = {p: CircuitBreaker(failure_threshold, reset_timeout) for p in providers}
+        self.latencies = {p: LatencyTracker(window) for p in providers}
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'failovers': 0, 'skipped_open': 0}
+
+    def hedge_delay(self, provider: str) -> float:
+        """Segundos de espera al primer fragmento antes de lanzar la petición de cobertura"""
+        tracker = self.latencies[provider]
+        if len(tracker) < self.min_samples:
+            return self.default_hedge_delay
+        return max(tracker.percentile(self.hedge_percentile), self.min_hedge_delay)
+
+    def _candidates(self, calls: Dict[str, Any]) -> List[str]:
+        """Proveedores configurados por orden de preferencia, omitiendo los de circuito abierto"""
+        configured = [p for p in self.providers if p in calls]
+        if not configured:
+            raise NoProviderAvailable("No hay proveedores LLM configurados")
+
+        allowed = []
+        for provider in configured:
+            if self.breakers[provider].allow():
+                allowed.append(provider)
+            else:
+                self._count('skipped_open')
+        # Con todos los circuitos abiertos se intenta igualmente el principal
+        return allowed or configured[:1]
+
+    def _count(self, field: str):
+        with self._lock:
+            self._stats[field] += 1
+
+    def _record(self, provider: str, latency: Optional[float], error: Optional[BaseException]):
+        if error is None:
+            self.latencies[provider].record(latency)
+            self.breakers[provider].record_success()
+        elif isinstance(error, asyncio.CancelledError):
+            self.breakers[provider].release()
+        else:
+            self.logger.warning(f"Fallo del proveedor {provider}: {error}")
+            self.breakers[provider].record_failure()
+
+    async def _atimed(self, attempt: _Attempt, fn: Callable[[], Awaitable[str]]) -> str:
+        # Cada tarea tiene su propia copia del contexto: la petición no se filtra a otras
+        _current_attempt.set(attempt)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._record(attempt.provider, None, e)
+            raise
+        finally:
+            attempt.responding.set()
+        # Sin primer fragmento señalado (respuesta no incremental) cuenta la respuesta completa
+        self._record(attempt.provider, (attempt.first_token_at or time.monotonic()) - attempt.start, None)
+        return result
+
+    @staticmethod
+    async def _first_responding(attempts: Dict[asyncio.Task, _Attempt]) -> asyncio.Task:
+        """Esperar a la primera petición que empieza a responder o termina"""
+        waiters = {asyncio.ensure_future(attempt.responding.wait()): task for task, attempt in attempts.items()}
+        try:
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        return waiters[next(iter(done))]
+
+    async def acall(self, calls: Dict[str, Callable[[], Awaitable[str]]]) -> Tuple[str, str]:
+        """
+        Ejecutar la consulta con cobertura y failover
+
+        Las llamadas señalan su primer fragmento con `mark_first_token`; si no
+        lo hacen, el primer fragmento es la respuesta completa.
+
+        Args:
+            calls: Función que devuelve la corrutina de cada proveedor disponible ('openai', 'anthropic')
+
+        Returns:
+            Tupla (proveedor que respondió, respuesta)
+        """
+        candidates = self._candidates(calls)
+        self._count('requests')
+        primary = candidates[0]
+        backups = candidates[1:]
+        attempts: Dict[asyncio.Task, _Attempt] = {}
+
+        def launch(provider: str):
+            attempt = _Attempt(provider)
+            attempts[asyncio.ensure_future(self._atimed(attempt, calls[provider]))] = attempt
+
+        launch(primary)
+        try:
+            if backups and self.hedge_enabled:
+                delay = self.hedge_delay(primary)
+                try:
+                    await asyncio.wait_for(next(iter(attempts.values())).responding.wait(), delay)
+                except asyncio.TimeoutError:
+                    provider = backups.pop(0)
+                    self._count('hedged')
+                    self.logger.info(f"{primary} sin respuesta tras {delay:.2f}s; cobertura con {provider}")
+                    launch(provider)
+
+            last_error = None
+            while attempts:
+                task = await self._first_responding(attempts)
+                provider = attempts.pop(task).provider
+                if not task.done() or task.exception() is None:
+                    # Ya está respondiendo: el resto de peticiones se cancela
+                    for other in attempts:
+                        other.cancel()
+                    attempts.clear()
+                    try:
+                        result = await task
+                    except Exception as e:
+                        last_error = e
+                    else:
+                        if provider != primary:
+                            self._count('hedge_wins')
+                        return provider, result
+                else:
+                    last_error = task.exception()
+
+                if backups and not attempts:
+                    self._count('failovers')
+                    provider = backups.pop(0)
+                    self.logger.info(f"Failover a {provider}")
+                    launch(provider)
+
+            raise last_error
+        finally:
+            for task in attempts:
+                task.cancel()
+            self._release(backups)
+
+    def stream(self, calls: Dict[str, Callable[[], Iterator[str]]]) -> Iterator[str]:
+        """
+        Emitir una respuesta en streaming con failover
+
+        Sin cobertura: una respuesta ya emitida no puede cambiar de proveedor.
+        Si el proveedor falla antes del primer fragmento se pasa al siguiente.
+        Las latencias de streaming no se registran (la espera de cobertura se
+        calcula con respuestas completas).
+
+        Args:
+            calls: Generador de fragmentos de cada proveedor disponible
+
+        Yields:
+            Fragmentos de texto de la respuesta
+        """
+        candidates = self._candidates(calls)
+        self._count('requests')
+        last_error = None
+        for index, provider in enumerate(candidates):
+            if index:
+                self._count('failovers')
+                self.logger.info(f"Failover a {provider}")
+            emitted = False
+            try:
+                for delta in calls[provider]():
+                    emitted = True
+                    yield delta
+            except Exception as e:
+                self.logger.warning(f"Fallo del proveedor {provider}: {e}")
+                self.breakers[provider].record_failure()
+                last_error = e
+                if emitted:
+                    break
+                continue
+            except BaseException:
+                # El consumidor cerró el stream (cliente desconectado)
+                self.breakers[provider].release()
+                self._release(candidates[index + 1:])
+                raise
+            self.breakers[provider].record_success()
+            self._release(candidates[index + 1:])
+            return
+
+        self._release(candidates[index + 1:])
+        raise last_error
+
+    async def astream(self, calls: Dict[str, Callable[[], AsyncIterator[str]]]) -> AsyncIterator[str]:
+        """Variante asíncrona de stream"""
+        candidates = self._candidates(calls)
+        self._count('requests')
+        last_error = None
+        for index, provider in enumerate(candidates):
+            if index:
+                self._count('failovers')
+                self.logger.info(f"Failover a {provider}")
+            emitted = False
+            try:
+                async for delta in calls[provider]():
+                    emitted = True
+                    yield delta
+            except Exception as e:
+                self.logger.warning(f"Fallo del proveedor {provider}: {e}")
+                self.breakers[provider].record_failure()
+                last_error = e
+                if emitted:
+                    break
+                continue
+            except BaseException:
+                # El consumidor cerró el stream o la tarea se canceló
+                self.breakers[provider].release()
+                self._release(candidates[index + 1:])
+                raise
+            self.breakers[provider].record_success()
+            self._release(candidates[index + 1:])
+            return
+
+        self._release(candidates[index + 1:])
+        raise last_error
+
+    def _release(self, providers: List[str]):
+        """Liberar la petición de prueba de los proveedores que no llegaron a usarse"""
+        for provider in providers:
+            self.breakers[provider].release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado de los circuitos, latencias recientes y peticiones de cobertura"""
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            **stats,
+            'hedge_enabled': self.hedge_enabled,
+            'providers': {
+                provider: {
+                    'circuit': self.breakers[provider].state,
+                    'samples': len(self.latencies[provider]),
+                    'p50': self.latencies[provider].percentile(50),
+                    f'p{int(self.hedge_percentile)}': self.latencies[provider].percentile(self.hedge_percentile),
+                    'hedge_delay': self.hedge_delay(provider)
+                }
+                for provider in self.providers
+            }
+        }
+
+
+_dispatcher: Optional[ProviderDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_provider_dispatcher() -> ProviderDispatcher:
+    """Obtener el dispatcher del proceso (LLM_PRIMARY_PROVIDER, LLM_SECONDARY_PROVIDER, LLM_HEDGE_*)"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                providers = [os.getenv('LLM_PRIMARY_PROVIDER', 'openai')]
+                secondary = os.getenv('LLM_SECONDARY_PROVIDER', 'anthropic')
+                if secondary and secondary not in providers:
+                    providers.append(secondary)
+                _dispatcher = ProviderDispatcher(
+                    providers,
+                    hedge_enabled=os.getenv('LLM_HEDGE_ENABLED', 'True').lower() == 'true',
+                    hedge_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', 95)),
+                    min_samples=int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20)),
+                    default_hedge_delay=float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', 10)),
+                    min_hedge_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY', 0.5)),
+                    failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+                    reset_timeout=float(os.getenv('LLM_BREAKER_RESET_TIMEOUT', 30))
+                )
+    return _dispatcher
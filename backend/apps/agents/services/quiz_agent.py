@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from .ai_service import BaseAIService
 
 class QuizAgent(BaseAIService):
@@ -6,6 +6,12 @@ class QuizAgent(BaseAIService):
     Agente especializado en la generación de quizzes y evaluaciones
     """
     
+    # Las peticiones repetidas sobre el mismo material producen el mismo prompt
+    response_cache_ttl = 86400
+    
+    # La generación de quizzes cede el cupo del proveedor al chat interactivo
+    request_priority = 'background'
+    
     def get_agent_name(self) -> str:
         """Nombre del agente"""
         return "Quiz Generator"
@@ -76,15 +82,22 @@ Eres un generador de quizzes especializado en crear evaluaciones educativas de a
 ¡Tu objetivo es crear quizzes que evalúen efectivamente el conocimiento específico del contexto proporcionado!
 """
     
-    def process_specialized_query(self, query: str, context: Dict[str, Any]) -> str:
+    def get_local_response(self, query: str, context: Dict[str, Any]) -> Optional[str]:
         """
-        Procesamiento especializado para generación de quizzes
+        Sin contexto explícito no se puede generar el quiz
         """
-        # Extraer contexto explícito
         explicit_context = context.get('explicit_context', '')
         
         if not explicit_context or not str(explicit_context).strip():
             return "Error: No se proporcionó contexto específico para generar el quiz."
+        return None
+    
+    def build_specialized_request(self, query: str, context: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Procesamiento especializado para generación de quizzes
+        """
+        # Extraer contexto explícito
+        explicit_context = context.get('explicit_context', '')
         
         # Construir prompt para generación de quiz
         quiz_prompt = f"""
@@ -118,4 +131,4 @@ Eres un generador de quizzes especializado en crear evaluaciones educativas de a
         Responde ÚNICAMENTE en formato JSON con el quiz basado en este contexto específico.
         """
         
-        return self.process_query(quiz_prompt, context) 
\ No newline at end of file
+        return quiz_prompt, context
\ No newline at end of file
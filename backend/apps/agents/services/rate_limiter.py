@@ -0,0 +1,286 @@
+"""
+Rate Limiter - Límites por proveedor LLM (peticiones y tokens por minuto) con colas de prioridad
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Clases de prioridad: menor valor = se atiende antes
+PRIORITIES = {
+    'interactive': 0,   # Chat en vivo (tutor)
+    'standard': 1,
+    'background': 2,    # Pregeneración de quizzes, reportes de analytics
+}
+
+# Límites por defecto (RPM, TPM) de cada proveedor
+DEFAULT_LIMITS = {
+    'openai': (500, 200000),
+    'anthropic': (50, 40000),
+}
+
+
+class RateLimitTimeout(Exception):
+    """La petición no obtuvo cupo antes de su plazo máximo de espera"""
+    pass
+
+
+class TokenBucket:
+    """Cubo de tokens que se rellena de forma continua hasta `per_minute` por minuto"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos hasta que haya `amount` disponibles (0 si ya los hay)"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        if self.capacity > 0:
+            self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    """Petición en cola; `wake` la despierta cuando puede volver a intentar"""
+
+    __slots__ = ('priority', 'amount', 'wake')
+
+    def __init__(self, priority: int, amount: int, wake):
+        self.priority = priority
+        self.amount = amount
+        self.wake = wake
+
+
+class ProviderRateLimiter:
+    """
+    Limitador compartido por todos los agentes del proceso para un proveedor.
+
+    Modela los límites del proveedor como dos cubos de tokens, uno de
+    peticiones por minuto (RPM) y otro de tokens por minuto (TPM). Las
+    peticiones que no caben esperan en una cola ordenada por prioridad y
+    orden de llegada: solo la cabeza de la cola puede consumir cupo, de modo
+    que el chat interactivo adelanta a las tareas en segundo plano. Si la
+    espera supera `max_wait`, se lanza RateLimitTimeout.
+
+    Un límite a 0 desactiva el cubo correspondiente.
+    """
+
+    def __init__(self, provider: str, rpm: int, tpm: int, max_wait: float = 20.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.provider = provider
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_wait = max_wait
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._stats = {'granted': 0, 'queued': 0, 'timeouts': 0, 'total_wait': 0.0, 'max_wait_seen': 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _enqueue(self, amount: int, priority: str, wake) -> tuple:
+        waiter = _Waiter(PRIORITIES.get(priority, PRIORITIES['standard']), amount, wake)
+        entry = (waiter.priority, next(self._sequence), waiter)
+        with self._lock:
+            heapq.heappush(self._queue, entry)
+        return entry
+
+    def _try_acquire(self, entry: tuple) -> Optional[float]:
+        """
+        Intentar consumir cupo para la entrada (con el lock tomado)
+
+        Returns:
+            0 si se concede, segundos de espera si es la cabeza de la cola, o None si no lo es
+        """
+        if self._queue[0] is not entry:
+            return None
+
+        waiter = entry[2]
+        now = time.monotonic()
+        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(waiter.amount, now))
+        if wait > 0:
+            return wait
+
+        self.requests.consume(1)
+        self.tokens.consume(waiter.amount)
+        heapq.heappop(self._queue)
+        self._wake_head()
+        return 0.0
+
+    def _remove(self, entry: tuple):
+        with self._lock:
+            if entry in self._queue:
+                was_head = self._queue[0] is entry
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                if was_head:
+                    self._wake_head()
+
+    def _wake_head(self):
+        if self._queue:
+            self._queue[0][2].wake()
+
+    def _record(self, waited: float) -> float:
+        with self._lock:
+            self._stats['granted'] += 1
+            if waited > 0:
+                self._stats['queued'] += 1
+                self._stats['total_wait'] += waited
+                self._stats['max_wait_seen'] = max(self._stats['max_wait_seen'], waited)
+        return waited
+
+    def _timeout(self, waited: float, priority: str):
+        with self._lock:
+            self._stats['timeouts'] += 1
+        self.logger.warning(
+            f"Límite de {self.provider} no liberado tras {waited:.1f}s (prioridad {priority})"
+        )
+        raise RateLimitTimeout(f"Límite de peticiones de {self.provider} alcanzado; intenta de nuevo en unos segundos")
+
+    def acquire(self, tokens: int, priority: str = 'standard', max_wait: Optional[float] = None) -> float:
+        """
+        Esperar cupo para una petición de `tokens` tokens (prompt + max_tokens)
+
+        Args:
+            tokens: Tokens que consumirá la petición
+            priority: 'interactive', 'standard' o 'background'
+            max_wait: Segundos máximos en cola (por defecto LLM_RATE_LIMIT_MAX_WAIT)
+
+        Returns:
+            Segundos de espera en cola
+        """
+        if not self.enabled:
+            return 0.0
+
+        event = threading.Event()
+        entry = self._enqueue(tokens, priority, event.set)
+        start = time.monotonic()
+        deadline = start + (self.max_wait if max_wait is None else max_wait)
+        queued = False
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    wait = self._try_acquire(entry)
+                now = time.monotonic()
+                if wait == 0:
+                    return self._record(now - start if queued else 0.0)
+                if now >= deadline:
+                    self._timeout(now - start, priority)
+                queued = True
+                event.wait(min(wait if wait is not None else deadline - now, deadline - now))
+        except BaseException:
+            self._remove(entry)
+            raise
+
+    async def aacquire(self, tokens: int, priority: str = 'standard', max_wait: Optional[float] = None) -> float:
+        """Variante asíncrona de acquire: la espera no bloquea el event loop"""
+        if not self.enabled:
+            return 0.0
+
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        entry = self._enqueue(tokens, priority, lambda: loop.call_soon_threadsafe(event.set))
+        start = time.monotonic()
+        deadline = start + (self.max_wait if max_wait is None else max_wait)
+        queued = False
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    wait = self._try_acquire(entry)
+                now = time.monotonic()
+                if wait == 0:
+                    return self._record(now - start if queued else 0.0)
+                if now >= deadline:
+                    self._timeout(now - start, priority)
+                queued = True
+                try:
+                    await asyncio.wait_for(
+                        event.wait(), min(wait if wait is not None else deadline - now, deadline - now)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._remove(entry)
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Profundidad de la cola por prioridad, esperas y cupo disponible"""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.wait_time(0, now)
+            self.tokens.wait_time(0, now)
+            depth = {name: 0 for name in PRIORITIES}
+            names = {value: name for name, value in PRIORITIES.items()}
+            for priority, _, _ in self._queue:
+                depth[names[priority]] += 1
+            stats = dict(self._stats)
+
+        return {
+            'provider': self.provider,
+            'enabled': self.enabled,
+            'rpm': self.rpm,
+            'tpm': self.tpm,
+            'available_requests': int(self.requests.tokens) if self.rpm else None,
+            'available_tokens': int(self.tokens.tokens) if self.tpm else None,
+            'queue_depth': sum(depth.values()),
+            'queue_depth_by_priority': depth,
+            **stats,
+            'avg_wait': round(stats['total_wait'] / stats['queued'], 3) if stats['queued'] else 0.0
+        }
+
+
+_rate_limiters: Dict[str, ProviderRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> ProviderRateLimiter:
+    """
+    Obtener el limitador del proceso para un proveedor
+
+    Se configura con <PROVEEDOR>_RPM y <PROVEEDOR>_TPM (p. ej. OPENAI_RPM)
+    y LLM_RATE_LIMIT_MAX_WAIT.
+    """
+    limiter = _rate_limiters.get(provider)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(provider)
+            if limiter is None:
+                default_rpm, default_tpm = DEFAULT_LIMITS.get(provider, (0, 0))
+                limiter = _rate_limiters[provider] = ProviderRateLimiter(
+                    provider,
+                    int(os.getenv(f'{provider.upper()}_RPM', default_rpm)),
+                    int(os.getenv(f'{provider.upper()}_TPM', default_tpm)),
+                    float(os.getenv('LLM_RATE_LIMIT_MAX_WAIT', 20))
+                )
+    return limiter
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """Métricas de todos los limitadores creados en el proceso"""
+    return {provider: limiter.get_stats() for provider, limiter in list(_rate_limiters.items())}
@@ -0,0 +1,252 @@
+"""
+Response Cache - Caché determinista de respuestas LLM por huella del prompt
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCacheBackend(ABC):
+    """Almacén clave-valor para las respuestas cacheadas"""
+
+    # True si get/set hacen E/S de red (se ejecutan en un hilo desde código asíncrono)
+    blocking = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: int):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class InMemoryLRUBackend(ResponseCacheBackend):
+    """LRU en memoria del proceso con expiración por entrada"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend(ResponseCacheBackend):
+    """Caché de Django configurada en settings.CACHES"""
+
+    blocking = True
+
+    def __init__(self, alias: str = 'default', prefix: str = 'llm_response'):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self.cache.get(f"{self.prefix}:{key}")
+
+    def set(self, key: str, value: str, ttl: int):
+        self.cache.set(f"{self.prefix}:{key}", value, ttl)
+
+    def clear(self):
+        # La caché de Django puede ser compartida: no se borra completa
+        logger.warning("DjangoCacheBackend.clear no está soportado; las entradas expiran por TTL")
+
+
+class RedisCacheBackend(ResponseCacheBackend):
+    """Redis compartido entre procesos y servidores"""
+
+    blocking = True
+
+    def __init__(self, url: Optional[str] = None, prefix: str = 'llm_response'):
+        import redis
+        self.client = redis.from_url(url or os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+                                     decode_responses=True)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(f"{self.prefix}:{key}")
+
+    def set(self, key: str, value: str, ttl: int):
+        self.client.set(f"{self.prefix}:{key}", value, ex=ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}:*"):
+            self.client.delete(key)
+
+
+def create_cache_backend(backend: str) -> Optional[ResponseCacheBackend]:
+    """
+    Crear el backend de la caché de respuestas
+
+    Args:
+        backend: 'memory', 'django', 'redis' u 'off'
+
+    Returns:
+        Backend, o None si la caché está desactivada
+    """
+    backend = (backend or 'off').lower()
+    if backend in ('off', 'none', 'false', '0', ''):
+        return None
+    if backend == 'memory':
+        return InMemoryLRUBackend(int(os.getenv('LLM_RESPONSE_CACHE_MAX_ENTRIES', 1000)))
+    if backend == 'django':
+        return DjangoCacheBackend(os.getenv('LLM_RESPONSE_CACHE_ALIAS', 'default'))
+    if backend == 'redis':
+        return RedisCacheBackend(os.getenv('LLM_RESPONSE_CACHE_REDIS_URL'))
+    raise ValueError(f"Backend de caché de respuestas no soportado: {backend}")
+
+
+class ResponseCache:
+    """
+    Caché de respuestas LLM indexada por la huella completa de la petición
+    (modelo, temperatura, max_tokens, prompt del sistema y prompt con contexto).
+
+    Dos peticiones con la misma huella producen la misma entrada, así que solo
+    se cachean los agentes que lo activan con un TTL (BaseAIService.response_cache_ttl).
+    """
+
+    def __init__(self, backend: Optional[ResponseCacheBackend] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0})
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @staticmethod
+    def fingerprint(model: str, temperature: float, max_tokens: int,
+                    system_prompt: str, context_prompt: str) -> str:
+        """Huella SHA-256 de todos los parámetros que determinan la respuesta"""
+        payload = json.dumps(
+            [model, float(temperature), int(max_tokens), system_prompt, context_prompt],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _count(self, agent: str, field: str):
+        with self._lock:
+            self._stats[agent][field] += 1
+
+    def get(self, key: str, agent: str = 'default') -> Optional[str]:
+        """Respuesta cacheada, o None (fallo de caché)"""
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self.logger.error(f"Error leyendo caché de respuestas: {e}")
+            self._count(agent, 'errors')
+            return None
+
+        self._count(agent, 'hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key: str, value: str, ttl: int, agent: str = 'default'):
+        """Guardar una respuesta durante ttl segundos"""
+        if not self.enabled or not value or ttl <= 0:
+            return
+        try:
+            self.backend.set(key, value, ttl)
+            self._count(agent, 'stores')
+        except Exception as e:
+            self.logger.error(f"Error guardando en caché de respuestas: {e}")
+            self._count(agent, 'errors')
+
+    async def aget(self, key: str, agent: str = 'default') -> Optional[str]:
+        if self.enabled and self.backend.blocking:
+            return await asyncio.to_thread(self.get, key, agent)
+        return self.get(key, agent)
+
+    async def aset(self, key: str, value: str, ttl: int, agent: str = 'default'):
+        if self.enabled and self.backend.blocking:
+            await asyncio.to_thread(self.set, key, value, ttl, agent)
+        else:
+            self.set(key, value, ttl, agent)
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+
+    def get_stats(self, agent: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Estadísticas de aciertos de la caché
+
+        Args:
+            agent: Nombre del agente, o None para el total del proceso
+        """
+        with self._lock:
+            if agent is not None:
+                counters = dict(self._stats.get(agent, {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}))
+            else:
+                counters = {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+                for values in self._stats.values():
+                    for field, count in values.items():
+                        counters[field] += count
+
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'enabled': self.enabled,
+            'backend': self.backend.__class__.__name__ if self.enabled else None,
+            **counters,
+            'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Obtener la caché de respuestas del proceso (LLM_RESPONSE_CACHE)"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                backend = None
+                try:
+                    backend = create_cache_backend(os.getenv('LLM_RESPONSE_CACHE', 'off'))
+                except Exception as e:
+                    logger.error(f"Caché de respuestas desactivada: {e}")
+                _response_cache = ResponseCache(backend)
+    return _response_cache
@@ -0,0 +1,173 @@
+"""
+Single Flight - Agrupación de peticiones LLM idénticas en curso
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Llamada en curso compartida por los hilos que piden la misma huella"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncCall:
+    """Tarea upstream compartida por las corrutinas que piden la misma huella"""
+
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa las llamadas concurrentes con la misma clave en una sola llamada
+    upstream: la primera la ejecuta y las demás esperan y reciben su
+    resultado (o su excepción).
+
+    El camino síncrono comparte las llamadas entre hilos del proceso; el
+    asíncrono, entre las corrutinas de cada event loop. En este último la
+    llamada corre en su propia tarea, de modo que si el cliente que la
+    inició se desconecta el resto sigue recibiendo la respuesta; cuando se
+    van todos (p. ej. la petición perdedora de una cobertura), la tarea se
+    cancela y la conexión con el proveedor se cierra.
+
+    Los hilos que esperan una llamada ajena lo hacen como mucho
+    `wait_timeout` segundos: si la llamada del líder se cuelga, fallan con
+    TimeoutError en lugar de bloquear su worker indefinidamente.
+    """
+
+    def __init__(self, enabled: bool = True, wait_timeout: Optional[float] = 90.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.enabled = enabled
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls = weakref.WeakKeyDictionary()
+        self._stats = {'leaders': 0, 'coalesced': 0, 'timeouts': 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Ejecutar fn una sola vez para todas las llamadas concurrentes con la misma clave
+
+        Args:
+            key: Huella de la petición
+            fn: Llamada upstream
+
+        Returns:
+            Resultado de fn (compartido por todas las llamadas agrupadas)
+        """
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            self.logger.info(f"Petición idéntica en curso ({key[:12]}); esperando su respuesta")
+            if not call.event.wait(self.wait_timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise TimeoutError(
+                    f"La petición idéntica en curso ({key[:12]}) no respondió en {self.wait_timeout}s"
+                )
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Variante asíncrona de do
+
+        Args:
+            key: Huella de la petición
+            fn: Función que devuelve la corrutina de la llamada upstream
+        """
+        if not self.enabled:
+            return await fn()
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            calls = self._async_calls.setdefault(loop, {})
+            call = calls.get(key)
+            if call is None:
+                call = calls[key] = _AsyncCall(loop.create_task(fn()))
+                call.task.add_done_callback(lambda done: self._forget(calls, key, call))
+                self._stats['leaders'] += 1
+            else:
+                self._stats['coalesced'] += 1
+                self.logger.info(f"Petición idéntica en curso ({key[:12]}); esperando su respuesta")
+            call.waiters += 1
+
+        try:
+            # shield: cancelar a un solicitante no cancela la llamada compartida...
+            return await asyncio.shield(call.task)
+        finally:
+            with self._lock:
+                call.waiters -= 1
+                abandoned = call.waiters == 0 and not call.task.done()
+                if abandoned and calls.get(key) is call:
+                    del calls[key]
+            # ...salvo que fuera el último que la esperaba
+            if abandoned:
+                call.task.cancel()
+
+    def _forget(self, calls: Dict[str, _AsyncCall], key: str, call: _AsyncCall):
+        with self._lock:
+            if calls.get(key) is call:
+                del calls[key]
+        # Marcar la excepción como recuperada aunque todos los solicitantes se hayan ido
+        if not call.task.cancelled():
+            call.task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Llamadas upstream realizadas y llamadas agrupadas sobre ellas"""
+        with self._lock:
+            in_flight = len(self._calls) + sum(len(calls) for calls in self._async_calls.values())
+            return {'enabled': self.enabled, **self._stats, 'in_flight': in_flight}
+
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Obtener el agrupador de peticiones del proceso (LLM_SINGLE_FLIGHT, LLM_SINGLE_FLIGHT_TIMEOUT)"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                enabled = os.getenv('LLM_SINGLE_FLIGHT', 'True').lower() == 'true'
+                _single_flight = SingleFlight(enabled, float(os.getenv('LLM_SINGLE_FLIGHT_TIMEOUT', 90)))
+    return _single_flight
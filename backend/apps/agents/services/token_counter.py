@@ -0,0 +1,94 @@
+"""
+Token Counter - Conteo de tokens memoizado y compartido por todos los agentes
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from .client_provider import get_client_provider
+from backend_project.tracing import accumulate
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """
+    Cuenta tokens con tiktoken guardando el resultado por hash del texto.
+
+    Los prompts del sistema, las instrucciones y los fragmentos RAG se repiten
+    de un turno a otro; con la caché solo se codifican la primera vez. La
+    clave es el hash del texto (no el texto), así que el coste en memoria por
+    entrada es constante. Las entradas menos usadas se descartan (LRU).
+    """
+
+    def __init__(self, encoding, max_entries: int = 4096):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.encoding = encoding
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def count(self, text: str) -> int:
+        """Número de tokens del texto"""
+        if not text:
+            return 0
+
+        start = time.perf_counter()
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                self._hits += 1
+        if tokens is not None:
+            accumulate('tokens.count', time.perf_counter() - start, hits=1)
+            return tokens
+
+        tokens = len(self.encoding.encode(text))
+        with self._lock:
+            self._misses += 1
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        accumulate('tokens.count', time.perf_counter() - start, misses=1)
+        return tokens
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Aciertos de la caché de conteos"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._counts),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_token_counter: Optional[TokenCounter] = None
+_token_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """Obtener el contador de tokens del proceso (LLM_TOKEN_COUNT_CACHE_SIZE entradas)"""
+    global _token_counter
+    if _token_counter is None:
+        with _token_counter_lock:
+            if _token_counter is None:
+                _token_counter = TokenCounter(
+                    get_client_provider().get_encoding("cl100k_base"),
+                    int(os.getenv('LLM_TOKEN_COUNT_CACHE_SIZE', 4096))
+                )
+    return _token_counter
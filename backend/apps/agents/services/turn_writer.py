@@ -0,0 +1,283 @@
+"""
+Turn Writer - Persistencia diferida (write-behind) de los turnos de conversación
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Marca de fin para el hilo escritor
+_STOP = object()
+
+
+class TurnWriter:
+    """
+    Cola de escritura diferida para ConversationMemory.
+
+    La vista encola el turno (mensaje del usuario y respuesta) y responde sin
+    esperar a Redis ni a la caché; un único hilo escritor vacía la cola por
+    lotes. Dentro de un lote los mensajes se agrupan por conversación
+    (usuario, agente) y cada grupo se guarda con una sola llamada a
+    add_messages. Como hay un solo escritor que procesa la cola en orden de
+    llegada y los grupos conservan ese orden, los mensajes de una misma
+    conversación se persisten en el orden en que se encolaron.
+
+    La cola está acotada: si se llena, el hilo que envía el turno espera a
+    que haya hueco (contrapresión en lugar de pérdida de datos o de
+    escrituras fuera de orden). Al cerrar el proceso se vacía la cola antes
+    de salir.
+
+    Mientras un turno no se ha guardado sigue siendo visible para las
+    lecturas que pasan por get_context, de modo que el siguiente mensaje del
+    usuario ve el turno anterior aunque el escritor vaya con retraso.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 100, linger: float = 0.0,
+                 enabled: bool = True):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.linger = linger
+        self.enabled = enabled
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._pending: Dict[str, deque] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {'submitted': 0, 'written': 0, 'batches': 0, 'failed': 0, 'sync_writes': 0, 'blocked': 0}
+
+    def _start(self):
+        """Arrancar el hilo escritor (con el lock tomado)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='turn-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, memory, messages: List[Dict[str, Any]]) -> bool:
+        """
+        Encolar mensajes de una conversación para guardarlos en segundo plano
+
+        Args:
+            memory: ConversationMemory de la conversación
+            messages: Mensajes construidos con ConversationMemory.build_message, en orden
+
+        Returns:
+            True si se encolaron, False si se escribieron de forma síncrona (cola desactivada o cerrada)
+        """
+        with self._lock:
+            self._stats['submitted'] += len(messages)
+            self._pending.setdefault(memory.conversation_key, deque()).extend(messages)
+            accepting = self.enabled and not self._closed
+            if accepting:
+                self._start()
+
+        if not accepting:
+            self._write(memory, messages, sync=True)
+            return False
+
+        try:
+            self._queue.put_nowait((memory, messages))
+        except queue.Full:
+            # Esperar hueco en lugar de escribir directamente, para no adelantar
+            # a los turnos de la misma conversación que ya están en cola
+            self.logger.warning("Cola de escritura de conversaciones llena; esperando al escritor")
+            with self._lock:
+                self._stats['blocked'] += 1
+            self._queue.put((memory, messages))
+        return True
+
+    def submit_turn(self, memory, message: str, response: str) -> bool:
+        """Encolar el mensaje del usuario y la respuesta del agente"""
+        return self.submit(memory, [
+            memory.build_message('user', message),
+            memory.build_message('assistant', response)
+        ])
+
+    def get_context(self, memory, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Contexto reciente de la conversación incluyendo los turnos aún en cola
+
+        Args:
+            memory: ConversationMemory de la conversación
+            limit: Número máximo de mensajes
+
+        Returns:
+            Lista de mensajes ordenados del más reciente al más antiguo, como ConversationMemory.get_context
+        """
+        with self._lock:
+            pending = list(self._pending.get(memory.conversation_key, ()))
+        if not pending:
+            return memory.get_context(limit=limit)
+
+        # Los mensajes que el escritor está guardando pueden aparecer también en el almacén
+        pending_ids = {self._message_id(message) for message in pending}
+        stored = [
+            message for message in memory.get_context(limit=limit + len(pending))
+            if self._message_id(message) not in pending_ids
+        ]
+        return (list(reversed(pending)) + stored)[:limit]
+
+    @staticmethod
+    def _message_id(message: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+        return message.get('role'), message.get('timestamp'), message.get('content')
+
+    def _write(self, memory, messages: List[Dict[str, Any]], sync: bool = False):
+        try:
+            ok = memory.add_messages(messages)
+        finally:
+            self._release_pending(memory.conversation_key, len(messages))
+        with self._lock:
+            if sync:
+                self._stats['sync_writes'] += 1
+            if ok:
+                self._stats['written'] += len(messages)
+            else:
+                self._stats['failed'] += len(messages)
+
+    def _release_pending(self, key: str, count: int):
+        """Retirar de pendientes los primeros `count` mensajes de la conversación (ya guardados o descartados)"""
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                return
+            for _ in range(min(count, len(pending))):
+                pending.popleft()
+            if not pending:
+                del self._pending[key]
+
+    def _next_batch(self) -> Tuple[List[Tuple[Any, List[Dict[str, Any]]]], bool]:
+        """
+        Esperar el siguiente lote
+
+        Returns:
+            Tupla (lote, se pidió parar); al parar, el lote contiene lo que quedaba en la cola
+        """
+        first = self._queue.get()
+        stop = first is _STOP
+        batch = [] if stop else [first]
+        deadline = time.monotonic() + self.linger
+        while stop or len(batch) < self.batch_size:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0 and not stop:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                self._queue.task_done()
+                continue
+            batch.append(item)
+        if stop and first is _STOP:
+            self._queue.task_done()
+        return batch, stop
+
+    def _run(self):
+        while True:
+            batch, stop = self._next_batch()
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Tuple[Any, List[Dict[str, Any]]]]):
+        if not batch:
+            return
+
+        # Agrupar por conversación conservando el orden de llegada
+        groups: "OrderedDict[str, Tuple[Any, List[Dict[str, Any]]]]" = OrderedDict()
+        for memory, messages in batch:
+            key = memory.conversation_key
+            if key not in groups:
+                groups[key] = (memory, [])
+            groups[key][1].extend(messages)
+
+        for memory, messages in groups.values():
+            try:
+                self._write(memory, messages)
+            except Exception as e:
+                self.logger.error(f"Error guardando conversación {memory.conversation_key}: {e}")
+                with self._lock:
+                    self._stats['failed'] += len(messages)
+
+        with self._lock:
+            self._stats['batches'] += 1
+
+    def flush(self):
+        """Esperar a que se hayan guardado todos los turnos encolados"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """Dejar de aceptar turnos, vaciar la cola y detener el hilo escritor"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is None:
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.logger.error(f"Quedaron {self._queue.qsize()} turnos sin guardar al cerrar")
+            return
+
+        # Turnos encolados mientras el escritor terminaba
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                self._write(*item, sync=True)
+            self._queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Mensajes encolados, guardados y fallidos, lotes y profundidad de la cola"""
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            **stats,
+            'enabled': self.enabled,
+            'queue_depth': self._queue.qsize(),
+            'max_queue': self.max_queue,
+            'avg_batch_messages': round(stats['written'] / stats['batches'], 2) if stats['batches'] else 0.0
+        }
+
+
+_turn_writer: Optional[TurnWriter] = None
+_turn_writer_lock = threading.Lock()
+
+
+def get_turn_writer() -> TurnWriter:
+    """
+    Obtener la cola de escritura de conversaciones del proceso
+
+    Se configura con CONVERSATION_WRITE_BEHIND, CONVERSATION_WRITE_QUEUE_SIZE,
+    CONVERSATION_WRITE_BATCH_SIZE y CONVERSATION_WRITE_LINGER_MS. La cola se
+    vacía al terminar el proceso.
+    """
+    global _turn_writer
+    if _turn_writer is None:
+        with _turn_writer_lock:
+            if _turn_writer is None:
+                _turn_writer = TurnWriter(
+                    max_queue=int(os.getenv('CONVERSATION_WRITE_QUEUE_SIZE', 10000)),
+                    batch_size=int(os.getenv('CONVERSATION_WRITE_BATCH_SIZE', 100)),
+                    linger=float(os.getenv('CONVERSATION_WRITE_LINGER_MS', 0)) / 1000,
+                    enabled=os.getenv('CONVERSATION_WRITE_BEHIND', 'True').lower() == 'true'
+                )
+                atexit.register(_turn_writer.close)
+    return _turn_writer
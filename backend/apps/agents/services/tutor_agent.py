@@ -3,7 +3,7 @@ Agente Tutor Virtual
 Especializado en educación personalizada y enseñanza adaptativa.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 from .ai_service import BaseAIService
 
 class TutorAgent(BaseAIService):
@@ -18,6 +18,9 @@ class TutorAgent(BaseAIService):
     - Sugerir recursos adicionales
     """
     
+    # Chat en vivo: se atiende antes que las tareas en segundo plano
+    request_priority = 'interactive'
+    
     def get_agent_name(self) -> str:
         """Nombre del agente"""
         return "Tutor Virtual"
@@ -99,7 +102,7 @@ Si el usuario solicita un quiz, evaluación o test:
 ¡Tu objetivo es hacer que cada estudiante se sienta confiado y emocionado por aprender, proporcionando explicaciones claras y ejercicios prácticos!
 """
     
-    def process_specialized_query(self, query: str, context: Dict[str, Any]) -> str:
+    def build_specialized_request(self, query: str, context: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """
         Procesamiento especializado para consultas educativas (solo explicaciones)
         """
@@ -131,10 +134,10 @@ Si el usuario solicita un quiz, evaluación o test:
                 f"No generes un quiz ni respondas en formato JSON, a menos que el usuario lo pida explícitamente.\n\n"
                 f"Concepto o duda: {query}"
             )
-            return self.process_query(prompt_refuerzo, educational_context)
+            return prompt_refuerzo, educational_context
 
         # Por defecto, comportamiento estándar (solo explicaciones)
-        return self.process_query(query, educational_context)
+        return query, educational_context
     
     def _identify_learning_objectives(self, query: str, subject: str) -> list:
         """Identificar objetivos de aprendizaje basados en la consulta"""
@@ -1,3 +1,1515 @@
-from django.test import TestCase
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here. 
\ No newline at end of file
+from unittest import mock
+
+from anthropic import AsyncAnthropic
+from channels.testing import WebsocketCommunicator
+from django.test import AsyncClient, SimpleTestCase
+from openai import OpenAI, AsyncOpenAI
+
+from .services.agent_manager import AGENT_CLASSES, AgentManager, get_agent_manager
+from .services.ai_service import BaseAIService, _compiled_prompts
+from .services.client_provider import LLMClientProvider
+from .services.conversation_memory import ConversationMemory
+from .services.provider_dispatcher import CircuitBreaker, ProviderDispatcher, mark_first_token
+from .services.background_loop import get_background_loop
+from .services.quiz_agent import QuizAgent
+from .services.response_cache import InMemoryLRUBackend, ResponseCache
+from .services.rate_limiter import ProviderRateLimiter, RateLimitTimeout, TokenBucket
+from .services.single_flight import SingleFlight
+from .services.turn_writer import TurnWriter
+from .services.token_counter import TokenCounter
+from .services.context_gatherer import ContextGatherer, ContextSource
+from .services.context_assembler import ContextAssembler, PromptSection
+from backend_project.tracing import Trace, span, use_trace, accumulate
+from backend_project.metrics import Histogram, MetricsRegistry
+from .views import AgentContextMixin
+from .consumers import ChatConsumer
+
+
+class FakeProviderServer:
+    """
+    Servidor HTTP local que imita la API de OpenAI (/v1/chat/completions)
+    o de Anthropic (/v1/messages) con latencia y código de estado configurables
+    """
+
+    def __init__(self, provider: str, text: str, delay: float = 0.0, status: int = 200,
+                 stream_gate: threading.Event = None):
+        self.provider = provider
+        self.text = text
+        self.delay = delay
+        self.status = status
+        # En streaming, el resto de palabras tras la primera se envía cuando se activa stream_gate
+        self.stream_gate = stream_gate
+        self.hits = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _payload(self) -> dict:
+        if self.provider == 'openai':
+            return {
+                'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-4o-mini',
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': self.text}}],
+                'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+            }
+        return {
+            'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': 'claude-test',
+            'content': [{'type': 'text', 'text': self.text}],
+            'stop_reason': 'end_turn', 'stop_sequence': None,
+            'usage': {'input_tokens': 1, 'output_tokens': 1}
+        }
+
+    def _stream_chunks(self):
+        """Eventos SSE de /v1/chat/completions con stream=True, uno por palabra"""
+        for i, word in enumerate(self.text.split(' ')):
+            if i == 1 and self.stream_gate is not None:
+                self.stream_gate.wait(5)
+            chunk = {
+                'id': 'chatcmpl-test', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'gpt-4o-mini',
+                'choices': [{'index': 0, 'delta': {'content': word if i == 0 else f' {word}'}, 'finish_reason': None}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                fake.hits += 1
+                time.sleep(fake.delay)
+                try:
+                    if request.get('stream') and fake.status == 200:
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'text/event-stream')
+                        self.end_headers()
+                        for event in fake._stream_chunks():
+                            self.wfile.write(event.encode())
+                            self.wfile.flush()
+                        return
+                    body = json.dumps(fake._payload() if fake.status == 200 else {'error': {'message': 'fallo'}})
+                    self.send_response(fake.status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body.encode())
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente canceló la petición perdedora
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class ProviderDispatcherTests(SimpleTestCase):
+    """Cobertura y failover del dispatcher contra proveedores falsos locales"""
+
+    def make_dispatcher(self, **kwargs):
+        options = {'default_hedge_delay': 0.2, 'min_hedge_delay': 0.05, 'failure_threshold': 2}
+        options.update(kwargs)
+        return ProviderDispatcher(['openai', 'anthropic'], **options)
+
+    def process_sync(self, dispatcher, primary, claude):
+        """Consulta síncrona del agente (process_query) con OpenAI en `primary` y el Claude falso"""
+        agent = make_agent()
+        agent.openai_client = agent.claude_client = object()
+        agent.single_flight = SingleFlight()
+        openai_client = AsyncOpenAI(api_key='test', base_url=f"{primary.url}/v1", max_retries=0)
+        with mock.patch.object(LLMClientProvider, 'get_async_openai_client', return_value=openai_client), \
+                mock.patch.object(LLMClientProvider, 'get_async_anthropic_client', return_value=claude), \
+                mock.patch('apps.agents.services.ai_service.get_provider_dispatcher', return_value=dispatcher):
+            return agent.process_query('hola', {'bypass_cache': True})
+
+    def test_fast_primary_is_not_hedged(self):
+        dispatcher = self.make_dispatcher()
+        claude = FakeAsyncClaude('claude')
+        with FakeProviderServer('openai', 'openai') as primary:
+            self.assertEqual(self.process_sync(dispatcher, primary, claude), 'openai')
+
+        self.assertEqual(claude.calls, 0)
+        self.assertEqual(dispatcher.get_stats()['hedged'], 0)
+
+    def test_slow_primary_is_hedged_to_secondary(self):
+        dispatcher = self.make_dispatcher()
+        with FakeProviderServer('openai', 'openai', delay=2.0) as primary:
+            start = time.monotonic()
+            response = self.process_sync(dispatcher, primary, FakeAsyncClaude('claude'))
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(response, 'claude')
+        self.assertLess(elapsed, 1.5)
+        stats = dispatcher.get_stats()
+        self.assertEqual(stats['hedged'], 1)
+        self.assertEqual(stats['hedge_wins'], 1)
+
+    def test_sync_hedge_loser_is_cancelled(self):
+        async def pending_tasks():
+            await asyncio.sleep(0.05)
+            return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+        dispatcher = self.make_dispatcher()
+        with FakeProviderServer('openai', 'openai', delay=2.0) as primary:
+            self.assertEqual(self.process_sync(dispatcher, primary, FakeAsyncClaude('claude')), 'claude')
+            # La petición perdedora ya no está en curso en el loop de fondo
+            self.assertEqual(get_background_loop().run(pending_tasks()), [])
+
+        # Cancelada, no fallida: el circuito de OpenAI sigue cerrado
+        self.assertEqual(dispatcher.breakers['openai'].state, CircuitBreaker.CLOSED)
+        self.assertEqual(dispatcher.latencies['openai'].percentile(50), None)
+
+    def test_failing_primary_fails_over_and_opens_circuit(self):
+        dispatcher = self.make_dispatcher()
+        with FakeProviderServer('openai', 'openai', status=500) as primary:
+            for _ in range(3):
+                self.assertEqual(self.process_sync(dispatcher, primary, FakeAsyncClaude('claude')), 'claude')
+
+        # Tras dos fallos el circuito se abre y el principal deja de recibir peticiones
+        self.assertEqual(primary.hits, 2)
+        self.assertEqual(dispatcher.breakers['openai'].state, CircuitBreaker.OPEN)
+        self.assertEqual(dispatcher.get_stats()['skipped_open'], 1)
+
+    def test_hedge_waits_for_first_token_not_full_response(self):
+        dispatcher = self.make_dispatcher()
+        called = []
+
+        async def streaming_primary():
+            await asyncio.sleep(0.05)
+            mark_first_token()
+            await asyncio.sleep(0.4)  # el resto de la respuesta tarda más que la espera de cobertura
+            return 'openai'
+
+        async def secondary():
+            called.append('anthropic')
+            return 'claude'
+
+        result = asyncio.run(dispatcher.acall({'openai': streaming_primary, 'anthropic': secondary}))
+
+        self.assertEqual(result, ('openai', 'openai'))
+        self.assertEqual(called, [])
+        self.assertEqual(dispatcher.get_stats()['hedged'], 0)
+        # La latencia registrada es la del primer fragmento, no la de la respuesta completa
+        self.assertLess(dispatcher.latencies['openai'].percentile(50), 0.2)
+
+    def test_hedge_delay_follows_latency_percentile(self):
+        dispatcher = self.make_dispatcher(min_samples=5, hedge_percentile=90)
+        for latency in [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1]:
+            dispatcher.latencies['openai'].record(latency)
+
+        self.assertAlmostEqual(dispatcher.hedge_delay('openai'), 1.0)
+        self.assertEqual(dispatcher.hedge_delay('anthropic'), 0.2)
+
+    def test_async_hedge_cancels_loser(self):
+        dispatcher = self.make_dispatcher()
+        cancelled = []
+
+        async def run(primary, secondary):
+            openai_client = AsyncOpenAI(api_key='test', base_url=f"{primary.url}/v1", max_retries=0)
+            claude_client = AsyncAnthropic(api_key='test', base_url=secondary.url, max_retries=0)
+
+            async def call_openai():
+                try:
+                    response = await openai_client.chat.completions.create(
+                        model='gpt-4o-mini', messages=[{'role': 'user', 'content': 'hola'}]
+                    )
+                    return response.choices[0].message.content
+                except asyncio.CancelledError:
+                    cancelled.append('openai')
+                    raise
+
+            async def call_claude():
+                response = await claude_client.messages.create(
+                    model='claude-test', max_tokens=10, messages=[{'role': 'user', 'content': 'hola'}]
+                )
+                return response.content[0].text
+
+            result = await dispatcher.acall({'openai': call_openai, 'anthropic': call_claude})
+            await asyncio.sleep(0)
+            return result
+
+        with FakeProviderServer('openai', 'openai', delay=2.0) as primary, \
+                FakeProviderServer('anthropic', 'claude') as secondary:
+            self.assertEqual(asyncio.run(run(primary, secondary)), ('anthropic', 'claude'))
+
+        self.assertEqual(cancelled, ['openai'])
+        self.assertEqual(dispatcher.breakers['openai'].state, CircuitBreaker.CLOSED)
+
+    def test_async_hedge_loser_is_cancelled_through_agent(self):
+        # Mismo escenario pasando por BaseAIService.aprocess_query y el single-flight
+        dispatcher = self.make_dispatcher()
+        agent = make_agent()
+        agent.openai_client = agent.claude_client = object()
+        agent.single_flight = SingleFlight()
+
+        async def run(primary):
+            openai_client = AsyncOpenAI(api_key='test', base_url=f"{primary.url}/v1", max_retries=0)
+            with mock.patch.object(LLMClientProvider, 'get_async_openai_client', return_value=openai_client), \
+                    mock.patch.object(LLMClientProvider, 'get_async_anthropic_client', return_value=FakeAsyncClaude('claude')), \
+                    mock.patch('apps.agents.services.ai_service.get_provider_dispatcher', return_value=dispatcher):
+                response = await agent.aprocess_query('hola', {})
+            await asyncio.sleep(0.05)
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            return response, pending
+
+        with FakeProviderServer('openai', 'openai', delay=2.0) as primary:
+            start = time.monotonic()
+            response, pending = asyncio.run(run(primary))
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(response, 'claude')
+        self.assertLess(elapsed, 1.5)
+        # La llamada compartida de OpenAI se canceló al irse su único solicitante
+        self.assertEqual(pending, [])
+        self.assertEqual(agent.single_flight.get_stats()['in_flight'], 0)
+        self.assertEqual(dispatcher.get_stats()['hedge_wins'], 1)
+
+
+    def stream_agent(self, dispatcher):
+        agent = make_agent()
+        agent.claude_client = FakeClaude('Hola desde Claude')
+        patcher = mock.patch('apps.agents.services.ai_service.get_provider_dispatcher', return_value=dispatcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return agent
+
+    def test_stream_falls_back_to_claude(self):
+        context = {'bypass_cache': True}
+        with FakeProviderServer('openai', 'Hola desde OpenAI') as primary:
+            dispatcher = self.make_dispatcher()
+            agent = self.stream_agent(dispatcher)
+            agent.openai_client = OpenAI(api_key='test', base_url=f"{primary.url}/v1", max_retries=0)
+            self.assertEqual(list(agent.process_query_stream('hola', context)), ['Hola', ' desde', ' OpenAI'])
+
+            # Sin cliente de OpenAI
+            agent.openai_client = None
+            self.assertEqual(''.join(agent.process_query_stream('hola', context)), 'Hola desde Claude')
+
+            # Circuito de OpenAI abierto: no recibe la petición
+            agent.openai_client = OpenAI(api_key='test', base_url=f"{primary.url}/v1", max_retries=0)
+            for _ in range(2):
+                dispatcher.breakers['openai'].record_failure()
+            self.assertEqual(''.join(agent.process_query_stream('hola', context)), 'Hola desde Claude')
+            self.assertEqual(primary.hits, 1)
+
+        # OpenAI falla antes del primer fragmento
+        dispatcher = self.make_dispatcher()
+        agent = self.stream_agent(dispatcher)
+        agent.openai_client = OpenAI(api_key='test', base_url='http://127.0.0.1:1/v1', max_retries=0)
+        self.assertEqual(''.join(agent.process_query_stream('hola', context)), 'Hola desde Claude')
+        self.assertEqual(dispatcher.get_stats()['failovers'], 1)
+
+    def test_async_stream_falls_back_to_claude(self):
+        dispatcher = self.make_dispatcher()
+        agent = self.stream_agent(dispatcher)
+        openai_client = AsyncOpenAI(api_key='test', base_url='http://127.0.0.1:1/v1', max_retries=0)
+
+        async def run():
+            with mock.patch.object(LLMClientProvider, 'get_async_openai_client', return_value=openai_client), \
+                    mock.patch.object(LLMClientProvider, 'get_async_anthropic_client',
+                                      return_value=FakeAsyncClaude('Hola desde Claude')):
+                return [delta async for delta in agent.aprocess_query_stream('hola', {'bypass_cache': True})]
+
+        self.assertEqual(asyncio.run(run()), ['Hola', ' desde', ' Claude'])
+        stats = dispatcher.get_stats()
+        self.assertEqual((stats['failovers'], stats['providers']['anthropic']['circuit']), (1, 'closed'))
+
+    def test_stream_failure_after_first_delta_is_not_retried(self):
+        dispatcher = self.make_dispatcher()
+
+        def broken():
+            yield 'Hola'
+            raise ConnectionError('conexión cortada')
+
+        def claude():
+            yield 'otra respuesta'
+
+        stream = dispatcher.stream({'openai': broken, 'anthropic': claude})
+        self.assertEqual(next(stream), 'Hola')
+        with self.assertRaises(ConnectionError):
+            next(stream)
+        self.assertEqual(dispatcher.get_stats()['failovers'], 0)
+
+
+class FakeClaude:
+    """
+    Cliente de Anthropic que responde al instante sin pasar por el SDK
+    (los parámetros aceptados por messages.create cambian entre versiones)
+    """
+
+    def __init__(self, text: str):
+        self.messages = SimpleNamespace(create=self._create, stream=self._stream)
+        self.text = text
+        self.calls = 0
+
+    def _message(self):
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=self.text)],
+            usage=SimpleNamespace(input_tokens=1, output_tokens=1)
+        )
+
+    def _words(self):
+        return [word if i == 0 else f' {word}' for i, word in enumerate(self.text.split(' '))]
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        return self._message()
+
+    @contextmanager
+    def _stream(self, **kwargs):
+        self.calls += 1
+        yield SimpleNamespace(text_stream=iter(self._words()), get_final_message=self._message)
+
+
+class FakeAsyncClaude(FakeClaude):
+    """Variante asíncrona de FakeClaude"""
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        return self._message()
+
+    @asynccontextmanager
+    async def _stream(self, **kwargs):
+        self.calls += 1
+
+        async def text_stream():
+            for word in self._words():
+                yield word
+
+        async def get_final_message():
+            return self._message()
+
+        yield SimpleNamespace(text_stream=text_stream(), get_final_message=get_final_message)
+
+
+class FakeMemory:
+    """ConversationMemory mínima que registra cada escritura; `gate` permite bloquear al escritor"""
+
+    def __init__(self, key: str, writes: list, gate: threading.Event = None):
+        self.conversation_key = key
+        self.writes = writes
+        self.gate = gate
+        self.entered = threading.Event()
+        self.stored = []
+
+    build_message = staticmethod(ConversationMemory.build_message)
+
+    def add_messages(self, messages):
+        # Los mensajes quedan guardados antes de que el escritor los dé por escritos
+        self.stored = list(reversed(messages)) + self.stored
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.writes.append((self.conversation_key, [m['content'] for m in messages]))
+        return True
+
+    def get_context(self, limit=10):
+        return self.stored[:limit]
+
+
+class TurnWriterTests(SimpleTestCase):
+    """Orden, agrupación por lotes y vaciado de la cola de escritura de conversaciones"""
+
+    def contents(self, writes, key):
+        return [content for write_key, batch in writes if write_key == key for content in batch]
+
+    def test_preserves_order_per_conversation(self):
+        writes = []
+        writer = TurnWriter()
+        memories = [FakeMemory('ana:tutor', writes), FakeMemory('luis:tutor', writes), FakeMemory('ana:quiz', writes)]
+        for i in range(30):
+            for memory in memories:
+                writer.submit_turn(memory, f'{memory.conversation_key} p{i}', f'{memory.conversation_key} r{i}')
+        writer.close()
+
+        for memory in memories:
+            key = memory.conversation_key
+            expected = [text for i in range(30) for text in (f'{key} p{i}', f'{key} r{i}')]
+            self.assertEqual(self.contents(writes, key), expected)
+
+    def test_batches_queued_turns_per_conversation(self):
+        writes = []
+        gate = threading.Event()
+        writer = TurnWriter(batch_size=100)
+        first = FakeMemory('ana:tutor', writes, gate)
+        second = FakeMemory('luis:tutor', writes)
+
+        writer.submit_turn(first, 'p1', 'r1')
+        self.assertTrue(first.entered.wait(5))
+        # Mientras el escritor está ocupado, los turnos se acumulan en la cola
+        writer.submit_turn(first, 'p2', 'r2')
+        writer.submit_turn(second, 'q1', 's1')
+        writer.submit_turn(first, 'p3', 'r3')
+        writer.submit_turn(second, 'q2', 's2')
+        gate.set()
+        writer.flush()
+
+        self.assertEqual(writes, [
+            ('ana:tutor', ['p1', 'r1']),
+            ('ana:tutor', ['p2', 'r2', 'p3', 'r3']),
+            ('luis:tutor', ['q1', 's1', 'q2', 's2']),
+        ])
+        self.assertEqual(writer.get_stats()['batches'], 2)
+        writer.close()
+
+    def test_context_includes_queued_turns(self):
+        writes = []
+        gate = threading.Event()
+        writer = TurnWriter()
+        memory = FakeMemory('ana:tutor', writes, gate)
+        other = FakeMemory('luis:tutor', writes)
+
+        writer.submit_turn(memory, 'p1', 'r1')
+        self.assertTrue(memory.entered.wait(5))
+        # p1/r1 ya están en el almacén pero el escritor no ha terminado; p2/r2 siguen en cola
+        writer.submit_turn(memory, 'p2', 'r2')
+        writer.submit_turn(other, 'q1', 's1')
+
+        def contents(limit=10):
+            return [message['content'] for message in writer.get_context(memory, limit=limit)]
+
+        self.assertEqual(contents(), ['r2', 'p2', 'r1', 'p1'])
+        self.assertEqual(contents(limit=3), ['r2', 'p2', 'r1'])
+
+        gate.set()
+        writer.flush()
+        self.assertEqual(contents(), ['r2', 'p2', 'r1', 'p1'])
+        self.assertEqual(writer._pending, {})
+        writer.close()
+
+    def test_close_drains_queue(self):
+        writes = []
+        gate = threading.Event()
+        writer = TurnWriter()
+        memory = FakeMemory('ana:tutor', writes, gate)
+
+        for i in range(5):
+            writer.submit_turn(memory, f'p{i}', f'r{i}')
+        threading.Timer(0.1, gate.set).start()
+        writer.close()
+
+        self.assertEqual(self.contents(writes, 'ana:tutor'), [t for i in range(5) for t in (f'p{i}', f'r{i}')])
+        self.assertEqual(writer.get_stats()['queue_depth'], 0)
+
+        # Tras cerrar, los turnos se escriben de forma síncrona
+        self.assertFalse(writer.submit_turn(memory, 'tarde', 'respuesta'))
+        self.assertEqual(writes[-1], ('ana:tutor', ['tarde', 'respuesta']))
+
+    def test_full_queue_blocks_instead_of_reordering(self):
+        writes = []
+        gate = threading.Event()
+        writer = TurnWriter(max_queue=1)
+        memory = FakeMemory('ana:tutor', writes, gate)
+
+        writer.submit_turn(memory, 'p1', 'r1')
+        self.assertTrue(memory.entered.wait(5))
+        writer.submit_turn(memory, 'p2', 'r2')
+        blocked = threading.Thread(target=writer.submit_turn, args=(memory, 'p3', 'r3'))
+        blocked.start()
+        blocked.join(0.2)
+        self.assertTrue(blocked.is_alive())
+
+        gate.set()
+        blocked.join(5)
+        writer.close()
+
+        self.assertEqual(self.contents(writes, 'ana:tutor'), ['p1', 'r1', 'p2', 'r2', 'p3', 'r3'])
+        self.assertEqual(writer.get_stats()['blocked'], 1)
+
+    def test_conversation_memory_batch_write(self):
+        memory = ConversationMemory('writer-test', 'tutor')
+        memory.clear_memory()
+        writer = TurnWriter()
+        writer.submit_turn(memory, 'hola', 'buenas')
+        writer.submit_turn(memory, 'fracciones', 'una fracción es...')
+        writer.close()
+
+        self.assertEqual(
+            [m['content'] for m in memory.get_context(limit=10)],
+            ['una fracción es...', 'fracciones', 'buenas', 'hola']
+        )
+        self.assertTrue(memory.get_session_metadata()['session_active'])
+
+
+class TracingTests(SimpleTestCase):
+    """Spans de la traza activa, también desde los hilos del recopilador de contexto"""
+
+    def test_spans_without_trace_are_noop(self):
+        with span('prompt.build') as current:
+            current.set(tokens=10)
+
+    def test_context_sources_are_traced_across_threads(self):
+        trace = Trace('chat')
+        gatherer = ContextGatherer(default_timeout=1.0)
+        with use_trace(trace, finish=False):
+            with span('context.gather'):
+                gatherer.gather({
+                    'history': ContextSource(lambda: ['hola'], []),
+                    'documents': ContextSource(lambda: time.sleep(0.05) or ['doc'], []),
+                })
+            accumulate('tokens.count', 0.001, hits=1)
+
+        spans = {s['name']: s for s in trace.to_dict()['spans']}
+        self.assertEqual(set(spans), {'context.gather', 'context.history', 'context.documents'})
+        self.assertEqual(spans['context.documents']['parent'], 'context.gather')
+        self.assertGreaterEqual(spans['context.gather']['duration_ms'], spans['context.documents']['duration_ms'])
+        self.assertEqual(trace.to_dict()['aggregates']['tokens.count']['hits'], 1)
+
+
+class MetricsTests(SimpleTestCase):
+    """Histogramas de latencia: percentiles, escrituras concurrentes y formato Prometheus"""
+
+    def test_quantiles_track_the_tail(self):
+        histogram = Histogram('latency_seconds', 'Latencia', ['agent'])
+        for i in range(1, 1001):
+            histogram.observe(i / 1000, agent='tutor')
+
+        summary = histogram.summary(agent='tutor')
+        self.assertEqual(summary['count'], 1000)
+        self.assertAlmostEqual(summary['avg'], 0.5005, places=3)
+        for key, expected in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            self.assertAlmostEqual(summary[key], expected, delta=expected * 0.1)
+        self.assertEqual(histogram.summary(agent='quiz')['p95'], 0.0)
+
+    def test_concurrent_observations_are_not_lost(self):
+        histogram = Histogram('latency_seconds', 'Latencia', ['agent'])
+
+        def observe(agent):
+            for _ in range(2000):
+                histogram.observe(0.1, agent=agent)
+
+        threads = [threading.Thread(target=observe, args=(agent,)) for agent in ('tutor', 'quiz') * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(histogram.count_and_sum()[0], 16000)
+        self.assertEqual(histogram.snapshot(agent='quiz')['count'], 8000)
+
+    def test_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        latency = registry.histogram('agent_request_duration_seconds', 'Latencia', ['agent'], buckets=(0.1, 1.0))
+        errors = registry.counter('agent_request_errors_total', 'Errores', ['agent', 'error'])
+        latency.observe(0.05, agent='tutor')
+        latency.observe(2.0, agent='tutor')
+        errors.inc(agent='tutor', error='TimeoutError')
+        self.assertIs(registry.histogram('agent_request_duration_seconds', 'Latencia', ['agent']), latency)
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE agent_request_duration_seconds histogram', lines)
+        self.assertIn('agent_request_duration_seconds_bucket{agent="tutor",le="0.1"} 1', lines)
+        self.assertIn('agent_request_duration_seconds_bucket{agent="tutor",le="1"} 1', lines)
+        self.assertIn('agent_request_duration_seconds_bucket{agent="tutor",le="+Inf"} 2', lines)
+        self.assertIn('agent_request_duration_seconds_count{agent="tutor"} 2', lines)
+        self.assertIn('agent_request_errors_total{agent="tutor",error="TimeoutError"} 1', lines)
+
+
+class FakeEncoding:
+    """Codificación por palabras (tiktoken descarga su vocabulario la primera vez)"""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return ' '.join(tokens)
+
+
+class EchoAgent(BaseAIService):
+    """Agente mínimo: solo el prompt del sistema y el nombre"""
+
+    def get_system_prompt(self) -> str:
+        return "Eres un agente de pruebas."
+
+    def get_agent_name(self) -> str:
+        return "Agente de pruebas"
+
+
+def make_agent(cls=EchoAgent):
+    with mock.patch.object(LLMClientProvider, 'get_encoding', return_value=FakeEncoding()):
+        return cls()
+
+
+class FakeChatMemory:
+    """ConversationMemory sin persistencia para las vistas de chat"""
+
+    def __init__(self, user_id, agent_type):
+        self.conversation_key = f"{user_id}:{agent_type}"
+
+    def get_context(self, limit=10):
+        return []
+
+    def get_session_metadata(self):
+        return {}
+
+
+class FakeTurnWriter:
+    def __init__(self):
+        self.turns = []
+
+    def submit_turn(self, memory, message, response):
+        self.turns.append((memory.conversation_key, message, response))
+
+    def get_context(self, memory, limit=10):
+        return memory.get_context(limit)
+
+
+def parse_sse(frame: bytes) -> dict:
+    event, data = frame.decode().strip().split('\n')
+    return json.loads(data[len('data: '):])
+
+
+class AsyncStreamingTests(SimpleTestCase):
+    """El endpoint SSE bajo ASGI emite cada fragmento en cuanto llega del modelo"""
+
+    async def test_first_delta_arrives_before_stream_ends(self):
+        gate = threading.Event()
+        manager = AgentManager()
+        manager.agents['tutor'] = make_agent()
+        turn_writer = FakeTurnWriter()
+
+        with FakeProviderServer('openai', 'Hola desde el modelo', stream_gate=gate) as server, \
+                mock.patch.object(LLMClientProvider, 'get_async_openai_client', return_value=AsyncOpenAI(
+                    api_key='test', base_url=f"{server.url}/v1", max_retries=0)), \
+                mock.patch('apps.agents.views.get_agent_manager', return_value=manager), \
+                mock.patch.object(AgentContextMixin, '_init_rag_service', return_value=None), \
+                mock.patch('apps.agents.views.ConversationMemory', FakeChatMemory), \
+                mock.patch('apps.agents.views.get_turn_writer', return_value=turn_writer):
+            response = await AsyncClient(HTTP_HOST='localhost').post(
+                '/api/agents/chat/stream/', {'text': 'hola', 'agent_type': 'tutor', 'userId': 'alumno'},
+                content_type='application/json'
+            )
+            self.assertTrue(response.is_async)
+            frames = response.streaming_content.__aiter__()
+
+            # El modelo aún no ha enviado el resto: el primer 'delta' llega antes del final
+            start = parse_sse(await asyncio.wait_for(anext(frames), 5))
+            first = parse_sse(await asyncio.wait_for(anext(frames), 5))
+            self.assertEqual((start['type'], first['type'], first['content']), ('start', 'delta', 'Hola'))
+            self.assertFalse(gate.is_set())
+
+            gate.set()
+            events = [parse_sse(frame) async for frame in frames]
+
+        self.assertEqual(events[-1]['type'], 'done')
+        self.assertEqual(events[-1]['response'], 'Hola desde el modelo')
+        self.assertEqual(''.join(event['content'] for event in [first] + events[:-1]), 'Hola desde el modelo')
+        self.assertEqual(turn_writer.turns, [('alumno:tutor', 'hola', 'Hola desde el modelo')])
+
+
+class SpecializedRequestTests(SimpleTestCase):
+    """Las cuatro variantes de consulta especializada envían la consulta que construye el agente"""
+
+    def setUp(self):
+        self.agent = make_agent(QuizAgent)
+        self.sent = []
+
+        def process_query(prompt, context):
+            self.sent.append((prompt, context))
+            return 'respuesta'
+
+        def process_query_stream(prompt, context):
+            self.sent.append((prompt, context))
+            yield 'respuesta'
+
+        async def aprocess_query(prompt, context):
+            return process_query(prompt, context)
+
+        async def aprocess_query_stream(prompt, context):
+            yield process_query(prompt, context)
+
+        for name, fn in (('process_query', process_query), ('process_query_stream', process_query_stream),
+                         ('aprocess_query', aprocess_query), ('aprocess_query_stream', aprocess_query_stream)):
+            patcher = mock.patch.object(self.agent, name, side_effect=fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_all(self, context):
+        async def collect(stream):
+            return [delta async for delta in stream]
+
+        return [
+            self.agent.process_specialized_query('quiz', context),
+            ''.join(self.agent.process_specialized_query_stream('quiz', context)),
+            asyncio.run(self.agent.aprocess_specialized_query('quiz', context)),
+            ''.join(asyncio.run(collect(self.agent.aprocess_specialized_query_stream('quiz', context)))),
+        ]
+
+    def test_all_variants_send_the_built_request(self):
+        context = {'explicit_context': 'Las fracciones tienen numerador y denominador.'}
+        prompt, prompt_context = self.agent.build_specialized_request('quiz', context)
+        self.assertIn('Las fracciones tienen numerador', prompt)
+
+        self.assertEqual(self.run_all(context), ['respuesta'] * 4)
+        self.assertEqual(self.sent, [(prompt, prompt_context)] * 4)
+
+    def test_local_response_skips_the_model(self):
+        responses = self.run_all({'explicit_context': '  '})
+        self.assertEqual(set(responses), {self.agent.get_local_response('quiz', {})})
+        self.assertTrue(responses[0].startswith('Error'))
+        self.assertEqual(self.sent, [])
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("La condición no se cumplió a tiempo")
+        time.sleep(0.005)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Agrupación de peticiones idénticas en curso"""
+
+    def run_coalesced(self, single_flight, fn, followers=3):
+        """Lanzar un líder y `followers` hilos con la misma clave; devuelve resultados o excepciones"""
+        gate = threading.Event()
+        outcomes = []
+
+        def upstream():
+            gate.wait(5)
+            return fn()
+
+        def request():
+            try:
+                outcomes.append(single_flight.do('clave', upstream))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=request) for _ in range(followers + 1)]
+        threads[0].start()
+        wait_until(lambda: single_flight.get_stats()['in_flight'] == 1)
+        for thread in threads[1:]:
+            thread.start()
+        wait_until(lambda: single_flight.get_stats()['coalesced'] == followers)
+        gate.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_followers_share_leader_result(self):
+        single_flight = SingleFlight()
+        calls = []
+        outcomes = self.run_coalesced(single_flight, lambda: calls.append(1) or 'respuesta')
+
+        self.assertEqual(outcomes, ['respuesta'] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(single_flight.get_stats()['in_flight'], 0)
+        self.assertEqual(single_flight.do('clave', lambda: 'nueva'), 'nueva')
+
+    def test_leader_exception_reaches_followers(self):
+        single_flight = SingleFlight()
+
+        def fail():
+            raise ValueError('proveedor caído')
+
+        outcomes = self.run_coalesced(single_flight, fail)
+
+        self.assertEqual(len(outcomes), 4)
+        self.assertTrue(all(isinstance(outcome, ValueError) for outcome in outcomes))
+        self.assertEqual(single_flight.get_stats()['in_flight'], 0)
+
+    def test_follower_wait_times_out(self):
+        single_flight = SingleFlight(wait_timeout=0.1)
+        gate = threading.Event()
+        leader = threading.Thread(target=single_flight.do, args=('clave', lambda: gate.wait(5)))
+        leader.start()
+        wait_until(lambda: single_flight.get_stats()['in_flight'] == 1)
+
+        with self.assertRaises(TimeoutError):
+            single_flight.do('clave', lambda: 'no debe llamarse')
+        gate.set()
+        leader.join(5)
+        self.assertEqual(single_flight.get_stats()['timeouts'], 1)
+
+    def test_async_call_survives_disconnecting_requester(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def run():
+            release = asyncio.Event()
+
+            async def upstream():
+                calls.append(1)
+                await release.wait()
+                return 'respuesta'
+
+            leaving = asyncio.create_task(single_flight.ado('clave', upstream))
+            staying = asyncio.create_task(single_flight.ado('clave', upstream))
+            await asyncio.sleep(0.01)
+            # El cliente que inició la llamada se desconecta; el otro sigue esperando
+            leaving.cancel()
+            await asyncio.sleep(0.01)
+            release.set()
+            return leaving, await asyncio.wait_for(staying, 5)
+
+        leaving, result = asyncio.run(run())
+
+        self.assertTrue(leaving.cancelled())
+        self.assertEqual(result, 'respuesta')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(single_flight.get_stats()['coalesced'], 1)
+
+
+class RateLimiterTests(SimpleTestCase):
+    """Cubos RPM/TPM y cola por prioridad del limitador de proveedores"""
+
+    def test_buckets_refill_continuously(self):
+        requests = TokenBucket(60)
+        now = time.monotonic()
+        self.assertEqual(requests.wait_time(1, now), 0.0)
+        requests.consume(60)
+        self.assertAlmostEqual(requests.wait_time(1, now), 1.0, places=3)
+        self.assertAlmostEqual(requests.wait_time(1, now + 0.5), 0.5, places=3)
+        self.assertEqual(requests.wait_time(1, now + 1.0), 0.0)
+        requests.wait_time(0, now + 3600)
+        self.assertEqual(requests.tokens, 60)
+
+        tokens = TokenBucket(6000)
+        tokens.consume(6000)
+        self.assertAlmostEqual(tokens.wait_time(500, now), 5.0, places=3)
+        # Una petición mayor que el cubo entero espera a que se llene, no para siempre
+        self.assertAlmostEqual(tokens.wait_time(10 ** 6, now), 60.0, places=3)
+
+    def test_tpm_limit_delays_until_refill(self):
+        limiter = ProviderRateLimiter('test', rpm=0, tpm=60000)
+        self.assertEqual(limiter.acquire(60000), 0.0)
+        waited = limiter.acquire(100)
+        self.assertGreater(waited, 0.05)
+        self.assertLess(waited, 1.0)
+        stats = limiter.get_stats()
+        self.assertEqual((stats['granted'], stats['queued'], stats['available_requests']), (2, 1, None))
+
+    def test_timeout_at_deadline(self):
+        limiter = ProviderRateLimiter('test', rpm=6, tpm=0)
+        limiter.requests.tokens = 0
+
+        start = time.monotonic()
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(1, max_wait=0.2)
+        elapsed = time.monotonic() - start
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertLess(elapsed, 1.0)
+
+        with self.assertRaises(RateLimitTimeout):
+            asyncio.run(limiter.aacquire(1, max_wait=0.2))
+
+        stats = limiter.get_stats()
+        self.assertEqual((stats['timeouts'], stats['granted'], stats['queue_depth']), (2, 0, 0))
+
+    def test_priority_order_and_queue_depth(self):
+        # 0.1 peticiones por segundo: nada se concede solo durante el test
+        limiter = ProviderRateLimiter('test', rpm=6, tpm=0)
+        limiter.requests.tokens = 0
+        granted = []
+
+        def request(priority):
+            limiter.acquire(1, priority)
+            granted.append(priority)
+
+        threads = []
+        for priority in ('background', 'standard', 'interactive'):
+            threads.append(threading.Thread(target=request, args=(priority,)))
+            threads[-1].start()
+            wait_until(lambda: limiter.get_stats()['queue_depth'] == len(threads))
+
+        stats = limiter.get_stats()
+        self.assertEqual(stats['queue_depth_by_priority'], {'interactive': 1, 'standard': 1, 'background': 1})
+
+        for expected in range(1, 4):
+            # Liberar cupo para una sola petición y despertar a la cabeza de la cola
+            with limiter._lock:
+                limiter.requests.tokens = 1
+                limiter._wake_head()
+            wait_until(lambda: len(granted) == expected)
+            self.assertEqual(limiter.get_stats()['queue_depth'], 3 - expected)
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(granted, ['interactive', 'standard', 'background'])
+        stats = limiter.get_stats()
+        self.assertEqual((stats['granted'], stats['queued'], stats['timeouts']), (3, 3, 0))
+
+
+class ResponseCacheTests(SimpleTestCase):
+    """Aciertos, fallos y expiración de la caché de respuestas por huella de la petición"""
+
+    def make_cached_agent(self, ttl=60):
+        agent = make_agent()
+        agent.response_cache = ResponseCache(InMemoryLRUBackend())
+        agent.response_cache_ttl = ttl
+        agent.single_flight = SingleFlight()
+        agent.claude_client = FakeClaude('respuesta')
+        return agent
+
+    def test_identical_request_is_served_from_cache(self):
+        agent = self.make_cached_agent()
+        self.assertEqual(agent._complete_with_claude('hola', {}), 'respuesta')
+        agent.claude_client.text = 'otra respuesta'
+
+        self.assertEqual(agent._complete_with_claude('hola', {}), 'respuesta')
+        self.assertEqual(agent.claude_client.calls, 1)
+        stats = agent.response_cache.get_stats(agent.get_agent_name())
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']), (1, 1, 1))
+
+    def test_changed_model_temperature_or_prompt_misses(self):
+        agent = self.make_cached_agent()
+        agent._complete_with_claude('hola', {})
+
+        with mock.patch.dict(os.environ, {'CLAUDE_MODEL': 'claude-otro'}):
+            agent._complete_with_claude('hola', {})
+        agent.temperature = 0.1
+        agent._complete_with_claude('hola', {})
+        agent._complete_with_claude('adiós', {})
+
+        self.assertEqual(agent.claude_client.calls, 4)
+        self.assertEqual(agent.response_cache.get_stats()['hits'], 0)
+        self.assertEqual(len(agent.response_cache.backend), 4)
+
+    def test_bypass_cache_forces_regeneration(self):
+        agent = self.make_cached_agent()
+        agent._complete_with_claude('hola', {})
+        agent.claude_client.text = 'nueva'
+
+        self.assertEqual(agent._complete_with_claude('hola', {'bypass_cache': True}), 'nueva')
+        self.assertEqual(agent.claude_client.calls, 2)
+        # La respuesta regenerada reemplaza a la cacheada
+        self.assertEqual(agent._complete_with_claude('hola', {}), 'nueva')
+        self.assertEqual(agent.claude_client.calls, 2)
+
+    def test_agent_without_ttl_never_stores(self):
+        agent = self.make_cached_agent(ttl=0)
+        agent._complete_with_claude('hola', {})
+        agent._complete_with_claude('hola', {})
+
+        self.assertEqual(agent.claude_client.calls, 2)
+        self.assertEqual(len(agent.response_cache.backend), 0)
+        self.assertEqual(agent.response_cache.get_stats()['stores'], 0)
+
+    def test_memory_backend_expires_entries(self):
+        backend = InMemoryLRUBackend()
+        with mock.patch('apps.agents.services.response_cache.time.monotonic', return_value=100.0):
+            backend.set('clave', 'valor', ttl=10)
+        with mock.patch('apps.agents.services.response_cache.time.monotonic', return_value=109.0):
+            self.assertEqual(backend.get('clave'), 'valor')
+        with mock.patch('apps.agents.services.response_cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(backend.get('clave'))
+        self.assertEqual(len(backend), 0)
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        backend = InMemoryLRUBackend(max_entries=2)
+        backend.set('a', '1', ttl=60)
+        backend.set('b', '2', ttl=60)
+        backend.get('a')
+        backend.set('c', '3', ttl=60)
+
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual((backend.get('a'), backend.get('c')), ('1', '3'))
+
+
+class ContextAssemblerTests(SimpleTestCase):
+    """Reparto del presupuesto de tokens entre secciones (un token por palabra)"""
+
+    def setUp(self):
+        self.assembler = ContextAssembler(
+            lambda text: len(text.split()),
+            lambda text, max_tokens: ' '.join(text.split()[:max_tokens])
+        )
+
+    def words(self, count, prefix='p'):
+        return ' '.join(f'{prefix}{i}' for i in range(count)) + '. '
+
+    def test_required_sections_survive_tiny_budget(self):
+        sections = [
+            PromptSection('query', ['Consulta del estudiante con seis palabras'], required=True),
+            PromptSection('instructions', ['Responde en español.'], required=True),
+            PromptSection('rag', [self.words(20)], priority=1),
+        ]
+        rendered, total = self.assembler.assemble(sections, budget=2)
+
+        self.assertEqual(rendered['query'], 'Consulta del estudiante con seis palabras')
+        self.assertEqual(rendered['instructions'], 'Responde en español.')
+        self.assertEqual(rendered['rag'], '')
+        self.assertEqual(total, 9)
+
+    def test_budget_goes_to_higher_priority_first(self):
+        sections = [
+            PromptSection('history', [self.words(10, 'h')], priority=2),
+            PromptSection('rag', [self.words(10, 'r')], priority=1),
+        ]
+        rendered, total = self.assembler.assemble(sections, budget=12)
+
+        self.assertEqual(rendered['rag'], self.words(10, 'r'))
+        # La sección de menor prioridad solo recibe lo que sobra
+        self.assertEqual(rendered['history'], 'h0 h1...')
+        self.assertEqual(total, 12)
+
+    def test_max_share_caps_first_pass(self):
+        sections = [
+            PromptSection('rag', [self.words(5, 'r') for _ in range(4)], priority=1, max_share=0.5),
+            PromptSection('history', [self.words(5, 'h') for _ in range(4)], priority=2),
+        ]
+        rendered, _ = self.assembler.assemble(sections, budget=20)
+
+        # Sin la cuota, la sección prioritaria se quedaría con todo el presupuesto
+        self.assertEqual(rendered['rag'], self.words(5, 'r') * 2)
+        self.assertEqual(rendered['history'], self.words(5, 'h') * 2)
+
+    def test_leftover_budget_returns_to_capped_section(self):
+        sections = [
+            PromptSection('rag', [self.words(5, 'r') for _ in range(4)], priority=1, max_share=0.5),
+            PromptSection('history', [self.words(5, 'h')], priority=2),
+        ]
+        rendered, total = self.assembler.assemble(sections, budget=20)
+
+        self.assertEqual(rendered['history'], self.words(5, 'h'))
+        self.assertEqual(rendered['rag'], self.words(5, 'r') * 3)
+        self.assertEqual(total, 20)
+
+    def test_trim_to_sentences_stops_at_sentence_boundary(self):
+        text = 'Primera frase corta. Segunda frase algo más larga. Tercera.'
+
+        self.assertEqual(self.assembler.trim_to_sentences(text, 5), ('Primera frase corta.', 3))
+        self.assertEqual(self.assembler.trim_to_sentences(text, 8),
+                         ('Primera frase corta. Segunda frase algo más larga.', 8))
+        self.assertEqual(self.assembler.trim_to_sentences(text, 0), ('', 0))
+
+    def test_trim_to_sentences_truncates_when_first_sentence_does_not_fit(self):
+        text = 'Una frase demasiado larga para el límite.\n'
+
+        self.assertEqual(self.assembler.trim_to_sentences(text, 2), ('Una frase...\n', 2))
+
+    def test_trimmed_section_keeps_whole_sentences(self):
+        sections = [
+            PromptSection('rag', ['Uno dos tres. Cuatro cinco seis. Siete ocho.'], header='Docs: ', priority=1),
+        ]
+        rendered, total = self.assembler.assemble(sections, budget=7)
+
+        self.assertEqual(rendered['rag'], 'Docs: Uno dos tres. Cuatro cinco seis.')
+        self.assertEqual(total, 7)
+
+
+class ContextGathererTests(SimpleTestCase):
+    """Las fuentes lentas o con errores degradan a su valor por defecto sin tumbar la consulta"""
+
+    def setUp(self):
+        self.gatherer = ContextGatherer(default_timeout=1.0)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def sources(self):
+        def failing():
+            raise ConnectionError('sin conexión')
+
+        return {
+            'history': ContextSource(lambda: ['hola'], []),
+            'documents': ContextSource(lambda: self.release.wait(5) and ['tarde'], [], timeout=0.1),
+            'profile': ContextSource(failing, {}),
+        }
+
+    def assert_degraded(self, results, elapsed):
+        self.assertEqual(results, {'history': ['hola'], 'documents': [], 'profile': {}})
+        # Se espera el plazo de la fuente lenta, no el por defecto ni lo que tarda la fuente
+        self.assertLess(elapsed, 0.8)
+        sources = self.gatherer.get_stats()['sources']
+        self.assertEqual((sources['documents']['timeouts'], sources['documents']['errors']), (1, 0))
+        self.assertEqual((sources['profile']['timeouts'], sources['profile']['errors']), (0, 1))
+        self.assertEqual((sources['history']['timeouts'], sources['history']['errors']), (0, 0))
+
+    def test_gather_degrades_slow_and_failing_sources(self):
+        start = time.monotonic()
+        results = self.gatherer.gather(self.sources())
+        self.assert_degraded(results, time.monotonic() - start)
+
+    def test_agather_degrades_slow_and_failing_sources(self):
+        start = time.monotonic()
+        results = asyncio.run(self.gatherer.agather(self.sources()))
+        self.assert_degraded(results, time.monotonic() - start)
+
+    def test_counters_accumulate_across_stages(self):
+        self.gatherer.gather(self.sources())
+        asyncio.run(self.gatherer.agather(self.sources()))
+
+        stats = self.gatherer.get_stats()
+        self.assertEqual(stats['stages'], 2)
+        self.assertEqual(stats['sources']['documents']['timeouts'], 2)
+        self.assertEqual(stats['sources']['profile']['errors'], 2)
+
+
+class CountingEncoding(FakeEncoding):
+    """FakeEncoding que cuenta las codificaciones reales"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        return super().encode(text)
+
+
+class PromptCountingAgent(EchoAgent):
+    builds = 0
+
+    def get_system_prompt(self) -> str:
+        PromptCountingAgent.builds += 1
+        return "Prompt del sistema con seis palabras."
+
+
+class OtherPromptAgent(PromptCountingAgent):
+    def get_agent_name(self) -> str:
+        return "Otro agente"
+
+
+class PromptCompilationTests(SimpleTestCase):
+    """Memo de conteos de tokens y prompts compilados una vez por (clase, nombre)"""
+
+    def setUp(self):
+        PromptCountingAgent.builds = 0
+        patcher = mock.patch.dict('apps.agents.services.ai_service._compiled_prompts', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_counts_hit_the_memo(self):
+        encoding = CountingEncoding()
+        agent = make_agent()
+        agent.token_counter = TokenCounter(encoding)
+
+        for _ in range(3):
+            self.assertEqual(agent.count_tokens('fragmento RAG repetido'), 3)
+        agent.count_tokens('otro texto')
+
+        self.assertEqual(encoding.encoded, ['fragmento RAG repetido', 'otro texto'])
+        stats = agent.token_counter.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (2, 2, 2))
+
+    def test_memo_evicts_least_recently_used(self):
+        encoding = CountingEncoding()
+        counter = TokenCounter(encoding, max_entries=2)
+        counter.count('a')
+        counter.count('b')
+        counter.count('a')
+        counter.count('c')
+        counter.count('a')
+        counter.count('b')
+
+        self.assertEqual(encoding.encoded, ['a', 'b', 'c', 'b'])
+
+    def test_system_prompt_is_compiled_once_per_class(self):
+        first, second = make_agent(PromptCountingAgent), make_agent(PromptCountingAgent)
+
+        self.assertEqual(first.get_compiled_system_prompt(), ("Prompt del sistema con seis palabras.", 6))
+        self.assertIs(first.get_compiled_system_prompt(), second.get_compiled_system_prompt())
+        self.assertEqual(PromptCountingAgent.builds, 1)
+
+        # Una subclase tiene su propia entrada aunque herede el prompt
+        make_agent(OtherPromptAgent).get_compiled_system_prompt()
+        self.assertEqual(PromptCountingAgent.builds, 2)
+
+    def test_instructions_are_cached_per_name(self):
+        agent = make_agent(PromptCountingAgent)
+
+        chat = agent._get_instructions(False)
+        quiz = agent._get_instructions(True)
+
+        self.assertIn('PROHIBIDO', chat)
+        self.assertIn('MODO QUIZ', quiz)
+        self.assertIs(agent._get_instructions(False), chat)
+        self.assertIs(make_agent(PromptCountingAgent)._get_instructions(True), quiz)
+        self.assertIn((PromptCountingAgent, 'instructions'), _compiled_prompts)
+        self.assertNotIn((OtherPromptAgent, 'instructions'), _compiled_prompts)
+
+
+class ClientPoolTests(SimpleTestCase):
+    """Todos los agentes comparten los clientes del proveedor, que se recrean tras un fork"""
+
+    def setUp(self):
+        self.provider = LLMClientProvider()
+        self.addCleanup(self.provider.close)
+        for patcher in (
+            mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'sk-test', 'ANTHROPIC_API_KEY': 'test'}),
+            mock.patch('apps.agents.services.ai_service.get_client_provider', return_value=self.provider),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_agents_share_sync_clients(self):
+        tutor, quiz = make_agent(), make_agent(QuizAgent)
+
+        self.assertIsNotNone(tutor.openai_client)
+        self.assertIs(tutor.openai_client, quiz.openai_client)
+        self.assertIsNotNone(tutor.claude_client)
+        self.assertIs(tutor.claude_client, quiz.claude_client)
+
+    def test_agents_share_async_clients_per_event_loop(self):
+        tutor, quiz = make_agent(), make_agent(QuizAgent)
+        for agent in (tutor, quiz):
+            agent.single_flight = SingleFlight()
+
+        async def ask_both():
+            await tutor._acomplete_with_openai('hola', {'bypass_cache': True})
+            await quiz._acomplete_with_openai('adiós', {'bypass_cache': True})
+            return self.provider.get_async_openai_client(), self.provider.get_async_anthropic_client()
+
+        create_openai = mock.patch.object(
+            self.provider, '_create_async_openai_client', wraps=self.provider._create_async_openai_client
+        )
+        with FakeProviderServer('openai', 'respuesta') as server, create_openai as factory, \
+                mock.patch.dict(os.environ, {'OPENAI_BASE_URL': f"{server.url}/v1"}):
+            first_openai, first_claude = asyncio.run(ask_both())
+            second_openai, second_claude = asyncio.run(ask_both())
+
+        self.assertEqual(server.hits, 4)
+        # Un cliente por event loop, compartido por los dos agentes
+        self.assertEqual(factory.call_count, 2)
+        self.assertIsNot(first_openai, second_openai)
+        self.assertIsNot(first_claude, second_claude)
+
+    def test_clients_are_rebuilt_after_fork(self):
+        parent = make_agent()
+        parent_pid = self.provider.get_stats()['pid']
+
+        with mock.patch('apps.agents.services.client_provider.os.getpid', return_value=parent_pid + 1):
+            child, sibling = make_agent(), make_agent(QuizAgent)
+
+            self.assertIsNot(child.openai_client, parent.openai_client)
+            self.assertIsNot(child.claude_client, parent.claude_client)
+            self.assertIs(child.openai_client, sibling.openai_client)
+            self.assertIs(child.claude_client, sibling.claude_client)
+            self.assertEqual(self.provider.get_stats()['pid'], parent_pid + 1)
+
+    def test_async_clients_are_rebuilt_after_fork(self):
+        async def clients():
+            return self.provider.get_async_openai_client(), self.provider.get_async_semaphore()
+
+        async def before_and_after_fork():
+            parent = await clients()
+            with mock.patch('apps.agents.services.client_provider.os.getpid', return_value=os.getpid() + 1):
+                child = await clients()
+            return parent, child
+
+        (parent_client, parent_semaphore), (child_client, child_semaphore) = asyncio.run(before_and_after_fork())
+
+        self.assertIsNot(parent_client, child_client)
+        self.assertIsNot(parent_semaphore, child_semaphore)
+
+
+class AgentManagerLifecycleTests(SimpleTestCase):
+    """Gestor único por proceso, construcción perezosa de los agentes y recarga aislada"""
+
+    def setUp(self):
+        self.built = []
+        self.build_lock = threading.Lock()
+
+    def factory(self, agent_id, delay=0.0):
+        def build():
+            with self.build_lock:
+                self.built.append(agent_id)
+            time.sleep(delay)
+            return SimpleNamespace(agent_id=agent_id)
+        return build
+
+    def concurrently(self, fn, workers=8):
+        barrier = threading.Barrier(workers)
+        results = [None] * workers
+
+        def run(i):
+            barrier.wait(5)
+            results[i] = fn()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_agent_manager_is_a_process_singleton(self):
+        original_init = AgentManager.__init__
+
+        def slow_init(manager):
+            self.built.append('manager')
+            time.sleep(0.05)
+            original_init(manager)
+
+        with mock.patch('apps.agents.services.agent_manager._agent_manager', None), \
+                mock.patch.object(AgentManager, '__init__', slow_init):
+            managers = self.concurrently(get_agent_manager)
+            self.assertIs(get_agent_manager(), managers[0])
+
+        self.assertTrue(all(manager is managers[0] for manager in managers))
+        self.assertEqual(self.built, ['manager'])
+
+    def test_agents_are_built_lazily_once(self):
+        with mock.patch.dict(AGENT_CLASSES, {'tutor': self.factory('tutor', delay=0.05),
+                                             'quiz': self.factory('quiz')}):
+            manager = AgentManager()
+            self.assertEqual(manager.agents, {})
+
+            agents = self.concurrently(lambda: manager.get_agent('tutor'))
+
+            self.assertTrue(all(agent is agents[0] for agent in agents))
+            self.assertEqual(self.built, ['tutor'])
+            self.assertEqual(list(manager.agents), ['tutor'])
+            with self.assertRaises(ValueError):
+                manager.get_agent('desconocido')
+
+    def test_reload_swaps_only_the_reloaded_agent(self):
+        with mock.patch.dict(AGENT_CLASSES, {'tutor': self.factory('tutor'), 'quiz': self.factory('quiz')}):
+            manager = AgentManager()
+            tutor, quiz = manager.get_agent('tutor'), manager.get_agent('quiz')
+
+            self.assertTrue(manager.reload_agent('tutor'))
+
+            self.assertIsNot(manager.get_agent('tutor'), tutor)
+            self.assertIs(manager.get_agent('quiz'), quiz)
+            self.assertEqual(self.built, ['tutor', 'quiz', 'tutor'])
+            self.assertFalse(manager.reload_agent('desconocido'))
+
+    def test_failed_reload_keeps_current_agent(self):
+        def broken():
+            raise RuntimeError('configuración inválida')
+
+        with mock.patch.dict(AGENT_CLASSES, {'tutor': self.factory('tutor')}):
+            manager = AgentManager()
+            tutor = manager.get_agent('tutor')
+            AGENT_CLASSES['tutor'] = broken
+
+            self.assertFalse(manager.reload_agent('tutor'))
+            self.assertIs(manager.get_agent('tutor'), tutor)
+
+
+class FakeStreamingManager:
+    """AgentManager con astream_query controlable; `gate` retiene la respuesta tras el primer fragmento"""
+
+    def __init__(self, words, gate: asyncio.Event = None):
+        self.words = words
+        self.gate = gate
+        self.contexts = []
+        self.yielded = 0
+        self.closed = False
+
+    async def astream_query(self, query, agent_type=None, context=None):
+        self.contexts.append(context)
+        try:
+            yield {'type': 'start', 'agent_used': 'tutor', 'agent_name': 'Tutor'}
+            for i, word in enumerate(self.words):
+                if i == 1 and self.gate is not None:
+                    await self.gate.wait()
+                self.yielded += 1
+                yield {'type': 'delta', 'content': word}
+            yield {'type': 'done', 'agent_used': 'tutor', 'agent_name': 'Tutor', 'response': ''.join(self.words)}
+        finally:
+            self.closed = True
+
+
+class ChatConsumerTests(SimpleTestCase):
+    """Streaming, cancelación y contrapresión del chat por WebSocket"""
+
+    def setUp(self):
+        self.turn_writer = FakeTurnWriter()
+        for patcher in (
+            mock.patch('apps.agents.consumers.ConversationMemory', FakeChatMemory),
+            mock.patch('apps.agents.consumers.get_turn_writer', return_value=self.turn_writer),
+            mock.patch('apps.agents.views.get_turn_writer', return_value=self.turn_writer),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def connect(self, manager):
+        patcher = mock.patch.object(ChatConsumer, '_create_services', return_value=(manager, None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_until(self, communicator, *types):
+        events = []
+        while not events or events[-1]['type'] not in types:
+            events.append(await communicator.receive_json_from(timeout=5))
+        return events
+
+    async def test_streams_response_and_saves_turn(self):
+        manager = FakeStreamingManager(['Hola', ' desde', ' el', ' modelo'])
+        communicator = await self.connect(manager)
+
+        await communicator.send_json_to({'text': 'hola', 'agent_type': 'tutor', 'userId': 'alumno'})
+        events = await self.receive_until(communicator, 'done', 'error')
+        await communicator.disconnect()
+
+        self.assertEqual(events[0]['type'], 'start')
+        self.assertEqual(events[-1]['type'], 'done')
+        self.assertEqual(''.join(e['content'] for e in events if e['type'] == 'delta'), 'Hola desde el modelo')
+        self.assertEqual(events[-1]['text'], 'Hola desde el modelo')
+        self.assertEqual(self.turn_writer.turns, [('alumno:tutor', 'hola', 'Hola desde el modelo')])
+        # Mismo contexto que las vistas de chat (AgentContextMixin)
+        context = manager.contexts[0]
+        self.assertEqual(context['user_profile'], AgentContextMixin()._get_user_profile('alumno'))
+        self.assertEqual(context['conversation_history'], [])
+
+    async def test_cancel_closes_model_stream(self):
+        manager = FakeStreamingManager(['Hola', ' desde', ' el', ' modelo'], gate=asyncio.Event())
+        communicator = await self.connect(manager)
+
+        await communicator.send_json_to({'text': 'hola', 'agent_type': 'tutor', 'userId': 'alumno'})
+        events = await self.receive_until(communicator, 'delta')
+        await communicator.send_json_to({'type': 'cancel'})
+        cancelled = await communicator.receive_json_from(timeout=5)
+        await communicator.disconnect()
+
+        self.assertEqual([e['type'] for e in events], ['start', 'delta'])
+        self.assertEqual(cancelled, {'type': 'cancelled'})
+        self.assertTrue(manager.closed)
+        self.assertEqual(manager.yielded, 1)
+        self.assertEqual(self.turn_writer.turns, [])
+
+    async def test_slow_client_aborts_response(self):
+        manager = FakeStreamingManager([f' p{i}' for i in range(50)])
+        release = asyncio.Event()
+        send_event = ChatConsumer._send_event
+
+        async def slow_send(consumer, event):
+            # El cliente no consume los fragmentos hasta que se libera
+            if event['type'] == 'delta':
+                await release.wait()
+            await send_event(consumer, event)
+
+        with mock.patch.dict(os.environ, {'WS_STREAM_QUEUE_SIZE': '2', 'WS_SLOW_CLIENT_TIMEOUT': '0.1'}), \
+                mock.patch.object(ChatConsumer, '_send_event', slow_send):
+            communicator = await self.connect(manager)
+            await communicator.send_json_to({'text': 'hola', 'agent_type': 'tutor', 'userId': 'alumno'})
+            await self.receive_until(communicator, 'start')
+            await asyncio.sleep(0.3)
+            self.assertTrue(manager.closed)
+            release.set()
+            events = await self.receive_until(communicator, 'error', 'done')
+            await communicator.disconnect()
+
+        self.assertEqual(events[-1]['type'], 'error')
+        self.assertIn('no consume', events[-1]['error'])
+        # El productor dejó de leer del modelo al llenarse la cola
+        self.assertLess(manager.yielded, 10)
+        self.assertEqual(self.turn_writer.turns, [])
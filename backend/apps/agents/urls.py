@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     # Endpoint principal para comunicación con agentes
     path('chat/', views.AgentChatAPIView.as_view(), name='agent_chat'),
+    path('chat/stream/', views.AgentChatStreamAPIView.as_view(), name='agent_chat_stream'),
+    path('chat/async/', views.AsyncAgentChatView.as_view(), name='agent_chat_async'),
     
     # Endpoint legacy para compatibilidad
     path('send-message/', views.SendMessageAPIView.as_view(), name='send_message'),
@@ -17,6 +19,7 @@ urlpatterns = [
     
     # Content Creator específico
     path('content-creator/', views.ContentCreatorAPIView.as_view(), name='content_creator'),
+    path('content-creator/async/', views.AsyncContentCreatorView.as_view(), name='content_creator_async'),
     
     # Análisis de imágenes
     path('analyze-image/', views.analyze_image, name='analyze_image'),
@@ -35,4 +38,5 @@ urlpatterns = [
     # Utilidades
     path('upload-file/', views.upload_file, name='upload_file'),
     path('health/', views.health_check, name='health_check'),
+    path('metrics/', views.prometheus_metrics, name='prometheus_metrics'),
 ] 
\ No newline at end of file
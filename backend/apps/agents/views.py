@@ -1,14 +1,22 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
+from django.views import View
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from .serializers import MessageSerializer
-from .services.agent_manager import AgentManager
+from .services.agent_manager import get_agent_manager
 from .services.conversation_memory import ConversationMemory, ConversationAnalytics
+from .services.context_gatherer import ContextSource, get_context_gatherer
+from .services.turn_writer import get_turn_writer
+from backend_project.tracing import trace_request, start_trace, use_trace, span, debug_traces_allowed
+from backend_project.metrics import get_metrics_registry, PROMETHEUS_CONTENT_TYPE
 from rag.services.enhanced_rag import EnhancedRAGService
 import json
 import os
@@ -30,31 +38,147 @@ from .services.smart_prompts_service import SmartPromptsService
 
 logger = logging.getLogger(__name__)
 
+class AgentContextMixin:
+    """
+    Construcción del contexto de agente compartida por las vistas de chat y el ChatConsumer
+    """
+
+    # Mensajes recientes del historial que se incluyen en el contexto
+    history_limit = 10
+
+    def _debug_trace_requested(self, request) -> bool:
+        """Flag de depuración (?debug_trace=1 o cabecera X-Debug-Trace) para devolver la traza"""
+        flag = request.GET.get('debug_trace') or request.headers.get('X-Debug-Trace')
+        return bool(flag) and flag.lower() in ('1', 'true') and debug_traces_allowed()
+
+    def _attach_trace(self, response, trace):
+        """Añadir la traza al cuerpo JSON de la respuesta"""
+        if isinstance(response, Response):
+            response.data['trace'] = trace.to_dict()
+        else:
+            payload = json.loads(response.content)
+            payload['trace'] = trace.to_dict()
+            response.content = json.dumps(payload, ensure_ascii=False, default=str)
+
+    def _init_rag_service(self):
+        """Crear el servicio RAG, o None si no está disponible"""
+        try:
+            from rag.services.enhanced_rag import EnhancedRAGService
+            return EnhancedRAGService()
+        except ImportError:
+            logger.warning("Enhanced RAG Service no disponible")
+            return None
+
+    def _context_sources(self, memory: ConversationMemory, user_id: str, message: str):
+        """Fuentes de contexto independientes de la consulta, con su valor si fallan"""
+        sources = {
+            'history': ContextSource(lambda: get_turn_writer().get_context(memory, limit=self.history_limit), []),
+            'profile': ContextSource(lambda: self._get_user_profile(user_id), {'user_id': user_id}),
+            'session': ContextSource(memory.get_session_metadata, {}),
+        }
+        # Buscar documentos relevantes si RAG está disponible
+        if self.rag_service:
+            sources['documents'] = ContextSource(
+                lambda: self.rag_service.search_relevant_content(message, user_id, top_k=5), []
+            )
+        return sources
+
+    def _assemble_agent_context(self, gathered: dict, user_id: str, explicit_context,
+                                is_quiz_system: bool, bypass_cache: bool) -> dict:
+        """Construir el contexto para el agente a partir de las fuentes recopiladas"""
+        return {
+            'user_id': user_id,
+            'conversation_history': gathered['history'],
+            'relevant_documents': gathered.get('documents', []),
+            'user_profile': gathered['profile'],
+            'session_metadata': gathered['session'],
+            'explicit_context': explicit_context,
+            'is_quiz_system': is_quiz_system,
+            'bypass_cache': bypass_cache,
+        }
+
+    def _build_agent_context(self, user_id: str, message: str, conversation_agent_type: str,
+                             explicit_context=None, is_quiz_system: bool = False,
+                             bypass_cache: bool = False):
+        """
+        Construir la memoria conversacional y el contexto para el agente
+
+        Historial, documentos RAG, perfil y metadatos de sesión se obtienen en
+        paralelo; una fuente lenta o con error se sustituye por contexto vacío.
+
+        Args:
+            bypass_cache: Ignorar la caché de respuestas y generar una respuesta nueva
+
+        Returns:
+            Tupla (ConversationMemory, contexto para AgentManager)
+        """
+        # Inicializar memoria conversacional
+        with span('memory.connect'):
+            memory = ConversationMemory(user_id, conversation_agent_type)
+
+        with span('context.gather'):
+            gathered = get_context_gatherer().gather(self._context_sources(memory, user_id, message))
+        context = self._assemble_agent_context(gathered, user_id, explicit_context, is_quiz_system, bypass_cache)
+        return memory, context
+
+    async def _abuild_agent_context(self, user_id: str, message: str, conversation_agent_type: str,
+                                    explicit_context=None, is_quiz_system: bool = False,
+                                    bypass_cache: bool = False):
+        """Variante asíncrona de _build_agent_context: las fuentes se esperan con asyncio.gather"""
+        with span('memory.connect'):
+            memory = await sync_to_async(ConversationMemory, thread_sensitive=False)(user_id, conversation_agent_type)
+
+        with span('context.gather'):
+            gathered = await get_context_gatherer().agather(self._context_sources(memory, user_id, message))
+        context = self._assemble_agent_context(gathered, user_id, explicit_context, is_quiz_system, bypass_cache)
+        return memory, context
+
+    def _save_messages(self, memory, user_id, conversation_agent_type, agent_used, message, response):
+        """Encolar el turno para guardarlo en la memoria del agente que respondió"""
+        if agent_used != conversation_agent_type:
+            memory = ConversationMemory(user_id, agent_used)
+        get_turn_writer().submit_turn(memory, message, response)
+
+    def _get_user_profile(self, user_id: str) -> dict:
+        """Obtener perfil del usuario (placeholder - implementar según modelo User)"""
+        return {
+            'user_id': user_id,
+            'name': 'Usuario',
+            'level': '7mo Grado',
+            'preferences': {},
+            'last_active': None
+        }
+
+
 @method_decorator(csrf_exempt, name='dispatch')
-class AgentChatAPIView(APIView):
+class AgentChatAPIView(AgentContextMixin, APIView):
     """
     API principal para comunicación con agentes especializados
     """
     
     def __init__(self):
         super().__init__()
-        self.agent_manager = AgentManager()
-        self.rag_service = None
-        try:
-            from rag.services.enhanced_rag import EnhancedRAGService
-            self.rag_service = EnhancedRAGService()
-        except ImportError:
-            logger.warning("Enhanced RAG Service no disponible")
+        self.agent_manager = get_agent_manager()
+        self.rag_service = self._init_rag_service()
     
     def post(self, request):
         """Procesar consulta de usuario con agentes IA"""
-        data = request.data
-        print("🔍 DEBUG: request.data =", data)
-        user_id = data.get('userId', 'default-user')
-        message = data.get('text') or data.get('message') or data.get('query')
-        agent_type = data.get('agent_type')
-        explicit_context = data.get('explicit_context') or data.get('context', None)
-        is_quiz_system = data.get('is_quiz_system', False)  # Nuevo parámetro
+        debug_trace = self._debug_trace_requested(request)
+        with trace_request('chat', force=debug_trace) as trace:
+            response = self._process_chat(request)
+            if trace is not None and debug_trace:
+                self._attach_trace(response, trace)
+        return response
+
+    def _process_chat(self, request):
+        with span('request.parse'):
+            data = request.data
+            print("🔍 DEBUG: request.data =", data)
+            user_id = data.get('userId', 'default-user')
+            message = data.get('text') or data.get('message') or data.get('query')
+            agent_type = data.get('agent_type')
+            explicit_context = data.get('explicit_context') or data.get('context', None)
+            is_quiz_system = data.get('is_quiz_system', False)  # Nuevo parámetro
 
         if not message:
             return Response(
@@ -63,34 +187,13 @@ class AgentChatAPIView(APIView):
             )
 
         try:
-            # Inicializar memoria conversacional
             # Si no se especifica agente, usar routing automático
             conversation_agent_type = agent_type or 'tutor'  # Default temporal
-            memory = ConversationMemory(user_id, conversation_agent_type)
-
-            # Obtener contexto conversacional
-            conversation_context = memory.get_context(limit=10)
-
-            # Buscar documentos relevantes si RAG está disponible
-            relevant_docs = []
-            if self.rag_service:
-                try:
-                    relevant_docs = self.rag_service.search_relevant_content(
-                        message, user_id, top_k=5
-                    )
-                except Exception as e:
-                    logger.warning(f"Error en RAG search: {e}")
-
-            # Construir contexto para el agente
-            context = {
-                'user_id': user_id,
-                'conversation_history': conversation_context,
-                'relevant_documents': relevant_docs,
-                'user_profile': self._get_user_profile(user_id),
-                'session_metadata': memory.get_session_metadata(),
-                'explicit_context': explicit_context,
-                'is_quiz_system': is_quiz_system,
-            }
+            memory, context = self._build_agent_context(
+                user_id, message, conversation_agent_type, explicit_context, is_quiz_system,
+                bool(data.get('bypass_cache', False))
+            )
+            relevant_docs = context['relevant_documents']
 
             # Procesar consulta con Agent Manager
             agent_response = self.agent_manager.route_query(
@@ -106,8 +209,9 @@ class AgentChatAPIView(APIView):
                     # Cambiar a la memoria del agente correcto
                     memory = ConversationMemory(user_id, memory_agent_type)
                 
-                memory.add_message('user', message)
-                memory.add_message('assistant', agent_response['response'])
+                # Se guardan en segundo plano, después de responder
+                with span('persist.enqueue'):
+                    get_turn_writer().submit_turn(memory, message, agent_response['response'])
 
                 return Response({
                     'status': 'success',
@@ -136,15 +240,160 @@ class AgentChatAPIView(APIView):
                 'user_id': user_id
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def _get_user_profile(self, user_id: str) -> dict:
-        """Obtener perfil del usuario (placeholder - implementar según modelo User)"""
-        return {
-            'user_id': user_id,
-            'name': 'Usuario',
-            'level': '7mo Grado',
-            'preferences': {},
-            'last_active': None
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Renderer para que DRF acepte clientes con 'Accept: text/event-stream'"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Solo se usa para respuestas de error previas al stream
+        return f"event: error\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AgentChatStreamAPIView(AgentChatAPIView):
+    """
+    Variante en streaming de AgentChatAPIView mediante Server-Sent Events.
+
+    Acepta el mismo cuerpo que AgentChatAPIView y emite los eventos 'start',
+    'delta' (fragmentos de texto), 'done' o 'error'. El mensaje completo se
+    guarda en la memoria conversacional cuando termina el stream. El frontend
+    lo consume con fetch + ReadableStream, ya que EventSource no admite POST.
+
+    Bajo ASGI los eventos salen de un generador asíncrono: Django consume un
+    generador síncrono con sync_to_async(list), que acumularía la respuesta
+    entera antes de enviar el primer evento.
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def post(self, request):
+        """Procesar consulta emitiendo la respuesta del agente en streaming"""
+        debug_trace = self._debug_trace_requested(request)
+        trace = start_trace('chat.stream', force=debug_trace)
+        with use_trace(trace, finish=False), span('request.parse'):
+            data = request.data
+            user_id = data.get('userId', 'default-user')
+            message = data.get('text') or data.get('message') or data.get('query')
+            agent_type = data.get('agent_type')
+            explicit_context = data.get('explicit_context') or data.get('context', None)
+            is_quiz_system = data.get('is_quiz_system', False)
+            bypass_cache = bool(data.get('bypass_cache', False))
+
+        if not message:
+            return Response(
+                {"error": "El campo 'text', 'message' o 'query' es requerido."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        stream_events = self._astream_events if isinstance(request._request, ASGIRequest) else self._stream_events
+        response = StreamingHttpResponse(
+            stream_events(user_id, message, agent_type, explicit_context, is_quiz_system, bypass_cache,
+                          trace, debug_trace),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Evitar que nginx acumule la respuesta antes de enviarla
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _stream_events(self, user_id, message, agent_type, explicit_context, is_quiz_system,
+                       bypass_cache=False, trace=None, debug_trace=False):
+        """Generador de eventos SSE para la consulta (la traza se cierra al terminar el stream)"""
+        with use_trace(trace):
+            yield from self._stream_traced_events(
+                user_id, message, agent_type, explicit_context, is_quiz_system, bypass_cache,
+                trace if debug_trace else None
+            )
+
+    def _stream_traced_events(self, user_id, message, agent_type, explicit_context, is_quiz_system,
+                              bypass_cache, debug_trace):
+        try:
+            conversation_agent_type = agent_type or 'tutor'  # Default temporal
+            memory, context = self._build_agent_context(
+                user_id, message, conversation_agent_type, explicit_context, is_quiz_system,
+                bypass_cache
+            )
+
+            for event in self.agent_manager.stream_query(
+                query=message,
+                agent_type=agent_type,
+                context=context
+            ):
+                if event['type'] == 'done':
+                    # Guardar mensajes en memoria una vez completada la respuesta
+                    with span('persist.enqueue'):
+                        self._save_messages(memory, user_id, conversation_agent_type, event['agent_used'],
+                                            message, event['response'])
+                    event = self._done_event(event, context, user_id, debug_trace)
+                yield self._format_sse(event)
+
+        except Exception as e:
+            logger.error(f"Error en AgentChatStreamAPIView: {e}")
+            yield self._error_event(user_id)
+
+    async def _astream_events(self, user_id, message, agent_type, explicit_context, is_quiz_system,
+                              bypass_cache=False, trace=None, debug_trace=False):
+        """Variante asíncrona de _stream_events para el servidor ASGI"""
+        with use_trace(trace):
+            async for event in self._astream_traced_events(
+                user_id, message, agent_type, explicit_context, is_quiz_system, bypass_cache,
+                trace if debug_trace else None
+            ):
+                yield event
+
+    async def _astream_traced_events(self, user_id, message, agent_type, explicit_context, is_quiz_system,
+                                     bypass_cache, debug_trace):
+        try:
+            conversation_agent_type = agent_type or 'tutor'  # Default temporal
+            memory, context = await self._abuild_agent_context(
+                user_id, message, conversation_agent_type, explicit_context, is_quiz_system,
+                bypass_cache
+            )
+
+            async for event in self.agent_manager.astream_query(
+                query=message,
+                agent_type=agent_type,
+                context=context
+            ):
+                if event['type'] == 'done':
+                    with span('persist.enqueue'):
+                        await sync_to_async(self._save_messages, thread_sensitive=False)(
+                            memory, user_id, conversation_agent_type, event['agent_used'],
+                            message, event['response']
+                        )
+                    event = self._done_event(event, context, user_id, debug_trace)
+                yield self._format_sse(event)
+
+        except Exception as e:
+            logger.error(f"Error en AgentChatStreamAPIView (ASGI): {e}")
+            yield self._error_event(user_id)
+
+    @staticmethod
+    def _done_event(event: dict, context: dict, user_id: str, debug_trace) -> dict:
+        """Completar el evento 'done' con los datos de la petición"""
+        event = {
+            **event,
+            'context_sources': len(context['relevant_documents']),
+            'user_id': user_id
         }
+        if debug_trace is not None:
+            event['trace'] = debug_trace.to_dict()
+        return event
+
+    def _error_event(self, user_id: str) -> str:
+        return self._format_sse({
+            'type': 'error',
+            'error': 'Error interno del servidor',
+            'response': 'Lo siento, hubo un problema procesando tu consulta. Por favor, intenta de nuevo.',
+            'user_id': user_id
+        })
+
+    @staticmethod
+    def _format_sse(event: dict) -> str:
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -162,7 +411,7 @@ class AgentManagementAPIView(APIView):
     
     def __init__(self):
         super().__init__()
-        self.agent_manager = AgentManager()
+        self.agent_manager = get_agent_manager()
     
     def get(self, request):
         """Obtener información de todos los agentes disponibles"""
@@ -328,17 +577,30 @@ def upload_file(request):
     file_obj = request.FILES['file']
     
     try:
-        file_content = TextExtractor.extract_text(file_obj)
+        rag_service = EnhancedRAGService() # No necesita user_id en el constructor
+        document_metadata = {'filename': file_obj.name, 'size': file_obj.size}
         
-        if not file_content:
-             return JsonResponse({'status': 'error', 'message': f'No se pudo extraer texto o el archivo está vacío: {file_obj.name}'}, status=400)
+        if file_obj.name.lower().endswith('.txt'):
+            # Los .txt se ingieren en streaming sin cargar el archivo completo en memoria
+            try:
+                rag_service.process_document_stream(
+                    file_obj.chunks(),
+                    user_id=user_id,
+                    document_metadata=document_metadata
+                )
+            except ValueError:
+                return JsonResponse({'status': 'error', 'message': f'No se pudo extraer texto o el archivo está vacío: {file_obj.name}'}, status=400)
+        else:
+            file_content = TextExtractor.extract_text(file_obj)
+            
+            if not file_content:
+                 return JsonResponse({'status': 'error', 'message': f'No se pudo extraer texto o el archivo está vacío: {file_obj.name}'}, status=400)
 
-        rag_service = EnhancedRAGService() # No necesita user_id en el constructor
-        rag_service.process_document(
-            document_content=file_content, 
-            user_id=user_id,
-            document_metadata={'filename': file_obj.name, 'size': file_obj.size}
-        )
+            rag_service.process_document(
+                document_content=file_content, 
+                user_id=user_id,
+                document_metadata=document_metadata
+            )
         
         return JsonResponse({
             'status': 'success',
@@ -358,14 +620,16 @@ def health_check(request):
     Endpoint de health check para el sistema de agentes
     """
     try:
-        agent_manager = AgentManager()
+        agent_manager = get_agent_manager()
         health_status = agent_manager.health_check()
         
         return JsonResponse({
             'status': 'healthy',
             'timestamp': health_status['timestamp'],
             'agents_status': health_status['agents_status'],
-            'system_metrics': health_status['metrics']
+            'system_metrics': health_status['metrics'],
+            'context_gathering': get_context_gatherer().get_stats(),
+            'conversation_writes': get_turn_writer().get_stats()
         }, status=200)
         
     except Exception as e:
@@ -377,6 +641,16 @@ def health_check(request):
         }, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def prometheus_metrics(request):
+    """
+    Métricas del proceso en formato de texto de Prometheus (histogramas de
+    latencia por agente y por proveedor, errores por tipo y tokens)
+    """
+    return HttpResponse(get_metrics_registry().render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def agent_capabilities(request, agent_id):
@@ -384,7 +658,7 @@ def agent_capabilities(request, agent_id):
     Obtener capacidades específicas de un agente
     """
     try:
-        agent_manager = AgentManager()
+        agent_manager = get_agent_manager()
         capabilities = agent_manager.get_agent_capabilities(agent_id)
         
         if not capabilities:
@@ -413,41 +687,13 @@ class ContentCreatorAPIView(APIView):
     
     def __init__(self):
         super().__init__()
-        self.agent_manager = AgentManager()
+        self.agent_manager = get_agent_manager()
     
     def post(self, request):
         """Generar contenido interactivo matemático"""
         try:
             data = request.data
-            user_id = data.get('userId', 'default-user')
-            
-            # Obtener contexto del frontend
-            explicit_context = data.get('explicit_context', None)  # Cambiar de 'context' a 'explicit_context'
-            structure_context = data.get('structure_context', '')
-            
-            # Si no hay concepto explícito, usar el mensaje como query
-            concept = data.get('concept', '')
-            if not concept:
-                # Usar el mensaje del usuario como query principal
-                query = data.get('message', 'Crear contenido interactivo matemático')
-            else:
-                query = f"Crea una {data.get('content_type', 'simulacion')} interactiva para enseñar {concept}"
-            
-            level = data.get('level', 'Secundaria')
-            content_type = data.get('content_type', 'simulacion')
-            documents = data.get('documents', [])
-            
-            # Contexto específico para content creator con información del frontend
-            context = {
-                'user_id': user_id,
-                'user_level': level,
-                'subject': concept,
-                'content_type': content_type,
-                'documents': documents,
-                'explicit_context': explicit_context,
-                'structure_context': structure_context,
-                'learning_style': 'visual-kinestésico'
-            }
+            query, context = self._build_content_request(data)
             
             # Procesar con el agente específico
             response = self.agent_manager.route_query(
@@ -457,26 +703,7 @@ class ContentCreatorAPIView(APIView):
             )
             
             if response['success']:
-                # Extraer concepto del contexto si no se proporcionó
-                extracted_concept = concept
-                if not extracted_concept and explicit_context:
-                    # Intentar extraer concepto del contexto
-                    if 'funciones lineales' in explicit_context.lower() or 'función lineal' in explicit_context.lower():
-                        extracted_concept = 'Funciones Lineales'
-                    elif 'fracciones' in explicit_context.lower():
-                        extracted_concept = 'Fracciones'
-                    elif 'geometría' in explicit_context.lower():
-                        extracted_concept = 'Geometría'
-                
-                return Response({
-                    'status': 'success',
-                    'content': response['response'],
-                    'agent_used': response['agent_used'],
-                    'response_time': response['response_time'],
-                    'concept': extracted_concept,
-                    'level': level,
-                    'content_type': content_type
-                }, status=status.HTTP_200_OK)
+                return Response(self._success_payload(response, data, context), status=status.HTTP_200_OK)
             else:
                 return Response({
                     'status': 'error',
@@ -491,6 +718,68 @@ class ContentCreatorAPIView(APIView):
                 'error': 'Error interno del servidor'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @staticmethod
+    def _build_content_request(data) -> tuple:
+        """Construir la consulta y el contexto del content creator a partir de la petición"""
+        user_id = data.get('userId', 'default-user')
+        
+        # Obtener contexto del frontend
+        explicit_context = data.get('explicit_context', None)  # Cambiar de 'context' a 'explicit_context'
+        structure_context = data.get('structure_context', '')
+        
+        # Si no hay concepto explícito, usar el mensaje como query
+        concept = data.get('concept', '')
+        if not concept:
+            # Usar el mensaje del usuario como query principal
+            query = data.get('message', 'Crear contenido interactivo matemático')
+        else:
+            query = f"Crea una {data.get('content_type', 'simulacion')} interactiva para enseñar {concept}"
+        
+        level = data.get('level', 'Secundaria')
+        content_type = data.get('content_type', 'simulacion')
+        documents = data.get('documents', [])
+        
+        # Contexto específico para content creator con información del frontend
+        context = {
+            'user_id': user_id,
+            'user_level': level,
+            'subject': concept,
+            'content_type': content_type,
+            'documents': documents,
+            'explicit_context': explicit_context,
+            'structure_context': structure_context,
+            'learning_style': 'visual-kinestésico',
+            'bypass_cache': bool(data.get('bypass_cache', False))
+        }
+        return query, context
+    
+    @staticmethod
+    def _success_payload(response: dict, data, context: dict) -> dict:
+        """Respuesta de éxito del content creator"""
+        concept = context['subject']
+        explicit_context = context['explicit_context']
+        
+        # Extraer concepto del contexto si no se proporcionó
+        extracted_concept = concept
+        if not extracted_concept and explicit_context:
+            # Intentar extraer concepto del contexto
+            if 'funciones lineales' in explicit_context.lower() or 'función lineal' in explicit_context.lower():
+                extracted_concept = 'Funciones Lineales'
+            elif 'fracciones' in explicit_context.lower():
+                extracted_concept = 'Fracciones'
+            elif 'geometría' in explicit_context.lower():
+                extracted_concept = 'Geometría'
+        
+        return {
+            'status': 'success',
+            'content': response['response'],
+            'agent_used': response['agent_used'],
+            'response_time': response['response_time'],
+            'concept': extracted_concept,
+            'level': context['user_level'],
+            'content_type': context['content_type']
+        }
+    
     def get(self, request):
         """Obtener información sobre tipos de contenido disponibles"""
         return Response({
@@ -525,6 +814,127 @@ class ContentCreatorAPIView(APIView):
         })
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAgentChatView(AgentContextMixin, View):
+    """
+    Versión asíncrona de AgentChatAPIView para el servidor ASGI.
+
+    La llamada al modelo se espera sin bloquear el worker, de modo que un
+    proceso puede mantener cientos de consultas en curso (limitadas por
+    LLM_MAX_CONCURRENCY). Memoria y búsqueda RAG se ejecutan en hilos.
+    """
+
+    async def post(self, request):
+        """Procesar consulta de usuario con agentes IA"""
+        debug_trace = self._debug_trace_requested(request)
+        with trace_request('chat.async', force=debug_trace) as trace:
+            response = await self._process_chat(request)
+            if trace is not None and debug_trace:
+                self._attach_trace(response, trace)
+        return response
+
+    async def _process_chat(self, request):
+        with span('request.parse'):
+            try:
+                data = json.loads(request.body or b'{}')
+            except json.JSONDecodeError:
+                return JsonResponse({'error': 'El cuerpo de la petición debe ser JSON válido.'}, status=400)
+
+            user_id = data.get('userId', 'default-user')
+            message = data.get('text') or data.get('message') or data.get('query')
+            agent_type = data.get('agent_type')
+            explicit_context = data.get('explicit_context') or data.get('context', None)
+            is_quiz_system = data.get('is_quiz_system', False)
+
+        if not message:
+            return JsonResponse(
+                {"error": "El campo 'text', 'message' o 'query' es requerido."},
+                status=400
+            )
+
+        try:
+            self.agent_manager = get_agent_manager()
+            self.rag_service = await sync_to_async(self._init_rag_service, thread_sensitive=False)()
+
+            conversation_agent_type = agent_type or 'tutor'  # Default temporal
+            memory, context = await self._abuild_agent_context(
+                user_id, message, conversation_agent_type, explicit_context, is_quiz_system,
+                bool(data.get('bypass_cache', False))
+            )
+
+            agent_response = await self.agent_manager.aroute_query(
+                query=message,
+                agent_type=agent_type,
+                context=context
+            )
+
+            if agent_response['success']:
+                with span('persist.enqueue'):
+                    await sync_to_async(self._save_messages, thread_sensitive=False)(
+                        memory, user_id, conversation_agent_type, agent_response['agent_used'],
+                        message, agent_response['response']
+                    )
+                return JsonResponse({
+                    'status': 'success',
+                    'response': agent_response['response'],
+                    'agent_used': agent_response['agent_used'],
+                    'agent_name': agent_response['agent_name'],
+                    'context_sources': len(context['relevant_documents']),
+                    'response_time': agent_response['response_time'],
+                    'user_id': user_id
+                })
+
+            return JsonResponse({
+                'status': 'error',
+                'error': agent_response.get('error', 'Error desconocido'),
+                'response': agent_response['response'],
+                'user_id': user_id
+            }, status=500)
+
+        except Exception as e:
+            logger.error(f"Error en AsyncAgentChatView: {e}")
+            return JsonResponse({
+                'status': 'error',
+                'error': 'Error interno del servidor',
+                'response': 'Lo siento, hubo un problema procesando tu consulta. Por favor, intenta de nuevo.',
+                'user_id': user_id
+            }, status=500)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncContentCreatorView(View):
+    """
+    Versión asíncrona de ContentCreatorAPIView para el servidor ASGI
+    """
+
+    async def post(self, request):
+        """Generar contenido interactivo matemático"""
+        try:
+            data = json.loads(request.body or b'{}')
+            query, context = ContentCreatorAPIView._build_content_request(data)
+
+            response = await get_agent_manager().aroute_query(
+                query=query,
+                agent_type='content_creator',
+                context=context
+            )
+
+            if response['success']:
+                return JsonResponse(ContentCreatorAPIView._success_payload(response, data, context))
+            return JsonResponse({
+                'status': 'error',
+                'error': response.get('error', 'Error generando contenido'),
+                'fallback_response': response.get('response', '')
+            }, status=500)
+
+        except Exception as e:
+            logger.error(f"Error en AsyncContentCreatorView: {e}")
+            return JsonResponse({
+                'status': 'error',
+                'error': 'Error interno del servidor'
+            }, status=500)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class HealthCheckAPIView(APIView):
     pass 
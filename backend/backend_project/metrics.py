@@ -0,0 +1,309 @@
+"""
+Metrics - Contadores e histogramas de latencia en formato Prometheus
+
+Los histogramas usan buckets logarítmicos fijos (cada límite es √2 veces el
+anterior, de 5ms a ~80s), de modo que cualquier percentil (p50, p95, p99)
+se estima con un error relativo acotado sin guardar las muestras. Cada serie
+(combinación de etiquetas) tiene su propio lock, que solo protege un par de
+sumas, así que registrar una observación es barato incluso con muchos hilos.
+
+El registro del proceso (get_metrics_registry) se sirve en formato de texto
+de Prometheus; Prometheus calcula los percentiles con histogram_quantile y
+el propio proceso los estima con `quantile` para las estadísticas JSON.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+
+def log_buckets(start: float = 0.005, factor: float = math.sqrt(2), count: int = 29) -> Tuple[float, ...]:
+    """Límites superiores de buckets en progresión geométrica"""
+    return tuple(round(start * factor ** i, 6) for i in range(count))
+
+
+# 5ms .. ~82s
+DEFAULT_LATENCY_BUCKETS = log_buckets()
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base de las métricas con etiquetas: una serie por combinación de valores"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"La métrica {self.name} requiere las etiquetas {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def _get_series(self, labels: Dict[str, Any]):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = self._new_series()
+        return series
+
+    def _matching(self, labels: Dict[str, Any]) -> List[Tuple[Tuple[str, ...], Any]]:
+        """Series cuyas etiquetas coinciden con las indicadas (el resto se agregan)"""
+        wanted = {self.labelnames.index(name): str(value) for name, value in labels.items()}
+        with self._lock:
+            items = list(self._series.items())
+        return [(key, series) for key, series in items
+                if all(key[index] == value for index, value in wanted.items())]
+
+    def label_values(self) -> List[Dict[str, str]]:
+        with self._lock:
+            keys = list(self._series)
+        return [dict(zip(self.labelnames, key)) for key in keys]
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._series.items())
+        for key, series in items:
+            lines.extend(self._render_series(list(zip(self.labelnames, key)), series))
+        return lines
+
+    def _render_series(self, labels: List[Tuple[str, str]], series) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterSeries:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+
+class Counter(_Metric):
+    """Contador monótono (p. ej. errores por tipo de excepción, tokens consumidos)"""
+
+    kind = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount: float = 1, **labels):
+        series = self._get_series(labels)
+        with series.lock:
+            series.value += amount
+
+    def value(self, **labels) -> float:
+        """Valor de la serie indicada, o la suma de las que coinciden con etiquetas parciales"""
+        return sum(series.value for _, series in self._matching(labels))
+
+    def _render_series(self, labels, series) -> List[str]:
+        return [f'{self.name}{_format_labels(labels)} {_format_value(series.value)}']
+
+
+class _HistogramSeries:
+    __slots__ = ('counts', 'sum', 'count', 'min', 'max', 'lock')
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+        self.min = math.inf
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+
+class Histogram(_Metric):
+    """Histograma de latencias con buckets fijos; los percentiles se estiman por interpolación"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        # Un bucket extra para las observaciones mayores que el último límite (+Inf)
+        return _HistogramSeries(len(self.buckets) + 1)
+
+    def observe(self, value: float, **labels):
+        series = self._get_series(labels)
+        index = bisect_left(self.buckets, value)
+        with series.lock:
+            series.counts[index] += 1
+            series.sum += value
+            series.count += 1
+            if value < series.min:
+                series.min = value
+            if value > series.max:
+                series.max = value
+
+    def snapshot(self, **labels) -> Dict[str, Any]:
+        """
+        Conteos por bucket, suma y total de las series que coinciden con las etiquetas
+
+        Args:
+            **labels: Etiquetas a fijar; las omitidas se agregan (p. ej. todos los agentes)
+
+        Returns:
+            Dict con 'counts' (no acumulados), 'sum', 'count', 'min' y 'max'
+        """
+        counts = [0] * (len(self.buckets) + 1)
+        total, count = 0.0, 0
+        minimum, maximum = math.inf, 0.0
+        for _, series in self._matching(labels):
+            with series.lock:
+                for index, value in enumerate(series.counts):
+                    counts[index] += value
+                total += series.sum
+                count += series.count
+                minimum = min(minimum, series.min)
+                maximum = max(maximum, series.max)
+        return {'counts': counts, 'sum': total, 'count': count, 'min': minimum, 'max': maximum}
+
+    def count_and_sum(self, **labels) -> Tuple[int, float]:
+        """Número de observaciones y su suma, sin leer los buckets"""
+        count, total = 0, 0.0
+        for _, series in self._matching(labels):
+            with series.lock:
+                count += series.count
+                total += series.sum
+        return count, total
+
+    def quantile(self, q: float, snapshot: Optional[Dict[str, Any]] = None, **labels) -> float:
+        """
+        Estimar un percentil interpolando linealmente dentro de su bucket
+
+        Los extremos del bucket se acotan con el mínimo y el máximo observados,
+        así que la estimación nunca sale del rango de las muestras.
+
+        Args:
+            q: Cuantil entre 0 y 1 (0.95 para p95)
+            snapshot: Resultado previo de `snapshot` (evita volver a leer las series)
+
+        Returns:
+            Latencia estimada en segundos (0.0 si no hay observaciones)
+        """
+        snapshot = snapshot or self.snapshot(**labels)
+        if not snapshot['count']:
+            return 0.0
+
+        rank = q * snapshot['count']
+        cumulative = 0
+        for index, count in enumerate(snapshot['counts']):
+            if count and cumulative + count >= rank:
+                lower = max(self.buckets[index - 1] if index else 0.0, snapshot['min'])
+                # Por encima del último límite la única cota superior es el máximo
+                upper = min(self.buckets[index], snapshot['max']) if index < len(self.buckets) else snapshot['max']
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return snapshot['max']
+
+    def summary(self, **labels) -> Dict[str, Any]:
+        """Total, media y percentiles (p50, p90, p95, p99) en segundos"""
+        snapshot = self.snapshot(**labels)
+        summary = {
+            'count': snapshot['count'],
+            'avg': round(snapshot['sum'] / snapshot['count'], 4) if snapshot['count'] else 0.0
+        }
+        for q in QUANTILES:
+            summary[f'p{int(q * 100)}'] = round(self.quantile(q, snapshot), 4)
+        return summary
+
+    def _render_series(self, labels, series) -> List[str]:
+        with series.lock:
+            counts = list(series.counts)
+            total, count = series.sum, series.count
+        lines = []
+        cumulative = 0
+        for bound, value in zip(self.buckets + (math.inf,), counts):
+            cumulative += value
+            bucket_labels = labels + [('le', _format_value(bound))]
+            lines.append(f'{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Métricas del proceso por nombre; registrar dos veces el mismo nombre devuelve la misma métrica"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"La métrica {name} ya está registrada con otro tipo o etiquetas")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Obtener el registro de métricas del proceso"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
@@ -0,0 +1,41 @@
+"""
+Middleware del proyecto
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware compatible con vistas asíncronas.
+
+    WhiteNoise solo declara soporte síncrono, lo que obliga a Django a
+    ejecutar toda la cadena de middlewares de cada petición ASGI en un
+    único hilo y serializa las vistas asíncronas. La búsqueda del fichero
+    estático no hace E/S bloqueante, así que basta con resolverla
+    directamente y esperar al siguiente middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
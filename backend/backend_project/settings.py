@@ -44,7 +44,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Para servir archivos estáticos
+    'backend_project.middleware.AsyncWhiteNoiseMiddleware',  # Para servir archivos estáticos (WhiteNoise)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'authentication.middleware.DisableCSRFMiddleware',  # Custom CSRF middleware
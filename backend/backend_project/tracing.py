@@ -0,0 +1,318 @@
+"""
+Tracing - Trazas ligeras por etapas de las peticiones de chat
+
+Cada petición puede abrir una traza (trace_request) en la que las distintas
+capas registran spans con `span(...)`: lectura de la petición, memoria
+conversacional, embedding y consulta vectorial del RAG, construcción del
+prompt, conteo de tokens, llamada al LLM y persistencia. Fuera de una traza
+activa, `span` no hace nada, así que el coste cuando el tracing está
+desactivado es una consulta a una ContextVar.
+
+Las trazas se exportan como una línea JSON en el log ('log') o se envían a
+un colector HTTP local ('collector').
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('current_trace', default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """Etapa de una traza; `set` añade atributos mientras está abierta"""
+
+    __slots__ = ('name', 'parent', 'start', 'duration', 'attributes')
+
+    def __init__(self, name: str, parent: Optional[str], start: float, attributes: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.start = start
+        self.duration = 0.0
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'start_ms': round((self.start - origin) * 1000, 2),
+            'duration_ms': round(self.duration * 1000, 2),
+            **self.attributes
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Traza de una petición: spans por etapa y acumulados de operaciones repetidas"""
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.spans: List[Span] = []
+        self.aggregates: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def accumulate(self, name: str, seconds: float, **counters):
+        """Sumar una operación repetida (p. ej. cada conteo de tokens) a su acumulado"""
+        with self._lock:
+            aggregate = self.aggregates.setdefault(name, {'calls': 0, 'total_ms': 0.0})
+            aggregate['calls'] += 1
+            aggregate['total_ms'] += seconds * 1000
+            for key, value in counters.items():
+                aggregate[key] = aggregate.get(key, 0) + value
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+            aggregates = {
+                name: {key: round(value, 2) if isinstance(value, float) else value for key, value in values.items()}
+                for name, values in self.aggregates.items()
+            }
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 2),
+            'attributes': self.attributes,
+            'spans': [span.to_dict(self.start) for span in spans],
+            'aggregates': aggregates
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Medir una etapa dentro de la traza activa
+
+    Yields:
+        Span al que se pueden añadir atributos con `set` (no hace nada sin traza activa)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NOOP_SPAN
+        return
+
+    current = Span(name, _current_span.get(), time.perf_counter(), attributes)
+    token = _current_span.set(name)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes['error'] = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current_span.reset(token)
+        trace.add_span(current)
+
+
+def record_span(name: str, start: float, duration: float, **attributes):
+    """Registrar una etapa medida fuera de un bloque `with` (p. ej. el primer token de un stream)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        recorded = Span(name, _current_span.get(), start, attributes)
+        recorded.duration = duration
+        trace.add_span(recorded)
+
+
+def accumulate(name: str, seconds: float, **counters):
+    """Sumar una operación repetida al acumulado de la traza activa"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.accumulate(name, seconds, **counters)
+
+
+def propagate(fn: Callable) -> Callable:
+    """
+    Envolver una función para ejecutarla en otro hilo con la traza activa
+
+    Los pools de hilos no copian las ContextVar; sin esto los spans de las
+    tareas enviadas al pool se perderían.
+    """
+    if _current_trace.get() is None:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def tracing_enabled() -> bool:
+    return os.getenv('TRACING_ENABLED', 'False').lower() == 'true'
+
+
+def debug_traces_allowed() -> bool:
+    """Si se permite devolver la traza en la respuesta (TRACE_DEBUG_RESPONSES, por defecto DEBUG)"""
+    value = os.getenv('TRACE_DEBUG_RESPONSES')
+    if value is not None:
+        return value.lower() == 'true'
+    from django.conf import settings
+    return bool(settings.DEBUG)
+
+
+def start_trace(name: str, force: bool = False, **attributes) -> Optional[Trace]:
+    """
+    Crear la traza de una petición si se debe trazar
+
+    Args:
+        name: Nombre de la traza (p. ej. 'chat')
+        force: Trazar aunque TRACING_ENABLED esté desactivado (flag de depuración)
+
+    Returns:
+        Trace, o None si esta petición no se traza
+    """
+    if not (force or tracing_enabled()):
+        return None
+    return Trace(name, attributes)
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace], finish: bool = True):
+    """
+    Activar una traza en el contexto actual
+
+    Args:
+        trace: Traza creada con start_trace (None no hace nada)
+        finish: Cerrar y exportar la traza al salir
+    """
+    if trace is None:
+        yield None
+        return
+
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # El generador de streaming terminó en otro contexto
+            _current_trace.set(None)
+        if finish:
+            trace.end = time.perf_counter()
+            get_trace_exporter().export(trace)
+
+
+@contextmanager
+def trace_request(name: str, force: bool = False, **attributes):
+    """
+    Abrir la traza de una petición y exportarla al terminar
+
+    Yields:
+        Trace activa, o None si no se traza esta petición
+    """
+    with use_trace(start_trace(name, force, **attributes)) as trace:
+        yield trace
+
+
+class TraceExporter:
+    """Destino de las trazas terminadas"""
+
+    def export(self, trace: Trace):
+        raise NotImplementedError
+
+
+class NoopExporter(TraceExporter):
+    def export(self, trace: Trace):
+        pass
+
+
+class LogExporter(TraceExporter):
+    """Una línea JSON por traza en el logger 'tracing'"""
+
+    def __init__(self):
+        self.logger = logging.getLogger('tracing')
+
+    def export(self, trace: Trace):
+        self.logger.info(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+
+
+class CollectorExporter(TraceExporter):
+    """
+    Envía las trazas por HTTP (POST JSON) a un colector local desde un hilo
+    en segundo plano; si la cola está llena, la traza se descarta.
+    """
+
+    def __init__(self, url: str, max_queue: int = 1000, timeout: float = 2.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.url = url
+        self.timeout = timeout
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+        self.dropped = 0
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace.to_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            payload = self._queue.get()
+            try:
+                request = urllib.request.Request(
+                    self.url,
+                    data=json.dumps(payload, default=str).encode('utf-8'),
+                    headers={'Content-Type': 'application/json'},
+                    method='POST'
+                )
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except Exception as e:
+                self.logger.warning(f"No se pudo enviar la traza al colector {self.url}: {e}")
+
+
+_exporter: Optional[TraceExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_trace_exporter() -> TraceExporter:
+    """Obtener el exportador del proceso (TRACE_EXPORT: 'log', 'collector' o 'none')"""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                kind = os.getenv('TRACE_EXPORT', 'log').lower()
+                if kind == 'collector' and os.getenv('TRACE_COLLECTOR_URL'):
+                    _exporter = CollectorExporter(os.getenv('TRACE_COLLECTOR_URL'))
+                elif kind == 'none':
+                    _exporter = NoopExporter()
+                else:
+                    _exporter = LogExporter()
+    return _exporter
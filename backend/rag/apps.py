@@ -1,6 +1,14 @@
+import os
+
 from django.apps import AppConfig
 
 
 class RagConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rag'
+
+    def ready(self):
+        # Precargar modelos al arrancar el worker si está habilitado
+        if os.getenv('RAG_WARMUP_ON_STARTUP', 'False').lower() == 'true':
+            from .services.model_registry import get_model_registry
+            get_model_registry().warmup()
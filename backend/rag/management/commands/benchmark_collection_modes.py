@@ -0,0 +1,177 @@
+"""
+Comando para comparar colecciones por usuario frente a colecciones compartidas
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rag.services.vector_store import create_vector_store, shared_collection_name
+
+
+def _open_store(backend: str, directory: str):
+    chroma_client = None
+    if backend == 'chroma':
+        import chromadb
+        from chromadb.config import Settings
+        chroma_client = chromadb.PersistentClient(path=directory, settings=Settings(anonymized_telemetry=False))
+    return create_vector_store(backend, directory, chroma_client=chroma_client)
+
+
+def _resident_mb() -> float:
+    """Memoria residente del proceso actual en MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _open_files() -> int:
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return -1
+
+
+def _measure_queries(backend, directory, mode, user_ids, shards, dim, query_count, top_k):
+    """
+    Abrir el almacén en un proceso nuevo y medir arranque en frío, latencia y memoria
+    (se ejecuta con multiprocessing 'spawn' para partir de un intérprete limpio)
+    """
+    rng = np.random.default_rng(7)
+    baseline_mb = _resident_mb()
+
+    def collection_for(user_id):
+        name = shared_collection_name(user_id, shards) if mode == 'shared' else f"user_{user_id}"
+        return store.get_collection(name)
+
+    start = time.perf_counter()
+    store = _open_store(backend, directory)
+    query = rng.standard_normal(dim).astype(np.float32)
+    collection_for(user_ids[0]).query(query_embeddings=[query.tolist()], n_results=top_k,
+                                      where={'user_id': user_ids[0]})
+    cold_start_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for _ in range(query_count):
+        user_id = user_ids[int(rng.integers(len(user_ids)))]
+        query = rng.standard_normal(dim).astype(np.float32)
+        start = time.perf_counter()
+        collection_for(user_id).query(query_embeddings=[query.tolist()], n_results=top_k,
+                                      where={'user_id': user_id})
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'cold_start_ms': round(cold_start_ms, 2),
+        'query_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'query_p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'resident_mb': round(_resident_mb(), 1),
+        'resident_delta_mb': round(_resident_mb() - baseline_mb, 1),
+        'open_files': _open_files(),
+    }
+
+
+def _directory_size_mb(directory: str) -> float:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return round(total / (1024 * 1024), 2)
+
+
+class Command(BaseCommand):
+    help = 'Compara memoria, arranque en frío y latencia de colecciones por usuario frente a compartidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Número de usuarios simulados')
+        parser.add_argument('--chunks-per-user', type=int, default=40, dest='chunks_per_user',
+                            help='Chunks por usuario')
+        parser.add_argument('--shards', type=int, default=16, help='Colecciones compartidas')
+        parser.add_argument('--backend', default='chroma', help='Backend vectorial (chroma, numpy, faiss)')
+        parser.add_argument('--dim', type=int, default=384, help='Dimensión de los embeddings')
+        parser.add_argument('--queries', type=int, default=300, help='Consultas a usuarios aleatorios')
+        parser.add_argument('--top-k', type=int, default=5, dest='top_k', help='Resultados por consulta')
+        parser.add_argument('--output', help='Ruta opcional para guardar los resultados en JSON')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(42)
+        user_ids = [f"bench{i}" for i in range(options['users'])]
+        results = []
+
+        for mode in ('per_user', 'shared'):
+            directory = tempfile.mkdtemp(prefix=f"rag_modes_{mode}_")
+            try:
+                ingest_seconds = self._ingest(rng, directory, mode, user_ids, options)
+                context = multiprocessing.get_context('spawn')
+                with context.Pool(1) as pool:
+                    measures = pool.apply(_measure_queries, (
+                        options['backend'], directory, mode, user_ids, options['shards'],
+                        options['dim'], options['queries'], options['top_k']
+                    ))
+                result = dict(
+                    mode=mode,
+                    backend=options['backend'],
+                    collections=options['users'] if mode == 'per_user' else min(options['shards'], len(user_ids)),
+                    ingest_seconds=round(ingest_seconds, 2),
+                    disk_mb=_directory_size_mb(directory),
+                    **measures
+                )
+                results.append(result)
+                self.stdout.write(
+                    f"{mode:>8} | {result['collections']:>6} colecciones | ingesta {result['ingest_seconds']:7.2f}s | "
+                    f"disco {result['disk_mb']:8.2f} MB | arranque {result['cold_start_ms']:8.1f}ms | "
+                    f"p50 {result['query_p50_ms']:7.2f}ms | p95 {result['query_p95_ms']:7.2f}ms | "
+                    f"RSS {result['resident_mb']:7.1f} MB | ficheros {result['open_files']}"
+                )
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        if options.get('output'):
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['output']}")
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado'))
+
+    def _ingest(self, rng, directory, mode, user_ids, options) -> float:
+        store = _open_store(options['backend'], directory)
+        chunks_per_user = options['chunks_per_user']
+
+        batches = {}
+        for user_id in user_ids:
+            vectors = rng.standard_normal((chunks_per_user, options['dim'])).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            name = shared_collection_name(user_id, options['shards']) if mode == 'shared' else f"user_{user_id}"
+            batch = batches.setdefault(name, {'ids': [], 'embeddings': [], 'metadatas': [], 'documents': []})
+            batch['ids'].extend(f"{user_id}_chunk_{i}" for i in range(chunks_per_user))
+            batch['embeddings'].append(vectors)
+            batch['metadatas'].extend({'user_id': user_id, 'chunk_index': i} for i in range(chunks_per_user))
+            batch['documents'].extend(f"chunk {i} de {user_id}" for i in range(chunks_per_user))
+
+        start = time.perf_counter()
+        for name, batch in batches.items():
+            collection = store.get_or_create_collection(name, metadata={'mode': mode})
+            embeddings = np.vstack(batch['embeddings'])
+            for offset in range(0, len(batch['ids']), 5000):
+                end = offset + 5000
+                collection.add(
+                    ids=batch['ids'][offset:end],
+                    embeddings=embeddings[offset:end].tolist(),
+                    metadatas=batch['metadatas'][offset:end],
+                    documents=batch['documents'][offset:end]
+                )
+        return time.perf_counter() - start
@@ -0,0 +1,124 @@
+"""
+Comando para comparar el rendimiento de los backends vectoriales del sistema RAG
+"""
+
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from rag.services.vector_store import create_vector_store
+
+
+class Command(BaseCommand):
+    help = 'Compara inserción y latencia de búsqueda de los backends vectoriales (chroma, numpy, faiss)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000],
+                            help='Número de chunks por colección a evaluar')
+        parser.add_argument('--backends', nargs='+', default=['chroma', 'numpy'],
+                            help='Backends a comparar (chroma, numpy, faiss)')
+        parser.add_argument('--dim', type=int, default=384, help='Dimensión de los embeddings')
+        parser.add_argument('--queries', type=int, default=200, help='Consultas por tamaño')
+        parser.add_argument('--top-k', type=int, default=5, dest='top_k', help='Resultados por consulta')
+        parser.add_argument('--batch-size', type=int, default=5000, dest='batch_size',
+                            help='Chunks por lote de inserción')
+        parser.add_argument('--output', help='Ruta opcional para guardar los resultados en JSON')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(42)
+        results = []
+
+        for size in options['sizes']:
+            vectors = self._random_unit_vectors(rng, size, options['dim'])
+            queries = self._random_unit_vectors(rng, options['queries'], options['dim'])
+            ids = [f"doc_bench_chunk_{i}" for i in range(size)]
+            metadatas = [{'user_id': 'bench', 'document_id': f"doc_{i % 20}", 'chunk_index': i}
+                         for i in range(size)]
+            documents = [f"chunk {i}" for i in range(size)]
+
+            for backend in options['backends']:
+                result = self._benchmark_backend(
+                    backend, size, vectors, queries, ids, metadatas, documents, options
+                )
+                results.append(result)
+                self.stdout.write(
+                    f"{backend:>8} | {size:>7} chunks | inserción {result['insert_seconds']:8.2f}s | "
+                    f"p50 {result['query_p50_ms']:8.2f}ms | p95 {result['query_p95_ms']:8.2f}ms | "
+                    f"p50 filtrado {result['filtered_query_p50_ms']:8.2f}ms"
+                )
+
+        if options.get('output'):
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Resultados guardados en {options['output']}")
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado'))
+
+    def _random_unit_vectors(self, rng, count, dim):
+        vectors = rng.standard_normal((count, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    def _benchmark_backend(self, backend, size, vectors, queries, ids, metadatas, documents, options):
+        directory = tempfile.mkdtemp(prefix=f"rag_bench_{backend}_")
+        try:
+            chroma_client = None
+            if backend == 'chroma':
+                import chromadb
+                from chromadb.config import Settings
+                chroma_client = chromadb.PersistentClient(
+                    path=directory,
+                    settings=Settings(anonymized_telemetry=False)
+                )
+
+            store = create_vector_store(backend, directory, chroma_client=chroma_client)
+            collection = store.get_or_create_collection('user_bench', metadata={'user_id': 'bench'})
+
+            start = time.perf_counter()
+            batch_size = options['batch_size']
+            for offset in range(0, size, batch_size):
+                end = offset + batch_size
+                collection.add(
+                    ids=ids[offset:end],
+                    embeddings=vectors[offset:end].tolist(),
+                    metadatas=metadatas[offset:end],
+                    documents=documents[offset:end]
+                )
+            insert_seconds = time.perf_counter() - start
+
+            latencies = self._time_queries(collection, queries, options['top_k'], {'user_id': 'bench'})
+            filtered_latencies = self._time_queries(collection, queries, options['top_k'], {'document_id': 'doc_3'})
+
+            return {
+                'backend': backend,
+                'size': size,
+                'dim': vectors.shape[1],
+                'insert_seconds': round(insert_seconds, 4),
+                'query_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                'query_p95_ms': round(float(np.percentile(latencies, 95)), 3),
+                'query_mean_ms': round(float(np.mean(latencies)), 3),
+                'filtered_query_p50_ms': round(float(np.percentile(filtered_latencies, 50)), 3),
+                'filtered_query_p95_ms': round(float(np.percentile(filtered_latencies, 95)), 3),
+            }
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _time_queries(self, collection, queries, top_k, where):
+        # Primera consulta fuera de la medición (carga perezosa de índices)
+        collection.query(query_embeddings=queries[:1].tolist(), n_results=top_k, where=where)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            collection.query(
+                query_embeddings=[query.tolist()],
+                n_results=top_k,
+                where=where,
+                include=['documents', 'metadatas', 'distances']
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
@@ -0,0 +1,51 @@
+"""
+Comando para compactar los índices FAISS o las colecciones planas del sistema RAG (pensado para cron)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.services.model_registry import get_model_registry
+
+
+class Command(BaseCommand):
+    help = 'Compacta los índices FAISS o las colecciones planas: elimina lápidas y reescribe cada colección'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['faiss', 'numpy'], default='faiss',
+                            help='Backend cuyas colecciones se compactan (por defecto faiss)')
+        parser.add_argument('--collection', action='append', dest='collections',
+                            help='Colección a compactar (puede repetirse; por defecto todas)')
+        parser.add_argument('--min-tombstone-ratio', type=float, default=0.0, dest='min_ratio',
+                            help='Compactar solo si la fracción de lápidas supera este valor')
+        parser.add_argument('--persist-directory', help='Directorio de persistencia (por defecto CHROMA_PERSIST_DIRECTORY)')
+
+    def handle(self, *args, **options):
+        store = get_model_registry().get_vector_store(
+            backend=options['backend'], persist_directory=options.get('persist_directory')
+        )
+
+        names = options.get('collections') or store.list_collections()
+        if not names:
+            self.stdout.write(f"No hay colecciones {options['backend']} que compactar")
+            return
+
+        for name in names:
+            try:
+                collection = store.get_collection(name)
+            except Exception as e:
+                raise CommandError(f"Colección no encontrada: {name}") from e
+
+            stats = collection.get_stats()
+            ratio = stats['tombstones'] / stats['rows'] if stats['rows'] else 0.0
+            if ratio < options['min_ratio'] or (options['min_ratio'] and not stats['tombstones']):
+                self.stdout.write(f"{name}: {stats['tombstones']} lápidas ({ratio:.1%}), se omite")
+                continue
+
+            collection.compact()
+            after = collection.get_stats()
+            self.stdout.write(
+                f"{name}: {stats['rows']} -> {after['rows']} vectores, "
+                f"índice {after['index_kind']}, generación {after['generation']}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Compactación completada'))
@@ -0,0 +1,130 @@
+"""
+Comando para migrar chunks entre colecciones por usuario y colecciones compartidas
+"""
+
+import os
+from collections import defaultdict
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.services.model_registry import get_model_registry
+from rag.services.vector_store import shared_collection_name
+
+
+class Command(BaseCommand):
+    help = 'Migra las colecciones user_<id> a colecciones compartidas (RAG_COLLECTION_MODE=shared) o al revés'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=['shared', 'per_user'], default='shared',
+                            help='Modo de destino')
+        parser.add_argument('--shards', type=int,
+                            help='Número de colecciones compartidas (por defecto RAG_SHARED_COLLECTIONS)')
+        parser.add_argument('--batch-size', type=int, default=500, dest='batch_size',
+                            help='Chunks por lote de inserción')
+        parser.add_argument('--keep-source', action='store_true', dest='keep_source',
+                            help='No eliminar los datos de origen tras copiarlos')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Mostrar lo que se migraría sin escribir nada')
+        parser.add_argument('--backend', help='Backend vectorial (por defecto RAG_VECTOR_BACKEND)')
+        parser.add_argument('--persist-directory', help='Directorio de persistencia (por defecto CHROMA_PERSIST_DIRECTORY)')
+
+    def handle(self, *args, **options):
+        self.store = get_model_registry().get_vector_store(
+            backend=options.get('backend'), persist_directory=options.get('persist_directory')
+        )
+        self.options = options
+        shards = options.get('shards') or int(os.getenv('RAG_SHARED_COLLECTIONS', 16))
+        if shards < 1:
+            raise CommandError('--shards debe ser mayor que cero')
+
+        if options['to'] == 'shared':
+            migrated = self._to_shared(shards)
+        else:
+            migrated = self._to_per_user()
+
+        action = 'Se migrarían' if options['dry_run'] else 'Migrados'
+        self.stdout.write(self.style.SUCCESS(f"{action} {migrated} chunks al modo {options['to']}"))
+        if not options['dry_run']:
+            self.stdout.write('Reinicia los workers con el RAG_COLLECTION_MODE correspondiente')
+
+    def _read_all(self, collection):
+        data = collection.get(include=['documents', 'metadatas', 'embeddings'])
+        embeddings = data.get('embeddings')
+        embeddings = np.asarray(embeddings if embeddings is not None else [], dtype=np.float32)
+        return data['ids'], data['documents'], data['metadatas'], embeddings
+
+    def _copy(self, target, ids, documents, metadatas, embeddings):
+        batch_size = self.options['batch_size']
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            target.upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadatas[start:end],
+                documents=documents[start:end]
+            )
+
+        # Verificar que todos los chunks llegaron antes de borrar el origen
+        copied = 0
+        for start in range(0, len(ids), batch_size):
+            copied += len(target.get(ids=ids[start:start + batch_size], include=['metadatas'])['ids'])
+        if copied != len(ids):
+            raise CommandError(f"Verificación fallida en {target.name}: {copied} de {len(ids)} chunks copiados")
+
+    def _to_shared(self, shards: int) -> int:
+        total = 0
+        for name in self.store.list_collections():
+            if not name.startswith('user_'):
+                continue
+
+            source = self.store.get_collection(name)
+            user_id = (getattr(source, 'metadata', None) or {}).get('user_id') or name[len('user_'):]
+            ids, documents, metadatas, embeddings = self._read_all(source)
+            target_name = shared_collection_name(user_id, shards)
+            self.stdout.write(f"{name}: {len(ids)} chunks -> {target_name}")
+            total += len(ids)
+            if self.options['dry_run']:
+                continue
+
+            if ids:
+                metadatas = [dict(metadata or {}, user_id=user_id) for metadata in metadatas]
+                target = self.store.get_or_create_collection(target_name, metadata={'mode': 'shared'})
+                self._copy(target, ids, documents, metadatas, embeddings)
+            if not self.options['keep_source']:
+                self.store.delete_collection(name)
+        return total
+
+    def _to_per_user(self) -> int:
+        total = 0
+        for name in self.store.list_collections():
+            if not name.startswith('rag_shared_'):
+                continue
+
+            source = self.store.get_collection(name)
+            ids, documents, metadatas, embeddings = self._read_all(source)
+            rows_by_user = defaultdict(list)
+            for row, metadata in enumerate(metadatas):
+                rows_by_user[(metadata or {}).get('user_id')].append(row)
+
+            if None in rows_by_user:
+                raise CommandError(f"{name}: {len(rows_by_user[None])} chunks sin user_id, no se pueden repartir")
+
+            for user_id, rows in rows_by_user.items():
+                target_name = f"user_{user_id}"
+                self.stdout.write(f"{name}: {len(rows)} chunks -> {target_name}")
+                total += len(rows)
+                if self.options['dry_run']:
+                    continue
+                target = self.store.get_or_create_collection(target_name, metadata={'user_id': user_id})
+                self._copy(
+                    target,
+                    [ids[row] for row in rows],
+                    [documents[row] for row in rows],
+                    [metadatas[row] for row in rows],
+                    embeddings[rows]
+                )
+
+            if not self.options['dry_run'] and not self.options['keep_source']:
+                self.store.delete_collection(name)
+        return total
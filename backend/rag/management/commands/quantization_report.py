@@ -0,0 +1,83 @@
+"""
+Comando para medir recall y memoria de la cuantización de embeddings del sistema RAG
+"""
+
+import json
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from rag.services.model_registry import get_model_registry
+from rag.services.quantization import create_quantizer, evaluate_quantizer
+
+
+class Command(BaseCommand):
+    help = 'Informe de recall@k frente a memoria para la cuantización sq8 y pq'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', help='Colección del almacén vectorial a evaluar (p. ej. user_42)')
+        parser.add_argument('--size', type=int, default=20000,
+                            help='Vectores sintéticos si no se indica colección')
+        parser.add_argument('--dim', type=int, default=384, help='Dimensión de los vectores sintéticos')
+        parser.add_argument('--queries', type=int, default=100, help='Consultas de evaluación')
+        parser.add_argument('--k', type=int, default=10, help='Resultados por consulta')
+        parser.add_argument('--kinds', nargs='+', default=['sq8', 'pq'], help='Cuantizaciones a evaluar')
+        parser.add_argument('--rescore', nargs='+', type=int, default=[0, 2, 4, 10],
+                            help='Factores de re-puntuación (0 = solo códigos)')
+        parser.add_argument('--pq-subvectors', type=int, default=48, dest='pq_subvectors',
+                            help='Subvectores de PQ')
+        parser.add_argument('--output', help='Ruta opcional para guardar el informe en JSON')
+
+    def handle(self, *args, **options):
+        vectors = self._load_vectors(options)
+        rng = np.random.default_rng(0)
+
+        # Las consultas se apartan de la colección para no encontrarse a sí mismas
+        query_count = min(options['queries'], len(vectors) // 10)
+        if query_count == 0:
+            raise CommandError('No hay vectores suficientes para evaluar')
+        query_rows = rng.choice(len(vectors), query_count, replace=False)
+        queries = vectors[query_rows]
+        vectors = np.delete(vectors, query_rows, axis=0)
+
+        reports = []
+        for kind in options['kinds']:
+            quantizer = create_quantizer(kind, **(
+                {'subvectors': options['pq_subvectors']} if kind == 'pq' else {}
+            ))
+            quantizer.train(vectors)
+            report = evaluate_quantizer(quantizer, vectors, queries, k=options['k'],
+                                        rescore_factors=options['rescore'])
+            reports.append(report)
+
+            recalls = ', '.join(f"{name}={value:.3f}" for name, value in report['recall_at_k'].items())
+            self.stdout.write(
+                f"{kind:>4} | {report['code_bytes_per_vector']:>4} B/vector "
+                f"({report['compression_ratio']}x) | {report['resident_mb']} MB vs {report['float32_mb']} MB "
+                f"float32 | recall@{report['k']}: {recalls}"
+            )
+
+        if options.get('output'):
+            with open(options['output'], 'w') as f:
+                json.dump(reports, f, indent=2)
+            self.stdout.write(f"Informe guardado en {options['output']}")
+
+        self.stdout.write(self.style.SUCCESS('Informe de cuantización completado'))
+
+    def _load_vectors(self, options) -> np.ndarray:
+        if not options.get('collection'):
+            rng = np.random.default_rng(42)
+            vectors = rng.standard_normal((options['size'], options['dim'])).astype(np.float32)
+            return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        store = get_model_registry().get_vector_store()
+        try:
+            collection = store.get_collection(options['collection'])
+        except Exception as e:
+            raise CommandError(f"Colección no encontrada: {options['collection']}") from e
+
+        embeddings = collection.get(include=['embeddings'])['embeddings']
+        if embeddings is None or not len(embeddings):
+            raise CommandError(f"La colección {options['collection']} no tiene embeddings")
+        self.stdout.write(f"Evaluando {len(embeddings)} embeddings de {options['collection']}")
+        return np.asarray(embeddings, dtype=np.float32)
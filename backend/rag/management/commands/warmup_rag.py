@@ -0,0 +1,41 @@
+"""
+Comando para precargar los modelos de embeddings y el cliente vectorial del sistema RAG
+"""
+
+from django.core.management.base import BaseCommand
+
+from rag.services.model_registry import get_model_registry
+
+
+class Command(BaseCommand):
+    help = 'Precarga los modelos de embeddings y el almacén vectorial del sistema RAG'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            action='append',
+            dest='models',
+            help='Modelo de embeddings a precargar (se puede repetir)'
+        )
+        parser.add_argument(
+            '--persist-directory',
+            dest='persist_directory',
+            help='Directorio de persistencia de ChromaDB'
+        )
+
+    def handle(self, *args, **options):
+        registry = get_model_registry()
+        result = registry.warmup(
+            model_names=options.get('models'),
+            persist_directory=options.get('persist_directory')
+        )
+
+        for model_name, model_status in result['models'].items():
+            self.stdout.write(f"Modelo {model_name}: {model_status}")
+        self.stdout.write(f"Almacén vectorial: {result['vector_store']}")
+
+        load_times = registry.get_stats()['load_times']
+        for resource, seconds in load_times.items():
+            self.stdout.write(f"  {resource}: {seconds:.2f}s")
+
+        self.stdout.write(self.style.SUCCESS('Calentamiento RAG completado'))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rag', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100, unique=True)),
+                ('total_documents', models.PositiveIntegerField(default=0)),
+                ('total_chunks', models.PositiveIntegerField(default=0)),
+                ('total_bytes', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ManifestDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_id', models.CharField(max_length=100)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('byte_size', models.PositiveBigIntegerField(default=0)),
+                ('timestamp', models.CharField(max_length=40)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('manifest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='rag.usermanifest')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'unique_together': {('manifest', 'document_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rag', '0002_document_manifest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rag_documents', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
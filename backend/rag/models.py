@@ -16,3 +16,33 @@ class Document(models.Model):
     
     def __str__(self):
         return f"{self.title} - {self.user.username}"
+
+
+class UserManifest(models.Model):
+    """Totales de documentos RAG por usuario (evita recorrer la colección vectorial)"""
+    user_id = models.CharField(max_length=100, unique=True)
+    total_documents = models.PositiveIntegerField(default=0)
+    total_chunks = models.PositiveIntegerField(default=0)
+    total_bytes = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.total_documents} documentos"
+
+
+class ManifestDocument(models.Model):
+    """Entrada del manifiesto por documento vectorizado"""
+    manifest = models.ForeignKey(UserManifest, on_delete=models.CASCADE, related_name='documents')
+    document_id = models.CharField(max_length=100)
+    chunk_count = models.PositiveIntegerField(default=0)
+    byte_size = models.PositiveBigIntegerField(default=0)
+    timestamp = models.CharField(max_length=40)
+    metadata = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        unique_together = ['manifest', 'document_id']
+
+    def __str__(self):
+        return f"{self.document_id} - {self.chunk_count} chunks"
@@ -0,0 +1,178 @@
+"""
+RAG Cache - Caché LRU con expiración (TTL) y límite de memoria para el sistema RAG
+"""
+
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(value: Any) -> int:
+    """Estimar el tamaño en bytes de un valor cacheado"""
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUTTLCache:
+    """
+    Caché en memoria del proceso con política LRU, expiración por TTL y
+    límites tanto de número de entradas como de bytes.
+
+    Las entradas pueden etiquetarse (p. ej. con la colección del usuario) para
+    invalidarlas en bloque con `invalidate_tag`.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1000,
+                 max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 3600):
+        """
+        Inicializar la caché
+
+        Args:
+            name: Nombre de la caché (para logs y estadísticas)
+            max_entries: Número máximo de entradas
+            max_bytes: Memoria máxima estimada en bytes
+            ttl_seconds: Tiempo de vida de cada entrada en segundos
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, size, tag)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self._current_bytes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Obtener un valor, o `default` si no existe o expiró"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+
+            value, expires_at, _, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, tag: Optional[Hashable] = None,
+            ttl_seconds: Optional[float] = None):
+        """Guardar un valor, desalojando las entradas menos usadas si hace falta"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, time.monotonic() + ttl, size, tag)
+            self._current_bytes += size
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._current_bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._evictions += 1
+
+    def _remove(self, key: Hashable):
+        """Eliminar una entrada (requiere tener el lock)"""
+        _, _, size, tag = self._entries.pop(key)
+        self._current_bytes -= size
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate_tag(self, tag: Hashable) -> int:
+        """
+        Eliminar todas las entradas asociadas a una etiqueta
+
+        Returns:
+            Número de entradas eliminadas
+        """
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            self._invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """Vaciar la caché"""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._current_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas de aciertos y ocupación"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations
+            }
+
+
+_caches: Dict[str, LRUTTLCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, **kwargs) -> LRUTTLCache:
+    """
+    Obtener una caché con nombre compartida por todo el proceso
+
+    Los argumentos solo se usan la primera vez que se crea la caché.
+    """
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                cache = LRUTTLCache(name, **kwargs)
+                _caches[name] = cache
+    return cache
@@ -0,0 +1,157 @@
+"""
+Document Manifest - Índice por usuario de los documentos vectorizados
+"""
+
+import logging
+from typing import Dict, Any, List, Optional
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from ..models import UserManifest, ManifestDocument
+
+logger = logging.getLogger(__name__)
+
+# Claves de metadatos de chunk que no forman parte de los metadatos del documento
+_CHUNK_METADATA_KEYS = ('user_id', 'document_id', 'chunk_index', 'chunk_text')
+
+
+class DocumentManifest:
+    """
+    Manifiesto mantenido por usuario con los documentos, número de chunks,
+    fechas y tamaño en bytes.
+
+    Permite listar documentos y obtener estadísticas sin recorrer los
+    metadatos de todos los chunks de la colección vectorial. Cada alta o baja
+    actualiza la entrada del documento y los totales del usuario en la misma
+    transacción.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def get(self, user_id: str) -> Optional[UserManifest]:
+        """Obtener el manifiesto de un usuario, o None si aún no existe"""
+        return UserManifest.objects.filter(user_id=user_id).first()
+
+    def exists(self, user_id: str) -> bool:
+        return UserManifest.objects.filter(user_id=user_id).exists()
+
+    def record_document(self, user_id: str, document_id: str, chunk_count: int, byte_size: int,
+                        timestamp: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Registrar un documento recién vectorizado
+
+        Args:
+            user_id: ID del usuario
+            document_id: ID del documento
+            chunk_count: Número de chunks insertados
+            byte_size: Tamaño del documento en bytes (UTF-8)
+            timestamp: Fecha de procesamiento (ISO 8601)
+            metadata: Metadatos del documento
+        """
+        with transaction.atomic():
+            manifest, _ = UserManifest.objects.select_for_update().get_or_create(user_id=user_id)
+            ManifestDocument.objects.create(
+                manifest=manifest,
+                document_id=document_id,
+                chunk_count=chunk_count,
+                byte_size=byte_size,
+                timestamp=timestamp,
+                metadata=metadata or {}
+            )
+            UserManifest.objects.filter(pk=manifest.pk).update(
+                total_documents=F('total_documents') + 1,
+                total_chunks=F('total_chunks') + chunk_count,
+                total_bytes=F('total_bytes') + byte_size
+            )
+
+    def remove_document(self, user_id: str, document_id: str) -> bool:
+        """
+        Eliminar un documento del manifiesto
+
+        Returns:
+            True si el documento estaba registrado
+        """
+        with transaction.atomic():
+            manifest = UserManifest.objects.select_for_update().filter(user_id=user_id).first()
+            if manifest is None:
+                return False
+            entry = ManifestDocument.objects.filter(manifest=manifest, document_id=document_id).first()
+            if entry is None:
+                return False
+            entry.delete()
+            UserManifest.objects.filter(pk=manifest.pk).update(
+                total_documents=F('total_documents') - 1,
+                total_chunks=F('total_chunks') - entry.chunk_count,
+                total_bytes=F('total_bytes') - entry.byte_size
+            )
+            return True
+
+    def remove_user(self, user_id: str):
+        """Eliminar el manifiesto completo de un usuario (sus documentos en cascada)"""
+        UserManifest.objects.filter(user_id=user_id).delete()
+
+    def list_documents(self, user_id: str) -> List[Dict[str, Any]]:
+        """Documentos de un usuario en el formato de EnhancedRAGService.get_user_documents"""
+        entries = ManifestDocument.objects.filter(manifest__user_id=user_id)
+        return [
+            {
+                'document_id': entry.document_id,
+                'timestamp': entry.timestamp,
+                'chunk_count': entry.chunk_count,
+                'byte_size': entry.byte_size,
+                'metadata': entry.metadata
+            }
+            for entry in entries
+        ]
+
+    def rebuild(self, user_id: str, metadatas: List[Dict[str, Any]],
+                documents: Optional[List[Optional[str]]] = None) -> UserManifest:
+        """
+        Reconstruir el manifiesto a partir de los chunks existentes (datos anteriores al manifiesto)
+
+        Args:
+            user_id: ID del usuario
+            metadatas: Metadatos de todos los chunks de la colección
+            documents: Texto de los chunks, para estimar el tamaño en bytes
+
+        Returns:
+            Manifiesto reconstruido
+        """
+        grouped: Dict[str, Dict[str, Any]] = {}
+        for i, metadata in enumerate(metadatas or []):
+            document_id = metadata.get('document_id')
+            if not document_id:
+                continue
+            entry = grouped.get(document_id)
+            if entry is None:
+                entry = grouped[document_id] = {
+                    'timestamp': metadata.get('timestamp') or '',
+                    'chunk_count': 0,
+                    'byte_size': 0,
+                    'metadata': {k: v for k, v in metadata.items() if k not in _CHUNK_METADATA_KEYS}
+                }
+            entry['chunk_count'] += 1
+            if documents and documents[i]:
+                entry['byte_size'] += len(documents[i].encode('utf-8'))
+
+        try:
+            with transaction.atomic():
+                UserManifest.objects.filter(user_id=user_id).delete()
+                manifest = UserManifest.objects.create(
+                    user_id=user_id,
+                    total_documents=len(grouped),
+                    total_chunks=sum(entry['chunk_count'] for entry in grouped.values()),
+                    total_bytes=sum(entry['byte_size'] for entry in grouped.values())
+                )
+                ManifestDocument.objects.bulk_create([
+                    ManifestDocument(manifest=manifest, document_id=document_id, **entry)
+                    for document_id, entry in sorted(grouped.items(), key=lambda item: item[1]['timestamp'])
+                ])
+        except IntegrityError:
+            # Otro worker reconstruyó el manifiesto a la vez
+            return self.get(user_id)
+
+        self.logger.info(f"Manifiesto reconstruido para usuario {user_id}: {len(grouped)} documentos")
+        return manifest
@@ -0,0 +1,226 @@
+"""
+Embedding Scheduler - Agrupación dinámica (micro-batching) de peticiones de embeddings
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _EncodeRequest:
+    """Petición individual de un llamador pendiente de su vector"""
+
+    __slots__ = ('texts', 'future', 'enqueued_at')
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingBatchScheduler:
+    """
+    Planificador que agrupa peticiones concurrentes de `encode` en micro-lotes.
+
+    Cada llamador encola sus textos y espera su propio resultado; un hilo de
+    fondo junta peticiones hasta llenar `max_batch_size` textos o hasta que
+    pasan `max_wait_ms` desde la primera petición del lote, ejecuta una sola
+    pasada del modelo y reparte los vectores a cada llamador.
+    """
+
+    def __init__(self, model, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        """
+        Inicializar el planificador
+
+        Args:
+            model: Modelo con método `encode(List[str]) -> np.ndarray`
+            max_batch_size: Máximo de textos por pasada del modelo
+            max_wait_ms: Espera máxima para completar un lote, en milisegundos
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.model = model
+        self.max_batch_size = max_batch_size or int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', 64))
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else float(
+            os.getenv('EMBEDDING_BATCH_MAX_WAIT_MS', 5)
+        )
+
+        self._queue: "queue.Queue[_EncodeRequest]" = queue.Queue()
+        # Petición que no cupo en el lote anterior; abre el siguiente (solo la usa el hilo de fondo)
+        self._carry: Optional[_EncodeRequest] = None
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def _ensure_worker(self):
+        """Arrancar el hilo de fondo (también tras un fork del proceso)"""
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._worker_pid != os.getpid():
+                # Las peticiones heredadas del proceso padre no tienen quién las espere
+                self._queue = queue.Queue()
+                self._carry = None
+            self._worker = threading.Thread(
+                target=self._run,
+                name='embedding-batch-scheduler',
+                daemon=True
+            )
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Obtener embeddings para `texts`, compartiendo la pasada del modelo con
+        otros llamadores concurrentes
+
+        Args:
+            texts: Textos a vectorizar
+            timeout: Tiempo máximo de espera en segundos
+
+        Returns:
+            Matriz (len(texts), dim) con los embeddings en el mismo orden
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        self._ensure_worker()
+
+        # Las peticiones grandes (ingesta de chunks) se trocean para que las
+        # consultas interactivas puedan intercalarse entre sus lotes
+        requests = []
+        for start in range(0, len(texts), self.max_batch_size):
+            request = _EncodeRequest(list(texts[start:start + self.max_batch_size]))
+            self._queue.put(request)
+            requests.append(request)
+
+        results = [request.future.result(timeout=timeout) for request in requests]
+        return results[0] if len(results) == 1 else np.vstack(results)
+
+    def _collect_batch(self) -> List[_EncodeRequest]:
+        """
+        Esperar la primera petición y juntar las que lleguen dentro de la ventana
+
+        Una petición que haría superar `max_batch_size` no se añade: se guarda
+        y abre el lote siguiente, así que ningún lote pasa del máximo (salvo
+        una petición única mayor que él, que `encode` no genera).
+        """
+        first, self._carry = self._carry, None
+        if first is None:
+            first = self._queue.get()
+        batch = [first]
+        batch_size = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+
+        while batch_size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if batch_size + len(request.texts) > self.max_batch_size:
+                self._carry = request
+                break
+            batch.append(request)
+            batch_size += len(request.texts)
+
+        return batch
+
+    def _run(self):
+        """Bucle del hilo de fondo"""
+        while True:
+            batch = self._collect_batch()
+            all_texts = [text for request in batch for text in request.texts]
+
+            compute_start = time.perf_counter()
+            try:
+                embeddings = np.asarray(self.model.encode(all_texts))
+            except Exception as e:
+                self.logger.error(f"Error generando embeddings en lote: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            compute_time = time.perf_counter() - compute_start
+
+            offset = 0
+            finished_at = time.perf_counter()
+            latencies = []
+            for request in batch:
+                count = len(request.texts)
+                request.future.set_result(embeddings[offset:offset + count])
+                offset += count
+                latencies.append(finished_at - request.enqueued_at)
+
+            self._record_batch(len(batch), len(all_texts), compute_time, latencies)
+
+    def _record_batch(self, request_count: int, text_count: int,
+                      compute_time: float, latencies: List[float]):
+        """Actualizar contadores de rendimiento"""
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['requests'] += request_count
+            self._stats['texts'] += text_count
+            self._stats['compute_seconds'] += compute_time
+            self._stats['latency_seconds_total'] += sum(latencies)
+            self._stats['latency_seconds_max'] = max(self._stats['latency_seconds_max'], max(latencies))
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], text_count)
+
+    def reset_stats(self):
+        """Reiniciar contadores de rendimiento"""
+        with self._stats_lock:
+            self._stats = {
+                'batches': 0,
+                'requests': 0,
+                'texts': 0,
+                'compute_seconds': 0.0,
+                'latency_seconds_total': 0.0,
+                'latency_seconds_max': 0.0,
+                'largest_batch': 0,
+                'started_at': time.time()
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Obtener contadores de throughput y latencia
+
+        Returns:
+            Diccionario con estadísticas del planificador
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        batches = max(stats['batches'], 1)
+        requests = max(stats['requests'], 1)
+        elapsed = max(time.time() - stats['started_at'], 1e-9)
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'queue_depth': self._queue.qsize(),
+            'batches': stats['batches'],
+            'requests': stats['requests'],
+            'texts': stats['texts'],
+            'largest_batch': stats['largest_batch'],
+            'avg_batch_size': round(stats['texts'] / batches, 2),
+            'avg_requests_per_batch': round(stats['requests'] / batches, 2),
+            'avg_latency_ms': round(stats['latency_seconds_total'] / requests * 1000, 2),
+            'max_latency_ms': round(stats['latency_seconds_max'] * 1000, 2),
+            'texts_per_second': round(stats['texts'] / elapsed, 2),
+            'model_texts_per_second': round(stats['texts'] / max(stats['compute_seconds'], 1e-9), 2)
+        }
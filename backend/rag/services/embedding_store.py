@@ -0,0 +1,151 @@
+"""
+Embedding Store - Almacén de embeddings direccionado por contenido
+"""
+
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ContentAddressedEmbeddingStore:
+    """
+    Almacén persistente de embeddings indexado por hash de (modelo, texto del chunk).
+
+    Permite reutilizar los embeddings de chunks idénticos entre usuarios y
+    re-subidas del mismo documento: solo se vectorizan los chunks que no están
+    en el almacén. Usa SQLite en modo WAL para poder compartirse entre workers.
+    """
+
+    # Máximo de parámetros por consulta IN (límite conservador de SQLite)
+    _QUERY_BATCH = 500
+
+    def __init__(self, db_path: str):
+        """
+        Inicializar el almacén
+
+        Args:
+            db_path: Ruta del fichero SQLite
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, "
+                "dim INTEGER NOT NULL, "
+                "vector BLOB NOT NULL)"
+            )
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """Calcular la clave de contenido para un chunk"""
+        return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Obtener la conexión del hilo actual (se reabre tras un fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Recuperar los embeddings existentes para un conjunto de claves
+
+        Args:
+            keys: Claves de contenido
+
+        Returns:
+            Diccionario clave -> vector float32 (solo las claves encontradas)
+        """
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, np.ndarray] = {}
+        conn = self._connection()
+
+        for start in range(0, len(unique_keys), self._QUERY_BATCH):
+            batch = unique_keys[start:start + self._QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch
+            ).fetchall()
+            for key, dim, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32, count=dim)
+
+        with self._stats_lock:
+            self._hits += len(found)
+            self._misses += len(unique_keys) - len(found)
+
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        """
+        Guardar embeddings nuevos
+
+        Args:
+            items: Diccionario clave -> vector
+        """
+        if not items:
+            return
+
+        rows = []
+        for key, vector in items.items():
+            vector = np.asarray(vector, dtype=np.float32).ravel()
+            rows.append((key, int(vector.shape[0]), vector.tobytes()))
+
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)",
+                rows
+            )
+
+    def count(self) -> int:
+        """Número de embeddings almacenados"""
+        return self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_stats(self) -> Dict[str, object]:
+        """Obtener estadísticas de reutilización"""
+        with self._stats_lock:
+            lookups = self._hits + self._misses
+            return {
+                'db_path': self.db_path,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_stores: Dict[str, ContentAddressedEmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(db_path: str) -> ContentAddressedEmbeddingStore:
+    """Obtener el almacén compartido por el proceso para una ruta"""
+    store = _stores.get(db_path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(db_path)
+            if store is None:
+                store = ContentAddressedEmbeddingStore(db_path)
+                _stores[db_path] = store
+    return store
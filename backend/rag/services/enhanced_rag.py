@@ -3,14 +3,22 @@ Enhanced RAG Service - Sistema RAG mejorado para agentes especializados
 """
 
 import os
+import json
+import uuid
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
+import codecs
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Callable, IO, Union
 import numpy as np
 from datetime import datetime
 
+from .model_registry import get_model_registry
+from .vector_store import shared_collection_name
+from .cache import get_cache
+from .embedding_store import ContentAddressedEmbeddingStore, get_embedding_store
+from .document_manifest import DocumentManifest
+from backend_project.tracing import span
+
 logger = logging.getLogger(__name__)
 
 class EnhancedRAGService:
@@ -26,28 +34,65 @@ class EnhancedRAGService:
         # Configuración
         self.embedding_model_name = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
         self.persist_directory = os.getenv('CHROMA_PERSIST_DIRECTORY', './chroma_db')
+        self.vector_backend = os.getenv('RAG_VECTOR_BACKEND', 'chroma')
+        self.collection_mode = os.getenv('RAG_COLLECTION_MODE', 'per_user')
+        self.shared_collections = int(os.getenv('RAG_SHARED_COLLECTIONS', 16))
+        if self.collection_mode not in ('per_user', 'shared'):
+            raise ValueError(f"Modo de colecciones no soportado: {self.collection_mode}")
+        self.batching_enabled = os.getenv('EMBEDDING_BATCHING_ENABLED', 'True').lower() == 'true'
+        
+        # Modelo y cliente compartidos por proceso (se cargan una sola vez por worker)
+        self.registry = get_model_registry()
         
-        # Inicializar modelo de embeddings
+        # Obtener modelo de embeddings
         try:
-            self.embedding_model = SentenceTransformer(self.embedding_model_name)
-            self.logger.info(f"Modelo de embeddings cargado: {self.embedding_model_name}")
+            self.embedding_model = self.registry.get_embedding_model(self.embedding_model_name)
+            self.embedding_scheduler = (
+                self.registry.get_embedding_scheduler(self.embedding_model_name)
+                if self.batching_enabled else None
+            )
         except Exception as e:
             self.logger.error(f"Error cargando modelo de embeddings: {e}")
             raise
         
-        # Inicializar ChromaDB
+        # Obtener almacén vectorial (ChromaDB o índice plano NumPy)
         try:
-            self.chroma_client = chromadb.PersistentClient(
-                path=self.persist_directory,
-                settings=Settings(
-                    allow_reset=True,
-                    anonymized_telemetry=False
-                )
-            )
-            self.logger.info(f"ChromaDB inicializado en: {self.persist_directory}")
+            self.vector_store = self.registry.get_vector_store(self.vector_backend, self.persist_directory)
         except Exception as e:
-            self.logger.error(f"Error inicializando ChromaDB: {e}")
+            self.logger.error(f"Error inicializando almacén vectorial '{self.vector_backend}': {e}")
             raise
+        
+        # Cachés compartidas por proceso: consulta -> embedding y búsqueda -> resultados.
+        # La caché de resultados se invalida al modificar la colección del usuario en
+        # este worker; el TTL acota la antigüedad frente a cambios hechos en otros workers.
+        cache_max_bytes = int(float(os.getenv('RAG_CACHE_MAX_MB', 64)) * 1024 * 1024)
+        self.query_embedding_cache = get_cache(
+            'query_embeddings',
+            max_entries=int(os.getenv('RAG_QUERY_CACHE_MAX_ENTRIES', 5000)),
+            max_bytes=cache_max_bytes,
+            ttl_seconds=float(os.getenv('RAG_QUERY_CACHE_TTL', 3600))
+        )
+        self.retrieval_cache = get_cache(
+            'retrieval_results',
+            max_entries=int(os.getenv('RAG_RETRIEVAL_CACHE_MAX_ENTRIES', 2000)),
+            max_bytes=cache_max_bytes,
+            ttl_seconds=float(os.getenv('RAG_RETRIEVAL_CACHE_TTL', 300))
+        )
+        
+        # Almacén de embeddings por contenido para no re-vectorizar chunks ya conocidos
+        self.embedding_store = None
+        if os.getenv('RAG_EMBEDDING_STORE_ENABLED', 'True').lower() == 'true':
+            store_path = os.getenv(
+                'RAG_EMBEDDING_STORE_PATH',
+                os.path.join(self.persist_directory, 'embedding_store.sqlite3')
+            )
+            try:
+                self.embedding_store = get_embedding_store(store_path)
+            except Exception as e:
+                self.logger.warning(f"Almacén de embeddings no disponible: {e}")
+        
+        # Manifiesto por usuario (documentos, chunks y bytes) para listados y estadísticas
+        self.manifest = DocumentManifest()
     
     def process_document(self, document_content: str, user_id: str, 
                         document_metadata: Optional[Dict[str, Any]] = None) -> str:
@@ -73,18 +118,18 @@ class EnhancedRAGService:
             if not chunks:
                 raise ValueError("No se pudieron generar chunks del documento")
             
-            # Generar embeddings
-            embeddings = self.embedding_model.encode(chunks)
+            # Generar embeddings (reutilizando los ya calculados para chunks idénticos)
+            embeddings = self._encode_chunks(chunks)
             
             # Obtener o crear colección para el usuario
-            collection_name = f"user_{user_id}"
-            collection = self.chroma_client.get_or_create_collection(
+            collection_name = self._collection_name(user_id)
+            collection = self.vector_store.get_or_create_collection(
                 name=collection_name,
-                metadata={"user_id": user_id}
+                metadata=self._collection_metadata(user_id)
             )
             
             # Preparar metadatos
-            document_id = f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            document_id = self._new_document_id()
             base_metadata = {
                 "user_id": user_id,
                 "document_id": document_id,
@@ -115,6 +160,10 @@ class EnhancedRAGService:
                 ids=chunk_ids
             )
             
+            self.retrieval_cache.invalidate_tag(self._cache_tag(user_id))
+            self._record_in_manifest(user_id, collection, base_metadata,
+                                     len(chunks), len(document_content.encode('utf-8')))
+            
             self.logger.info(f"Documento procesado: {document_id} - {len(chunks)} chunks para usuario {user_id}")
             return document_id
             
@@ -122,6 +171,130 @@ class EnhancedRAGService:
             self.logger.error(f"Error procesando documento: {e}")
             raise
     
+    def process_document_stream(self, text_source: Union[Iterable[Union[str, bytes]], IO], user_id: str,
+                                document_metadata: Optional[Dict[str, Any]] = None,
+                                batch_size: Optional[int] = None,
+                                progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """
+        Procesar y vectorizar un documento en modo streaming con memoria acotada.
+        
+        El texto se consume por bloques, se divide en chunks de forma incremental y
+        cada lote de `batch_size` chunks se vectoriza e inserta antes de leer el
+        siguiente, por lo que el pico de memoria no depende del tamaño del documento.
+        
+        Args:
+            text_source: Generador/iterable de fragmentos de texto o bytes, u objeto tipo fichero
+            user_id: ID del usuario
+            document_metadata: Metadatos adicionales del documento
+            batch_size: Chunks por lote de vectorización e inserción
+            progress_callback: Función llamada tras cada lote con el progreso
+        
+        Returns:
+            ID del documento procesado
+        """
+        batch_size = batch_size or int(os.getenv('RAG_INGEST_BATCH_SIZE', 64))
+        
+        collection = self.vector_store.get_or_create_collection(
+            name=self._collection_name(user_id),
+            metadata=self._collection_metadata(user_id)
+        )
+        
+        document_id = self._new_document_id()
+        base_metadata = {
+            "user_id": user_id,
+            "document_id": document_id,
+            "timestamp": datetime.now().isoformat(),
+            "chunk_count": 0
+        }
+        if document_metadata:
+            base_metadata.update(document_metadata)
+        
+        progress = {
+            'document_id': document_id,
+            'chunks_processed': 0,
+            'batches_processed': 0,
+            'characters_processed': 0,
+            'done': False
+        }
+        byte_size = 0
+        
+        def count_bytes(blocks: Iterable[str]) -> Iterator[str]:
+            nonlocal byte_size
+            for block in blocks:
+                byte_size += len(block.encode('utf-8'))
+                yield block
+        
+        def flush(batch: List[str]):
+            start_index = progress['chunks_processed']
+            embeddings = self._encode_chunks(batch)
+            
+            chunk_metadatas = []
+            for offset, chunk in enumerate(batch):
+                chunk_metadata = base_metadata.copy()
+                chunk_metadata.update({
+                    "chunk_index": start_index + offset,
+                    "chunk_text": chunk[:100] + "..." if len(chunk) > 100 else chunk
+                })
+                chunk_metadatas.append(chunk_metadata)
+            
+            collection.upsert(
+                documents=batch,
+                embeddings=embeddings.tolist(),
+                metadatas=chunk_metadatas,
+                ids=[f"{document_id}_chunk_{start_index + offset}" for offset in range(len(batch))]
+            )
+            
+            progress['chunks_processed'] += len(batch)
+            progress['batches_processed'] += 1
+            progress['characters_processed'] += sum(len(chunk) for chunk in batch)
+            if progress_callback:
+                progress_callback(dict(progress))
+        
+        try:
+            batch = []
+            for chunk in self._iter_chunks(count_bytes(self._iter_text_blocks(text_source))):
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+            
+            total_chunks = progress['chunks_processed']
+            if total_chunks == 0:
+                raise ValueError("El contenido del documento está vacío")
+            
+            # El total de chunks solo se conoce al final: completar los metadatos por lotes
+            for start in range(0, total_chunks, batch_size):
+                end = min(start + batch_size, total_chunks)
+                collection.update(
+                    ids=[f"{document_id}_chunk_{i}" for i in range(start, end)],
+                    metadatas=[{"chunk_count": total_chunks}] * (end - start)
+                )
+            
+            self.retrieval_cache.invalidate_tag(self._cache_tag(user_id))
+            self._record_in_manifest(user_id, collection, dict(base_metadata, chunk_count=total_chunks),
+                                     total_chunks, byte_size)
+            
+            progress['done'] = True
+            if progress_callback:
+                progress_callback(dict(progress))
+            
+            self.logger.info(f"Documento procesado en streaming: {document_id} - {total_chunks} chunks "
+                             f"en {progress['batches_processed']} lotes para usuario {user_id}")
+            return document_id
+            
+        except Exception as e:
+            self.logger.error(f"Error procesando documento en streaming: {e}")
+            # No dejar documentos a medio indexar
+            if progress['chunks_processed']:
+                try:
+                    collection.delete(where=self._user_where(user_id, {"document_id": document_id}))
+                    self.retrieval_cache.invalidate_tag(self._cache_tag(user_id))
+                except Exception as cleanup_error:
+                    self.logger.error(f"Error limpiando documento parcial {document_id}: {cleanup_error}")
+            raise
+    
     def search_relevant_content(self, query: str, user_id: str, 
                                top_k: int = 5, filter_metadata: Optional[Dict] = None) -> List[str]:
         """
@@ -141,31 +314,47 @@ class EnhancedRAGService:
             if not query.strip():
                 return []
             
-            # Generar embedding de la consulta
-            query_embedding = self.embedding_model.encode([query])
-            
             # Obtener colección del usuario
-            collection_name = f"user_{user_id}"
+            collection_name = self._collection_name(user_id)
+            cache_tag = self._cache_tag(user_id)
+            
+            # Consultar caché de resultados
+            normalized_query = self._normalize_query(query)
+            query_hash = hashlib.sha256(normalized_query.encode('utf-8')).hexdigest()
+            retrieval_key = (
+                cache_tag,
+                query_hash,
+                top_k,
+                json.dumps(filter_metadata or {}, sort_keys=True, default=str)
+            )
+            with span('rag.retrieval_cache') as current:
+                cached_chunks = self.retrieval_cache.get(retrieval_key)
+                current.set(hit=cached_chunks is not None)
+            if cached_chunks is not None:
+                self.logger.info(f"Búsqueda servida desde caché: {len(cached_chunks)} chunks para '{query[:50]}...'")
+                return list(cached_chunks)
+            
+            # Generar embedding de la consulta
+            query_embedding = self._get_query_embedding(normalized_query)
             
             try:
-                collection = self.chroma_client.get_collection(collection_name)
+                collection = self.vector_store.get_collection(collection_name)
             except Exception:
                 # La colección no existe, usuario sin documentos
                 self.logger.info(f"No se encontraron documentos para el usuario {user_id}")
                 return []
             
-            # Preparar filtros
-            where_filter = {"user_id": user_id}
-            if filter_metadata:
-                where_filter.update(filter_metadata)
+            # Preparar filtros (el user_id aísla al usuario también en colecciones compartidas)
+            where_filter = self._user_where(user_id, filter_metadata)
             
             # Realizar búsqueda
-            results = collection.query(
-                query_embeddings=query_embedding.tolist(),
-                n_results=min(top_k, 10),  # Máximo 10 resultados
-                where=where_filter,
-                include=["documents", "metadatas", "distances"]
-            )
+            with span('rag.vector_query', collection=collection_name):
+                results = collection.query(
+                    query_embeddings=query_embedding.tolist(),
+                    n_results=min(top_k, 10),  # Máximo 10 resultados
+                    where=where_filter,
+                    include=["documents", "metadatas", "distances"]
+                )
             
             # Extraer documentos relevantes
             relevant_chunks = []
@@ -179,6 +368,8 @@ class EnhancedRAGService:
                     if distance < 1.2:  # Umbral de relevancia ajustable
                         relevant_chunks.append(doc)
             
+            self.retrieval_cache.set(retrieval_key, tuple(relevant_chunks), tag=cache_tag)
+            
             self.logger.info(f"Búsqueda completada: {len(relevant_chunks)} chunks relevantes para '{query[:50]}...'")
             return relevant_chunks
             
@@ -186,6 +377,130 @@ class EnhancedRAGService:
             self.logger.error(f"Error en búsqueda de contenido: {e}")
             return []
     
+    def _collection_name(self, user_id: str) -> str:
+        """Colección que almacena los chunks de un usuario según el modo configurado"""
+        if self.collection_mode == 'shared':
+            return shared_collection_name(user_id, self.shared_collections)
+        return f"user_{user_id}"
+    
+    def _collection_metadata(self, user_id: str) -> Dict[str, Any]:
+        if self.collection_mode == 'shared':
+            return {"mode": "shared"}
+        return {"user_id": user_id}
+    
+    def _cache_tag(self, user_id: str) -> str:
+        """Etiqueta de invalidación de la caché de resultados (por usuario en ambos modos)"""
+        return f"user_{user_id}"
+    
+    def _user_where(self, user_id: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Filtro de metadatos acotado al usuario
+        
+        Args:
+            user_id: ID del usuario (clave de partición)
+            extra: Condiciones adicionales
+        
+        Returns:
+            Filtro estilo ChromaDB (con $and si hay varias condiciones)
+        """
+        conditions = [{"user_id": user_id}]
+        conditions.extend({key: value} for key, value in (extra or {}).items())
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+    
+    def _new_document_id(self) -> str:
+        """Generar un ID de documento único (dos subidas en el mismo segundo no colisionan)"""
+        return f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    
+    def _normalize_query(self, query: str) -> str:
+        """Normalizar consulta para usarla como clave de caché"""
+        return " ".join(query.lower().split())
+    
+    def _get_query_embedding(self, normalized_query: str) -> np.ndarray:
+        """Obtener embedding de una consulta normalizada, usando la caché si es posible"""
+        cache_key = (self.embedding_model_name, normalized_query)
+        with span('rag.embed') as current:
+            query_embedding = self.query_embedding_cache.get(cache_key)
+            current.set(cached=query_embedding is not None)
+            if query_embedding is None:
+                query_embedding = np.asarray(self._encode([normalized_query]))
+                self.query_embedding_cache.set(cache_key, query_embedding)
+        return query_embedding
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        Obtener estadísticas de aciertos de las cachés RAG
+        
+        Returns:
+            Diccionario con estadísticas por caché
+        """
+        return {
+            'query_embeddings': self.query_embedding_cache.get_stats(),
+            'retrieval_results': self.retrieval_cache.get_stats()
+        }
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Generar embeddings, agrupando con otras peticiones concurrentes si el
+        micro-batching está habilitado
+        """
+        if self.embedding_scheduler is not None:
+            return self.embedding_scheduler.encode(texts)
+        return self.embedding_model.encode(texts)
+    
+    def _encode_chunks(self, chunks: List[str]) -> np.ndarray:
+        """
+        Generar embeddings de chunks consultando primero el almacén por contenido
+        y vectorizando solo los que faltan
+        
+        Args:
+            chunks: Lista de chunks de texto
+        
+        Returns:
+            Matriz de embeddings en el mismo orden que los chunks
+        """
+        if self.embedding_store is None:
+            return self._encode(chunks)
+        
+        try:
+            keys = [ContentAddressedEmbeddingStore.make_key(self.embedding_model_name, chunk)
+                    for chunk in chunks]
+            vectors = self.embedding_store.get_many(keys)
+            
+            # Vectorizar una sola vez cada chunk distinto que falte
+            missing = {}
+            for key, chunk in zip(keys, chunks):
+                if key not in vectors and key not in missing:
+                    missing[key] = chunk
+            
+            if missing:
+                new_embeddings = self._encode(list(missing.values()))
+                new_vectors = {key: np.asarray(vector, dtype=np.float32)
+                               for key, vector in zip(missing.keys(), new_embeddings)}
+                self.embedding_store.put_many(new_vectors)
+                vectors.update(new_vectors)
+            
+            self.logger.info(f"Embeddings de chunks: {len(chunks) - len(missing)} reutilizados, "
+                             f"{len(missing)} calculados")
+            return np.vstack([vectors[key] for key in keys])
+            
+        except Exception as e:
+            self.logger.warning(f"Error usando el almacén de embeddings, vectorizando todo: {e}")
+            return self._encode(chunks)
+    
+    def get_embedding_stats(self) -> Dict[str, Any]:
+        """
+        Obtener contadores de throughput y latencia de embeddings
+        
+        Returns:
+            Diccionario con estadísticas del planificador de micro-lotes
+        """
+        if self.embedding_scheduler is None:
+            return {'batching_enabled': False}
+        
+        stats = self.embedding_scheduler.get_stats()
+        stats['batching_enabled'] = True
+        return stats
+    
     def _chunk_document(self, document_content: str, chunk_size: int = 500, 
                        overlap: int = 50) -> List[str]:
         """
@@ -215,21 +530,7 @@ class EnhancedRAGService:
                 
                 # Si no es el último chunk, buscar un punto de corte natural
                 if end < len(content):
-                    # Buscar punto de corte en los últimos 100 caracteres
-                    search_start = max(end - 100, start)
-                    search_text = content[search_start:end]
-                    
-                    # Buscar separadores naturales
-                    separators = ['\n\n', '. ', '.\n', '\n', ';', ',']
-                    best_cut = end
-                    
-                    for separator in separators:
-                        separator_pos = search_text.rfind(separator)
-                        if separator_pos != -1:
-                            best_cut = search_start + separator_pos + len(separator)
-                            break
-                    
-                    end = best_cut
+                    end = self._find_chunk_cut(content, start, end)
                 
                 # Extraer chunk
                 chunk = content[start:end].strip()
@@ -245,6 +546,100 @@ class EnhancedRAGService:
             self.logger.error(f"Error chunking documento: {e}")
             return [document_content]  # Fallback: documento completo
     
+    def _find_chunk_cut(self, content: str, start: int, end: int) -> int:
+        """
+        Buscar un punto de corte natural en los últimos 100 caracteres del chunk
+        
+        Args:
+            content: Texto que contiene el chunk
+            start: Inicio del chunk
+            end: Fin máximo del chunk
+        
+        Returns:
+            Posición de corte
+        """
+        search_start = max(end - 100, start)
+        search_text = content[search_start:end]
+        
+        # Buscar separadores naturales
+        separators = ['\n\n', '. ', '.\n', '\n', ';', ',']
+        
+        for separator in separators:
+            separator_pos = search_text.rfind(separator)
+            if separator_pos != -1:
+                return search_start + separator_pos + len(separator)
+        
+        return end
+    
+    def _iter_text_blocks(self, text_source: Union[Iterable[Union[str, bytes]], IO],
+                          block_size: int = 65536) -> Iterator[str]:
+        """
+        Recorrer una fuente de texto en bloques de tamaño acotado
+        
+        Args:
+            text_source: Objeto tipo fichero (texto o binario) o iterable de fragmentos
+            block_size: Tamaño máximo de cada bloque en caracteres
+        
+        Returns:
+            Iterador de bloques de texto
+        """
+        if hasattr(text_source, 'read'):
+            pieces = iter(lambda: text_source.read(block_size), text_source.read(0))
+        else:
+            pieces = iter(text_source)
+        
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for piece in pieces:
+            if isinstance(piece, (bytes, bytearray)):
+                piece = decoder.decode(piece)
+            # Fragmentos enormes se trocean para no copiar el búfer completo en cada corte
+            for offset in range(0, len(piece), block_size):
+                yield piece[offset:offset + block_size]
+        
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+    
+    def _iter_chunks(self, text_blocks: Iterable[str], chunk_size: int = 500,
+                     overlap: int = 50) -> Iterator[str]:
+        """
+        Dividir texto en chunks de forma incremental, con la misma segmentación
+        que `_chunk_document` pero manteniendo en memoria solo un búfer acotado
+        
+        Args:
+            text_blocks: Bloques de texto consecutivos
+            chunk_size: Tamaño máximo de cada chunk en caracteres
+            overlap: Overlap entre chunks en caracteres
+        
+        Returns:
+            Iterador de chunks de texto
+        """
+        buffer = ""
+        started = False
+        
+        for block in text_blocks:
+            if not started:
+                # Equivalente al strip() inicial del documento completo
+                block = block.lstrip()
+                if not block:
+                    continue
+                started = True
+            
+            buffer += block
+            
+            # Mientras haya más texto que un chunk, el corte no es el último
+            while len(buffer) > chunk_size:
+                end = self._find_chunk_cut(buffer, 0, chunk_size)
+                chunk = buffer[:end].strip()
+                if chunk:
+                    yield chunk
+                buffer = buffer[end - overlap:]
+        
+        # Último tramo del documento
+        buffer = buffer.rstrip()
+        if buffer:
+            yield from self._chunk_document(buffer, chunk_size, overlap)
+    
     def get_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
         """
         Obtener información de documentos de un usuario
@@ -256,38 +651,77 @@ class EnhancedRAGService:
             Lista de información de documentos
         """
         try:
-            collection_name = f"user_{user_id}"
-            
-            try:
-                collection = self.chroma_client.get_collection(collection_name)
-            except Exception:
+            if self._get_manifest(user_id) is None:
                 return []
             
-            # Obtener todos los metadatos
-            results = collection.get(include=["metadatas"])
-            
-            if not results or not results.get('metadatas'):
-                return []
-            
-            # Agrupar por documento
-            documents = {}
-            for metadata in results['metadatas']:
-                doc_id = metadata.get('document_id')
-                if doc_id and doc_id not in documents:
-                    documents[doc_id] = {
-                        'document_id': doc_id,
-                        'timestamp': metadata.get('timestamp'),
-                        'chunk_count': metadata.get('chunk_count', 0),
-                        'metadata': {k: v for k, v in metadata.items() 
-                                   if k not in ['user_id', 'document_id', 'chunk_index', 'chunk_text']}
-                    }
-            
-            return list(documents.values())
+            return self.manifest.list_documents(user_id)
             
         except Exception as e:
             self.logger.error(f"Error obteniendo documentos del usuario {user_id}: {e}")
             return []
     
+    def _get_manifest(self, user_id: str, collection=None, exclude_document_id: Optional[str] = None):
+        """
+        Obtener el manifiesto del usuario, reconstruyéndolo desde la colección si aún no existe
+        
+        Args:
+            user_id: ID del usuario
+            collection: Colección del usuario (si ya se tiene)
+            exclude_document_id: Documento que no se incluye en la reconstrucción
+        
+        Returns:
+            UserManifest, o None si el usuario no tiene colección
+        """
+        manifest = self.manifest.get(user_id)
+        if manifest is not None:
+            return manifest
+        
+        if collection is None:
+            try:
+                collection = self.vector_store.get_collection(self._collection_name(user_id))
+            except Exception:
+                return None
+        
+        # Datos anteriores al manifiesto: un único recorrido de los chunks del usuario
+        results = collection.get(where=self._user_where(user_id), include=["metadatas", "documents"])
+        metadatas, documents = results.get('metadatas') or [], results.get('documents')
+        if exclude_document_id:
+            keep = [i for i, metadata in enumerate(metadatas) if metadata.get('document_id') != exclude_document_id]
+            metadatas = [metadatas[i] for i in keep]
+            documents = [documents[i] for i in keep] if documents else documents
+        if self.collection_mode == 'shared' and not metadatas:
+            # En una colección compartida, sin chunks propios no hay colección del usuario
+            return None
+        return self.manifest.rebuild(user_id, metadatas, documents)
+    
+    def _record_in_manifest(self, user_id: str, collection, base_metadata: Dict[str, Any],
+                            chunk_count: int, byte_size: int):
+        """Registrar en el manifiesto un documento ya insertado en la colección"""
+        try:
+            if not self.manifest.exists(user_id):
+                # Reconstruir sin el documento recién insertado: su tamaño real es el del
+                # documento, no la suma de sus chunks (que se solapan)
+                self._get_manifest(user_id, collection, exclude_document_id=base_metadata['document_id'])
+            
+            self.manifest.record_document(
+                user_id,
+                base_metadata['document_id'],
+                chunk_count,
+                byte_size,
+                base_metadata['timestamp'],
+                {k: v for k, v in base_metadata.items() if k not in ('user_id', 'document_id')}
+            )
+        except Exception as e:
+            # Un manifiesto desactualizado se descarta y se reconstruye en la siguiente lectura
+            self.logger.error(f"Error actualizando manifiesto del usuario {user_id}: {e}")
+            self._invalidate_manifest(user_id)
+    
+    def _invalidate_manifest(self, user_id: str):
+        try:
+            self.manifest.remove_user(user_id)
+        except Exception as e:
+            self.logger.error(f"Error eliminando manifiesto del usuario {user_id}: {e}")
+    
     def delete_user_documents(self, user_id: str, document_id: Optional[str] = None) -> bool:
         """
         Eliminar documentos de un usuario
@@ -300,10 +734,10 @@ class EnhancedRAGService:
             True si se eliminó exitosamente
         """
         try:
-            collection_name = f"user_{user_id}"
+            collection_name = self._collection_name(user_id)
             
             try:
-                collection = self.chroma_client.get_collection(collection_name)
+                collection = self.vector_store.get_collection(collection_name)
             except Exception:
                 return True  # No hay documentos que eliminar
             
@@ -311,16 +745,31 @@ class EnhancedRAGService:
                 # Eliminar documento específico
                 # Obtener IDs de chunks del documento
                 results = collection.get(
-                    where={"document_id": document_id},
+                    where=self._user_where(user_id, {"document_id": document_id}),
                     include=["metadatas"]
                 )
                 
                 if results and results.get('ids'):
                     collection.delete(ids=results['ids'])
+                    self.retrieval_cache.invalidate_tag(self._cache_tag(user_id))
                     self.logger.info(f"Documento {document_id} eliminado para usuario {user_id}")
+                
+                try:
+                    self.manifest.remove_document(user_id, document_id)
+                except Exception as e:
+                    self.logger.error(f"Error actualizando manifiesto del usuario {user_id}: {e}")
+                    self._invalidate_manifest(user_id)
+            elif self.collection_mode == 'shared':
+                # Eliminar solo los chunks del usuario de la colección compartida
+                collection.delete(where=self._user_where(user_id))
+                self.retrieval_cache.invalidate_tag(self._cache_tag(user_id))
+                self._invalidate_manifest(user_id)
+                self.logger.info(f"Todos los documentos eliminados para usuario {user_id}")
             else:
                 # Eliminar toda la colección del usuario
-                self.chroma_client.delete_collection(collection_name)
+                self.vector_store.delete_collection(collection_name)
+                self.retrieval_cache.invalidate_tag(self._cache_tag(user_id))
+                self._invalidate_manifest(user_id)
                 self.logger.info(f"Todos los documentos eliminados para usuario {user_id}")
             
             return True
@@ -340,35 +789,24 @@ class EnhancedRAGService:
             Diccionario con estadísticas
         """
         try:
-            collection_name = f"user_{user_id}"
+            collection_name = self._collection_name(user_id)
             
-            try:
-                collection = self.chroma_client.get_collection(collection_name)
-            except Exception:
+            manifest = self._get_manifest(user_id)
+            if manifest is None:
                 return {
                     'total_chunks': 0,
                     'total_documents': 0,
-                    'collection_exists': False
+                    'collection_exists': False,
+                    'cache': self.get_cache_stats()
                 }
             
-            # Contar total de chunks
-            count_result = collection.count()
-            
-            # Obtener documentos únicos
-            results = collection.get(include=["metadatas"])
-            unique_docs = set()
-            
-            if results and results.get('metadatas'):
-                for metadata in results['metadatas']:
-                    doc_id = metadata.get('document_id')
-                    if doc_id:
-                        unique_docs.add(doc_id)
-            
             return {
-                'total_chunks': count_result,
-                'total_documents': len(unique_docs),
+                'total_chunks': manifest.total_chunks,
+                'total_documents': manifest.total_documents,
+                'total_bytes': manifest.total_bytes,
                 'collection_exists': True,
-                'collection_name': collection_name
+                'collection_name': collection_name,
+                'cache': self.get_cache_stats()
             }
             
         except Exception as e:
@@ -395,14 +833,21 @@ class EnhancedRAGService:
         }
         
         try:
-            # Verificar ChromaDB
-            collections = self.chroma_client.list_collections()
+            # Verificar almacén vectorial
+            collections = self.vector_store.list_collections()
+            health_status['vector_backend'] = self.vector_store.backend_name
             health_status['chroma_collections'] = len(collections)
             
             # Test de embedding
             test_embedding = self.embedding_model.encode(["test"])
             health_status['embedding_dimension'] = len(test_embedding)
             
+            # Estado del registro de modelos del proceso
+            health_status['model_registry'] = self.registry.get_stats()
+            health_status['embedding_scheduler'] = self.get_embedding_stats()
+            if self.embedding_store is not None:
+                health_status['embedding_store'] = self.embedding_store.get_stats()
+            
         except Exception as e:
             health_status['status'] = 'unhealthy'
             health_status['error'] = str(e)
@@ -0,0 +1,719 @@
+"""
+FAISS Vector Store - Índices ANN (HNSW/IVF) persistentes para colecciones grandes
+"""
+
+import os
+import re
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from .cache import LRUTTLCache
+from .vector_store import VectorCollection, DirectoryVectorStore, interprocess_lock
+
+logger = logging.getLogger(__name__)
+
+# Claves de metadatos permitidas en filtros (se interpolan en la ruta JSON)
+_METADATA_KEY_RE = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+# Claves con índice de expresión en SQLite (filtros habituales del servicio RAG)
+_INDEXED_METADATA_KEYS = ('user_id', 'document_id')
+
+# Filas por bloque al copiar vectores o añadirlos al índice
+_ADD_BLOCK_ROWS = 65536
+
+# Máximo de parámetros por consulta IN (límite conservador de SQLite)
+_QUERY_BATCH = 500
+
+
+def _metadata_expression(key: str) -> str:
+    """Expresión SQL que extrae una clave de los metadatos JSON"""
+    if not _METADATA_KEY_RE.match(key):
+        raise ValueError(f"Clave de metadatos no soportada en filtros: {key}")
+    return f"json_extract(metadata, '$.\"{key}\"')"
+
+
+def _where_to_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """
+    Traducir un filtro estilo ChromaDB a una cláusula SQL sobre la tabla de registros
+
+    Args:
+        where: Filtro de metadatos ($and, $or, $eq, $ne, $in, $nin, $gt, $gte, $lt, $lte)
+
+    Returns:
+        Tupla (cláusula, parámetros)
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+
+    for key, condition in where.items():
+        if key in ('$and', '$or'):
+            sub_clauses = []
+            for sub_where in condition:
+                sub_clause, sub_params = _where_to_sql(sub_where)
+                sub_clauses.append(sub_clause)
+                params.extend(sub_params)
+            joiner = ' AND ' if key == '$and' else ' OR '
+            clauses.append(f"({joiner.join(sub_clauses) or '1'})")
+            continue
+
+        expression = _metadata_expression(key)
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+
+        for operator, operand in condition.items():
+            if operator == '$eq':
+                clauses.append(f"{expression} = ?")
+                params.append(operand)
+            elif operator == '$ne':
+                clauses.append(f"({expression} IS NULL OR {expression} != ?)")
+                params.append(operand)
+            elif operator in ('$in', '$nin'):
+                operand = list(operand)
+                if not operand:
+                    clauses.append('0' if operator == '$in' else '1')
+                    continue
+                placeholders = ",".join("?" * len(operand))
+                if operator == '$in':
+                    clauses.append(f"{expression} IN ({placeholders})")
+                else:
+                    clauses.append(f"({expression} IS NULL OR {expression} NOT IN ({placeholders}))")
+                params.extend(operand)
+            elif operator in ('$gt', '$gte', '$lt', '$lte'):
+                sql_operator = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}[operator]
+                clauses.append(f"{expression} {sql_operator} ?")
+                params.append(operand)
+            else:
+                raise ValueError(f"Operador de filtro no soportado: {operator}")
+
+    return ' AND '.join(clauses) or '1', params
+
+
+class FaissCollection(VectorCollection):
+    """
+    Colección respaldada por un índice FAISS (HNSW o IVF) para corpus de
+    millones de chunks, donde la búsqueda plana ya no cumple la latencia.
+
+    Disposición en disco (una carpeta por colección):
+      - `vectors.{gen}.f32`: matriz float32 en bruto, solo se añaden filas.
+        La fila es el ID interno de FAISS.
+      - `index.{gen}.faiss`: instantánea del índice. Al cargarla se añaden
+        las filas posteriores, así que no hace falta guardarla en cada escritura.
+      - `records.sqlite3`: IDs, documentos y metadatos, lápidas y estado.
+
+    Las altas son incrementales. Las bajas y las sustituciones dejan una lápida
+    que se excluye en la búsqueda. Cuando las lápidas superan
+    `compact_ratio`, se compacta: se reescriben los vectores vivos, se
+    reconstruye el índice y se sube la generación. En modo IVF se usa un
+    índice exacto hasta tener vectores suficientes para entrenar los centroides.
+    """
+
+    def __init__(self, name: str, directory: str, options: Dict[str, Any]):
+        """
+        Inicializar la colección
+
+        Args:
+            name: Nombre de la colección
+            directory: Carpeta de la colección
+            options: Configuración del índice (ver FaissVectorStore)
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.name = name
+        self.directory = directory
+        self.options = options
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+        self._version = None
+        self._generation = None
+        self._index = None
+        self._index_kind = None
+        self._saved_rows = 0
+        self._dim = 0
+        self._row_count = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._tombstones = np.zeros(0, dtype=np.int64)
+        self._tombstone_selector = None
+        self._filter_cache = LRUTTLCache(
+            f"faiss_filters:{name}", max_entries=256, max_bytes=64 * 1024 * 1024, ttl_seconds=3600
+        )
+
+        self.metadata: Dict[str, Any] = {}
+        collection_meta_path = os.path.join(directory, 'collection.json')
+        if os.path.exists(collection_meta_path):
+            with open(collection_meta_path) as f:
+                self.metadata = json.load(f)
+
+        self._init_schema()
+
+    # ------------------------------------------------------------------
+    # SQLite
+    # ------------------------------------------------------------------
+
+    def _connection(self) -> sqlite3.Connection:
+        """Obtener la conexión del hilo actual (se reabre tras un fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(os.path.join(self.directory, 'records.sqlite3'),
+                                   timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self, immediate: bool = False):
+        """Transacción explícita (de lectura consistente o de escritura)"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _init_schema(self):
+        with self._transaction(immediate=True) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "faiss_id INTEGER PRIMARY KEY, "
+                "record_id TEXT NOT NULL UNIQUE, "
+                "document TEXT, "
+                "metadata TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS tombstones (faiss_id INTEGER PRIMARY KEY)")
+            for key in _INDEXED_METADATA_KEYS:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_records_{key} ON records ({_metadata_expression(key)})"
+                )
+
+    @staticmethod
+    def _read_state(conn: sqlite3.Connection) -> Dict[str, Any]:
+        values = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        return {
+            'version': int(values.get('version', 0)),
+            'generation': int(values.get('generation', 0)),
+            'row_count': int(values.get('row_count', 0)),
+            'dim': int(values.get('dim', 0)),
+            'index_kind': values.get('index_kind'),
+        }
+
+    @staticmethod
+    def _write_state(conn: sqlite3.Connection, state: Dict[str, Any]):
+        """Guardar el estado incrementando la versión (invalida cachés de otros procesos)"""
+        state = dict(state, version=state['version'] + 1)
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in state.items() if value is not None]
+        )
+
+    # ------------------------------------------------------------------
+    # Índice y vectores
+    # ------------------------------------------------------------------
+
+    def _vectors_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'vectors.{generation}.f32')
+
+    def _index_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'index.{generation}.faiss')
+
+    def _write_lock(self):
+        return interprocess_lock(self._lock, os.path.join(self.directory, '.lock'))
+
+    def _target_kind(self, live_count: int) -> str:
+        """Tipo de índice que corresponde a la configuración y al tamaño"""
+        index_type = self.options['index_type']
+        if index_type == 'ivf' and live_count < self.options['nlist'] * 39:
+            # FAISS necesita ~39 vectores por centroide para entrenar IVF
+            return 'flat'
+        return index_type
+
+    def _new_index(self, kind: str, dim: int):
+        if kind == 'hnsw':
+            index = faiss.index_factory(dim, f"HNSW{self.options['hnsw_m']},Flat")
+            index.hnsw.efConstruction = self.options['ef_construction']
+            return index
+        if kind == 'ivf':
+            return faiss.index_factory(dim, f"IVF{self.options['nlist']},Flat")
+        return faiss.IndexFlatL2(dim)
+
+    def _open_vectors(self, generation: int, row_count: int, dim: int):
+        self._dim = dim
+        self._row_count = row_count
+        if row_count and dim:
+            self._vectors = np.memmap(self._vectors_path(generation), dtype=np.float32,
+                                      mode='r', shape=(row_count, dim))
+        else:
+            self._vectors = None
+
+    def _add_rows(self, index, vectors: np.ndarray, start: int, stop: int):
+        for block_start in range(start, stop, _ADD_BLOCK_ROWS):
+            block_stop = min(block_start + _ADD_BLOCK_ROWS, stop)
+            index.add(np.ascontiguousarray(vectors[block_start:block_stop]))
+
+    def _load_generation(self, state: Dict[str, Any]):
+        """Cargar la instantánea del índice de una generación y ponerla al día"""
+        generation = state['generation']
+        index_path = self._index_path(generation)
+        dim = state['dim']
+
+        if os.path.exists(index_path):
+            index = faiss.read_index(index_path)
+            saved_rows = index.ntotal
+        elif dim:
+            index = self._new_index(state['index_kind'] or self._target_kind(0), dim)
+            saved_rows = 0
+        else:
+            index, saved_rows = None, 0
+
+        # La instantánea puede ser más reciente que el estado leído: sus filas ya están en disco
+        row_count = max(state['row_count'], index.ntotal if index is not None else 0)
+        self._open_vectors(generation, row_count, dim)
+        if index is not None and index.ntotal < row_count:
+            self._add_rows(index, self._vectors, index.ntotal, row_count)
+
+        self._index = index
+        self._index_kind = state['index_kind'] or self._target_kind(0)
+        self._saved_rows = saved_rows
+        self._generation = generation
+
+    def _refresh(self):
+        """Sincronizar con el estado publicado (altas nuevas, lápidas o compactación)"""
+        with self._lock:
+            state = self._read_state(self._connection())
+            if state['version'] == self._version:
+                return
+
+            if state['generation'] != self._generation or (self._index is None and state['dim']):
+                for _ in range(5):
+                    try:
+                        self._load_generation(state)
+                        break
+                    except (FileNotFoundError, RuntimeError, ValueError):
+                        # Otra compactación publicó una generación nueva y borró esta; reintentar
+                        state = self._read_state(self._connection())
+                else:
+                    raise RuntimeError(f"No se pudo cargar una generación estable de la colección {self.name}")
+            elif state['row_count'] > self._row_count:
+                previous_rows = self._index.ntotal
+                self._open_vectors(state['generation'], state['row_count'], state['dim'])
+                self._add_rows(self._index, self._vectors, previous_rows, state['row_count'])
+
+            rows = self._connection().execute("SELECT faiss_id FROM tombstones ORDER BY faiss_id").fetchall()
+            self._tombstones = np.array([row[0] for row in rows], dtype=np.int64)
+            if len(self._tombstones):
+                batch = faiss.IDSelectorBatch(self._tombstones)
+                self._tombstone_selector = (batch, faiss.IDSelectorNot(batch))
+            else:
+                self._tombstone_selector = None
+
+            self._filter_cache.clear()
+            self._version = state['version']
+
+    def _save_snapshot(self):
+        """Guardar la instantánea del índice (requiere el lock de escritura)"""
+        if self._index is None:
+            return
+        path = self._index_path(self._generation)
+        tmp_path = path + '.tmp'
+        faiss.write_index(self._index, tmp_path)
+        os.replace(tmp_path, path)
+        self._saved_rows = self._index.ntotal
+
+    def _maintain(self):
+        """Compactar, entrenar o guardar la instantánea si toca (requiere el lock de escritura)"""
+        live_count = self._row_count - len(self._tombstones)
+        target_kind = self._target_kind(live_count)
+        kind_changed = target_kind != self._index_kind and not (
+            self._index_kind == 'ivf' and self.options['index_type'] == 'ivf'
+        )
+
+        if kind_changed or (len(self._tombstones)
+                            and len(self._tombstones) >= self.options['compact_ratio'] * self._row_count):
+            self._rebuild()
+        elif self._index is not None and self._index.ntotal - self._saved_rows >= self.options['save_interval']:
+            self._save_snapshot()
+
+    def _rebuild(self):
+        """
+        Reescribir los vectores vivos y reconstruir el índice en una nueva generación
+        (requiere el lock de escritura)
+        """
+        conn = self._connection()
+        live = np.array(
+            [row[0] for row in conn.execute("SELECT faiss_id FROM records ORDER BY faiss_id").fetchall()],
+            dtype=np.int64
+        )
+        state = self._read_state(conn)
+        old_generation = state['generation']
+        generation = old_generation + 1
+        dim = state['dim']
+
+        with open(self._vectors_path(generation), 'wb') as f:
+            for block_start in range(0, len(live), _ADD_BLOCK_ROWS):
+                rows = live[block_start:block_start + _ADD_BLOCK_ROWS]
+                f.write(np.ascontiguousarray(self._vectors[rows], dtype=np.float32).tobytes())
+
+        kind = self._target_kind(len(live))
+        index = self._new_index(kind, dim) if dim else None
+        self._open_vectors(generation, len(live), dim)
+        if index is not None and len(live):
+            if not index.is_trained:
+                sample_size = min(len(live), self.options['nlist'] * 256)
+                sample = np.sort(np.random.default_rng(0).choice(len(live), sample_size, replace=False))
+                index.train(np.ascontiguousarray(self._vectors[sample]))
+            self._add_rows(index, self._vectors, 0, len(live))
+
+        self._index = index
+        self._index_kind = kind
+        self._generation = generation
+        self._save_snapshot()
+
+        with self._transaction(immediate=True) as conn:
+            conn.execute("DELETE FROM tombstones")
+            # Renumerar en orden ascendente: cada ID nuevo es <= el antiguo y ya está libre
+            conn.executemany(
+                "UPDATE records SET faiss_id = ? WHERE faiss_id = ?",
+                [(new_id, int(old_id)) for new_id, old_id in enumerate(live) if new_id != old_id]
+            )
+            self._write_state(conn, dict(state, generation=generation, row_count=len(live), index_kind=kind))
+
+        for stale in (self._vectors_path(old_generation), self._index_path(old_generation)):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+        self.logger.info(
+            f"Colección {self.name} compactada: {len(live)} vectores, índice {kind}, generación {generation}"
+        )
+        self._refresh()
+
+    def compact(self):
+        """Forzar la compactación y reconstrucción del índice"""
+        with self._write_lock():
+            self._refresh()
+            self._rebuild()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado del índice de la colección"""
+        self._refresh()
+        return {
+            'name': self.name,
+            'index_kind': self._index_kind,
+            'generation': self._generation,
+            'rows': self._row_count,
+            'live': self._row_count - len(self._tombstones),
+            'tombstones': len(self._tombstones),
+            'unsaved_rows': (self._index.ntotal - self._saved_rows) if self._index is not None else 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Filtros
+    # ------------------------------------------------------------------
+
+    def _candidates(self, where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Filas que cumplen el filtro, con los vectores precargados si son pocas
+
+        Returns:
+            None si no hay filtro o lo cumplen todas las filas vivas
+        """
+        if not where:
+            return None
+
+        cache_key = json.dumps(where, sort_keys=True, default=str)
+        entry = self._filter_cache.get(cache_key)
+        if entry is None:
+            clause, params = _where_to_sql(where)
+            rows = self._connection().execute(
+                f"SELECT faiss_id FROM records WHERE {clause} ORDER BY faiss_id", params
+            ).fetchall()
+            candidates = np.array([row[0] for row in rows], dtype=np.int64)
+            # Ignorar filas publicadas después del último refresco
+            candidates = candidates[candidates < self._row_count]
+
+            entry = {'rows': candidates, 'all': len(candidates) == self._row_count - len(self._tombstones)}
+            if not entry['all'] and 0 < len(candidates) <= self.options['exact_search_max']:
+                vectors = np.ascontiguousarray(self._vectors[candidates])
+                entry['vectors'] = vectors
+                entry['norms'] = np.einsum('ij,ij->i', vectors, vectors)
+            elif not entry['all'] and len(candidates):
+                entry['selector'] = faiss.IDSelectorBatch(candidates)
+            self._filter_cache.set(cache_key, entry)
+
+        return None if entry['all'] else entry
+
+    def _search_params(self, k: int, selector):
+        kind = self._index_kind
+        if kind == 'hnsw':
+            params = faiss.SearchParametersHNSW(efSearch=max(self.options['ef_search'], k))
+        elif kind == 'ivf':
+            params = faiss.SearchParametersIVF(nprobe=self.options['nprobe'])
+        else:
+            params = faiss.SearchParameters()
+        if selector is not None:
+            params.sel = selector
+        return params
+
+    # ------------------------------------------------------------------
+    # API de colección
+    # ------------------------------------------------------------------
+
+    def _existing_rows(self, conn: sqlite3.Connection, ids: List[str]) -> Dict[str, int]:
+        existing = {}
+        for start in range(0, len(ids), _QUERY_BATCH):
+            batch = ids[start:start + _QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            existing.update(conn.execute(
+                f"SELECT record_id, faiss_id FROM records WHERE record_id IN ({placeholders})", batch
+            ).fetchall())
+        return existing
+
+    def _write_records(self, ids: List[str], embeddings, metadatas, documents, replace: bool):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(ids):
+            raise ValueError("Las dimensiones de los embeddings no coinciden con los IDs")
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or [None for _ in ids]
+
+        with self._write_lock():
+            self._refresh()
+            conn = self._connection()
+            state = self._read_state(conn)
+            if state['dim'] and state['dim'] != embeddings.shape[1]:
+                raise ValueError(f"Dimensión {embeddings.shape[1]} distinta de la colección ({state['dim']})")
+
+            existing = self._existing_rows(conn, list(ids))
+            # Posición de cada ID en el lote (la última gana, como en upsert)
+            positions = {record_id: i for i, record_id in enumerate(ids)}
+            if not replace:
+                positions = {record_id: i for record_id, i in positions.items() if record_id not in existing}
+            if not positions:
+                return
+
+            replaced = [existing[record_id] for record_id in positions if record_id in existing]
+            selected = list(positions.values())
+            start_row = state['row_count']
+            dim = embeddings.shape[1]
+
+            # Las filas añadidas solo son visibles tras confirmar el estado en SQLite
+            with open(self._vectors_path(state['generation']), 'ab') as f:
+                f.truncate(start_row * dim * 4)
+                f.write(np.ascontiguousarray(embeddings[selected]).tobytes())
+
+            with self._transaction(immediate=True) as conn:
+                if replaced:
+                    conn.executemany("DELETE FROM records WHERE faiss_id = ?", [(row,) for row in replaced])
+                    conn.executemany("INSERT INTO tombstones (faiss_id) VALUES (?)", [(row,) for row in replaced])
+                conn.executemany(
+                    "INSERT INTO records (faiss_id, record_id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (start_row + offset, ids[i], documents[i],
+                         json.dumps(metadatas[i] or {}, ensure_ascii=False))
+                        for offset, i in enumerate(selected)
+                    ]
+                )
+                self._write_state(conn, dict(
+                    state,
+                    row_count=start_row + len(selected),
+                    dim=dim,
+                    index_kind=state['index_kind'] or self._target_kind(0)
+                ))
+
+            self._refresh()
+            self._maintain()
+
+    def add(self, ids, embeddings, metadatas=None, documents=None):
+        self._write_records(ids, embeddings, metadatas, documents, replace=False)
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        self._write_records(ids, embeddings, metadatas, documents, replace=True)
+
+    def update(self, ids, metadatas=None):
+        if not metadatas:
+            return
+        with self._write_lock():
+            with self._transaction(immediate=True) as conn:
+                rows = []
+                for record_id, metadata in zip(ids, metadatas):
+                    current = conn.execute(
+                        "SELECT metadata FROM records WHERE record_id = ?", (record_id,)
+                    ).fetchone()
+                    if current is not None:
+                        merged = dict(json.loads(current[0]), **metadata)
+                        rows.append((json.dumps(merged, ensure_ascii=False), record_id))
+                conn.executemany("UPDATE records SET metadata = ? WHERE record_id = ?", rows)
+                self._write_state(conn, self._read_state(conn))
+            self._refresh()
+
+    def _select_rows(self, conn: sqlite3.Connection, ids: Optional[List[str]],
+                     where: Optional[Dict[str, Any]]) -> List[tuple]:
+        """Registros (faiss_id, record_id, document, metadata) que cumplen IDs y filtro"""
+        clause, params = _where_to_sql(where) if where else ('1', [])
+        query = f"SELECT faiss_id, record_id, document, metadata FROM records WHERE {clause}"
+        if ids is None:
+            return conn.execute(query + " ORDER BY faiss_id", params).fetchall()
+
+        rows = []
+        for start in range(0, len(ids), _QUERY_BATCH):
+            batch = list(ids[start:start + _QUERY_BATCH])
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(conn.execute(
+                f"{query} AND record_id IN ({placeholders})", params + batch
+            ).fetchall())
+        return sorted(rows)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        include = include or ['documents', 'metadatas', 'distances']
+        queries = np.ascontiguousarray(np.asarray(query_embeddings, dtype=np.float32))
+        if queries.ndim == 1:
+            queries = queries[None, :]
+
+        for _ in range(3):
+            self._refresh()
+            generation = self._generation
+            hits = self._search(queries, n_results, where)
+
+            found_ids = sorted({int(row) for row_hits in hits for row, _ in row_hits})
+            with self._transaction() as conn:
+                current_generation = self._read_state(conn)['generation']
+                records = {}
+                for start in range(0, len(found_ids), _QUERY_BATCH):
+                    batch = found_ids[start:start + _QUERY_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    for faiss_id, record_id, document, metadata in conn.execute(
+                        f"SELECT faiss_id, record_id, document, metadata FROM records "
+                        f"WHERE faiss_id IN ({placeholders})", batch
+                    ):
+                        records[faiss_id] = (record_id, document, json.loads(metadata))
+
+            # Una compactación concurrente renumeró los IDs internos: repetir la búsqueda
+            if current_generation == generation:
+                break
+
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for row_hits in hits:
+            # Los registros borrados tras la búsqueda no se devuelven
+            row_hits = [(row, distance) for row, distance in row_hits if row in records]
+            result['ids'].append([records[row][0] for row, _ in row_hits])
+            result['documents'].append([records[row][1] for row, _ in row_hits])
+            result['metadatas'].append([records[row][2] for row, _ in row_hits])
+            result['distances'].append([distance for _, distance in row_hits])
+
+        for field in ('documents', 'metadatas', 'distances'):
+            if field not in include:
+                result[field] = None
+        return result
+
+    def _search(self, queries: np.ndarray, n_results: int,
+                where: Optional[Dict[str, Any]]) -> List[List[Tuple[int, float]]]:
+        """Top-k por consulta como listas de (faiss_id, distancia L2²)"""
+        with self._lock:
+            candidates = self._candidates(where)
+            index = self._index
+
+            if index is None or self._row_count - len(self._tombstones) == 0 or (
+                    candidates is not None and not len(candidates['rows'])):
+                return [[] for _ in queries]
+
+            if candidates is not None and 'vectors' in candidates:
+                vectors, norms, rows = candidates['vectors'], candidates['norms'], candidates['rows']
+            else:
+                if candidates is not None:
+                    selector = candidates['selector']
+                else:
+                    selector = self._tombstone_selector[1] if self._tombstone_selector else None
+                # La búsqueda se hace bajo el lock: las altas incrementales mutan el índice
+                distances, rows = index.search(queries, n_results, params=self._search_params(n_results, selector))
+                return [
+                    [(int(row), max(float(distance), 0.0)) for row, distance in zip(query_rows, query_distances)
+                     if row >= 0]
+                    for query_rows, query_distances in zip(rows, distances)
+                ]
+
+        # Filtro selectivo: búsqueda exacta sobre los vectores precargados (fuera del lock)
+        hits = []
+        k = min(n_results, len(rows))
+        for query in queries:
+            distances = norms - 2.0 * (vectors @ query) + float(query @ query)
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+            hits.append([(int(rows[i]), max(float(distances[i]), 0.0)) for i in top])
+        return hits
+
+    def get(self, ids=None, where=None, include=None):
+        include = include or ['documents', 'metadatas']
+        if 'embeddings' in include:
+            self._refresh()
+        with self._transaction() as conn:
+            rows = self._select_rows(conn, ids, where)
+        return {
+            'ids': [row[1] for row in rows],
+            'documents': [row[2] for row in rows] if 'documents' in include else None,
+            'metadatas': [json.loads(row[3]) for row in rows] if 'metadatas' in include else None,
+            'embeddings': [
+                self._vectors[row[0]].tolist() if row[0] < self._row_count else None for row in rows
+            ] if 'embeddings' in include else None,
+        }
+
+    def delete(self, ids=None, where=None):
+        with self._write_lock():
+            self._refresh()
+            with self._transaction(immediate=True) as conn:
+                rows = [(row[0],) for row in self._select_rows(conn, ids, where)]
+                if not rows:
+                    return
+                conn.executemany("DELETE FROM records WHERE faiss_id = ?", rows)
+                conn.executemany("INSERT INTO tombstones (faiss_id) VALUES (?)", rows)
+                self._write_state(conn, self._read_state(conn))
+            self._refresh()
+            self._maintain()
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+class FaissVectorStore(DirectoryVectorStore):
+    """
+    Almacén de colecciones FAISS en disco, una carpeta por colección.
+
+    Configuración por entorno:
+      RAG_FAISS_INDEX_TYPE: hnsw (por defecto), ivf o flat
+      RAG_FAISS_NLIST / RAG_FAISS_NPROBE: listas y sondas de IVF
+      RAG_FAISS_HNSW_M / RAG_FAISS_EF_SEARCH: grado y amplitud de búsqueda de HNSW
+      RAG_FAISS_COMPACT_RATIO: fracción de lápidas que dispara la compactación
+      RAG_FAISS_SAVE_INTERVAL: altas entre instantáneas del índice
+      RAG_FAISS_EXACT_SEARCH_MAX: máximo de filas filtradas para búsqueda exacta
+    """
+
+    backend_name = 'faiss'
+
+    def __init__(self, root_directory: str, options: Optional[Dict[str, Any]] = None):
+        self.options = {
+            'index_type': os.getenv('RAG_FAISS_INDEX_TYPE', 'hnsw'),
+            'nlist': int(os.getenv('RAG_FAISS_NLIST', '1024')),
+            'nprobe': int(os.getenv('RAG_FAISS_NPROBE', '16')),
+            'hnsw_m': int(os.getenv('RAG_FAISS_HNSW_M', '32')),
+            'ef_construction': 80,
+            'ef_search': int(os.getenv('RAG_FAISS_EF_SEARCH', '64')),
+            'compact_ratio': float(os.getenv('RAG_FAISS_COMPACT_RATIO', '0.2')),
+            'save_interval': int(os.getenv('RAG_FAISS_SAVE_INTERVAL', '10000')),
+            'exact_search_max': int(os.getenv('RAG_FAISS_EXACT_SEARCH_MAX', '10000')),
+        }
+        self.options.update(options or {})
+        if self.options['index_type'] not in ('hnsw', 'ivf', 'flat'):
+            raise ValueError(f"Tipo de índice FAISS no soportado: {self.options['index_type']}")
+        super().__init__(root_directory)
+
+    def _new_collection(self, name: str) -> FaissCollection:
+        return FaissCollection(name, self._collection_directory(name), self.options)
@@ -0,0 +1,664 @@
+"""
+Flat Vector Store - Índice plano en proceso con NumPy, matriz memory-mapped y registros en SQLite
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from .quantization import create_quantizer, load_quantizer, save_quantizer
+from .vector_store import VectorCollection, DirectoryVectorStore, interprocess_lock
+
+logger = logging.getLogger(__name__)
+
+# Filas por bloque al copiar la matriz o calcular normas (acota la memoria temporal)
+_BLOCK_ROWS = 65536
+
+# Vectores de la muestra con la que se entrena el cuantizador
+_TRAINING_SAMPLE = 65536
+
+# Parámetros por sentencia `IN (...)` (SQLite admite 999 en versiones antiguas)
+_QUERY_BATCH = 500
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    """Evaluar una condición de filtro estilo ChromaDB sobre un valor"""
+    if not isinstance(condition, dict):
+        return value == condition
+
+    for operator, operand in condition.items():
+        if operator == '$eq':
+            matched = value == operand
+        elif operator == '$ne':
+            matched = value != operand
+        elif operator == '$in':
+            matched = value in operand
+        elif operator == '$nin':
+            matched = value not in operand
+        elif operator in ('$gt', '$gte', '$lt', '$lte'):
+            if value is None:
+                return False
+            matched = {
+                '$gt': lambda: value > operand,
+                '$gte': lambda: value >= operand,
+                '$lt': lambda: value < operand,
+                '$lte': lambda: value <= operand,
+            }[operator]()
+        else:
+            raise ValueError(f"Operador de filtro no soportado: {operator}")
+        if not matched:
+            return False
+    return True
+
+
+def _match_where(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Evaluar un filtro estilo ChromaDB ($and, $or y condiciones por clave) sobre unos metadatos"""
+    for key, condition in where.items():
+        if key == '$and':
+            matched = all(_match_where(metadata, sub_where) for sub_where in condition)
+        elif key == '$or':
+            matched = any(_match_where(metadata, sub_where) for sub_where in condition)
+        else:
+            matched = _match_condition(metadata.get(key), condition)
+        if not matched:
+            return False
+    return True
+
+
+class FlatCollection(VectorCollection):
+    """
+    Colección plana: los vectores se guardan en una matriz float32 en bruto
+    (`vectors.{gen}.f32`, memory-mapped) y los IDs, documentos y metadatos en
+    el sidecar `records.sqlite3`.
+
+    La búsqueda es fuerza bruta: una sola multiplicación matriz-vector y
+    `argpartition` para el top-k. Para colecciones de unos miles de chunks es
+    más rápida que el viaje de ida y vuelta a ChromaDB.
+
+    A la matriz solo se le añaden filas. Una baja o una sustitución borra el
+    registro del sidecar y su fila queda como lápida; cuando las lápidas
+    superan `compact_ratio`, las filas vivas se reescriben en la siguiente
+    generación. En memoria se mantienen los IDs, los metadatos (para los
+    filtros) y las normas; los documentos se leen de SQLite para los
+    resultados.
+
+    Con cuantización ('sq8' o 'pq') se guarda además una matriz de códigos
+    (`codes.{gen}.u8`) sobre la que se puntúa; la matriz float32 solo se lee
+    para re-puntuar los `rescore_factor * k` mejores candidatos. El
+    cuantizador se entrena al compactar en cuanto hay `min_training_size`
+    vectores.
+    """
+
+    def __init__(self, name: str, directory: str, quantization: Optional[str] = None,
+                 rescore_factor: int = 4, pq_subvectors: int = 48, min_training_size: int = 1024,
+                 compact_ratio: float = 0.2):
+        """
+        Inicializar la colección
+
+        Args:
+            name: Nombre de la colección
+            directory: Carpeta de la colección
+            quantization: None, 'sq8' o 'pq'
+            rescore_factor: Candidatos por resultado re-puntuados con float32 (0 = solo códigos)
+            pq_subvectors: Subvectores de PQ
+            min_training_size: Vectores necesarios para entrenar el cuantizador
+            compact_ratio: Fracción de lápidas que dispara la compactación
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.name = name
+        self.directory = directory
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.pq_subvectors = pq_subvectors
+        self.min_training_size = min_training_size
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+        self._version = None
+        self._generation = None
+        self._row_count = 0
+        self._dim = 0
+        self._quantizer = None
+        self._vectors: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._code_aux: Optional[np.ndarray] = None
+        self._live = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._id_index: Dict[str, int] = {}
+
+        self.metadata: Dict[str, Any] = {}
+        collection_meta_path = os.path.join(directory, 'collection.json')
+        if os.path.exists(collection_meta_path):
+            with open(collection_meta_path) as f:
+                self.metadata = json.load(f)
+
+        with self._transaction(immediate=True) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "row INTEGER PRIMARY KEY, "
+                "record_id TEXT NOT NULL UNIQUE, "
+                "document TEXT, "
+                "metadata TEXT NOT NULL)"
+            )
+
+    # ------------------------------------------------------------------
+    # Sidecar SQLite y matrices
+    # ------------------------------------------------------------------
+
+    def _connection(self) -> sqlite3.Connection:
+        """Obtener la conexión del hilo actual (se reabre tras un fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(os.path.join(self.directory, 'records.sqlite3'),
+                                   timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self, immediate: bool = False):
+        """Transacción explícita (de lectura consistente o de escritura)"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @staticmethod
+    def _read_state(conn: sqlite3.Connection) -> Dict[str, Any]:
+        values = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        return {
+            'version': int(values.get('version', 0)),
+            'generation': int(values.get('generation', 0)),
+            'row_count': int(values.get('row_count', 0)),
+            'dim': int(values.get('dim', 0)),
+            'code_width': int(values.get('code_width', 0)),
+            'quantization': values.get('quantization') or None,
+        }
+
+    @staticmethod
+    def _write_state(conn: sqlite3.Connection, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Guardar el estado incrementando la versión (invalida el estado cargado por otros procesos)"""
+        state = dict(state, version=state['version'] + 1)
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, str(value) if value is not None else '') for key, value in state.items()]
+        )
+        return state
+
+    def _vectors_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'vectors.{generation}.f32')
+
+    def _codes_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'codes.{generation}.u8')
+
+    @property
+    def _quantizer_path(self) -> str:
+        return os.path.join(self.directory, 'quantizer.npz')
+
+    def _write_lock(self):
+        """Lock exclusivo entre hilos y entre procesos para escrituras"""
+        return interprocess_lock(self._lock, os.path.join(self.directory, '.lock'))
+
+    @staticmethod
+    def _open_matrix(path: str, dtype, rows: int, columns: int) -> Optional[np.ndarray]:
+        if not rows or not columns:
+            return None
+        return np.memmap(path, dtype=dtype, mode='r', shape=(rows, columns))
+
+    @staticmethod
+    def _append_rows(path: str, offset: int, rows: np.ndarray):
+        """Añadir filas al final de un fichero, descartando lo escrito por una escritura que no se confirmó"""
+        with open(path, 'ab') as f:
+            f.truncate(offset)
+            f.write(np.ascontiguousarray(rows).tobytes())
+
+    @staticmethod
+    def _row_norms(vectors: Optional[np.ndarray], start: int, stop: int) -> np.ndarray:
+        norms = np.empty(stop - start, dtype=np.float32)
+        for block_start in range(start, stop, _BLOCK_ROWS):
+            block = np.asarray(vectors[block_start:min(block_start + _BLOCK_ROWS, stop)])
+            norms[block_start - start:block_start - start + len(block)] = np.einsum('ij,ij->i', block, block)
+        return norms
+
+    # ------------------------------------------------------------------
+    # Estado en memoria
+    # ------------------------------------------------------------------
+
+    def _map(self, state: Dict[str, Any]):
+        """
+        Mapear las matrices del estado publicado; dentro de la misma generación
+        las filas anteriores no cambian y solo se procesan las nuevas
+        """
+        generation, row_count, dim = state['generation'], state['row_count'], state['dim']
+        keep = min(self._row_count, row_count) if generation == self._generation else 0
+        vectors = self._open_matrix(self._vectors_path(generation), np.float32, row_count, dim)
+        quantizer, codes, norms, code_aux = self._quantizer, None, None, None
+
+        if state['code_width']:
+            if quantizer is None or quantizer.kind != state['quantization']:
+                quantizer, keep = load_quantizer(self._quantizer_path), 0
+            codes = self._open_matrix(self._codes_path(generation), np.uint8, row_count, state['code_width'])
+            # Las normas float32 no se calculan: leerían toda la matriz mapeada
+            code_aux = quantizer.precompute(codes[keep:])
+            if keep and code_aux is not None:
+                code_aux = np.concatenate([self._code_aux[:keep], code_aux])
+        else:
+            norms = self._row_norms(vectors, keep, row_count)
+            if keep:
+                norms = np.concatenate([self._norms[:keep], norms])
+
+        self._quantizer, self._vectors, self._codes = quantizer, vectors, codes
+        self._norms, self._code_aux = norms, code_aux
+        self._generation, self._row_count, self._dim = generation, row_count, dim
+
+    def _refresh(self) -> Dict[str, Any]:
+        """
+        Cargar el estado publicado por otros procesos si ha cambiado
+
+        Returns:
+            Estado publicado
+        """
+        with self._lock:
+            state = self._read_state(self._connection())
+            if state['version'] == self._version:
+                return state
+
+            for _ in range(5):
+                try:
+                    with self._transaction() as conn:
+                        state = self._read_state(conn)
+                        self._map(state)
+                        ids: List[Optional[str]] = [None] * state['row_count']
+                        metadatas: List[Optional[Dict[str, Any]]] = [None] * state['row_count']
+                        for row, record_id, metadata in conn.execute("SELECT row, record_id, metadata FROM records"):
+                            ids[row], metadatas[row] = record_id, json.loads(metadata)
+                    break
+                except (FileNotFoundError, ValueError):
+                    # Una compactación publicó una generación nueva y borró esta; reintentar
+                    continue
+            else:
+                raise RuntimeError(f"No se pudo cargar una generación estable de la colección {self.name}")
+
+            self._ids, self._metadatas = ids, metadatas
+            self._live = np.array([record_id is not None for record_id in ids], dtype=bool)
+            self._id_index = {record_id: row for row, record_id in enumerate(ids) if record_id is not None}
+            self._version = state['version']
+            return state
+
+    def _publish(self, state: Dict[str, Any], removed: List[int] = (),
+                 added: List[Tuple[int, str, Optional[str], Dict[str, Any]]] = (),
+                 updated: List[Tuple[int, Dict[str, Any]]] = ()):
+        """
+        Confirmar una escritura en el sidecar y aplicarla en memoria sin
+        recargar la colección (requiere el lock de escritura)
+
+        Args:
+            state: Estado de la colección tras la escritura
+            removed: Filas cuyo registro se borra (pasan a ser lápidas)
+            added: Registros nuevos como (fila, ID, documento, metadatos)
+            updated: Metadatos nuevos como (fila, metadatos)
+        """
+        with self._transaction(immediate=True) as conn:
+            conn.executemany("DELETE FROM records WHERE row = ?", [(row,) for row in removed])
+            conn.executemany(
+                "INSERT INTO records (row, record_id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(row, record_id, document, json.dumps(metadata, ensure_ascii=False))
+                 for row, record_id, document, metadata in added]
+            )
+            conn.executemany(
+                "UPDATE records SET metadata = ? WHERE row = ?",
+                [(json.dumps(metadata, ensure_ascii=False), row) for row, metadata in updated]
+            )
+            state = self._write_state(conn, state)
+
+        # Copia al escribir: las búsquedas en curso conservan las listas anteriores
+        new_rows = state['row_count'] - self._row_count
+        ids = self._ids + [None] * new_rows
+        metadatas = self._metadatas + [None] * new_rows
+        live = np.concatenate([self._live, np.zeros(new_rows, dtype=bool)])
+        for row in removed:
+            self._id_index.pop(ids[row], None)
+            ids[row], metadatas[row], live[row] = None, None, False
+        for row, record_id, _, metadata in added:
+            ids[row], metadatas[row], live[row] = record_id, metadata, True
+            self._id_index[record_id] = row
+        for row, metadata in updated:
+            metadatas[row] = metadata
+
+        self._map(state)
+        self._ids, self._metadatas, self._live = ids, metadatas, live
+        self._version = state['version']
+
+    # ------------------------------------------------------------------
+    # Compactación
+    # ------------------------------------------------------------------
+
+    def _maintain(self):
+        """Compactar (y entrenar el cuantizador) si toca (requiere el lock de escritura)"""
+        live_count = int(self._live.sum())
+        tombstones = self._row_count - live_count
+        needs_training = bool(self.quantization) and live_count >= self.min_training_size and (
+            self._codes is None or self._quantizer.kind != self.quantization
+        )
+        if (tombstones and tombstones >= self.compact_ratio * self._row_count) or needs_training:
+            self._rebuild()
+
+    def _trained_quantizer(self, vectors: np.ndarray):
+        """Cuantizador de la colección: el guardado si es del tipo configurado o uno nuevo entrenado con una muestra"""
+        if self._quantizer is not None and self._quantizer.kind == self.quantization:
+            return self._quantizer
+        if os.path.exists(self._quantizer_path):
+            quantizer = load_quantizer(self._quantizer_path)
+            if quantizer.kind == self.quantization:
+                return quantizer
+
+        quantizer = create_quantizer(self.quantization, **(
+            {'subvectors': self.pq_subvectors} if self.quantization == 'pq' else {}
+        ))
+        sample_size = min(len(vectors), _TRAINING_SAMPLE)
+        sample = np.sort(np.random.default_rng(0).choice(len(vectors), sample_size, replace=False))
+        quantizer.train(np.asarray(vectors[sample]))
+        save_quantizer(quantizer, self._quantizer_path)
+        self.logger.info(f"Cuantizador {self.quantization} entrenado para la colección {self.name} "
+                         f"con {sample_size} vectores")
+        return quantizer
+
+    def _rebuild(self):
+        """
+        Reescribir las filas vivas en una nueva generación, con sus códigos si
+        hay cuantización (requiere el lock de escritura)
+        """
+        state = self._refresh()
+        live = np.flatnonzero(self._live)
+        old_generation = state['generation']
+        generation = old_generation + 1
+
+        with open(self._vectors_path(generation), 'wb') as f:
+            for block_start in range(0, len(live), _BLOCK_ROWS):
+                rows = live[block_start:block_start + _BLOCK_ROWS]
+                f.write(np.ascontiguousarray(self._vectors[rows], dtype=np.float32).tobytes())
+        vectors = self._open_matrix(self._vectors_path(generation), np.float32, len(live), state['dim'])
+
+        code_width, quantization = 0, None
+        # Un cuantizador ya entrenado se sigue usando aunque la compactación deje menos filas
+        trained = self._quantizer is not None and self._quantizer.kind == self.quantization
+        if vectors is not None and self.quantization and (trained or len(live) >= self.min_training_size):
+            quantizer = self._trained_quantizer(vectors)
+            with open(self._codes_path(generation), 'wb') as f:
+                for block_start in range(0, len(live), _BLOCK_ROWS):
+                    codes = quantizer.encode(np.asarray(vectors[block_start:block_start + _BLOCK_ROWS]))
+                    code_width = codes.shape[1]
+                    f.write(np.ascontiguousarray(codes, dtype=np.uint8).tobytes())
+            self._quantizer, quantization = quantizer, quantizer.kind
+
+        with self._transaction(immediate=True) as conn:
+            # Renumerar en orden ascendente: cada fila nueva es <= la antigua y ya está libre
+            conn.executemany(
+                "UPDATE records SET row = ? WHERE row = ?",
+                [(new_row, int(old_row)) for new_row, old_row in enumerate(live) if new_row != old_row]
+            )
+            self._write_state(conn, dict(state, generation=generation, row_count=len(live),
+                                         code_width=code_width, quantization=quantization))
+
+        # Los lectores con la generación anterior mapeada siguen funcionando tras el unlink
+        for stale in (self._vectors_path(old_generation), self._codes_path(old_generation)):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+        self.logger.info(f"Colección {self.name} compactada: {len(live)} vectores, generación {generation}")
+        self._refresh()
+
+    def compact(self):
+        """Forzar la compactación de la colección"""
+        with self._write_lock():
+            self._rebuild()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado de la colección (mismas claves que las colecciones FAISS)"""
+        self._refresh()
+        live = int(self._live.sum())
+        return {
+            'name': self.name,
+            'index_kind': self._quantizer.kind if self._codes is not None else 'flat',
+            'generation': self._generation,
+            'rows': self._row_count,
+            'live': live,
+            'tombstones': self._row_count - live,
+        }
+
+    # ------------------------------------------------------------------
+    # API de colección
+    # ------------------------------------------------------------------
+
+    def _mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Filas vivas que cumplen el filtro (las lápidas no tienen metadatos)"""
+        if not where:
+            return self._live.copy()
+        return np.fromiter(
+            (metadata is not None and _match_where(metadata, where) for metadata in self._metadatas),
+            dtype=bool, count=len(self._metadatas)
+        )
+
+    def _select(self, ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> List[int]:
+        """Filas vivas que cumplen IDs y filtro"""
+        mask = self._mask(where)
+        if ids is not None:
+            id_mask = np.zeros(len(mask), dtype=bool)
+            id_mask[[self._id_index[record_id] for record_id in ids if record_id in self._id_index]] = True
+            mask &= id_mask
+        return np.flatnonzero(mask).tolist()
+
+    def _documents(self, record_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Documentos de los registros indicados, leídos de SQLite"""
+        documents = {}
+        conn = self._connection()
+        for start in range(0, len(record_ids), _QUERY_BATCH):
+            batch = record_ids[start:start + _QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            documents.update(conn.execute(
+                f"SELECT record_id, document FROM records WHERE record_id IN ({placeholders})", batch
+            ).fetchall())
+        return documents
+
+    def _write_records(self, ids: List[str], embeddings, metadatas, documents, replace: bool):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(ids):
+            raise ValueError("Las dimensiones de los embeddings no coinciden con los IDs")
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or [None for _ in ids]
+
+        with self._write_lock():
+            state = self._refresh()
+            if state['dim'] and state['dim'] != embeddings.shape[1]:
+                raise ValueError(f"Dimensión {embeddings.shape[1]} distinta de la colección ({state['dim']})")
+
+            # Posición de cada ID en el lote: la última gana en upsert, la primera en add
+            positions: Dict[str, int] = {}
+            for i, record_id in enumerate(ids):
+                if replace:
+                    positions[record_id] = i
+                elif record_id not in self._id_index:
+                    positions.setdefault(record_id, i)
+            if not positions:
+                return
+
+            selected = list(positions.values())
+            start_row = state['row_count']
+            new_vectors = embeddings[selected]
+
+            # Las filas añadidas solo son visibles tras confirmar el estado en SQLite
+            self._append_rows(self._vectors_path(state['generation']), start_row * embeddings.shape[1] * 4,
+                              new_vectors)
+            if state['code_width']:
+                self._append_rows(self._codes_path(state['generation']), start_row * state['code_width'],
+                                  self._quantizer.encode(new_vectors).astype(np.uint8))
+
+            self._publish(
+                dict(state, row_count=start_row + len(selected), dim=embeddings.shape[1]),
+                removed=[self._id_index[record_id] for record_id in positions if record_id in self._id_index],
+                added=[(start_row + offset, ids[i], documents[i], metadatas[i] or {})
+                       for offset, i in enumerate(selected)]
+            )
+            self._maintain()
+
+    def add(self, ids, embeddings, metadatas=None, documents=None):
+        self._write_records(ids, embeddings, metadatas, documents, replace=False)
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None):
+        self._write_records(ids, embeddings, metadatas, documents, replace=True)
+
+    def update(self, ids, metadatas=None):
+        if not metadatas:
+            return
+        with self._write_lock():
+            state = self._refresh()
+            updated = {}
+            for record_id, metadata in zip(ids, metadatas):
+                row = self._id_index.get(record_id)
+                if row is not None:
+                    updated[row] = dict(updated.get(row, self._metadatas[row]), **metadata)
+            if updated:
+                self._publish(state, updated=list(updated.items()))
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        include = include or ['documents', 'metadatas', 'distances']
+        self._refresh()
+
+        # Referencias locales: una escritura concurrente reemplaza los atributos, no los muta
+        with self._lock:
+            vectors, norms, ids, metadatas = self._vectors, self._norms, self._ids, self._metadatas
+            codes, code_aux, quantizer = self._codes, self._code_aux, self._quantizer
+            mask = self._mask(where)
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        candidate_count = int(mask.sum())
+
+        for query in queries:
+            if candidate_count == 0:
+                top_rows = np.zeros(0, dtype=np.int64)
+                distances = np.zeros(0, dtype=np.float32)
+            elif codes is not None:
+                top_rows, distances = self._quantized_top_k(
+                    query, min(n_results, candidate_count), candidate_count,
+                    vectors, codes, code_aux, quantizer, mask
+                )
+            else:
+                # ||x - q||² = ||x||² - 2·x·q + ||q||²  (una sola matmul)
+                distances = norms - 2.0 * (vectors @ query) + float(query @ query)
+                distances = np.where(mask, distances, np.inf)
+                k = min(n_results, candidate_count)
+                top_rows = np.argpartition(distances, k - 1)[:k]
+                top_rows = top_rows[np.argsort(distances[top_rows])]
+                distances = np.maximum(distances[top_rows], 0.0)
+
+            result['ids'].append([ids[row] for row in top_rows])
+            result['metadatas'].append([metadatas[row] for row in top_rows])
+            result['distances'].append([float(distance) for distance in distances])
+
+        if 'documents' in include:
+            documents = self._documents(sorted({record_id for row_ids in result['ids'] for record_id in row_ids}))
+            result['documents'] = [[documents.get(record_id) for record_id in row_ids] for row_ids in result['ids']]
+
+        for field in ('documents', 'metadatas', 'distances'):
+            if field not in include:
+                result[field] = None
+        return result
+
+    def _quantized_top_k(self, query: np.ndarray, k: int, candidate_count: int, vectors: np.ndarray,
+                         codes: np.ndarray, code_aux, quantizer, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k puntuando sobre los códigos y re-puntuando los mejores con float32"""
+        distances = np.where(mask, quantizer.distances(codes, query, code_aux), np.inf)
+        if not self.rescore_factor:
+            top_rows = np.argpartition(distances, k - 1)[:k]
+            top_rows = top_rows[np.argsort(distances[top_rows])]
+            return top_rows, np.maximum(distances[top_rows], 0.0)
+
+        shortlist_size = min(k * self.rescore_factor, candidate_count)
+        shortlist = np.sort(np.argpartition(distances, shortlist_size - 1)[:shortlist_size])
+        # Solo se leen del disco las filas candidatas de la matriz mapeada
+        difference = np.asarray(vectors[shortlist]) - query
+        exact = np.einsum('ij,ij->i', difference, difference)
+        order = np.argsort(exact)[:k]
+        return shortlist[order], exact[order]
+
+    def get(self, ids=None, where=None, include=None):
+        include = include or ['documents', 'metadatas']
+        self._refresh()
+        with self._lock:
+            rows = self._select(ids, where)
+            record_ids = [self._ids[row] for row in rows]
+            metadatas = [self._metadatas[row] for row in rows]
+            vectors = self._vectors
+        documents = self._documents(record_ids) if 'documents' in include else None
+        return {
+            'ids': record_ids,
+            'documents': [documents.get(record_id) for record_id in record_ids] if documents is not None else None,
+            'metadatas': metadatas if 'metadatas' in include else None,
+            'embeddings': [vectors[row].tolist() for row in rows] if 'embeddings' in include else None,
+        }
+
+    def delete(self, ids=None, where=None):
+        with self._write_lock():
+            state = self._refresh()
+            rows = self._select(ids, where)
+            if rows:
+                self._publish(state, removed=rows)
+                self._maintain()
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+class NumpyVectorStore(DirectoryVectorStore):
+    """
+    Almacén de colecciones planas en disco, una carpeta por colección.
+
+    Configuración por entorno:
+      RAG_VECTOR_QUANTIZATION: none (por defecto), sq8 o pq
+      RAG_QUANTIZATION_RESCORE: candidatos por resultado re-puntuados con float32 (0 = solo códigos)
+      RAG_PQ_SUBVECTORS: subvectores de PQ (bytes por vector)
+      RAG_QUANTIZATION_MIN_VECTORS: vectores necesarios para entrenar el cuantizador
+      RAG_FLAT_COMPACT_RATIO: fracción de lápidas que dispara la compactación
+    """
+
+    backend_name = 'numpy'
+
+    def __init__(self, root_directory: str, quantization_options: Optional[Dict[str, Any]] = None):
+        quantization = os.getenv('RAG_VECTOR_QUANTIZATION', 'none').lower()
+        self.quantization_options = {
+            'quantization': None if quantization in ('', 'none') else quantization,
+            'rescore_factor': int(os.getenv('RAG_QUANTIZATION_RESCORE', '4')),
+            'pq_subvectors': int(os.getenv('RAG_PQ_SUBVECTORS', '48')),
+            'min_training_size': int(os.getenv('RAG_QUANTIZATION_MIN_VECTORS', '1024')),
+        }
+        self.quantization_options.update(quantization_options or {})
+        if self.quantization_options['quantization'] not in (None, 'sq8', 'pq'):
+            raise ValueError(f"Tipo de cuantización no soportado: {self.quantization_options['quantization']}")
+        self.compact_ratio = float(os.getenv('RAG_FLAT_COMPACT_RATIO', '0.2'))
+        super().__init__(root_directory)
+
+    def _new_collection(self, name: str) -> FlatCollection:
+        return FlatCollection(name, self._collection_directory(name), compact_ratio=self.compact_ratio,
+                              **self.quantization_options)
@@ -0,0 +1,228 @@
+"""
+Model Registry - Registro por proceso de modelos de embeddings y clientes vectoriales
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingModelRegistry:
+    """
+    Registro compartido a nivel de proceso (un worker) para los recursos
+    costosos del sistema RAG.
+
+    Cada modelo de SentenceTransformer y cada cliente persistente de ChromaDB
+    se carga una sola vez por worker y se reutiliza en el servicio RAG, en las
+    vistas de agentes y en los comandos de management.
+    """
+
+    def __init__(self):
+        """Inicializar el registro vacío"""
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self._models: Dict[str, Any] = {}
+        self._clients: Dict[str, Any] = {}
+        self._schedulers: Dict[str, Any] = {}
+        self._stores: Dict[str, Any] = {}
+        self._load_times: Dict[str, float] = {}
+
+    def _check_fork(self):
+        """
+        Descartar recursos heredados si el proceso fue bifurcado (p. ej. gunicorn
+        con --preload). Los clientes de ChromaDB no son seguros tras un fork.
+        """
+        current_pid = os.getpid()
+        if current_pid != self._pid:
+            self.logger.info(f"Fork detectado ({self._pid} -> {current_pid}), reiniciando clientes vectoriales")
+            self._clients = {}
+            self._stores = {}
+            self._pid = current_pid
+
+    def get_embedding_model(self, model_name: Optional[str] = None):
+        """
+        Obtener el modelo de embeddings, cargándolo en el primer uso
+
+        Args:
+            model_name: Nombre del modelo (por defecto EMBEDDING_MODEL)
+
+        Returns:
+            Instancia compartida de SentenceTransformer
+        """
+        model_name = model_name or os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+
+                start_time = time.perf_counter()
+                model = SentenceTransformer(model_name)
+                self._load_times[f"model:{model_name}"] = time.perf_counter() - start_time
+                self._models[model_name] = model
+                self.logger.info(f"Modelo de embeddings cargado: {model_name} "
+                                 f"({self._load_times[f'model:{model_name}']:.2f}s)")
+        return model
+
+    def get_embedding_scheduler(self, model_name: Optional[str] = None):
+        """
+        Obtener el planificador de micro-lotes asociado a un modelo
+
+        Args:
+            model_name: Nombre del modelo (por defecto EMBEDDING_MODEL)
+
+        Returns:
+            Instancia compartida de EmbeddingBatchScheduler
+        """
+        model_name = model_name or os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+        scheduler = self._schedulers.get(model_name)
+        if scheduler is not None:
+            return scheduler
+
+        model = self.get_embedding_model(model_name)
+        with self._lock:
+            scheduler = self._schedulers.get(model_name)
+            if scheduler is None:
+                from .embedding_scheduler import EmbeddingBatchScheduler
+
+                scheduler = EmbeddingBatchScheduler(model)
+                self._schedulers[model_name] = scheduler
+        return scheduler
+
+    def get_chroma_client(self, persist_directory: Optional[str] = None):
+        """
+        Obtener el cliente persistente de ChromaDB para un directorio
+
+        Args:
+            persist_directory: Directorio de persistencia (por defecto CHROMA_PERSIST_DIRECTORY)
+
+        Returns:
+            Instancia compartida de chromadb.PersistentClient
+        """
+        persist_directory = persist_directory or os.getenv('CHROMA_PERSIST_DIRECTORY', './chroma_db')
+
+        with self._lock:
+            self._check_fork()
+            client = self._clients.get(persist_directory)
+            if client is None:
+                import chromadb
+                from chromadb.config import Settings
+
+                start_time = time.perf_counter()
+                client = chromadb.PersistentClient(
+                    path=persist_directory,
+                    settings=Settings(
+                        allow_reset=True,
+                        anonymized_telemetry=False
+                    )
+                )
+                self._load_times[f"chroma:{persist_directory}"] = time.perf_counter() - start_time
+                self._clients[persist_directory] = client
+                self.logger.info(f"ChromaDB inicializado en: {persist_directory}")
+        return client
+
+    def get_vector_store(self, backend: Optional[str] = None,
+                         persist_directory: Optional[str] = None):
+        """
+        Obtener el almacén vectorial compartido para un backend
+
+        Args:
+            backend: 'chroma', 'numpy' o 'faiss' (por defecto RAG_VECTOR_BACKEND)
+            persist_directory: Directorio de persistencia (por defecto CHROMA_PERSIST_DIRECTORY)
+
+        Returns:
+            Instancia compartida de VectorStore
+        """
+        backend = backend or os.getenv('RAG_VECTOR_BACKEND', 'chroma')
+        persist_directory = persist_directory or os.getenv('CHROMA_PERSIST_DIRECTORY', './chroma_db')
+        store_key = f"{backend}:{persist_directory}"
+
+        with self._lock:
+            self._check_fork()
+            store = self._stores.get(store_key)
+            if store is None:
+                from .vector_store import create_vector_store
+
+                chroma_client = self.get_chroma_client(persist_directory) if backend == 'chroma' else None
+                store = create_vector_store(backend, persist_directory, chroma_client=chroma_client)
+                self._stores[store_key] = store
+                self.logger.info(f"Almacén vectorial '{backend}' inicializado en: {persist_directory}")
+        return store
+
+    def warmup(self, model_names: Optional[List[str]] = None,
+               persist_directory: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Precargar modelos y clientes (pensado para el arranque del worker)
+
+        Args:
+            model_names: Modelos a precargar (por defecto EMBEDDING_MODEL)
+            persist_directory: Directorio del almacén vectorial a abrir
+
+        Returns:
+            Diccionario con el resultado del calentamiento
+        """
+        model_names = model_names or [os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')]
+        result = {'models': {}, 'vector_store': None}
+
+        for model_name in model_names:
+            try:
+                model = self.get_embedding_model(model_name)
+                # Una pasada de inferencia inicializa kernels y buffers internos
+                model.encode(["warmup"])
+                result['models'][model_name] = 'ready'
+            except Exception as e:
+                self.logger.error(f"Error precargando modelo {model_name}: {e}")
+                result['models'][model_name] = f"error: {e}"
+
+        try:
+            self.get_vector_store(persist_directory=persist_directory)
+            result['vector_store'] = 'ready'
+        except Exception as e:
+            self.logger.error(f"Error precargando almacén vectorial: {e}")
+            result['vector_store'] = f"error: {e}"
+
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del registro"""
+        return {
+            'pid': self._pid,
+            'loaded_models': list(self._models.keys()),
+            'open_clients': list(self._clients.keys()),
+            'embedding_schedulers': list(self._schedulers.keys()),
+            'vector_stores': list(self._stores.keys()),
+            'load_times': dict(self._load_times)
+        }
+
+    def clear(self):
+        """Liberar todos los recursos cargados (útil en tests)"""
+        with self._lock:
+            self._models = {}
+            self._clients = {}
+            self._schedulers = {}
+            self._stores = {}
+            self._load_times = {}
+
+
+_registry: Optional[EmbeddingModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> EmbeddingModelRegistry:
+    """Obtener el registro de modelos del proceso actual"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = EmbeddingModelRegistry()
+    return _registry
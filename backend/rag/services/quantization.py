@@ -0,0 +1,281 @@
+"""
+Quantization - Cuantización escalar (int8) y por productos (PQ) de embeddings
+"""
+
+import os
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Filas por bloque al codificar o puntuar (acota la memoria temporal)
+_BLOCK_ROWS = 65536
+
+
+class ScalarQuantizer:
+    """
+    Cuantización escalar a int8: cada dimensión se mapea linealmente de su
+    rango [min, max] a 256 niveles. 4x menos memoria que float32.
+
+    La distancia se calcula sobre los códigos sin decodificarlos:
+    ||x̂ - q||² = ||x̂||² - 2·(min·q + códigos·(escala∘q)) + ||q||²
+    """
+
+    kind = 'sq8'
+
+    def __init__(self):
+        self.vmin: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.vmin is not None
+
+    def train(self, vectors: np.ndarray):
+        """Calcular el rango de cada dimensión"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.vmin = vectors.min(axis=0)
+        scale = (vectors.max(axis=0) - self.vmin) / 255.0
+        scale[scale == 0] = 1.0
+        self.scale = scale.astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return np.clip(np.rint((vectors - self.vmin) / self.scale), 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.vmin + codes.astype(np.float32) * self.scale
+
+    def precompute(self, codes: np.ndarray) -> np.ndarray:
+        """Normas al cuadrado de los vectores reconstruidos"""
+        norms = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            decoded = self.decode(codes[start:start + _BLOCK_ROWS])
+            norms[start:start + len(decoded)] = np.einsum('ij,ij->i', decoded, decoded)
+        return norms
+
+    def distances(self, codes: np.ndarray, query: np.ndarray, aux: np.ndarray) -> np.ndarray:
+        """Distancias L2² aproximadas de la consulta a todos los códigos"""
+        scaled_query = (self.scale * query).astype(np.float32)
+        offset = float(self.vmin @ query)
+        query_norm = float(query @ query)
+        result = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            dots = block.astype(np.float32) @ scaled_query + offset
+            result[start:start + len(block)] = aux[start:start + len(block)] - 2.0 * dots + query_norm
+        return result
+
+    def bytes_per_vector(self, dim: int) -> int:
+        return dim
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {'vmin': self.vmin, 'scale': self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.vmin = np.asarray(state['vmin'], dtype=np.float32)
+        self.scale = np.asarray(state['scale'], dtype=np.float32)
+
+
+class ProductQuantizer:
+    """
+    Cuantización por productos: el vector se divide en `m` subvectores y cada
+    uno se sustituye por el índice (1 byte) de su centroide más cercano entre
+    256 aprendidos con k-means. Con 384 dimensiones y m=48 ocupa 48 bytes por
+    vector (32x menos que float32).
+
+    La distancia asimétrica usa una tabla consulta-centroide por subespacio:
+    ||x̂ - q||² = Σ_j tabla[j, código_j]
+    """
+
+    kind = 'pq'
+    n_centroids = 256
+
+    def __init__(self, subvectors: int = 48, iterations: int = 15):
+        """
+        Args:
+            subvectors: Número de subvectores (se ajusta a un divisor de la dimensión)
+            iterations: Iteraciones de k-means por subespacio
+        """
+        self.subvectors = subvectors
+        self.iterations = iterations
+        self.centroids: Optional[np.ndarray] = None  # (m, 256, dsub)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _subspaces(self, vectors: np.ndarray) -> np.ndarray:
+        m = self.centroids.shape[0]
+        return vectors.reshape(len(vectors), m, -1)
+
+    def train(self, vectors: np.ndarray):
+        """Entrenar los centroides de cada subespacio con k-means"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        count, dim = vectors.shape
+        if count < self.n_centroids:
+            raise ValueError(f"PQ necesita al menos {self.n_centroids} vectores para entrenar")
+
+        m = max(d for d in range(1, min(self.subvectors, dim) + 1) if dim % d == 0)
+        rng = np.random.default_rng(0)
+        # ~40 puntos por centroide bastan para k-means y acotan el coste del entrenamiento
+        max_training = self.n_centroids * 40
+        if count > max_training:
+            vectors = vectors[np.sort(rng.choice(count, max_training, replace=False))]
+
+        sub_vectors = vectors.reshape(len(vectors), m, dim // m)
+        centroids = np.empty((m, self.n_centroids, dim // m), dtype=np.float32)
+        for j in range(m):
+            data = sub_vectors[:, j, :]
+            current = data[rng.choice(len(data), self.n_centroids, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(data, current)
+                counts = np.bincount(assignment, minlength=self.n_centroids)
+                sums = np.stack([
+                    np.bincount(assignment, weights=data[:, d], minlength=self.n_centroids)
+                    for d in range(data.shape[1])
+                ], axis=1)
+                filled = counts > 0
+                current[filled] = sums[filled] / counts[filled, None]
+                # Reubicar centroides vacíos en puntos aleatorios
+                empty = np.flatnonzero(~filled)
+                if len(empty):
+                    current[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+            centroids[j] = current
+        self.centroids = centroids
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        distances = (np.einsum('ij,ij->i', centroids, centroids)[None, :]
+                     - 2.0 * data @ centroids.T)
+        return np.argmin(distances, axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        m = self.centroids.shape[0]
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for start in range(0, len(vectors), _BLOCK_ROWS):
+            block = self._subspaces(vectors[start:start + _BLOCK_ROWS])
+            for j in range(m):
+                codes[start:start + len(block), j] = self._nearest(block[:, j, :], self.centroids[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        m = self.centroids.shape[0]
+        return self.centroids[np.arange(m)[None, :], codes.astype(np.int64)].reshape(len(codes), -1)
+
+    def precompute(self, codes: np.ndarray) -> None:
+        return None
+
+    def distances(self, codes: np.ndarray, query: np.ndarray, aux: Any = None) -> np.ndarray:
+        """Distancias L2² aproximadas con tablas de consulta (ADC)"""
+        m = self.centroids.shape[0]
+        query_sub = query.astype(np.float32).reshape(m, 1, -1)
+        table = ((self.centroids - query_sub) ** 2).sum(axis=2)  # (m, 256)
+        subspace = np.arange(m)[None, :]
+        result = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            result[start:start + len(block)] = table[subspace, block].sum(axis=1)
+        return result
+
+    def bytes_per_vector(self, dim: int) -> int:
+        return self.centroids.shape[0] if self.is_trained else self.subvectors
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {'centroids': self.centroids}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.centroids = np.asarray(state['centroids'], dtype=np.float32)
+
+
+def create_quantizer(kind: str, **kwargs):
+    """
+    Crear un cuantizador sin entrenar
+
+    Args:
+        kind: 'sq8' o 'pq'
+        **kwargs: Parámetros del cuantizador (p. ej. subvectors para PQ)
+    """
+    if kind == 'sq8':
+        return ScalarQuantizer()
+    if kind == 'pq':
+        return ProductQuantizer(**kwargs)
+    raise ValueError(f"Tipo de cuantización no soportado: {kind}")
+
+
+def save_quantizer(quantizer, path: str):
+    """Guardar un cuantizador entrenado (escritura atómica)"""
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, kind=np.array(quantizer.kind), **quantizer.state())
+    os.replace(tmp_path, path)
+
+
+def load_quantizer(path: str):
+    """Cargar un cuantizador guardado con save_quantizer"""
+    with np.load(path) as data:
+        quantizer = create_quantizer(str(data['kind']))
+        quantizer.load_state({key: data[key] for key in data.files if key != 'kind'})
+    return quantizer
+
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    """Índices del top-k exacto por distancia L2²"""
+    distances = np.einsum('ij,ij->i', vectors, vectors) - 2.0 * (vectors @ query)
+    k = min(k, len(vectors))
+    top = np.argpartition(distances, k - 1)[:k]
+    return top[np.argsort(distances[top])]
+
+
+def evaluate_quantizer(quantizer, vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                       rescore_factors: Iterable[int] = (0, 2, 4, 10)) -> Dict[str, Any]:
+    """
+    Medir el recall@k y la memoria de un cuantizador entrenado
+
+    Args:
+        quantizer: Cuantizador entrenado
+        vectors: Vectores de la colección
+        queries: Consultas de evaluación
+        k: Resultados por consulta
+        rescore_factors: Factores de re-puntuación a evaluar (0 = solo códigos)
+
+    Returns:
+        Diccionario con memoria por vector, compresión y recall por factor
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    codes = quantizer.encode(vectors)
+    aux = quantizer.precompute(codes)
+    dim = vectors.shape[1]
+
+    recalls = {factor: [] for factor in rescore_factors}
+    for query in queries:
+        expected = set(exact_top_k(vectors, query, k).tolist())
+        approx = quantizer.distances(codes, query, aux)
+        for factor in rescore_factors:
+            candidate_count = min(len(vectors), k * max(factor, 1))
+            candidates = np.argpartition(approx, candidate_count - 1)[:candidate_count]
+            if factor:
+                top = candidates[exact_top_k(vectors[candidates], query, k)]
+            else:
+                top = candidates[np.argsort(approx[candidates])][:k]
+            recalls[factor].append(len(expected & set(top.tolist())) / min(k, len(vectors)))
+
+    code_bytes = quantizer.bytes_per_vector(dim)
+    return {
+        'quantization': quantizer.kind,
+        'vectors': len(vectors),
+        'dim': dim,
+        'float32_bytes_per_vector': dim * 4,
+        'code_bytes_per_vector': code_bytes,
+        'compression_ratio': round(dim * 4 / code_bytes, 2),
+        'resident_mb': round(code_bytes * len(vectors) / (1024 * 1024), 3),
+        'float32_mb': round(dim * 4 * len(vectors) / (1024 * 1024), 3),
+        'recall_at_k': {
+            f"rescore_x{factor}" if factor else 'codes_only': round(float(np.mean(values)), 4)
+            for factor, values in recalls.items()
+        },
+        'k': k,
+    }
@@ -0,0 +1,266 @@
+"""
+Vector Store - Interfaz de almacenes vectoriales intercambiables para el sistema RAG
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - plataformas sin fcntl (Windows)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionNotFoundError(Exception):
+    """La colección solicitada no existe en el almacén"""
+    pass
+
+
+@contextmanager
+def interprocess_lock(thread_lock, lock_path: str):
+    """
+    Lock exclusivo entre hilos (thread_lock) y entre procesos (flock sobre lock_path)
+
+    Args:
+        thread_lock: Lock del proceso que serializa a los hilos
+        lock_path: Fichero usado para el lock entre workers
+    """
+    with thread_lock:
+        lock_file = open(lock_path, 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+class VectorCollection(ABC):
+    """
+    Colección de vectores con el subconjunto de la API de colecciones de
+    ChromaDB que usa `EnhancedRAGService`.
+
+    Los resultados de `query` y `get` usan el mismo formato que ChromaDB y las
+    distancias son L2 al cuadrado (el espacio por defecto de ChromaDB), de modo
+    que el umbral de relevancia es el mismo con cualquier backend.
+    """
+
+    @abstractmethod
+    def add(self, ids: List[str], embeddings: List[List[float]],
+            metadatas: Optional[List[Dict[str, Any]]] = None,
+            documents: Optional[List[str]] = None):
+        """Insertar vectores nuevos (los IDs existentes se ignoran)"""
+        pass
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]],
+               metadatas: Optional[List[Dict[str, Any]]] = None,
+               documents: Optional[List[str]] = None):
+        """Insertar o reemplazar vectores"""
+        pass
+
+    @abstractmethod
+    def update(self, ids: List[str], metadatas: Optional[List[Dict[str, Any]]] = None):
+        """Actualizar (fusionar) metadatos de vectores existentes"""
+        pass
+
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Buscar los vecinos más cercanos"""
+        pass
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Obtener registros por ID o filtro de metadatos"""
+        pass
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        """Eliminar registros por ID o filtro de metadatos"""
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        """Número de registros en la colección"""
+        pass
+
+
+class VectorStore(ABC):
+    """
+    Almacén de colecciones vectoriales.
+    """
+
+    backend_name = 'base'
+
+    @abstractmethod
+    def get_collection(self, name: str) -> VectorCollection:
+        """Obtener una colección existente (lanza CollectionNotFoundError si no existe)"""
+        pass
+
+    @abstractmethod
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> VectorCollection:
+        """Obtener o crear una colección"""
+        pass
+
+    @abstractmethod
+    def delete_collection(self, name: str):
+        """Eliminar una colección completa"""
+        pass
+
+    @abstractmethod
+    def list_collections(self) -> List[str]:
+        """Nombres de las colecciones existentes"""
+        pass
+
+
+class ChromaVectorStore(VectorStore):
+    """
+    Almacén respaldado por ChromaDB (backend por defecto).
+
+    Las colecciones nativas de ChromaDB ya implementan la API de `VectorCollection`,
+    por lo que se devuelven tal cual.
+    """
+
+    backend_name = 'chroma'
+
+    def __init__(self, client):
+        """
+        Args:
+            client: Cliente de ChromaDB (normalmente compartido vía el registro de modelos)
+        """
+        self.client = client
+
+    def get_collection(self, name: str):
+        try:
+            return self.client.get_collection(name)
+        except Exception as e:
+            raise CollectionNotFoundError(name) from e
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None):
+        return self.client.get_or_create_collection(name=name, metadata=metadata)
+
+    def delete_collection(self, name: str):
+        self.client.delete_collection(name)
+
+    def list_collections(self) -> List[str]:
+        collections = self.client.list_collections()
+        # Según la versión de ChromaDB se devuelven nombres u objetos Collection
+        return [getattr(collection, 'name', collection) for collection in collections]
+
+
+class DirectoryVectorStore(VectorStore):
+    """
+    Almacén en disco con una carpeta por colección. Lleva la cuenta de las
+    colecciones abiertas en el proceso; las subclases solo crean cada
+    colección a partir de su carpeta.
+    """
+
+    def __init__(self, root_directory: str):
+        """
+        Args:
+            root_directory: Carpeta que contiene una subcarpeta por colección
+        """
+        self.root_directory = root_directory
+        self._lock = threading.Lock()
+        self._collections: Dict[str, VectorCollection] = {}
+        os.makedirs(root_directory, exist_ok=True)
+
+    @abstractmethod
+    def _new_collection(self, name: str) -> VectorCollection:
+        """Abrir la colección guardada en su carpeta"""
+        pass
+
+    def _collection_directory(self, name: str) -> str:
+        return os.path.join(self.root_directory, name)
+
+    def _load(self, name: str) -> VectorCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._new_collection(name)
+                self._collections[name] = collection
+            return collection
+
+    def get_collection(self, name: str) -> VectorCollection:
+        if not os.path.isdir(self._collection_directory(name)):
+            with self._lock:
+                self._collections.pop(name, None)
+            raise CollectionNotFoundError(name)
+        return self._load(name)
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> VectorCollection:
+        directory = self._collection_directory(name)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, 'collection.json'), 'w') as f:
+                json.dump(metadata or {}, f)
+        return self._load(name)
+
+    def delete_collection(self, name: str):
+        directory = self._collection_directory(name)
+        if not os.path.isdir(directory):
+            raise CollectionNotFoundError(name)
+        with self._lock:
+            self._collections.pop(name, None)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def list_collections(self) -> List[str]:
+        return sorted(
+            entry for entry in os.listdir(self.root_directory)
+            if os.path.isdir(os.path.join(self.root_directory, entry))
+        )
+
+
+def shared_collection_name(user_id: str, shard_count: int) -> str:
+    """
+    Colección compartida que corresponde a un usuario en el modo multi-tenant
+
+    Args:
+        user_id: ID del usuario (clave de partición)
+        shard_count: Número de colecciones compartidas
+
+    Returns:
+        Nombre de la colección (estable para el mismo número de colecciones)
+    """
+    shard = int(hashlib.sha256(str(user_id).encode('utf-8')).hexdigest()[:8], 16) % shard_count
+    return f"rag_shared_{shard:03d}"
+
+
+def create_vector_store(backend: str, persist_directory: str, chroma_client=None) -> VectorStore:
+    """
+    Crear un almacén vectorial
+
+    Args:
+        backend: 'chroma', 'numpy' o 'faiss'
+        persist_directory: Directorio base de persistencia
+        chroma_client: Cliente de ChromaDB (solo para el backend 'chroma')
+
+    Returns:
+        Instancia de VectorStore
+    """
+    if backend == 'chroma':
+        return ChromaVectorStore(chroma_client)
+
+    if backend == 'numpy':
+        from .flat_vector_store import NumpyVectorStore
+        return NumpyVectorStore(os.path.join(persist_directory, 'flat_index'))
+
+    if backend == 'faiss':
+        from .faiss_vector_store import FaissVectorStore
+        return FaissVectorStore(os.path.join(persist_directory, 'faiss_index'))
+
+    raise ValueError(f"Backend vectorial no soportado: {backend}")
@@ -1,3 +1,669 @@
-from django.test import TestCase
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import uuid
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+
+from .models import UserManifest
+from .services.cache import LRUTTLCache
+from .services.embedding_scheduler import EmbeddingBatchScheduler
+from .services.embedding_store import ContentAddressedEmbeddingStore
+from .services.enhanced_rag import EnhancedRAGService
+from .services.faiss_vector_store import FaissVectorStore
+from .services.flat_vector_store import FlatCollection, NumpyVectorStore
+
+
+class FakeEmbeddingModel:
+    """Modelo que devuelve la longitud de cada texto como vector y registra el tamaño de cada pasada"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode(self, texts):
+        self.batch_sizes.append(len(texts))
+        return np.array([[float(len(text))] for text in texts], dtype=np.float32)
+
+
+class EmbeddingSchedulerTests(SimpleTestCase):
+    """Micro-lotes del planificador de embeddings"""
+
+    def test_batches_never_exceed_max_size(self):
+        model = FakeEmbeddingModel()
+        scheduler = EmbeddingBatchScheduler(model, max_batch_size=4, max_wait_ms=50)
+        results = {}
+
+        def encode(i):
+            texts = ['x' * (i + 1)] * 3
+            results[i] = scheduler.encode(texts, timeout=5)
+
+        threads = [threading.Thread(target=encode, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(size <= 4 for size in model.batch_sizes), model.batch_sizes)
+        self.assertEqual(sum(model.batch_sizes), 18)
+        for i, vectors in results.items():
+            self.assertEqual(vectors[:, 0].tolist(), [float(i + 1)] * 3)
+
+
+class ChromaParityMixin:
+    """
+    Mismo escenario de altas, bajas, actualizaciones y búsquedas filtradas en
+    una colección local y en ChromaDB; los resultados deben coincidir.
+    """
+
+    dim = 16
+    size = 240
+
+    def setUp(self):
+        import chromadb
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.chroma_client = chromadb.EphemeralClient()
+        name = f'parity_{uuid.uuid4().hex}'
+        self.chroma = self.chroma_client.create_collection(name, metadata={
+            'hnsw:space': 'l2', 'hnsw:search_ef': 200, 'hnsw:construction_ef': 200
+        })
+        self.addCleanup(self.chroma_client.delete_collection, name)
+        self.rng = np.random.default_rng(7)
+
+    def make_collection(self):
+        raise NotImplementedError
+
+    def _records(self, start, stop):
+        ids = [f'chunk_{i}' for i in range(start, stop)]
+        embeddings = self.rng.normal(size=(stop - start, self.dim)).astype(np.float32)
+        metadatas = [
+            {'user_id': f'user_{i % 3}', 'page': i % 10, 'kind': 'a' if i % 2 else 'b'}
+            for i in range(start, stop)
+        ]
+        documents = [f'texto del fragmento {i}' for i in range(start, stop)]
+        return ids, embeddings, metadatas, documents
+
+    def _both(self, collection, method, *args, **kwargs):
+        getattr(self.chroma, method)(*args, **kwargs)
+        getattr(collection, method)(*args, **kwargs)
+
+    def assertSameQueries(self, collection, queries):
+        for where in (None, {'user_id': 'user_0'}, {'page': {'$gt': 6}}, {'kind': {'$in': ['a']}},
+                      {'$and': [{'user_id': 'user_1'}, {'page': {'$lte': 4}}]},
+                      {'$or': [{'user_id': 'user_2'}, {'page': 3}]}):
+            expected = self.chroma.query(query_embeddings=queries, n_results=6, where=where)
+            actual = collection.query(queries, n_results=6, where=where)
+            self.assertEqual(actual['ids'], expected['ids'], where)
+            self.assertEqual(actual['documents'], expected['documents'], where)
+            self.assertEqual(actual['metadatas'], [list(row) for row in expected['metadatas']], where)
+            np.testing.assert_allclose(actual['distances'], expected['distances'], rtol=1e-3, atol=1e-3)
+
+    def assertSameRecords(self, collection, where=None):
+        expected = self.chroma.get(where=where)
+        actual = collection.get(where=where)
+        self.assertEqual(
+            sorted(zip(actual['ids'], actual['documents'])),
+            sorted(zip(expected['ids'], expected['documents']))
+        )
+        self.assertEqual(
+            dict(zip(actual['ids'], actual['metadatas'])),
+            dict(zip(expected['ids'], expected['metadatas']))
+        )
+        if where is None:
+            self.assertEqual(collection.count(), self.chroma.count())
+
+    def test_parity_with_chroma(self):
+        collection = self.make_collection()
+        queries = self.rng.normal(size=(4, self.dim)).astype(np.float32)
+
+        ids, embeddings, metadatas, documents = self._records(0, self.size)
+        self._both(collection, 'add', ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+        self.assertSameRecords(collection)
+        self.assertSameQueries(collection, queries)
+
+        ids, embeddings, metadatas, documents = self._records(self.size - 20, self.size + 20)
+        self._both(collection, 'upsert', ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+        self._both(collection, 'update', ids=['chunk_1', 'chunk_2'], metadatas=[{'page': 3}, {'user_id': 'user_2'}])
+        self.assertSameRecords(collection)
+        self.assertSameQueries(collection, queries)
+
+        self._both(collection, 'delete', where={'user_id': 'user_2'})
+        self._both(collection, 'delete', ids=[f'chunk_{i}' for i in range(0, 60, 4)])
+        self.assertSameRecords(collection)
+        self.assertSameRecords(collection, where={'$and': [{'user_id': 'user_0'}, {'page': {'$gte': 5}}]})
+        self.assertSameQueries(collection, queries)
+
+        # Otra instancia sobre el mismo directorio (otro proceso) ve lo mismo
+        self.assertSameQueries(self.make_collection(), queries)
+
+
+class FlatChromaParityTests(ChromaParityMixin, SimpleTestCase):
+    """Colección plana frente a ChromaDB"""
+
+    def make_collection(self):
+        return FlatCollection('parity', self.directory)
+
+
+class QuantizedFlatChromaParityTests(ChromaParityMixin, SimpleTestCase):
+    """
+    Colecciones planas cuantizadas (SQ8 y PQ) frente a ChromaDB: la lista
+    corta puntuada con códigos se re-puntúa con float32, así que el top-k
+    y las distancias deben coincidir.
+    """
+
+    quantization = 'sq8'
+    options = {'min_training_size': 100}
+
+    def make_collection(self):
+        return FlatCollection('parity', self.directory, quantization=self.quantization, **self.options)
+
+    def test_parity_with_chroma(self):
+        super().test_parity_with_chroma()
+        self.assertEqual(self.make_collection().get_stats()['index_kind'], self.quantization)
+
+
+class ProductQuantizedFlatChromaParityTests(QuantizedFlatChromaParityTests):
+    quantization = 'pq'
+    # El upsert lleva la colección a 260 vectores y entrena los 256 centroides
+    options = {'min_training_size': 256, 'pq_subvectors': 8, 'rescore_factor': 10}
+
+
+class FaissChromaParityTests(ChromaParityMixin, SimpleTestCase):
+    """Colección FAISS (HNSW, con búsqueda exacta desactivada) frente a ChromaDB"""
+
+    def make_collection(self):
+        store = FaissVectorStore(self.directory, {'index_type': 'hnsw', 'ef_search': 200, 'exact_search_max': 0})
+        return store.get_or_create_collection('parity')
+
+
+class VectorStoreSettingsTests(SimpleTestCase):
+    """Cada backend en disco lee solo su propia configuración"""
+
+    def test_faiss_store_ignores_flat_settings(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        with mock.patch.dict(os.environ, {'RAG_VECTOR_QUANTIZATION': 'int4'}):
+            with self.assertRaises(ValueError):
+                NumpyVectorStore(directory)
+            store = FaissVectorStore(directory)
+
+        store.get_or_create_collection('curriculo')
+        self.assertEqual(store.list_collections(), ['curriculo'])
+        self.assertIs(store.get_collection('curriculo'), store.get_collection('curriculo'))
+
+
+class FlatCollectionStorageTests(SimpleTestCase):
+    """Escrituras de solo altas y compactación de la colección plana"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.rng = np.random.default_rng(3)
+
+    def _add(self, collection, start, stop):
+        collection.add(
+            ids=[f'chunk_{i}' for i in range(start, stop)],
+            embeddings=self.rng.normal(size=(stop - start, 8)).astype(np.float32),
+            metadatas=[{'page': i} for i in range(start, stop)],
+            documents=[f'doc {i}' for i in range(start, stop)]
+        )
+
+    def test_writes_append_without_rewriting(self):
+        collection = FlatCollection('append', self.directory, compact_ratio=0.5)
+        vectors_path = os.path.join(self.directory, 'vectors.0.f32')
+
+        self._add(collection, 0, 100)
+        self.assertEqual(os.path.getsize(vectors_path), 100 * 8 * 4)
+        inode = os.stat(vectors_path).st_ino
+        self._add(collection, 100, 110)
+        collection.delete(ids=['chunk_3', 'chunk_4'])
+        collection.update(ids=['chunk_5'], metadatas=[{'page': 50}])
+
+        self.assertEqual(os.stat(vectors_path).st_ino, inode)
+        self.assertEqual(os.path.getsize(vectors_path), 110 * 8 * 4)
+        self.assertEqual(collection.get_stats()['tombstones'], 2)
+        self.assertEqual(collection.count(), 108)
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith('.json')])
+
+    def test_other_instances_see_writes(self):
+        writer = FlatCollection('shared', self.directory, compact_ratio=0.5)
+        reader = FlatCollection('shared', self.directory)
+        self._add(writer, 0, 10)
+        self.assertEqual(reader.count(), 10)
+        self.assertEqual(len(reader.get(where={'page': {'$lt': 5}})['ids']), 5)
+
+        # Misma generación: el lector solo procesa las filas nuevas y vuelve a leer los registros
+        self._add(writer, 10, 12)
+        writer.update(ids=['chunk_0'], metadatas=[{'page': 99}])
+        writer.delete(ids=['chunk_1'])
+        self.assertEqual(reader.get(ids=['chunk_0', 'chunk_1', 'chunk_11'])['metadatas'], [{'page': 99}, {'page': 11}])
+        self.assertEqual(reader.get_stats()['generation'], 0)
+        query = self.rng.normal(size=8).astype(np.float32)
+        self.assertEqual(reader.query(query, n_results=11), writer.query(query, n_results=11))
+
+    def test_compaction_preserves_results(self):
+        collection = FlatCollection('compact', self.directory, compact_ratio=0.3)
+        reader = FlatCollection('compact', self.directory)
+        self._add(collection, 0, 100)
+        query = self.rng.normal(size=8).astype(np.float32)
+
+        collection.delete(where={'page': {'$lt': 20}})
+        before = reader.query(query, n_results=10)
+        self.assertEqual(reader.get_stats()['generation'], 0)
+
+        collection.delete(where={'page': {'$lt': 35}})
+        expected = [row_id for row_id in before['ids'][0]
+                    if int(row_id.split('_')[1]) >= 35]
+        after = reader.query(query, n_results=10)
+        stats = reader.get_stats()
+        self.assertEqual((stats['generation'], stats['rows'], stats['tombstones']), (1, 65, 0))
+        self.assertEqual(after['ids'][0][:len(expected)], expected)
+        self.assertEqual(after['documents'][0][0], f"doc {after['ids'][0][0].split('_')[1]}")
+        self.assertEqual([name for name in os.listdir(self.directory) if name.startswith('vectors.')],
+                         ['vectors.1.f32'])
+
+
+class FakeRegistry:
+    """Registro de modelos con un modelo de embeddings determinista y un almacén plano temporal"""
+
+    def __init__(self, directory):
+        self.vector_store = NumpyVectorStore(directory)
+
+    def get_embedding_model(self, name):
+        return self
+
+    def encode(self, texts):
+        return np.array([[len(text), text.count(' '), sum(map(ord, text)) % 97] for text in texts],
+                        dtype=np.float32)
+
+    def get_vector_store(self, backend=None, persist_directory=None):
+        return self.vector_store
+
+
+class RAGServiceTestCase(TestCase):
+    """Servicio RAG sobre un registro falso y un almacén plano temporal"""
+
+    environment = {}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        environment = mock.patch.dict(os.environ, {
+            'RAG_COLLECTION_MODE': 'per_user',
+            'EMBEDDING_BATCHING_ENABLED': 'False',
+            'RAG_EMBEDDING_STORE_ENABLED': 'False',
+            **self.environment,
+        })
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.registry = FakeRegistry(self.directory)
+        registry = mock.patch('rag.services.enhanced_rag.get_model_registry', return_value=self.registry)
+        registry.start()
+        self.addCleanup(registry.stop)
+        self.service = EnhancedRAGService()
+        # Las cachés son compartidas por el proceso: no arrastrar resultados de otros tests
+        self.service.query_embedding_cache.clear()
+        self.service.retrieval_cache.clear()
+
+
+class DocumentManifestTests(RAGServiceTestCase):
+    """El manifiesto por usuario se mantiene con las altas, las bajas y los datos anteriores"""
+
+    def assertManifest(self, user_id, documents, chunks, total_bytes):
+        stats = self.service.get_collection_stats(user_id)
+        self.assertEqual((stats['total_documents'], stats['total_chunks'], stats['total_bytes']),
+                         (documents, chunks, total_bytes))
+        self.assertEqual(len(self.service.get_user_documents(user_id)), documents)
+
+    def test_process_and_delete_update_counts(self):
+        first = 'Primer documento. ' * 60
+        second = 'Segundo documento con tildes: acción. ' * 10
+        first_id = self.service.process_document(first, 'alumno', {'title': 'uno'})
+        first_chunks = len(self.service._chunk_document(first))
+        self.assertManifest('alumno', 1, first_chunks, len(first.encode('utf-8')))
+
+        self.service.process_document(second, 'alumno')
+        second_chunks = len(self.service._chunk_document(second))
+        self.assertManifest('alumno', 2, first_chunks + second_chunks,
+                            len(first.encode('utf-8')) + len(second.encode('utf-8')))
+        document = next(entry for entry in self.service.get_user_documents('alumno')
+                        if entry['document_id'] == first_id)
+        self.assertEqual((document['chunk_count'], document['metadata']['title']), (first_chunks, 'uno'))
+
+        self.assertTrue(self.service.delete_user_documents('alumno', first_id))
+        self.assertManifest('alumno', 1, second_chunks, len(second.encode('utf-8')))
+
+        self.assertTrue(self.service.delete_user_documents('alumno'))
+        self.assertFalse(UserManifest.objects.filter(user_id='alumno').exists())
+        self.assertFalse(self.service.get_collection_stats('alumno')['collection_exists'])
+
+    def test_legacy_collection_is_rebuilt_once(self):
+        # Chunks insertados antes de existir el manifiesto
+        collection = self.service.vector_store.get_or_create_collection('user_antiguo')
+        chunks = ['uno ' * 10, 'dos ' * 10, 'tres ' * 10]
+        collection.add(
+            ids=['doc_a_chunk_0', 'doc_a_chunk_1', 'doc_b_chunk_0'],
+            embeddings=FakeRegistry.encode(None, chunks),
+            metadatas=[
+                {'user_id': 'antiguo', 'document_id': document_id, 'chunk_index': index, 'timestamp': '2024-01-01'}
+                for document_id, index in (('doc_a', 0), ('doc_a', 1), ('doc_b', 0))
+            ],
+            documents=chunks
+        )
+        total_bytes = sum(len(chunk.encode('utf-8')) for chunk in chunks)
+        self.assertManifest('antiguo', 2, 3, total_bytes)
+
+        with mock.patch.object(collection, 'get', side_effect=AssertionError('recorrido completo')):
+            self.assertManifest('antiguo', 2, 3, total_bytes)
+
+        self.service.delete_user_documents('antiguo', 'doc_a')
+        self.assertManifest('antiguo', 1, 1, len(chunks[2].encode('utf-8')))
+
+
+class LRUTTLCacheTests(SimpleTestCase):
+    """Desalojo por entradas y por bytes, expiración e invalidación por etiqueta"""
+
+    def test_evicts_least_recently_used_by_entry_count(self):
+        cache = LRUTTLCache('test', max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # 'b' pasa a ser la menos usada
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+    def test_evicts_by_bytes(self):
+        vector = np.zeros(10, dtype=np.float32)  # 40 bytes
+        cache = LRUTTLCache('test', max_entries=100, max_bytes=100)
+        for key in 'abc':
+            cache.set(key, vector.copy())
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        stats = cache.get_stats()
+        self.assertEqual((stats['entries'], stats['bytes'], stats['evictions']), (2, 80, 1))
+
+        cache.set('grande', np.zeros(100, dtype=np.float32))  # más que max_bytes: no se guarda
+        self.assertIsNone(cache.get('grande'))
+        self.assertEqual(cache.get_stats()['entries'], 2)
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUTTLCache('test', ttl_seconds=10)
+        with mock.patch('rag.services.cache.time.monotonic', return_value=100.0):
+            cache.set('a', 1)
+            cache.set('b', 2, ttl_seconds=60)
+        with mock.patch('rag.services.cache.time.monotonic', return_value=109.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('rag.services.cache.time.monotonic', return_value=110.0):
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('b'), 2)
+
+        stats = cache.get_stats()
+        self.assertEqual((stats['entries'], stats['expirations']), (1, 1))
+
+    def test_invalidate_tag_only_removes_tagged_entries(self):
+        cache = LRUTTLCache('test')
+        cache.set('a1', 1, tag='user_a')
+        cache.set('a2', 2, tag='user_a')
+        cache.set('b1', 3, tag='user_b')
+        cache.set('sin_tag', 4)
+
+        self.assertEqual(cache.invalidate_tag('user_a'), 2)
+        self.assertEqual(cache.invalidate_tag('user_a'), 0)
+        self.assertEqual([cache.get(key) for key in ('a1', 'a2', 'b1', 'sin_tag')], [None, None, 3, 4])
+        self.assertEqual(cache.get_stats()['invalidations'], 2)
+
+
+class RetrievalCacheInvalidationTests(RAGServiceTestCase):
+    """Modificar los documentos de un usuario solo invalida sus búsquedas cacheadas"""
+
+    def assertCached(self, user_id, query, cached):
+        with mock.patch.object(self.service, '_get_query_embedding',
+                               wraps=self.service._get_query_embedding) as embed:
+            self.service.search_relevant_content(query, user_id)
+        self.assertEqual(embed.called, not cached)
+
+    def test_changes_invalidate_only_that_user(self):
+        ana_id = self.service.process_document('apuntes de ana', 'ana')
+        self.service.process_document('apuntes de luis', 'luis')
+        self.assertEqual(self.service.search_relevant_content('apuntes de ana', 'ana'), ['apuntes de ana'])
+        self.service.search_relevant_content('apuntes de luis', 'luis')
+        self.assertCached('ana', 'apuntes de ana', True)
+
+        self.service.process_document('más apuntes de ana', 'ana')
+        self.assertCached('ana', 'apuntes de ana', False)
+        self.assertCached('luis', 'apuntes de luis', True)
+
+        self.service.delete_user_documents('ana', ana_id)
+        self.assertCached('ana', 'apuntes de ana', False)
+        self.assertCached('luis', 'apuntes de luis', True)
+
+        self.service.delete_user_documents('ana')
+        self.assertEqual(self.service.search_relevant_content('apuntes de ana', 'ana'), [])
+        self.assertCached('luis', 'apuntes de luis', True)
+
+
+class EmbeddingStoreTests(SimpleTestCase):
+    """Almacén de embeddings direccionado por (modelo, texto)"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.store = ContentAddressedEmbeddingStore(os.path.join(directory, 'embeddings.sqlite3'))
+
+    def test_put_many_get_many_round_trip(self):
+        vectors = {
+            ContentAddressedEmbeddingStore.make_key('modelo', text): np.arange(4, dtype=np.float32) + index
+            for index, text in enumerate(['uno', 'dos', 'tres'])
+        }
+        self.store.put_many(vectors)
+        missing = ContentAddressedEmbeddingStore.make_key('modelo', 'cuatro')
+
+        found = self.store.get_many(list(vectors) + [missing])
+        self.assertEqual(set(found), set(vectors))
+        for key, vector in vectors.items():
+            self.assertEqual(found[key].dtype, np.float32)
+            np.testing.assert_array_equal(found[key], vector)
+        self.assertEqual(self.store.count(), 3)
+        stats = self.store.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+
+    def test_key_includes_model_name(self):
+        key = ContentAddressedEmbeddingStore.make_key('modelo-a', 'mismo texto')
+        self.assertEqual(key, ContentAddressedEmbeddingStore.make_key('modelo-a', 'mismo texto'))
+        self.assertNotEqual(key, ContentAddressedEmbeddingStore.make_key('modelo-b', 'mismo texto'))
+
+        self.store.put_many({key: np.ones(3, dtype=np.float32)})
+        self.assertEqual(self.store.get_many([ContentAddressedEmbeddingStore.make_key('modelo-b', 'mismo texto')]), {})
+
+
+class EmbeddingStoreReuseTests(RAGServiceTestCase):
+    """Re-ingerir chunks ya vectorizados no vuelve a llamar al modelo"""
+
+    environment = {'RAG_EMBEDDING_STORE_ENABLED': 'True'}
+
+    def setUp(self):
+        store_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_directory, True)
+        store_path = mock.patch.dict(os.environ, {
+            'RAG_EMBEDDING_STORE_PATH': os.path.join(store_directory, 'embeddings.sqlite3')
+        })
+        store_path.start()
+        self.addCleanup(store_path.stop)
+        super().setUp()
+
+    def test_reingest_skips_encoder(self):
+        content = 'Texto repetido entre subidas. ' * 40
+        with mock.patch.object(self.registry, 'encode', wraps=self.registry.encode) as encode:
+            self.service.process_document(content, 'ana')
+            self.assertEqual(encode.call_count, 1)
+            stored = self.service.embedding_store.count()
+            self.assertEqual(stored, len(set(self.service._chunk_document(content))))
+
+            self.service.process_document(content, 'luis')
+            self.service.process_document_stream([content], 'ana')
+            self.assertEqual(encode.call_count, 1)
+
+            self.service.embedding_model_name = 'otro-modelo'
+            self.service.process_document(content, 'ana')
+            self.assertEqual(encode.call_count, 2)
+        self.assertEqual(self.service.embedding_store.count(), 2 * stored)
+
+
+class StreamingIngestionTests(RAGServiceTestCase):
+    """La ingesta en streaming produce los mismos chunks que la ingesta completa"""
+
+    def _random_document(self, rng):
+        words = ['acción', 'niño', 'año', 'corazón', 'tema', 'examen', 'ejercicio', 'clase', '€', '数学']
+        separators = [' ', ' ', ' ', '. ', '.\n', '\n\n', ', ', '! ', '? ']
+        length = rng.randint(1, 2500)
+        pieces = [' ' * rng.randint(0, 3)]
+        while sum(map(len, pieces)) < length:
+            pieces.append(rng.choice(words))
+            pieces.append(rng.choice(separators))
+        return ''.join(pieces)
+
+    def _random_split(self, rng, data):
+        cuts = sorted(rng.sample(range(1, len(data)), min(len(data) - 1, rng.randint(0, 12))))
+        return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+    def test_chunks_match_full_document_chunking(self):
+        rng = random.Random(0)
+        for _ in range(150):
+            document = self._random_document(rng)
+            if not document.strip():
+                continue
+            expected = self.service._chunk_document(document)
+            for source in (self._random_split(rng, document),
+                           self._random_split(rng, document.encode('utf-8')),
+                           io.StringIO(document)):
+                blocks = self.service._iter_text_blocks(source, block_size=rng.randint(1, 700))
+                self.assertEqual(list(self.service._iter_chunks(blocks)), expected)
+
+    def test_multibyte_characters_split_across_upload_chunks(self):
+        document = 'Lección de matemáticas: 数学 y €. ' * 200
+        upload = SimpleUploadedFile('apuntes.txt', document.encode('utf-8'))
+        blocks = list(self.service._iter_text_blocks(upload.chunks(chunk_size=7)))
+        self.assertEqual(''.join(blocks), document)
+
+        upload.seek(0)
+        document_id = self.service.process_document_stream(upload.chunks(chunk_size=7), 'ana', batch_size=3)
+        collection = self.service.vector_store.get_collection('user_ana')
+        stored = collection.get(where={'document_id': document_id}, include=['documents', 'metadatas'])
+        chunks = [text for _, text in sorted(
+            (metadata['chunk_index'], text) for metadata, text in zip(stored['metadatas'], stored['documents'])
+        )]
+        self.assertEqual(chunks, self.service._chunk_document(document))
+        self.assertFalse(any('\ufffd' in chunk for chunk in chunks))
+
+    def test_batches_are_upserted_with_progress(self):
+        document = 'Frase de prueba para el streaming. ' * 150
+        expected = self.service._chunk_document(document)
+        updates = []
+        with mock.patch.object(FlatCollection, 'upsert', autospec=True,
+                               side_effect=FlatCollection.upsert) as upsert:
+            document_id = self.service.process_document_stream(
+                iter([document]), 'ana', batch_size=4, progress_callback=updates.append
+            )
+
+        batch_sizes = [len(call.kwargs['ids']) for call in upsert.call_args_list]
+        self.assertEqual(sum(batch_sizes), len(expected))
+        self.assertTrue(all(size == 4 for size in batch_sizes[:-1]))
+        self.assertEqual([update['batches_processed'] for update in updates[:-1]],
+                         list(range(1, len(batch_sizes) + 1)))
+        self.assertEqual([update['chunks_processed'] for update in updates[:-1]],
+                         [min(4 * i, len(expected)) for i in range(1, len(batch_sizes) + 1)])
+        self.assertFalse(any(update['done'] for update in updates[:-1]))
+        self.assertEqual(updates[-1], {
+            'document_id': document_id,
+            'chunks_processed': len(expected),
+            'batches_processed': len(batch_sizes),
+            'characters_processed': sum(map(len, expected)),
+            'done': True
+        })
+
+        stored = self.service.vector_store.get_collection('user_ana').get(include=['metadatas'])
+        self.assertEqual({metadata['chunk_count'] for metadata in stored['metadatas']}, {len(expected)})
+        document_info = self.service.get_user_documents('ana')[0]
+        self.assertEqual((document_info['document_id'], document_info['chunk_count']),
+                         (document_id, len(expected)))
+
+    def test_failure_mid_stream_removes_partial_chunks(self):
+        previous_id = self.service.process_document('Documento anterior que debe quedarse.', 'ana')
+        encode_chunks = self.service._encode_chunks
+        calls = []
+
+        def failing_encode(chunks):
+            calls.append(len(chunks))
+            if len(calls) == 3:
+                raise RuntimeError('modelo caído')
+            return encode_chunks(chunks)
+
+        updates = []
+        with mock.patch.object(self.service, '_encode_chunks', side_effect=failing_encode):
+            with self.assertRaises(RuntimeError):
+                self.service.process_document_stream(
+                    iter(['Frase de prueba para el streaming. ' * 150]), 'ana',
+                    batch_size=4, progress_callback=updates.append
+                )
+
+        self.assertEqual(len(updates), 2)
+        partial_id = updates[0]['document_id']
+        collection = self.service.vector_store.get_collection('user_ana')
+        self.assertEqual(collection.get(where={'document_id': partial_id})['ids'], [])
+        self.assertEqual(collection.count(), 1)
+        self.assertEqual([entry['document_id'] for entry in self.service.get_user_documents('ana')],
+                         [previous_id])
+
+
+class SharedCollectionIsolationTests(RAGServiceTestCase):
+    """En modo compartido cada usuario solo ve y borra sus propios chunks"""
+
+    environment = {'RAG_COLLECTION_MODE': 'shared', 'RAG_SHARED_COLLECTIONS': '1'}
+
+    def setUp(self):
+        super().setUp()
+        # Anagramas: el modelo falso les asigna el mismo embedding (distancia 0)
+        self.ana_id = self.service.process_document('tema de examen', 'ana')
+        self.luis_id = self.service.process_document('examen de tema', 'luis')
+        self.collection = self.service.vector_store.get_collection('rag_shared_000')
+
+    def test_users_share_one_collection(self):
+        self.assertEqual(self.service.vector_store.list_collections(), ['rag_shared_000'])
+        self.assertEqual(self.collection.count(), 2)
+
+    def test_search_only_returns_own_chunks(self):
+        self.assertEqual(self.service.search_relevant_content('examen de tema', 'ana', top_k=10),
+                         ['tema de examen'])
+        self.assertEqual(self.service.search_relevant_content('tema de examen', 'luis', top_k=10),
+                         ['examen de tema'])
+        self.assertEqual(self.service.search_relevant_content('tema de examen', 'marta'), [])
+
+    def test_documents_listing_is_per_user(self):
+        self.assertEqual([entry['document_id'] for entry in self.service.get_user_documents('ana')],
+                         [self.ana_id])
+        self.assertEqual([entry['document_id'] for entry in self.service.get_user_documents('luis')],
+                         [self.luis_id])
+        self.assertEqual(self.service.get_user_documents('marta'), [])
+
+    def test_delete_only_removes_own_chunks(self):
+        # Un documento ajeno no se puede borrar aunque esté en la misma colección
+        self.assertTrue(self.service.delete_user_documents('ana', self.luis_id))
+        self.assertEqual(self.collection.count(), 2)
+
+        self.assertTrue(self.service.delete_user_documents('ana'))
+        self.assertEqual(self.collection.count(), 1)
+        self.assertEqual(self.service.search_relevant_content('examen de tema', 'ana'), [])
+        self.assertEqual(self.service.get_user_documents('ana'), [])
+        self.assertEqual(self.service.search_relevant_content('tema de examen', 'luis'), ['examen de tema'])
+        self.assertEqual([entry['document_id'] for entry in self.service.get_user_documents('luis')],
+                         [self.luis_id])